@@ -1,4 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any, Optional
 from datetime import date, datetime
@@ -8,22 +9,36 @@ from backend.app.db.models import User, ChargePile, CarRequest, RateRule, Servic
 from backend.app.db.schemas import (
     ChargePile as ChargePileSchema, PileStatus,
     RateRule as RateRuleSchema, RateType, ServiceRate as ServiceRateSchema,
-    RequestStatus
+    RequestStatus, ChargeMode, RerateRequest
 )
 from backend.app.core.auth import get_admin_user
+from backend.app.core.serialization import ORJSONResponse
+from backend.app.core.pagination import filter_date_range, paginate
+from backend.app.core.stall_detector import stall_detector
 from backend.app.services.report import ReportService
 from backend.app.services.fault_handler import FaultHandler
+from backend.app.services.scheduler_actor import scheduler_actors
 from backend.app.services.scheduler import ChargingScheduler
+from backend.app.services.archive import ArchiveService
+from backend.app.services.export import ExportService, EXPORT_DATASETS, USER_FILTER_DATASETS
+from backend.app.services.billing import BillingService
+# 分析接口使用的列式历史数据模块(history_store、analytics)只在调用这些接口时导入
+from backend.app.services.tariff import tariff_service
+from backend.app.services.charge_curve import charged_energy, effective_amount
 
 router = APIRouter()
 
 @router.get("/pile", response_model=List[Dict[str, Any]])
 async def get_all_piles(
+    station_id: Optional[str] = Query(None, description="充电站ID，不填时返回所有充电站"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
     """获取所有充电桩状态"""
-    piles = db.query(ChargePile).order_by(ChargePile.id).all()
+    query = db.query(ChargePile)
+    if station_id:
+        query = query.filter(ChargePile.station_id == station_id)
+    piles = query.order_by(ChargePile.id).all()
     
     result = []
     for pile in piles:
@@ -59,10 +74,9 @@ async def get_all_piles(
                     charging_minutes = (datetime.now() - car.start_time).total_seconds() / 60
                     charging_car["charging_minutes"] = charging_minutes
                     
-                    # 估算已充电量
-                    power_per_minute = pile.power / 60  # 每分钟充电量
-                    charged_kwh = power_per_minute * charging_minutes
-                    charging_car["charged_kwh"] = min(charged_kwh, car.amount_kwh)
+                    # 按功率曲线估算已充电量
+                    charged_kwh = charged_energy(pile, car, charging_minutes)
+                    charging_car["charged_kwh"] = charged_kwh
                     charging_car["charging_progress"] = min(charged_kwh / car.amount_kwh * 100, 100)
             else:
                 queuing_cars.append(car_data)
@@ -71,6 +85,7 @@ async def get_all_piles(
         pile_data = {
             "id": pile.id,
             "code": pile.code,
+            "station_id": pile.station_id,
             "type": pile.type,
             "status": pile.status,
             "power": pile.power,
@@ -84,7 +99,8 @@ async def get_all_piles(
         
         result.append(pile_data)
     
-    return result
+    # 直接返回响应，跳过逐项的 response_model 校验和转换
+    return ORJSONResponse(result)
 
 @router.get("/pile/{code}", response_model=Dict[str, Any])
 async def get_pile_detail(
@@ -133,10 +149,9 @@ async def get_pile_detail(
                 charging_minutes = (datetime.now() - car.start_time).total_seconds() / 60
                 charging_car["charging_minutes"] = charging_minutes
                 
-                # 估算已充电量
-                power_per_minute = pile.power / 60  # 每分钟充电量
-                charged_kwh = power_per_minute * charging_minutes
-                charging_car["charged_kwh"] = min(charged_kwh, car.amount_kwh)
+                # 按功率曲线估算已充电量
+                charged_kwh = charged_energy(pile, car, charging_minutes)
+                charging_car["charged_kwh"] = charged_kwh
                 charging_car["charging_progress"] = min(charged_kwh / car.amount_kwh * 100, 100)
         else:
             queuing_cars.append(car_data)
@@ -177,7 +192,7 @@ async def get_pile_detail(
         "fault_history": fault_history
     }
     
-    return pile_detail
+    return ORJSONResponse(pile_detail)
 
 @router.post("/pile/{code}/poweron", response_model=Dict[str, Any])
 async def power_on_pile(
@@ -206,11 +221,23 @@ async def power_on_pile(
             detail=f"充电桩 {code} 已经处于运行状态"
         )
     
-    # 更新充电桩状态
-    pile.status = PileStatus.AVAILABLE
-    db.commit()
+    pile_id = pile.id
+
+    def power_on(session: Session):
+        # 更新充电桩状态
+        target = ChargingScheduler.lock_pile(session, pile_id)
+        if target.status != PileStatus.OFFLINE:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"充电桩 {code} 已经处于运行状态"
+            )
+        target.status = PileStatus.AVAILABLE
+        ChargingScheduler.bump_pile_version(session, target)
+        session.commit()
     
-    return {"code": code, "status": pile.status, "message": f"充电桩 {code} 已启动"}
+    # 启动后从等候区叫号
+    await scheduler_actors.get(pile.station_id).submit("pile_poweron", power_on, dispatch=True)
+    return {"code": code, "status": PileStatus.AVAILABLE, "message": f"充电桩 {code} 已启动"}
 
 @router.post("/pile/{code}/shutdown", response_model=Dict[str, Any])
 async def shutdown_pile(
@@ -234,22 +261,24 @@ async def shutdown_pile(
             detail=f"充电桩 {code} 已经处于关闭状态"
         )
     
-    # 检查是否有正在充电的车辆
-    charging_car = (
-        db.query(CarRequest)
-        .filter(CarRequest.pile_id == pile.id)
-        .filter(CarRequest.status == "CHARGING")
-        .first()
-    )
-    
-    # 如果有正在充电的车辆或排队中的车辆，先处理这些车辆
-    affected_cars = 0
-    rescheduled_cars = []
-    
-    try:
+    pile_id = pile.id
+
+    def shutdown(session: Session):
+        # 检查是否有正在充电的车辆
+        charging_car = (
+            session.query(CarRequest)
+            .filter(CarRequest.pile_id == pile_id)
+            .filter(CarRequest.status == "CHARGING")
+            .first()
+        )
+        
+        # 如果有正在充电的车辆或排队中的车辆，先处理这些车辆
+        affected_cars = 0
+        rescheduled_cars = []
+        
         # 先报告故障，这会停止计费并生成详单，将所有车辆移回等候区
-        if charging_car or db.query(CarRequest).filter(CarRequest.pile_id == pile.id).filter(CarRequest.status == "QUEUING").count() > 0:
-            success, message = FaultHandler.report_pile_fault(db, pile.id, f"管理员禁用充电桩 {code}")
+        if charging_car or session.query(CarRequest).filter(CarRequest.pile_id == pile_id).filter(CarRequest.status == "QUEUING").count() > 0:
+            success, message = FaultHandler.report_pile_fault(session, pile_id, f"管理员禁用充电桩 {code}")
             if not success:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -258,7 +287,7 @@ async def shutdown_pile(
             
             # 获取所有被移回等候区的车辆
             affected_requests = (
-                db.query(CarRequest)
+                session.query(CarRequest)
                 .filter(CarRequest.status == RequestStatus.WAITING)
                 .filter(CarRequest.end_time != None)  # 曾经充过电的
                 .all()
@@ -270,22 +299,28 @@ async def shutdown_pile(
                 # 根据策略选择调度方法
                 if strategy == "priority":
                     # 找到最优的同类型充电桩
-                    best_pile = ChargingScheduler.find_best_pile(db, request.mode, request.amount_kwh)
+                    best_pile = ChargingScheduler.find_best_pile(session, request.mode, effective_amount(request))
                     if best_pile:
                         # 分配到充电桩
-                        success = ChargingScheduler.assign_to_pile(db, request.id, best_pile.id)
+                        success = ChargingScheduler.assign_to_pile(session, request.id, best_pile.id)
                         if success:
                             rescheduled_cars.append(request.id)
                 elif strategy == "time_order":
                     # 时间顺序调度，按照排队号码排序
                     # 这里简化处理，直接调用调度器的方法
-                    success = ChargingScheduler.schedule_request(db, request.id)
+                    success = ChargingScheduler.schedule_request(session, request.id)
                     if success:
                         rescheduled_cars.append(request.id)
         
         # 更新充电桩状态为关闭
-        pile.status = PileStatus.OFFLINE
-        db.commit()
+        target = ChargingScheduler.lock_pile(session, pile_id)
+        target.status = PileStatus.OFFLINE
+        ChargingScheduler.bump_pile_version(session, target)
+        session.commit()
+        return affected_cars, rescheduled_cars
+    
+    try:
+        affected_cars, rescheduled_cars = await scheduler_actors.get(pile.station_id).submit("pile_shutdown", shutdown)
         
         if affected_cars > 0:
             return {
@@ -298,8 +333,9 @@ async def shutdown_pile(
             }
         else:
             return {"code": code, "status": PileStatus.OFFLINE, "message": f"充电桩 {code} 已关闭"}
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"关闭充电桩失败: {str(e)}"
@@ -307,18 +343,47 @@ async def shutdown_pile(
 
 @router.get("/requests", response_model=List[Dict[str, Any]])
 async def get_recent_requests(
-    limit: int = Query(10, description="返回的请求数量"),
+    response: Response,
+    limit: int = Query(10, ge=1, description="返回的请求数量"),
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor"),
+    request_status: Optional[RequestStatus] = Query(None, alias="status", description="请求状态"),
+    mode: Optional[ChargeMode] = Query(None, description="充电模式"),
+    pile_code: Optional[str] = Query(None, description="充电桩编号"),
+    user_id: Optional[str] = Query(None, description="用户ID"),
+    start_date: Optional[date] = Query(None, description="请求日期起"),
+    end_date: Optional[date] = Query(None, description="请求日期止"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
-    """获取最近的充电请求"""
-    requests = (
-        db.query(CarRequest)
-        .order_by(CarRequest.request_time.desc())
-        .limit(limit)
-        .all()
-    )
-    
+    """按请求时间倒序分页获取充电请求"""
+    if start_date and end_date:
+        _check_date_range(start_date, end_date)
+
+    query = db.query(CarRequest)
+    if user_id:
+        query = query.filter(CarRequest.user_id == user_id)
+    if request_status:
+        query = query.filter(CarRequest.status == request_status)
+    if mode:
+        query = query.filter(CarRequest.mode == mode)
+    if pile_code:
+        pile = db.query(ChargePile).filter(ChargePile.code == pile_code).first()
+        if not pile:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"充电桩 {pile_code} 不存在"
+            )
+        query = query.filter(CarRequest.pile_id == pile.id)
+    query = filter_date_range(query, CarRequest.request_time, start_date, end_date)
+
+    requests = paginate(response, query, CarRequest.request_time, CarRequest.id, cursor, limit)
+
+    # 一次查询本页涉及的充电桩编号
+    pile_ids = {req.pile_id for req in requests if req.pile_id}
+    pile_codes = dict(
+        db.query(ChargePile.id, ChargePile.code).filter(ChargePile.id.in_(pile_ids)).all()
+    ) if pile_ids else {}
+
     result = []
     for req in requests:
         result.append({
@@ -328,7 +393,7 @@ async def get_recent_requests(
             "mode": req.mode,
             "amount_kwh": req.amount_kwh,
             "status": req.status,
-            "pile_code": req.pile.code if req.pile else None,
+            "pile_code": pile_codes.get(req.pile_id),
             "request_time": req.request_time,
         })
     return result
@@ -362,7 +427,10 @@ async def report_pile_fault(
         )
     
     # 报告故障
-    success, message = FaultHandler.report_pile_fault(db, pile.id, description)
+    pile_id = pile.id
+    success, message = await scheduler_actors.get(pile.station_id).submit(
+        "pile_fault", lambda session: FaultHandler.report_pile_fault(session, pile_id, description)
+    )
     
     if not success:
         raise HTTPException(
@@ -394,29 +462,37 @@ async def recover_pile_fault(
             detail=f"充电桩 {code} 不处于故障状态"
         )
     
-    # 恢复故障
-    success, message = FaultHandler.recover_pile_fault(db, pile.id)
-    
-    if not success:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=message
-        )
-    
-    # 重新调度
-    if strategy == "priority":
-        rescheduled_cars = FaultHandler.priority_reschedule(db, pile.id)
-    elif strategy == "time_order":
-        rescheduled_cars = FaultHandler.time_order_reschedule(db, pile.id)
-    else:
+    if strategy not in ("priority", "time_order"):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"未知的故障恢复策略: {strategy}"
         )
     
+    pile_id = pile.id
+
+    def recover(session: Session):
+        # 恢复故障
+        success, message = FaultHandler.recover_pile_fault(session, pile_id)
+        
+        if not success:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=message
+            )
+        
+        # 重新调度
+        if strategy == "priority":
+            rescheduled_cars = FaultHandler.priority_reschedule(session, pile_id)
+        else:
+            rescheduled_cars = FaultHandler.time_order_reschedule(session, pile_id)
+        return message, rescheduled_cars
+    
+    message, rescheduled_cars = await scheduler_actors.get(pile.station_id).submit("pile_recover", recover)
+    db.expire_all()
+    
     return {
         "code": code, 
-        "status": pile.status, 
+        "status": db.query(ChargePile.status).filter(ChargePile.id == pile_id).scalar(), 
         "message": message,
         "strategy": strategy,
         "rescheduled_count": len(rescheduled_cars)
@@ -453,6 +529,7 @@ async def update_rate_rule(
         rule.price = price
     
     db.commit()
+    tariff_service.invalidate()
     
     return {
         "type": type,
@@ -545,7 +622,7 @@ async def get_daily_report(
     total_service_fee = sum(report.service_fee for report in reports)
     total_fee = sum(report.total_fee for report in reports)
     
-    return {
+    return ORJSONResponse({
         "report_date": report_date,
         "reports": result,
         "summary": {
@@ -556,7 +633,7 @@ async def get_daily_report(
             "total_service_fee": total_service_fee,
             "total_fee": total_fee
         }
-    }
+    })
 
 @router.get("/reports/weekly", response_model=Dict[str, Any])
 async def get_weekly_report(
@@ -566,7 +643,7 @@ async def get_weekly_report(
 ):
     """获取周报表"""
     report = ReportService.get_weekly_report(db, date_in_week)
-    return report
+    return ORJSONResponse(report)
 
 @router.get("/reports/monthly", response_model=Dict[str, Any])
 async def get_monthly_report(
@@ -577,7 +654,22 @@ async def get_monthly_report(
 ):
     """获取月报表"""
     report = ReportService.get_monthly_report(db, year, month)
-    return report
+    return ORJSONResponse(report)
+
+@router.get("/scheduler/stats", response_model=Dict[str, Any])
+async def get_scheduler_stats(
+    current_user: User = Depends(get_admin_user)
+):
+    """获取各充电站调度执行器的队列深度和命令延迟统计"""
+    return scheduler_actors.stats()
+
+@router.get("/loop-stalls", response_model=Dict[str, Any])
+async def get_loop_stalls(
+    top: int = Query(20, ge=1, le=100, description="返回的归因条数"),
+    current_user: User = Depends(get_admin_user)
+):
+    """获取事件循环阻塞统计(需打开系统配置 loop_stall_detector)，按路由和函数归因"""
+    return stall_detector.stats(top)
 
 @router.get("/schedule-strategy", response_model=Dict[str, Any])
 async def get_schedule_strategy(
@@ -597,6 +689,8 @@ async def get_schedule_strategy(
         strategy_description = "单次调度总充电时长最短：多辆车一次性调度，按充电模式分配对应充电桩，满足总充电时长最短"
     elif strategy == "bulk_mode":
         strategy_description = f"批量调度总充电时长最短：等待车辆数量达到{bulk_size}辆时才进行一次批量调度，忽略充电模式，满足总充电时长最短"
+    elif strategy == "cost_mode":
+        strategy_description = "电价最省：在车辆预计离开时间前充完的前提下，选择电费最低的充电桩和开始时刻"
     
     return {
         "strategy": strategy,
@@ -606,14 +700,14 @@ async def get_schedule_strategy(
 
 @router.patch("/schedule-strategy", response_model=Dict[str, Any])
 async def update_schedule_strategy(
-    strategy: str = Query(..., description="调度策略 (default: 默认调度, batch_mode: 单次调度总充电时长最短, bulk_mode: 批量调度总充电时长最短)"),
+    strategy: str = Query(..., description="调度策略 (default: 默认调度, batch_mode: 单次调度总充电时长最短, bulk_mode: 批量调度总充电时长最短, cost_mode: 电价最省)"),
     bulk_size: int = Query(10, ge=1, description="批量调度时的车辆数量，仅在bulk_mode模式下有效"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_admin_user)
 ):
     """更新调度策略"""
     # 验证策略有效性
-    if strategy not in ["default", "batch_mode", "bulk_mode"]:
+    if strategy not in ["default", "batch_mode", "bulk_mode", "cost_mode"]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"无效的调度策略: {strategy}"
@@ -652,6 +746,8 @@ async def update_schedule_strategy(
             strategy_description = "单次调度总充电时长最短：多辆车一次性调度，按充电模式分配对应充电桩，满足总充电时长最短"
         elif strategy == "bulk_mode":
             strategy_description = f"批量调度总充电时长最短：等待车辆数量达到{bulk_size}辆时才进行一次批量调度，忽略充电模式，满足总充电时长最短"
+        elif strategy == "cost_mode":
+            strategy_description = "电价最省：在车辆预计离开时间前充完的前提下，选择电费最低的充电桩和开始时刻"
         
         return {
             "strategy": strategy,
@@ -663,4 +759,181 @@ async def update_schedule_strategy(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"更新调度策略失败: {str(e)}"
-        ) 
\ No newline at end of file
+        ) 
+@router.post("/archive", response_model=Dict[str, Any])
+async def archive_cold_data(
+    older_than_days: Optional[int] = Query(None, ge=1, description="归档多少天前结束的数据，默认使用配置 archive_after_days"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """立即执行一次冷数据归档"""
+    try:
+        stats = ArchiveService.archive_cold_data(db, older_than_days=older_than_days)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"冷数据归档失败: {str(e)}"
+        )
+    return {"archived": stats, "message": "冷数据归档完成"}
+
+@router.post("/bill-summary/rebuild", response_model=Dict[str, Any])
+async def rebuild_bill_summaries(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """从日账单重建用户月度账单汇总"""
+    try:
+        count = BillingService.rebuild_monthly_summaries(db)
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"重建月度账单汇总失败: {str(e)}"
+        )
+    return {"summaries": count, "message": "月度账单汇总重建完成"}
+
+def _check_date_range(start_date: date, end_date: date):
+    if end_date < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="结束日期不能早于开始日期"
+        )
+
+@router.get("/export/{dataset}")
+async def export_csv(
+    dataset: str,
+    http_request: Request,
+    start_date: date = Query(..., description="开始日期"),
+    end_date: date = Query(..., description="结束日期(包含)"),
+    user_id: Optional[str] = Query(None, description="仅导出指定用户的数据(会话和详单)"),
+    current_user: User = Depends(get_admin_user)
+):
+    """
+    流式导出CSV
+    dataset: reports(日报表), sessions(充电会话), bill-details(账单详单)
+    客户端支持 gzip 时边生成边压缩
+    """
+    if dataset not in EXPORT_DATASETS:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"未知的导出数据: {dataset}"
+        )
+    if user_id and dataset not in USER_FILTER_DATASETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{dataset} 不支持按用户导出"
+        )
+    _check_date_range(start_date, end_date)
+    
+    compress = "gzip" in http_request.headers.get("accept-encoding", "")
+    headers = {"Content-Disposition": f"attachment; filename={dataset}_{start_date}_{end_date}.csv"}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    
+    return StreamingResponse(
+        ExportService.stream_csv(dataset, start_date, end_date, user_id=user_id, compress=compress),
+        media_type="text/csv; charset=utf-8",
+        headers=headers
+    )
+
+@router.get("/analytics/utilization", response_model=Dict[str, Any])
+async def get_pile_utilization(
+    start_date: date = Query(..., description="开始日期"),
+    end_date: date = Query(..., description="结束日期(包含)"),
+    current_user: User = Depends(get_admin_user)
+):
+    """各充电桩按小时统计的利用率(基于列式历史数据)"""
+    from backend.app.services.analytics import AnalyticsService
+
+    _check_date_range(start_date, end_date)
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "utilization": AnalyticsService.utilization(start_date, end_date)
+    }
+
+@router.get("/analytics/revenue", response_model=Dict[str, Any])
+async def get_revenue_by_band(
+    start_date: date = Query(..., description="开始日期"),
+    end_date: date = Query(..., description="结束日期(包含)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """按峰/平/谷电价时段统计充电量和充电费用(基于列式历史数据)"""
+    from backend.app.services.analytics import AnalyticsService
+
+    _check_date_range(start_date, end_date)
+    rate_rules = BillingService.load_rate_rules(db)
+    result = AnalyticsService.revenue_by_band(start_date, end_date, rate_rules)
+    result.update({"start_date": start_date, "end_date": end_date})
+    return result
+
+@router.get("/analytics/wait-times", response_model=Dict[str, Any])
+async def get_wait_times(
+    start_date: date = Query(..., description="开始日期"),
+    end_date: date = Query(..., description="结束日期(包含)"),
+    bin_minutes: int = Query(5, ge=1, description="直方图区间宽度(分钟)"),
+    max_minutes: int = Query(120, ge=1, description="直方图上限(分钟)，超出部分计入最后一个区间"),
+    current_user: User = Depends(get_admin_user)
+):
+    """等待时长分布(基于列式历史数据)"""
+    from backend.app.services.analytics import AnalyticsService
+
+    _check_date_range(start_date, end_date)
+    result = AnalyticsService.wait_times(start_date, end_date, bin_minutes, max_minutes)
+    result.update({"start_date": start_date, "end_date": end_date})
+    return result
+
+@router.post("/analytics/rerate", response_model=Dict[str, Any])
+async def rerate_sessions(
+    rerate_request: RerateRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """按假设的费率重新计价历史会话，预估费率调整对各充电桩和每天收入的影响(基于列式历史数据)"""
+    from backend.app.services.analytics import AnalyticsService, hypothetical_rules
+
+    _check_date_range(rerate_request.start_date, rerate_request.end_date)
+    if any(price <= 0 for price in (rerate_request.prices or {}).values()):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="电价必须大于0"
+        )
+    rate_rules = hypothetical_rules(
+        BillingService.load_rate_rules(db), rerate_request.prices, rerate_request.rules
+    )
+    service_rate = rerate_request.service_rate
+    if service_rate is None:
+        service_rate = BillingService.get_current_service_rate(db)
+    result = AnalyticsService.rerate(
+        rerate_request.start_date, rerate_request.end_date, rate_rules, service_rate
+    )
+    result.update({
+        "start_date": rerate_request.start_date,
+        "end_date": rerate_request.end_date,
+        "service_rate": service_rate
+    })
+    return ORJSONResponse(result)
+
+@router.post("/analytics/history", response_model=Dict[str, Any])
+async def export_session_history(
+    month: int = Query(..., ge=200001, le=999912, description="导出月份(YYYYMM)"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_admin_user)
+):
+    """立即重新导出指定月份的列式历史数据"""
+    from backend.app.services.history_store import history_store
+
+    if not 1 <= month % 100 <= 12:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="月份格式应为YYYYMM"
+        )
+    try:
+        stats = history_store.export_month(db, month)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"历史数据导出失败: {str(e)}"
+        )
+    return {"month": month, "exported": stats, "message": "历史数据导出完成"}
@@ -1,12 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
-from typing import List, Dict, Any, Optional
+from typing import Dict, Any, Optional
 from datetime import date, datetime
 
 from backend.app.db.database import get_db
-from backend.app.db.models import User, BillMaster, BillDetail
+from backend.app.db.models import User, BillMaster
 from backend.app.core.auth import get_current_user
+from backend.app.core.pagination import paginate
 from backend.app.services.billing import BillingService
+from backend.app.services.archive import ArchiveService
 
 router = APIRouter()
 
@@ -52,9 +54,9 @@ async def get_bill_detail(
             detail=f"未找到详单 {detail_number}"
         )
     
-    # 获取会话信息
-    from backend.app.db.models import ChargeSession, ChargePile
-    session = db.query(ChargeSession).filter(ChargeSession.id == detail.session_id).first()
+    # 获取会话信息(可能已归档)
+    from backend.app.db.models import ChargePile
+    session = ArchiveService.find_session(db, detail.session_id)
     
     if not session:
         raise HTTPException(
@@ -65,9 +67,8 @@ async def get_bill_detail(
     # 获取充电桩信息
     pile = db.query(ChargePile).filter(ChargePile.id == session.pile_id).first()
     
-    # 获取充电请求信息
-    from backend.app.db.models import CarRequest
-    request = db.query(CarRequest).filter(CarRequest.id == session.request_id).first()
+    # 获取充电请求信息(可能已归档)
+    request = ArchiveService.find_request(db, session.request_id)
     
     # 构建详单信息
     detail_info = {
@@ -94,13 +95,16 @@ async def get_bill_detail(
     
     return detail_info
 
-@router.get("/list/{month}", response_model=List[Dict[str, Any]])
+@router.get("/list/{month}", response_model=Dict[str, Any])
 async def get_monthly_bills(
     month: str,  # 格式: YYYY-MM
+    response: Response,
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, description="每页账单数量"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取用户指定月份的所有账单"""
+    """获取用户指定月份的账单，账单按日期倒序分页，月度总计覆盖整月"""
     try:
         year, month = map(int, month.split("-"))
         if month < 1 or month > 12:
@@ -111,22 +115,21 @@ async def get_monthly_bills(
             detail="月份格式错误，应为 YYYY-MM"
         )
     
-    # 查询该月份的所有账单
-    from sqlalchemy import extract
-    bills = (
+    # 按日期范围过滤，可以使用 (user_id, bill_date) 索引
+    month_start, month_end = BillingService.month_range(year, month)
+    month_query = (
         db.query(BillMaster)
         .filter(BillMaster.user_id == current_user.user_id)
-        .filter(extract('year', BillMaster.bill_date) == year)
-        .filter(extract('month', BillMaster.bill_date) == month)
-        .order_by(BillMaster.bill_date.desc())
-        .all()
+        .filter(BillMaster.bill_date >= month_start)
+        .filter(BillMaster.bill_date < month_end)
+    )
+    
+    bills = paginate(
+        response, month_query, BillMaster.bill_date, BillMaster.id, cursor, limit, parse=date.fromisoformat
     )
     
-    # 计算月度总计
-    total_charge_fee = sum(bill.total_charge_fee for bill in bills)
-    total_service_fee = sum(bill.total_service_fee for bill in bills)
-    total_fee = sum(bill.total_fee for bill in bills)
-    total_kwh = sum(bill.total_kwh for bill in bills)
+    # 月度总计读取月度汇总表
+    totals = BillingService.get_monthly_summary(db, current_user.user_id, year, month)
     
     # 构建账单列表
     bill_list = []
@@ -143,10 +146,11 @@ async def get_monthly_bills(
     summary = {
         "year": year,
         "month": month,
-        "total_charge_fee": total_charge_fee,
-        "total_service_fee": total_service_fee,
-        "total_fee": total_fee,
-        "total_kwh": total_kwh,
+        "bill_count": totals["bill_count"],
+        "total_charge_fee": totals["total_charge_fee"],
+        "total_service_fee": totals["total_service_fee"],
+        "total_fee": totals["total_fee"],
+        "total_kwh": totals["total_kwh"],
         "bills": bill_list
     }
     
@@ -166,8 +170,7 @@ async def get_bill_by_session(
         )
     
     # 查询充电会话
-    from backend.app.db.models import ChargeSession, CarRequest
-    session = db.query(ChargeSession).filter(ChargeSession.id == session_id).first()
+    session = ArchiveService.find_session(db, session_id)
     
     if not session:
         raise HTTPException(
@@ -176,7 +179,7 @@ async def get_bill_by_session(
         )
     
     # 验证用户权限
-    request = db.query(CarRequest).filter(CarRequest.id == session.request_id).first()
+    request = ArchiveService.find_request(db, session.request_id)
     if not request or request.user_id != current_user.user_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -184,14 +187,8 @@ async def get_bill_by_session(
         )
     
     # 查询账单详情
-    detail = db.query(BillDetail).filter(BillDetail.session_id == session_id).first()
-    
-    if not detail:
-        # 如果未找到详单但会话存在，尝试生成账单
-        from backend.app.services.charging_service import ChargingService
-        detail = ChargingService.generate_bill(db, session)
-        if detail:
-            db.commit()
+    # 只读：详单由账单过账管道生成，会话刚结束时可能尚未过账
+    detail = ArchiveService.find_bill_detail(db, session_id=session_id)
     
     if not detail:
         raise HTTPException(
@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import asyncio
 import logging
 
 from backend.app.db.database import get_db
@@ -9,34 +11,51 @@ from backend.app.db.models import User, CarRequest, ChargePile, ChargeSession
 from backend.app.db.schemas import (
     ChargeRequestCreate, ChargeRequestUpdate, ChargeRequest, 
     ChargeRequestDetail, ChargeMode, RequestStatus, ChargeModeUpdateRequest,
-    ChargeAmountUpdateRequest
+    ChargeAmountUpdateRequest, ChargeStatusBatchRequest
 )
 from backend.app.core.auth import get_current_user
 from backend.app.services.scheduler import ChargingScheduler
 from backend.app.services.billing import BillingService
 from backend.app.services.charging_service import ChargingService
-from backend.app.core.config import get_station_config
+from backend.app.services.scheduler_actor import scheduler_actors, SchedulerActor, SchedulerBusyError
+from backend.app.services.progress_stream import progress_broadcaster, TERMINAL_STATUSES
+from backend.app.services.eta import eta_service
+from backend.app.services.charge_curve import CONSTANT_CURVE, curve_for, pile_curve
+from backend.app.core.config import get_station_config, get_station_ids
+from backend.app.core.serialization import ORJSONResponse, dumps_text
+from backend.app.core.pagination import filter_date_range, paginate
+from backend.app.core.station import DEFAULT_STATION, station_scope
 
 router = APIRouter()
 
 logger = logging.getLogger(__name__)
 
+def _request_actor(db: Session, request_id: int) -> SchedulerActor:
+    """充电请求所属充电站的调度执行器"""
+    station_id = db.query(CarRequest.station_id).filter(CarRequest.id == request_id).scalar()
+    return scheduler_actors.get(station_id)
+
 @router.get("/waiting_area", response_model=Dict[str, Any])
-async def get_waiting_area_status(db: Session = Depends(get_db)):
+async def get_waiting_area_status(
+    station_id: str = Query(DEFAULT_STATION, description="充电站ID"),
+    db: Session = Depends(get_db)
+):
     """获取等候区状态"""
     logger.info("--- Enter get_waiting_area_status ---")
     try:
         logger.info("Step 1: Getting station config.")
-        config = get_station_config()
+        config = get_station_config(station_id)
         capacity = config.get("WaitingAreaSize", 6)
         logger.info(f"Step 1 successful. Capacity is {capacity}.")
 
         logger.info("Step 2: Counting fast waiting cars.")
-        fast_waiting = ChargingScheduler.count_waiting_cars(db, ChargeMode.FAST)
+        with station_scope(station_id):
+            fast_waiting = ChargingScheduler.count_waiting_cars(db, ChargeMode.FAST)
         logger.info(f"Step 2 successful. Fast waiting cars: {fast_waiting}.")
 
         logger.info("Step 3: Counting slow waiting cars.")
-        slow_waiting = ChargingScheduler.count_waiting_cars(db, ChargeMode.SLOW)
+        with station_scope(station_id):
+            slow_waiting = ChargingScheduler.count_waiting_cars(db, ChargeMode.SLOW)
         logger.info(f"Step 3 successful. Slow waiting cars: {slow_waiting}.")
         
         total_waiting = fast_waiting + slow_waiting
@@ -64,37 +83,55 @@ async def create_charge_request(
     current_user: User = Depends(get_current_user)
 ):
     """提交充电请求"""
-    try:
+    if request.departure_time and request.departure_time <= datetime.now():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="预计离开时间必须晚于当前时间"
+        )
+    
+    if request.station_id not in get_station_ids():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"充电站 {request.station_id} 不存在"
+        )
+    
+    user_id = current_user.user_id
+    
+    def create(session: Session) -> int:
         # 检查等候区是否已满
-        if not ChargingScheduler.check_waiting_area_capacity(db):
+        if not ChargingScheduler.check_waiting_area_capacity(session):
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="等候区已满，请稍后再试"
             )
         
         # 生成排队号码
-        queue_number = ChargingScheduler.generate_queue_number(db, request.mode)
+        queue_number = ChargingScheduler.generate_queue_number(session, request.mode)
         
         # 创建充电请求
         db_request = CarRequest(
-            user_id=current_user.user_id,
+            user_id=user_id,
+            station_id=request.station_id,
             queue_number=queue_number,
             mode=request.mode,
             amount_kwh=request.amount_kwh,
             battery_capacity=request.battery_capacity,
             status=RequestStatus.WAITING,
-            request_time=datetime.now()
+            request_time=datetime.now(),
+            departure_time=request.departure_time
         )
         
-        db.add(db_request)
-        db.commit()
-        db.refresh(db_request)
-        
-        # 提交事务后再尝试调度
+        session.add(db_request)
+        session.commit()
         logger.info(f"New charge request {db_request.id} created, attempting to schedule.")
-        ChargingScheduler.check_and_call_waiting_cars(db)
-        
-        return db_request
+        return db_request.id
+    
+    try:
+        # 提交事务后由调度执行器统一叫号
+        request_id = await scheduler_actors.get(request.station_id).submit("create_request", create, dispatch=True)
+        return db.query(CarRequest).filter(CarRequest.id == request_id).first()
+    except (HTTPException, SchedulerBusyError):
+        raise
     except Exception as e:
         logger.error(f"Error creating charge request: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -104,18 +141,63 @@ async def create_charge_request(
 
 @router.get("/requests", response_model=List[ChargeRequest])
 async def get_user_requests(
-    status: Optional[str] = None,
+    response: Response,
+    request_status: Optional[RequestStatus] = Query(None, alias="status", description="请求状态"),
+    mode: Optional[ChargeMode] = Query(None, description="充电模式"),
+    start_date: Optional[date] = Query(None, description="请求日期起"),
+    end_date: Optional[date] = Query(None, description="请求日期止"),
+    cursor: Optional[str] = Query(None, description="分页游标，取上一页响应头 X-Next-Cursor"),
+    limit: Optional[int] = Query(None, ge=1, description="每页数量"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取用户的充电请求列表"""
+    """
+    按请求时间倒序获取用户的充电请求
+    指定 cursor 或 limit 时分页返回，都不指定时返回全部请求(与分页前的行为一致)
+    """
+    if start_date and end_date and end_date < start_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="结束日期不能早于开始日期"
+        )
+
     query = db.query(CarRequest).filter(CarRequest.user_id == current_user.user_id)
+    if request_status:
+        query = query.filter(CarRequest.status == request_status)
+    if mode:
+        query = query.filter(CarRequest.mode == mode)
+    query = filter_date_range(query, CarRequest.request_time, start_date, end_date)
+
+    return paginate(
+        response, query, CarRequest.request_time, CarRequest.id, cursor, limit, unpaged_by_default=True
+    )
+
+@router.post("/state:batch", response_model=Dict[str, Any])
+async def get_charge_state_batch(
+    batch: ChargeStatusBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量获取充电实时状态"""
+    config = get_station_config()
+    max_size = config.get("StatusBatchMaxSize", 50)
     
-    if status:
-        query = query.filter(CarRequest.status == status)
+    if len(batch.request_ids) > max_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多查询 {max_size} 个充电请求"
+        )
+    
+    # 只返回当前用户名下的请求，其余视为不存在
+    states = ChargingService.get_charging_status_batch(
+        db, batch.request_ids, user_id=current_user.user_id
+    )
+    missing = [request_id for request_id in dict.fromkeys(batch.request_ids) if request_id not in states]
     
-    requests = query.order_by(CarRequest.request_time.desc()).all()
-    return requests
+    return {
+        "states": {str(request_id): state for request_id, state in states.items()},
+        "missing": missing
+    }
 
 @router.get("/{request_id}", response_model=ChargeRequestDetail)
 async def get_charge_request(
@@ -179,9 +261,10 @@ async def get_charge_request(
         if request.status == RequestStatus.WAITING:
             logger.debug(f"处理等候区等待状态")
             try:
-                # 计算同模式下在等候区等待的车辆数量（排在前面的）
+                # 计算同一充电站同模式下在等候区等待的车辆数量（排在前面的）
                 wait_count = (
                     db.query(CarRequest)
+                    .filter(CarRequest.station_id == request.station_id)
                     .filter(CarRequest.mode == request.mode)
                     .filter(CarRequest.status == RequestStatus.WAITING)
                     .filter(CarRequest.queue_number < request.queue_number)
@@ -193,14 +276,17 @@ async def get_charge_request(
                 # 估算等待时间
                 # 简单估计：假设所有充电桩都有车，新来的车需要等待最后一个位置
                 logger.debug(f"获取可用充电桩: 模式={request.mode}")
-                piles = ChargingScheduler.get_available_piles(db, request.mode)
+                with station_scope(request.station_id):
+                    piles = ChargingScheduler.get_available_piles(db, request.mode)
                 pile_count = len(piles) if piles else 0
                 logger.debug(f"可用充电桩数量: {pile_count}")
                 
                 if pile_count > 0:
-                    # 假设每辆车平均充电时间为 amount_kwh / power
+                    # 假设每辆车平均充电时间与本车相同(按功率曲线计算)
                     power = 30.0 if request.mode == ChargeMode.FAST else 7.0
-                    avg_charging_time = request.amount_kwh / power * 60  # 转换为分钟
+                    avg_charging_time = curve_for(request.mode).charge_minutes(
+                        request.amount_kwh, power, request.battery_capacity
+                    )
                     logger.debug(f"平均充电时间: {avg_charging_time}分钟")
                     
                     # 估计等待时间 = 前面等待的车辆数 / 充电桩数 * 平均充电时间
@@ -225,9 +311,11 @@ async def get_charge_request(
                     pile = db.query(ChargePile).filter(ChargePile.id == request.pile_id).first()
                     if pile:
                         power = pile.power
+                        curve = pile_curve(pile)
                         logger.debug(f"充电桩功率: {power}")
                     else:
                         power = 30.0
+                        curve = CONSTANT_CURVE
                         logger.warning(f"未找到充电桩，使用默认功率: {power}")
                     
                     # 如果是正在充电的车辆
@@ -241,12 +329,14 @@ async def get_charge_request(
                         result.charging_minutes = charging_duration.total_seconds() / 60
                         logger.debug(f"充电时长: {result.charging_minutes}分钟")
                         
-                        power_per_minute = power / 60
-                        result.charged_kwh = min(power_per_minute * result.charging_minutes, request.amount_kwh)
+                        result.charged_kwh = curve.energy_after(
+                            result.charging_minutes, power, request.amount_kwh, request.battery_capacity
+                        )
                         logger.debug(f"已充电量: {result.charged_kwh}kWh")
                         
-                        remaining_kwh = request.amount_kwh - result.charged_kwh
-                        result.remaining_minutes = (remaining_kwh / power) * 60 if power > 0 else 0
+                        result.remaining_minutes = curve.remaining_minutes(
+                            result.charged_kwh, power, request.amount_kwh, request.battery_capacity
+                        ) if power > 0 else 0
                         logger.debug(f"剩余时间: {result.remaining_minutes}分钟")
                         
                         result.progress = (result.charged_kwh / request.amount_kwh) * 100 if request.amount_kwh > 0 else 100
@@ -276,7 +366,9 @@ async def get_charge_request(
                             result.estimated_wait_time = wait_time_minutes
                             
                             # 加上自己的充电时间
-                            own_charging_time = (request.amount_kwh / power) * 60 if power > 0 else 0
+                            own_charging_time = curve.charge_minutes(
+                                request.amount_kwh, power, request.battery_capacity
+                            ) if power > 0 else 0
                             logger.debug(f"自己充电时间: {own_charging_time}分钟")
                             result.estimated_finish_time = datetime.now() + timedelta(minutes=(wait_time_minutes + own_charging_time))
                             logger.debug(f"估计完成时间: {result.estimated_finish_time}")
@@ -382,37 +474,40 @@ async def update_charge_request(
             detail=f"无法修改状态为 {request.status} 的充电请求"
         )
     
-    # 修改充电模式
-    if request_update.mode is not None and request_update.mode != request.mode:
-        # 只允许在等候区修改充电模式
-        if request.status != RequestStatus.WAITING:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="只能在等候区修改充电模式"
-            )
-        
-        # 更新模式和排队号码
-        old_mode = request.mode
-        request.mode = request_update.mode
-        
-        # 生成新的排队号码
-        request.queue_number = ChargingScheduler.generate_queue_number(db, request.mode)
-    
-    # 修改充电量
-    if request_update.amount_kwh is not None:
-        # 充电区只允许取消，不允许修改
-        if request.status != RequestStatus.WAITING:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="只能在等候区修改充电量"
-            )
+    def update(session: Session):
+        target = session.query(CarRequest).filter(CarRequest.id == request_id).with_for_update().first()
+        
+        # 修改充电模式
+        if request_update.mode is not None and request_update.mode != target.mode:
+            # 只允许在等候区修改充电模式
+            if target.status != RequestStatus.WAITING:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="只能在等候区修改充电模式"
+                )
+            
+            # 更新模式和排队号码
+            target.mode = request_update.mode
+            
+            # 生成新的排队号码
+            target.queue_number = ChargingScheduler.generate_queue_number(session, target.mode)
+        
+        # 修改充电量
+        if request_update.amount_kwh is not None:
+            # 充电区只允许取消，不允许修改
+            if target.status != RequestStatus.WAITING:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="只能在等候区修改充电量"
+                )
+            
+            target.amount_kwh = request_update.amount_kwh
         
-        request.amount_kwh = request_update.amount_kwh
+        session.commit()
     
-    db.commit()
-    db.refresh(request)
-    
-    return request
+    await _request_actor(db, request_id).submit("update_request", update)
+    db.expire_all()
+    return db.query(CarRequest).filter(CarRequest.id == request_id).first()
 
 @router.put("/requests/{request_id}/mode", response_model=ChargeRequest)
 async def change_charge_mode(
@@ -426,33 +521,35 @@ async def change_charge_mode(
     """
     logger.info(f"--- 正在修改充电请求 {request_id} 的模式为 {mode_update.mode} ---")
 
-    # 使用 with_for_update 来锁定行，防止并发问题
-    request = db.query(CarRequest).filter(
-        CarRequest.id == request_id,
-        CarRequest.user_id == current_user.user_id
-    ).with_for_update().first()
+    user_id = current_user.user_id
 
-    if not request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="充电请求不存在"
-        )
+    def change_mode(session: Session):
+        # 使用 with_for_update 来锁定行，防止并发问题
+        request = session.query(CarRequest).filter(
+            CarRequest.id == request_id,
+            CarRequest.user_id == user_id
+        ).with_for_update().first()
 
-    # 检查状态是否为 'WAITING'
-    if request.status != RequestStatus.WAITING.value:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"只能修改处于'等候区(WAITING)'状态的请求，当前状态为 {request.status}"
-        )
-        
-    if request.mode == mode_update.mode.value:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"请求已经是 {mode_update.mode.value} 模式，无需修改"
-        )
+        if not request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="充电请求不存在"
+            )
 
-    # 更新模式并重新生成排队号
-    try:
+        # 检查状态是否为 'WAITING'
+        if request.status != RequestStatus.WAITING.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"只能修改处于'等候区(WAITING)'状态的请求，当前状态为 {request.status}"
+            )
+            
+        if request.mode == mode_update.mode.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"请求已经是 {mode_update.mode.value} 模式，无需修改"
+            )
+
+        # 更新模式并重新生成排队号
         old_mode = request.mode
         new_mode = mode_update.mode
         
@@ -462,22 +559,19 @@ async def change_charge_mode(
         request.mode = new_mode.value
         
         # 重新生成排队号
-        new_queue_number = ChargingScheduler.generate_queue_number(db, new_mode)
-        request.queue_number = new_queue_number
-        
+        request.queue_number = ChargingScheduler.generate_queue_number(session, new_mode)
         request.request_time = datetime.now()
         
-        db.commit()
-        db.refresh(request)
-        
+        session.commit()
         logger.info(f"请求 {request_id} 模式修改成功，新排队号: {request.queue_number}")
-        
-        ChargingScheduler.check_and_call_waiting_cars(db)
-        
-        return request
 
+    try:
+        await _request_actor(db, request_id).submit("change_mode", change_mode, dispatch=True)
+        db.expire_all()
+        return db.query(CarRequest).filter(CarRequest.id == request_id).first()
+    except (HTTPException, SchedulerBusyError):
+        raise
     except Exception as e:
-        db.rollback()
         logger.error(f"修改充电模式失败: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -496,48 +590,52 @@ async def change_charge_amount(
     """
     logger.info(f"--- 正在修改充电请求 {request_id} 的充电量为 {amount_update.amount_kwh} kWh ---")
 
-    request = db.query(CarRequest).filter(
-        CarRequest.id == request_id,
-        CarRequest.user_id == current_user.user_id
-    ).with_for_update().first()
+    user_id = current_user.user_id
 
-    if not request:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="充电请求不存在"
-        )
+    def change_amount(session: Session):
+        request = session.query(CarRequest).filter(
+            CarRequest.id == request_id,
+            CarRequest.user_id == user_id
+        ).with_for_update().first()
 
-    if request.status != RequestStatus.WAITING.value:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"只能修改处于'等候区(WAITING)'状态的请求，当前状态为 {request.status}"
-        )
+        if not request:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="充电请求不存在"
+            )
 
-    if amount_update.amount_kwh > request.battery_capacity:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"充电量 ({amount_update.amount_kwh} kWh) 不能超过电池容量 ({request.battery_capacity} kWh)"
-        )
-    
-    if amount_update.amount_kwh == request.amount_kwh:
-        return request
+        if request.status != RequestStatus.WAITING.value:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"只能修改处于'等候区(WAITING)'状态的请求，当前状态为 {request.status}"
+            )
+
+        if amount_update.amount_kwh > request.battery_capacity:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"充电量 ({amount_update.amount_kwh} kWh) 不能超过电池容量 ({request.battery_capacity} kWh)"
+            )
+        
+        if amount_update.amount_kwh == request.amount_kwh:
+            session.rollback()
+            return
 
-    try:
         old_amount = request.amount_kwh
         new_amount = amount_update.amount_kwh
         
         request.amount_kwh = new_amount
         request.updated_at = datetime.now()
         
-        db.commit()
-        db.refresh(request)
-        
+        session.commit()
         logger.info(f"请求 {request_id} 充电量从 {old_amount} kWh 修改成功为 {new_amount} kWh")
-        
-        return request
 
+    try:
+        await _request_actor(db, request_id).submit("change_amount", change_amount)
+        db.expire_all()
+        return db.query(CarRequest).filter(CarRequest.id == request_id).first()
+    except (HTTPException, SchedulerBusyError):
+        raise
     except Exception as e:
-        db.rollback()
         logger.error(f"修改充电量失败: {e}", exc_info=True)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -577,7 +675,9 @@ async def cancel_charge_request(
         )
     
     # 取消充电请求
-    success, message = ChargingScheduler.cancel_charging(db, request_id)
+    success, message = await scheduler_actors.get(request.station_id).submit(
+        "cancel_request", lambda session: ChargingScheduler.cancel_charging(session, request_id)
+    )
     
     if not success:
         raise HTTPException(
@@ -609,19 +709,162 @@ async def get_charge_state(
     
     return state
 
+@router.get("/{request_id}/eta", response_model=Dict[str, Any])
+async def get_charge_eta(
+    request_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取充电请求的预计开始/完成时间
+    基于充电桩队列前缀和计算，等候区车辆给出进入最优充电桩时的预计值
+    """
+    request = db.query(CarRequest).filter(
+        CarRequest.id == request_id,
+        CarRequest.user_id == current_user.user_id
+    ).first()
+    
+    if not request:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="充电请求不存在"
+        )
+    
+    now = datetime.now()
+    result = {
+        "request_id": request.id,
+        "status": request.status,
+        "pile_id": request.pile_id,
+        "queue_position": request.queue_position,
+        "wait_minutes": None,
+        "finish_minutes": None,
+        "estimated_start_time": None,
+        "estimated_finish_time": None
+    }
+    
+    if request.status in [RequestStatus.FINISHED, RequestStatus.CANCELED]:
+        result["wait_minutes"] = 0
+        result["finish_minutes"] = 0
+        result["estimated_start_time"] = request.start_time
+        result["estimated_finish_time"] = request.end_time
+        return result
+    
+    if request.status == RequestStatus.WAITING:
+        # 等候区车辆：取追加到各可用充电桩队尾时最早的完成时间
+        best_pile = None
+        best_finish = float('inf')
+        with station_scope(request.station_id):
+            for pile in ChargingScheduler.get_available_piles(db, request.mode):
+                finish = eta_service.finish_if_appended(db, pile.id, request.amount_kwh, request.battery_capacity)
+                if finish < best_finish:
+                    best_finish = finish
+                    best_pile = pile
+        
+        if best_pile is None:
+            return result
+        
+        wait_minutes = best_finish - pile_curve(best_pile).charge_minutes(
+            request.amount_kwh, best_pile.power, request.battery_capacity
+        )
+        result["pile_id"] = best_pile.id
+        result["pile_code"] = best_pile.code
+        result["wait_minutes"] = wait_minutes
+        result["finish_minutes"] = best_finish
+        result["estimated_start_time"] = now + timedelta(minutes=wait_minutes)
+        result["estimated_finish_time"] = now + timedelta(minutes=best_finish)
+        return result
+    
+    # 充电区车辆：直接查询所在充电桩的队列索引
+    index = eta_service.get(db, request.pile_id) if request.pile_id else None
+    if index is None or index.power <= 0:
+        return result
+    
+    position = request.queue_position or 0
+    if request.status == RequestStatus.CHARGING:
+        wait_minutes = 0.0
+        finish_minutes = eta_service.waiting_minutes(db, request.pile_id, 1)
+        result["estimated_start_time"] = request.start_time
+    else:
+        wait_minutes = eta_service.waiting_minutes(db, request.pile_id, position)
+        finish_minutes = wait_minutes + index.duration_of(request.amount_kwh, request.battery_capacity)
+        result["estimated_start_time"] = now + timedelta(minutes=wait_minutes)
+    
+    result["wait_minutes"] = wait_minutes
+    result["finish_minutes"] = finish_minutes
+    result["estimated_finish_time"] = now + timedelta(minutes=finish_minutes)
+    return result
+
+@router.get("/{request_id}/stream")
+async def stream_charge_state(
+    request_id: int,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    以Server-Sent Events推送充电进度
+    进度由广播器按节拍统一计算后分发，请求结束(完成/取消)后自动关闭推流
+    """
+    # 查询请求
+    request = db.query(CarRequest).filter(
+        CarRequest.id == request_id,
+        CarRequest.user_id == current_user.user_id
+    ).first()
+    
+    if not request:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="充电请求不存在"
+        )
+    
+    # get_db 的清理要等流式响应结束后才执行，这里提前关闭会话归还数据库连接，
+    # 推流期间不占用连接(get_current_user 与本接口共用同一个会话)
+    db.close()
+    
+    keepalive = get_station_config().get("ProgressStreamKeepalive", 15)
+    queue = progress_broadcaster.subscribe(request_id)
+    
+    async def event_generator():
+        try:
+            while True:
+                if await http_request.is_disconnected():
+                    break
+                try:
+                    state = await asyncio.wait_for(queue.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    # 心跳注释行，防止代理断开空闲连接
+                    yield ": keep-alive\n\n"
+                    continue
+                
+                data = dumps_text(state)
+                yield f"event: progress\ndata: {data}\n\n"
+                
+                if state.get("status") in TERMINAL_STATUSES:
+                    break
+        finally:
+            progress_broadcaster.unsubscribe(request_id, queue)
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/queue/{mode}", response_model=Dict[str, Any])
 async def get_queue_info(
     mode: ChargeMode,
+    station_id: str = Query(DEFAULT_STATION, description="充电站ID"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取队列信息"""
+    """获取充电站的队列信息"""
     try:
-        # 查询等候区中该模式的车辆数量
-        waiting_count = ChargingScheduler.count_waiting_cars(db, mode)
-        
-        # 获取该模式下的所有充电桩
-        piles = ChargingScheduler.get_all_piles_by_mode(db, mode)
+        with station_scope(station_id):
+            # 查询等候区中该模式的车辆数量
+            waiting_count = ChargingScheduler.count_waiting_cars(db, mode)
+            
+            # 获取该模式下的所有充电桩
+            piles = ChargingScheduler.get_all_piles_by_mode(db, mode)
         pile_queues = {}
         total_charging = 0
         total_queuing = 0
@@ -658,14 +901,15 @@ async def get_queue_info(
             total_charging += charging_count
             total_queuing += queuing_count
         
-        return {
+        return ORJSONResponse({
+            "station_id": station_id,
             "mode": mode,
             "waiting_count": waiting_count,
             "charging_count": total_charging,
             "queuing_count": total_queuing,
             "total_count": waiting_count + total_charging + total_queuing,
             "pile_queues": pile_queues
-        }
+        })
     except Exception as e:
         logger.error(f"Error getting queue info: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -701,7 +945,9 @@ async def simulate_charging(
     # 当进度达到100%时，我们不再是"模拟"，而是要真正地"完成"充电
     if progress >= 100:
         logger.info(f"Simulate endpoint received 100% progress for request {request_id}. Finishing charging.")
-        success, message = ChargingScheduler.finish_charging(db, request_id)
+        success, message = await scheduler_actors.get(request.station_id).submit(
+            "finish_charging", lambda session: ChargingScheduler.finish_charging(session, request_id)
+        )
         if not success:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -710,7 +956,10 @@ async def simulate_charging(
         return {"message": message}
 
     # 如果进度不到100%，则仍然走模拟逻辑 (虽然在当前场景下不太可能)
-    success, message = ChargingService.simulate_charging_progress(db, request_id, progress)
+    success, message = await scheduler_actors.get(request.station_id).submit(
+        "simulate_progress", lambda session: ChargingService.simulate_charging_progress(session, request_id, progress)
+    )
+    db.expire_all()
     
     if not success:
         raise HTTPException(
@@ -2,11 +2,12 @@
 后台任务定义
 """
 import logging
-from sqlalchemy.orm import Session
 from contextlib import contextmanager
 
 from backend.app.db.database import SessionLocal
 from backend.app.services.scheduler import ChargingScheduler
+from backend.app.services.scheduler_actor import scheduler_actors
+from backend.app.core.health import health_monitor
 
 logger = logging.getLogger(__name__)
 
@@ -19,23 +20,33 @@ def get_db_session():
     finally:
         db.close()
 
-def periodic_charge_check(db: Session):
+def periodic_charge_check():
     """
     定期检查并处理已完成的充电请求
-    这是系统的主调度循环，每隔一段时间会自动执行
+    这是系统的主调度循环，每隔一段时间会自动执行。
+    检查作为命令提交给调度执行器，与接口请求的队列变更串行执行，会话由执行器管理
     """
     try:
         logger.info("--- 后台任务: 运行定期充电检查 ---")
         
-        # 每次运行前先确保数据状态一致
-        ChargingScheduler.fix_pile_charging_status(db)
+        # 队列变更都在锁定充电桩的事务中完成，不再需要每次运行前修复队列数据
+        # (fix_pile_charging_status 只在启动时运行一次，用于修复上次异常退出遗留的数据)
         
-        # 检查并自动完成已达到请求量的充电任务
-        scheduler = ChargingScheduler()
-        scheduler.check_and_finish_completed_charges(db)
-        
-        # 从等候区召唤车辆
-        scheduler.check_and_call_waiting_cars(db)
+        # 本进程负责的各充电站并行检查并自动完成已达到请求量的充电任务，执行后从等候区召唤车辆
+        results = scheduler_actors.submit_each_threadsafe(
+            "periodic_check",
+            ChargingScheduler.check_and_finish_completed_charges,
+            scheduler_actors.owned_station_ids(),
+            dispatch=True
+        )
+        failed = False
+        for station_id, result in results.items():
+            if isinstance(result, Exception):
+                failed = True
+                logger.error(f"--- 后台任务: 充电站 {station_id} 定期检查失败: {result} ---")
+        if not failed:
+            # 就绪检查据此判断定期检查是否还在正常运行
+            health_monitor.record_tick()
         
     except Exception as e:
         logger.error(f"--- 后台任务: 定期检查期间发生错误: {e} ---", exc_info=True) 
\ No newline at end of file
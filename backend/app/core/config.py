@@ -1,14 +1,14 @@
 import os
-import yaml
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 import logging
 
+from backend.app.core.station import DEFAULT_STATION, current_station_id
+
 # 配置文件路径
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "config.yml")
 
 # 添加日志记录
 logger = logging.getLogger(__name__)
-logger.info(f"配置文件路径: {CONFIG_PATH}")
 
 # 配置缓存
 _config_cache: Dict[str, Any] = {}
@@ -27,8 +27,11 @@ def get_config() -> Dict[str, Any]:
         mod_time = os.path.getmtime(CONFIG_PATH)
         if not _config_cache or _config_cache.get("_mod_time") != mod_time:
             logger.info(f"正在加载配置文件: {CONFIG_PATH}")
+            # 首次读取配置时才导入 yaml，优先使用 libyaml 的 C 解析器
+            import yaml
+            loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
             with open(CONFIG_PATH, 'r', encoding='utf-8') as f:
-                config = yaml.safe_load(f)
+                config = yaml.load(f, Loader=loader)
                 config["_mod_time"] = mod_time
                 _config_cache = config
                 logger.info("配置已重新加载")
@@ -90,11 +93,28 @@ def get_system_config() -> Dict[str, Any]:
     return get_config().get("system", {})
 
 # 获取充电站配置
-def get_station_config() -> Dict[str, Any]:
+def get_station_config(station_id: Optional[str] = None) -> Dict[str, Any]:
     """
     获取充电站配置
+    station 为各充电站共用的参数，stations 中对应充电站的参数覆盖共用参数
+    未指定 station_id 时使用当前充电站(见 core.station)
+    """
+    config = get_config()
+    base = config.get("station", {})
+    stations = {str(key): value for key, value in (config.get("stations") or {}).items()}
+    overrides = stations.get(station_id or current_station_id())
+    if not overrides:
+        return base
+    return {**base, **overrides}
+
+# 获取充电站列表
+def get_station_ids() -> List[str]:
+    """
+    获取所有充电站ID
+    未配置 stations 时只有默认充电站
     """
-    return get_config().get("station", {})
+    stations = get_config().get("stations") or {}
+    return [str(station_id) for station_id in stations] or [DEFAULT_STATION]
 
 # 获取费率配置
 def get_rate_config() -> Dict[str, Any]:
@@ -0,0 +1,168 @@
+"""
+存活与就绪检查
+负载均衡器通过 /live 和 /ready 判断实例是否可用：
+- /live: 进程和事件循环仍在响应即返回200(事件循环被阻塞时接口本身无法返回，由负载均衡器超时判定)
+- /ready: 启动预热已完成，且以下指标都不超过系统配置中的阈值，否则返回503，由负载均衡器暂时摘除该实例
+  - 数据库连接池占用率
+  - 距上一次成功的定期调度检查的时间
+  - 事件循环延迟(由监测任务周期性测量)
+  - 单个 WebSocket 连接积压的消息数(已交给发送但客户端尚未接收完)、调度命令队列积压的命令数
+
+所有检查只读取内存中的计数，不访问数据库，可以被频繁调用
+"""
+from typing import Any, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import logging
+import time
+
+from backend.app.db.database import engine
+from backend.app.core.config import get_system_config
+from backend.app.core.startup import startup_state
+from backend.app.services.websocket import manager
+from backend.app.services.send_backlog import send_backlog
+from backend.app.services.scheduler_actor import scheduler_actors
+
+logger = logging.getLogger(__name__)
+
+# 保留的事件循环延迟样本数，就绪检查使用其中的最大值
+LAG_SAMPLES = 20
+
+def pool_status() -> Dict[str, Any]:
+    """数据库连接池的占用情况，连接池没有容量上限时 saturation 为 None"""
+    pool = engine.pool
+    if not callable(getattr(pool, "checkedout", None)):
+        return {"saturation": None}
+    size = pool.size()
+    max_overflow = getattr(pool, "_max_overflow", 0)
+    checked_out = pool.checkedout()
+    capacity = size + max_overflow if max_overflow >= 0 else None
+    return {
+        "size": size,
+        "checked_out": checked_out,
+        "overflow": pool.overflow(),
+        "capacity": capacity,
+        "saturation": round(checked_out / capacity, 3) if capacity else None,
+    }
+
+def _check(value: Optional[float], limit: float, **details) -> Dict[str, Any]:
+    """value 为 None 表示暂无数据，视为通过"""
+    return {"ok": value is None or value <= limit, "value": value, "limit": limit, **details}
+
+class HealthMonitor:
+    """事件循环延迟监测任务和定期调度检查的心跳"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.interval = 0.5
+        # 最近的事件循环延迟样本(秒)
+        self.lag_samples: Deque[float] = deque(maxlen=LAG_SAMPLES)
+        # 监测任务最近一次被唤醒的时间(time.monotonic)
+        self.last_beat: Optional[float] = None
+        # 定期检查开始运行的时间和最近一次成功的时间(time.monotonic)
+        self._ticks_expected_since: Optional[float] = None
+        self._last_tick: Optional[float] = None
+        # 上一次就绪检查的结果，只在结果变化时记录日志
+        self._was_ready = False
+
+    # ---- 事件循环延迟 ----
+
+    async def start(self):
+        """在事件循环中启动延迟监测任务(应用启动时调用)"""
+        if self._task is not None and not self._task.done():
+            return
+        self.interval = float(get_system_config().get("health_loop_interval", 0.5))
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        """每隔 interval 秒醒来一次，实际醒来时间比预期晚的部分即事件循环延迟"""
+        loop = asyncio.get_running_loop()
+        self.last_beat = time.monotonic()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag_samples.append(max(0.0, loop.time() - expected))
+            self.last_beat = time.monotonic()
+
+    def loop_lag(self) -> Dict[str, Any]:
+        samples = list(self.lag_samples)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "lag_ms": round(samples[-1] * 1000, 2) if samples else None,
+            "max_lag_ms": round(max(samples) * 1000, 2) if samples else None,
+        }
+
+    # ---- 定期调度检查 ----
+
+    def expect_ticks(self):
+        """定期检查任务开始运行(启动定时任务时调用)"""
+        self._ticks_expected_since = time.monotonic()
+
+    def record_tick(self):
+        """定期检查成功完成一次(在定时任务线程中调用)"""
+        self._last_tick = time.monotonic()
+
+    def tick_age(self) -> Optional[float]:
+        """距上一次成功的定期检查的秒数，定时任务尚未启动时为 None"""
+        since = self._last_tick if self._last_tick is not None else self._ticks_expected_since
+        if since is None:
+            return None
+        return round(time.monotonic() - since, 3)
+
+    # ---- 检查 ----
+
+    def liveness(self) -> Dict[str, Any]:
+        return {"status": "ok", "loop": self.loop_lag()}
+
+    def readiness(self) -> Dict[str, Any]:
+        """就绪报告：启动报告加上各项检查，ready 为所有检查都通过"""
+        settings = get_system_config()
+        pool = pool_status()
+        loop = self.loop_lag()
+        actor_backlog = scheduler_actors.queue_depths()
+        ws_backlog = send_backlog.stats()
+        checks = {
+            "db_pool": _check(
+                pool.pop("saturation"), float(settings.get("health_max_pool_saturation", 0.9)), **pool
+            ),
+            "scheduler_tick": _check(
+                self.tick_age(), float(settings.get("health_max_tick_age", 60)),
+                seen=self._last_tick is not None
+            ),
+            "loop_lag": _check(
+                loop["max_lag_ms"], float(settings.get("health_max_loop_lag_ms", 500)),
+                running=loop["running"], lag_ms=loop["lag_ms"]
+            ),
+            "websocket_backlog": _check(
+                ws_backlog.pop("max_messages"), int(settings.get("health_max_ws_backlog", 20)),
+                connections=manager.connection_count(), backlogged=ws_backlog.pop("connections"), **ws_backlog
+            ),
+            "scheduler_backlog": _check(
+                sum(actor_backlog.values()), int(settings.get("health_max_actor_backlog", 500)),
+                stations=actor_backlog
+            ),
+        }
+        report = startup_state.report()
+        report["ready"] = report["ready"] and all(check["ok"] for check in checks.values())
+        report["checks"] = checks
+        if report["ready"] != self._was_ready:
+            self._was_ready = report["ready"]
+            if report["ready"]:
+                logger.info("就绪检查通过")
+            elif startup_state.ready:
+                failed = [name for name, check in checks.items() if not check["ok"]]
+                logger.warning(f"就绪检查未通过: {', '.join(failed)}")
+        return report
+
+# 创建健康检查实例
+health_monitor = HealthMonitor()
@@ -0,0 +1,107 @@
+"""
+键集(keyset)分页
+按 (排序列, id) 倒序翻页，游标记录上一页最后一行的 (排序列值, id)，
+下一页从该位置之后继续读取，配合 (过滤列..., 排序列, id) 索引时每一页都是一次索引范围扫描，
+响应时间与翻到第几页无关(OFFSET 分页需要先扫描并丢弃前面所有行)。
+
+游标是不透明的字符串，客户端原样回传即可；下一页游标通过响应头 X-Next-Cursor 返回，
+没有下一页时不返回该响应头
+"""
+from typing import Any, Callable, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+import base64
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+from backend.app.core.config import get_station_config
+from backend.app.core.serialization import dumps, loads
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def page_limit(limit: Optional[int]) -> int:
+    """每页条数：未指定时使用 HistoryPageSize，且不超过 HistoryPageMaxSize"""
+    config = get_station_config()
+    if limit is None:
+        limit = config.get("HistoryPageSize", 50)
+    return max(1, min(limit, config.get("HistoryPageMaxSize", 200)))
+
+def encode_cursor(sort_value: Any, row_id: int) -> str:
+    return base64.urlsafe_b64encode(dumps([sort_value, row_id])).decode("ascii")
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    """解析游标，格式错误时抛出 ValueError"""
+    try:
+        sort_value, row_id = loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError("无效的分页游标") from e
+    if not isinstance(sort_value, str) or not isinstance(row_id, int):
+        raise ValueError("无效的分页游标")
+    return sort_value, row_id
+
+def keyset_page(
+    query,
+    sort_column,
+    id_column,
+    cursor: Optional[str],
+    limit: int,
+    parse: Callable[[str], Any] = datetime.fromisoformat
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    按 (sort_column, id_column) 倒序读取一页
+    parse 把游标中的字符串还原为排序列的值(日期列传 date.fromisoformat)
+    返回 (本页数据, 下一页游标)
+    """
+    if cursor:
+        raw_value, last_id = decode_cursor(cursor)
+        last_value = parse(raw_value)
+        # 展开成 sort <= v AND (sort < v OR id < last_id)，保证可以使用排序列上的索引范围扫描
+        query = query.filter(and_(
+            sort_column <= last_value,
+            or_(sort_column < last_value, id_column < last_id)
+        ))
+
+    # 多取一条判断是否还有下一页
+    rows = query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    sort_value = getattr(last, sort_column.key)
+    if isinstance(sort_value, (date, datetime)):
+        sort_value = sort_value.isoformat()
+    return rows, encode_cursor(sort_value, getattr(last, id_column.key))
+
+def paginate(
+    response: Response,
+    query,
+    sort_column,
+    id_column,
+    cursor: Optional[str],
+    limit: Optional[int],
+    parse: Callable[[str], Any] = datetime.fromisoformat,
+    unpaged_by_default: bool = False
+) -> List[Any]:
+    """
+    接口中使用的键集分页：按 page_limit 确定每页条数，游标无效时返回400，
+    有下一页时通过 X-Next-Cursor 响应头返回下一页游标。
+    unpaged_by_default=True 时，未指定 cursor 和 limit 的请求仍按原来的方式返回全部数据(同样倒序)，
+    用于原先返回全部数据、现有前端不处理分页的接口
+    """
+    if unpaged_by_default and cursor is None and limit is None:
+        return query.order_by(sort_column.desc(), id_column.desc()).all()
+    try:
+        rows, next_cursor = keyset_page(query, sort_column, id_column, cursor, page_limit(limit), parse)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
+
+def filter_date_range(query, column, start_date: Optional[date], end_date: Optional[date]):
+    """按日期范围过滤时间列，写成半开区间 [start, end + 1 天) 以便使用索引"""
+    if start_date is not None:
+        query = query.filter(column >= datetime.combine(start_date, datetime.min.time()))
+    if end_date is not None:
+        query = query.filter(column < datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+    return query
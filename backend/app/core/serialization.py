@@ -0,0 +1,44 @@
+"""
+JSON 序列化
+接口响应和 WebSocket 消息统一用 orjson 编码：原生支持 datetime/date/枚举/numpy 数组，
+比标准库 json + jsonable_encoder 快一个数量级，并直接输出 UTF-8 bytes。
+时间按 ISO 8601 输出，与原来的 datetime.isoformat() 格式一致
+"""
+from decimal import Decimal
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse as _ORJSONResponse
+from pydantic import BaseModel
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+def _default(obj: Any) -> Any:
+    """orjson 不直接支持的类型"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"无法序列化类型 {type(obj).__name__}")
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 JSON bytes"""
+    return orjson.dumps(obj, default=_default, option=OPTIONS)
+
+def dumps_text(obj: Any) -> str:
+    """序列化为 JSON 字符串(WebSocket 文本帧、SSE)"""
+    return dumps(obj).decode("utf-8")
+
+def loads(data: Any) -> Any:
+    return orjson.loads(data)
+
+class ORJSONResponse(_ORJSONResponse):
+    """
+    orjson 编码的 JSON 响应(应用的默认响应类)
+    接口直接返回该响应时跳过 response_model 校验和 jsonable_encoder 转换，用于返回大量嵌套数据的接口
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
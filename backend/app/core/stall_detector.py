@@ -0,0 +1,208 @@
+"""
+事件循环阻塞检测(可选，系统配置 loop_stall_detector 打开)
+接口中的 async def 处理函数直接执行同步的数据库调用，执行期间事件循环被阻塞，WebSocket 推送也随之停顿。
+
+检测方式：
+- 事件循环中的心跳任务每隔 loop_stall_sample_ms 更新一次心跳时间
+- 独立的监视线程以同样的间隔检查心跳，心跳超过 loop_stall_threshold_ms 未更新即认为事件循环被阻塞，
+  阻塞期间每个间隔采集一次事件循环线程的调用栈
+- 心跳恢复后结束本次阻塞：取出现次数最多的调用栈，归因到接口路由(调用栈中的路由处理函数)
+  和应用内最深的一层函数(通常是服务层函数)，记录日志并累加到统计中
+
+未阻塞时监视线程只比较时间戳，不采集调用栈。统计通过管理接口 /api/admin/loop-stalls 查看
+"""
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from collections import Counter, deque
+from datetime import datetime
+import asyncio
+import logging
+import sys
+import threading
+import time
+
+from backend.app.core.config import get_system_config
+
+logger = logging.getLogger(__name__)
+
+# 应用自身的包(backend.app.)，用于找出调用栈中应用内最深的函数
+APP_PACKAGE = __name__.rsplit(".", 2)[0] + "."
+# 保留的最近阻塞记录数
+RECENT_STALLS = 50
+# 日志和记录中保留的调用栈层数(最内层)
+STACK_DEPTH = 25
+
+# 调用栈中的一帧: (模块, 函数限定名, 行号)，最内层在前
+Frame = Tuple[str, str, int]
+
+def route_index(app) -> Dict[Any, str]:
+    """{路由处理函数的代码对象: "方法 路径"}，用于从调用栈中识别当前执行的路由"""
+    index = {}
+    for route in getattr(app, "routes", []):
+        code = getattr(getattr(route, "endpoint", None), "__code__", None)
+        if code is None:
+            continue
+        methods = getattr(route, "methods", None)
+        index[code] = f"{','.join(sorted(methods))} {route.path}" if methods else f"WS {route.path}"
+    return index
+
+def attribute(stack: Tuple[Frame, ...]) -> str:
+    """阻塞归因的函数：应用内最深的一帧，没有时取最内层一帧"""
+    for module, name, _ in stack:
+        if module.startswith(APP_PACKAGE) and module != __name__:
+            return f"{module}.{name}"
+    if stack:
+        module, name, _ = stack[0]
+        return f"{module}.{name}"
+    return "?"
+
+class StallDetector:
+    """事件循环阻塞检测器"""
+
+    def __init__(self):
+        self.threshold = 0.2
+        self.interval = 0.02
+        self._beat = 0.0
+        self._routes: Dict[Any, str] = {}
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        # 统计信息在监视线程中写入、在事件循环中读取
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.stalls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=RECENT_STALLS)
+        # {(路由, 函数): [次数, 总时长ms, 最长ms]}
+        self._sites: Dict[Tuple[Optional[str], str], List[float]] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ---- 生命周期 ----
+
+    async def start(self, app=None):
+        """在事件循环中启动心跳任务和监视线程(应用启动时调用)"""
+        if self.running:
+            return
+        settings = get_system_config()
+        self.threshold = float(settings.get("loop_stall_threshold_ms", 200)) / 1000
+        self.interval = float(settings.get("loop_stall_sample_ms", 20)) / 1000
+        if app is not None:
+            self._routes = route_index(app)
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="loop-stall-detector", daemon=True)
+        self._thread.start()
+        logger.info(f"事件循环阻塞检测已启动，阈值 {self.threshold * 1000:.0f} ms")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+
+    # ---- 监视线程 ----
+
+    def _watch(self):
+        samples: List[Tuple[Optional[str], Tuple[Frame, ...]]] = []
+        stalled_beat: Optional[float] = None
+        while not self._stopping.wait(self.interval):
+            beat = self._beat
+            if stalled_beat is not None and beat != stalled_beat:
+                # 心跳已恢复，阻塞时长为两次心跳的间隔减去正常的心跳间隔
+                self._finish(samples, (beat - stalled_beat - self.interval) * 1000)
+                samples, stalled_beat = [], None
+            if time.monotonic() - beat - self.interval <= self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                samples.append(self._sample(frame))
+            stalled_beat = beat
+
+    def _sample(self, frame) -> Tuple[Optional[str], Tuple[Frame, ...]]:
+        """采集一次调用栈，返回 (路由, 调用栈)"""
+        route = None
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if route is None:
+                route = self._routes.get(code)
+            stack.append((frame.f_globals.get("__name__", "?"), getattr(code, "co_qualname", code.co_name), frame.f_lineno))
+            frame = frame.f_back
+        return route, tuple(stack)
+
+    def _finish(self, samples: List[Tuple[Optional[str], Tuple[Frame, ...]]], duration_ms: float):
+        """结束一次阻塞：按出现次数最多的调用栈归因，记录日志和统计"""
+        if not samples:
+            return
+        (route, stack), _ = Counter(samples).most_common(1)[0]
+        function = attribute(stack)
+        lines = [f"{module}.{name}:{lineno}" for module, name, lineno in stack[:STACK_DEPTH]]
+        stall = {
+            "at": datetime.now().isoformat(timespec="seconds"),
+            "duration_ms": round(duration_ms, 1),
+            "route": route,
+            "function": function,
+            "samples": len(samples),
+            "stack": lines,
+        }
+        with self._lock:
+            self.stalls += 1
+            self.total_ms += duration_ms
+            self.max_ms = max(self.max_ms, duration_ms)
+            self.recent.append(stall)
+            site = self._sites.setdefault((route, function), [0, 0.0, 0.0])
+            site[0] += 1
+            site[1] += duration_ms
+            site[2] = max(site[2], duration_ms)
+        logger.warning(
+            f"事件循环阻塞 {duration_ms:.0f} ms，路由 {route or '-'}，函数 {function}，调用栈(最内层在前):\n  "
+            + "\n  ".join(lines)
+        )
+
+    # ---- 统计 ----
+
+    def stats(self, top: int = 20) -> Dict[str, Any]:
+        """阻塞次数和时长，按累计阻塞时长排序的归因，以及最近的阻塞记录"""
+        with self._lock:
+            sites = sorted(self._sites.items(), key=lambda item: item[1][1], reverse=True)[:top]
+            return {
+                "running": self.running,
+                "threshold_ms": round(self.threshold * 1000, 1),
+                "stalls": self.stalls,
+                "total_ms": round(self.total_ms, 1),
+                "max_ms": round(self.max_ms, 1),
+                "sites": [
+                    {
+                        "route": route,
+                        "function": function,
+                        "count": count,
+                        "total_ms": round(total, 1),
+                        "max_ms": round(longest, 1),
+                    }
+                    for (route, function), (count, total, longest) in sites
+                ],
+                "recent": list(self.recent),
+            }
+
+# 创建事件循环阻塞检测器实例
+stall_detector = StallDetector()
@@ -0,0 +1,114 @@
+"""
+启动过程记录
+应用启动分为两段：
+- 启动事件中只做不依赖数据库的初始化(队列日志写入器、事件总线)，进程可以立即接受连接
+- 预热在后台执行：可选的表结构检查、回填月度账单汇总、修复充电桩队列数据、加载队列时间索引和电价曲线，
+  数据库暂不可用时按退避间隔重试。预热完成后才启动各充电站的调度执行器和定时任务，
+  队列修复和索引加载不会与调度命令并发执行
+
+预热完成前，修改数据的接口由 WarmupGuardMiddleware 直接返回503(登录注册除外)。
+各阶段耗时和缓存预热状态记录在这里，由就绪检查接口返回
+"""
+from typing import Any, Dict, Optional
+from contextlib import contextmanager
+from datetime import datetime
+import logging
+import threading
+import time
+
+from backend.app.core.serialization import ORJSONResponse
+
+logger = logging.getLogger(__name__)
+
+# 预热完成前需要加载的缓存
+WARM_CACHES = ("pile_queues", "eta_index", "tariff_curve")
+
+class StartupState:
+    """记录启动各阶段耗时和缓存预热状态"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+        self.started_at = datetime.now()
+        self.phases: Dict[str, float] = {}
+        self.warm: Dict[str, bool] = dict.fromkeys(WARM_CACHES, False)
+        self.ready_after: Optional[float] = None
+        self.warmup_attempts = 0
+        self.last_error: Optional[str] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """记录一个启动阶段的耗时(秒)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phases[name] = round(elapsed, 4)
+            logger.info(f"启动阶段 {name} 耗时 {elapsed * 1000:.1f} ms")
+
+    def mark_warm(self, cache: str):
+        with self._lock:
+            self.warm[cache] = True
+
+    def record_failure(self, error: Exception):
+        with self._lock:
+            self.warmup_attempts += 1
+            self.last_error = str(error)
+
+    def mark_ready(self):
+        with self._lock:
+            self.warmup_attempts += 1
+            self.last_error = None
+            self.ready_after = round(time.perf_counter() - self._started, 4)
+        logger.info(f"应用预热完成，距启动 {self.ready_after} 秒")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None and all(self.warm.values())
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready_after is not None and all(self.warm.values()),
+                "started_at": self.started_at,
+                "ready_after_seconds": self.ready_after,
+                "caches": dict(self.warm),
+                "phases": dict(self.phases),
+                "warmup_attempts": self.warmup_attempts,
+                "last_error": self.last_error,
+            }
+
+# 创建启动状态实例
+startup_state = StartupState()
+
+# 预热完成前拒绝的请求方法
+MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+# 预热期间仍然放行的接口(不涉及充电队列)
+WARMUP_EXEMPT_PREFIXES = ("/api/auth/",)
+
+class WarmupGuardMiddleware:
+    """预热完成前对修改数据的 /api/ 接口返回503，由客户端稍后重试(ASGI 中间件，不包装流式响应)"""
+
+    def __init__(self, app, state: StartupState = startup_state, retry_after: int = 5):
+        self.app = app
+        self.state = state
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and scope["method"] in MUTATING_METHODS
+            and scope["path"].startswith("/api/")
+            and not scope["path"].startswith(WARMUP_EXEMPT_PREFIXES)
+            and not self.state.ready
+        ):
+            response = ORJSONResponse(
+                status_code=503,
+                content={"detail": "服务预热中，请稍后再试"},
+                headers={"Retry-After": str(self.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
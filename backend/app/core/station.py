@@ -0,0 +1,27 @@
+"""
+充电站分区
+充电桩和充电请求按 station_id 划分到各个充电站，每个充电站有独立的调度执行器。
+调度器中按充电站汇总的查询(等候区车辆、可调度的充电桩、排队号码)只针对"当前充电站"：
+调度执行器执行命令前用 station_scope 进入所属充电站，未进入任何充电站时为默认充电站
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+# 默认充电站ID(单站部署及历史数据)
+DEFAULT_STATION = "default"
+
+_current_station: ContextVar[str] = ContextVar("current_station", default=DEFAULT_STATION)
+
+def current_station_id() -> str:
+    """当前充电站ID"""
+    return _current_station.get()
+
+@contextmanager
+def station_scope(station_id: str) -> Iterator[str]:
+    """在指定充电站的作用域内执行"""
+    token = _current_station.set(station_id or DEFAULT_STATION)
+    try:
+        yield station_id
+    finally:
+        _current_station.reset(token)
@@ -1,9 +1,14 @@
-from sqlalchemy import create_engine
+from typing import Dict, List
+import logging
+
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
 from backend.app.core.config import get_db_url
 
+logger = logging.getLogger(__name__)
+
 # 创建SQLAlchemy引擎
 engine = create_engine(
     get_db_url(),
@@ -34,4 +39,33 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def check_schema(create_missing: bool = False) -> Dict[str, List[str]]:
+    """
+    比较模型定义与数据库中的表结构，返回缺失的表和列 {"tables": [...], "columns": ["表.列", ...]}
+    create_missing=True 时创建缺失的表(不修改已有表)
+    导入模型模块并访问数据库，只在启动预热阶段按配置调用，不在模块导入时执行
+    """
+    # 导入模型模块是为了把全部模型注册到元数据上，元数据从模型模块取，表明这一依赖
+    import backend.app.db.models as _models
+    metadata = _models.Base.metadata
+
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    missing_tables = [name for name in metadata.tables if name not in existing]
+    missing_columns = []
+    for name, table in metadata.tables.items():
+        if name not in existing:
+            continue
+        columns = {column["name"] for column in inspector.get_columns(name)}
+        missing_columns.extend(f"{name}.{column.name}" for column in table.columns if column.name not in columns)
+
+    if missing_tables:
+        logger.warning(f"数据库缺少表: {', '.join(missing_tables)}")
+        if create_missing:
+            metadata.create_all(bind=engine, tables=[metadata.tables[name] for name in missing_tables])
+            logger.info(f"已创建缺失的表: {', '.join(missing_tables)}")
+    if missing_columns:
+        logger.warning(f"数据库表缺少列(需手动迁移): {', '.join(missing_columns)}")
+    return {"tables": missing_tables, "columns": missing_columns}
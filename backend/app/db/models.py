@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Enum, DateTime, Boolean, ForeignKey, Date, Time, Text
+from sqlalchemy import Column, Integer, String, Float, Enum, DateTime, Boolean, ForeignKey, Date, Time, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -11,12 +11,14 @@ class ChargePile(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(10), unique=True, nullable=False, comment="桩编号，如A、B、C等")
+    station_id = Column(String(20), default="default", nullable=False, index=True, comment="所属充电站ID")
     type = Column(Enum("FAST", "SLOW"), nullable=False, comment="桩类型，快充或慢充")
     status = Column(Enum("AVAILABLE", "BUSY", "FAULT", "OFFLINE"), default="OFFLINE", nullable=False, comment="桩状态")
     power = Column(Float(precision=2), nullable=False, comment="充电功率 kWh/h")
     total_charge_count = Column(Integer, default=0, nullable=False, comment="累计充电次数")
     total_charge_time = Column(Integer, default=0, nullable=False, comment="累计充电时长(分钟)")
     total_charge_amount = Column(Float(precision=2), default=0.0, nullable=False, comment="累计充电度数")
+    version = Column(Integer, default=0, nullable=False, comment="队列版本号，队列每次变更时递增(乐观锁)")
     created_at = Column(DateTime, default=func.now(), nullable=False)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
     
@@ -31,6 +33,7 @@ class CarRequest(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(String(50), nullable=False, comment="用户ID")
+    station_id = Column(String(20), default="default", nullable=False, index=True, comment="所属充电站ID")
     queue_number = Column(String(20), unique=True, nullable=False, comment="排队号码，如F1、T2等")
     mode = Column(Enum("FAST", "SLOW"), nullable=False, comment="充电模式，快充或慢充")
     amount_kwh = Column(Float(precision=2), nullable=False, comment="请求充电量(kWh)")
@@ -41,6 +44,7 @@ class CarRequest(Base):
     request_time = Column(DateTime, default=func.now(), nullable=False, comment="请求时间")
     start_time = Column(DateTime, comment="开始充电时间")
     end_time = Column(DateTime, comment="结束充电时间")
+    departure_time = Column(DateTime, comment="用户预计离开时间(最晚完成时间)")
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
     
     # 关系
@@ -48,6 +52,14 @@ class CarRequest(Base):
     charge_sessions = relationship("ChargeSession", back_populates="request")
     queue_logs = relationship("QueueLog", back_populates="request")
 
+    # 历史请求按 (请求时间, id) 倒序键集分页，过滤列在前
+    __table_args__ = (
+        Index("idx_user_time", "user_id", "request_time", "id"),
+        Index("idx_request_time", "request_time", "id"),
+        Index("idx_status_time", "status", "request_time", "id"),
+        Index("idx_pile_time", "pile_id", "request_time", "id"),
+    )
+
 # 充电会话表
 class ChargeSession(Base):
     __tablename__ = "t_charge_session"
@@ -87,6 +99,23 @@ class BillMaster(Base):
     # 关系
     bill_details = relationship("BillDetail", back_populates="bill")
 
+    __table_args__ = (
+        Index("idx_user_date", "user_id", "bill_date", unique=True),
+    )
+
+# 用户月度账单汇总表
+class BillMonthlySummary(Base):
+    __tablename__ = "t_bill_monthly_summary"
+    
+    user_id = Column(String(50), primary_key=True, comment="用户ID")
+    bill_month = Column(Date, primary_key=True, comment="账单月份(当月1日)")
+    bill_count = Column(Integer, default=0, nullable=False, comment="有账单的天数")
+    total_charge_fee = Column(Float(precision=2), default=0.0, nullable=False, comment="总充电费用")
+    total_service_fee = Column(Float(precision=2), default=0.0, nullable=False, comment="总服务费用")
+    total_fee = Column(Float(precision=2), default=0.0, nullable=False, comment="总费用")
+    total_kwh = Column(Float(precision=2), default=0.0, nullable=False, comment="总充电量")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False)
+
 # 账单详情表
 class BillDetail(Base):
     __tablename__ = "t_bill_detail"
@@ -141,7 +170,7 @@ class QueueLog(Base):
     to_status = Column(String(20), nullable=False, comment="变更后状态")
     pile_id = Column(Integer, comment="充电桩ID")
     queue_position = Column(Integer, comment="队列位置")
-    log_time = Column(DateTime, default=func.now(), nullable=False, comment="日志时间")
+    log_time = Column(DateTime, default=func.now(), nullable=False, index=True, comment="日志时间")
     remark = Column(String(255), comment="备注")
     
     # 关系
@@ -200,4 +229,81 @@ class User(Base):
     password = Column(String(255), nullable=False, comment="密码")
     role = Column(Enum("USER", "ADMIN"), default="USER", nullable=False, comment="角色")
     created_at = Column(DateTime, default=func.now(), nullable=False)
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False) 
\ No newline at end of file
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now(), nullable=False) 
+
+# 充电请求归档表(按归档月份分区，结构与 t_car_request 一致)
+class CarRequestArchive(Base):
+    __tablename__ = "t_car_request_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False, comment="原充电请求ID")
+    archive_month = Column(Integer, primary_key=True, autoincrement=False, comment="归档月份(YYYYMM，按请求时间)")
+    user_id = Column(String(50), nullable=False, index=True, comment="用户ID")
+    station_id = Column(String(20), default="default", nullable=False, comment="所属充电站ID")
+    queue_number = Column(String(20), nullable=False, comment="排队号码")
+    mode = Column(Enum("FAST", "SLOW"), nullable=False, comment="充电模式，快充或慢充")
+    amount_kwh = Column(Float(precision=2), nullable=False, comment="请求充电量(kWh)")
+    battery_capacity = Column(Float(precision=2), nullable=False, comment="电池总容量(kWh)")
+    status = Column(Enum("WAITING", "QUEUING", "CHARGING", "FINISHED", "CANCELED"), nullable=False, comment="请求状态")
+    pile_id = Column(Integer, comment="分配的充电桩ID")
+    queue_position = Column(Integer, comment="在充电桩队列中的位置")
+    request_time = Column(DateTime, nullable=False, comment="请求时间")
+    start_time = Column(DateTime, comment="开始充电时间")
+    end_time = Column(DateTime, comment="结束充电时间")
+    departure_time = Column(DateTime, comment="用户预计离开时间(最晚完成时间)")
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=func.now(), nullable=False, comment="归档时间")
+
+# 充电会话归档表
+class ChargeSessionArchive(Base):
+    __tablename__ = "t_charge_session_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False, comment="原充电会话ID")
+    archive_month = Column(Integer, primary_key=True, autoincrement=False, comment="归档月份(YYYYMM，按会话开始时间)")
+    request_id = Column(Integer, nullable=False, index=True, comment="关联的充电请求ID")
+    pile_id = Column(Integer, nullable=False, comment="充电桩ID")
+    start_time = Column(DateTime, nullable=False, comment="会话开始时间")
+    end_time = Column(DateTime, comment="会话结束时间")
+    charged_kwh = Column(Float(precision=2), nullable=False, comment="充电电量(kWh)")
+    charging_time = Column(Integer, nullable=False, comment="充电时长(分钟)")
+    charge_fee = Column(Float(precision=2), nullable=False, comment="充电费用")
+    service_fee = Column(Float(precision=2), nullable=False, comment="服务费用")
+    total_fee = Column(Float(precision=2), nullable=False, comment="总费用")
+    status = Column(Enum("CHARGING", "COMPLETED", "INTERRUPTED"), nullable=False, comment="会话状态")
+    created_at = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=func.now(), nullable=False, comment="归档时间")
+
+# 账单详情归档表
+class BillDetailArchive(Base):
+    __tablename__ = "t_bill_detail_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False, comment="原详单ID")
+    archive_month = Column(Integer, primary_key=True, autoincrement=False, comment="归档月份(YYYYMM，按启动时间)")
+    bill_id = Column(Integer, nullable=False, index=True, comment="关联的账单ID")
+    session_id = Column(Integer, nullable=False, comment="关联的充电会话ID")
+    detail_number = Column(String(50), nullable=False, index=True, comment="详单编号")
+    pile_code = Column(String(10), nullable=False, comment="充电桩编号")
+    charged_kwh = Column(Float(precision=2), nullable=False, comment="充电电量")
+    charging_time = Column(Integer, nullable=False, comment="充电时长(分钟)")
+    start_time = Column(DateTime, nullable=False, comment="启动时间")
+    end_time = Column(DateTime, comment="停止时间")
+    charge_fee = Column(Float(precision=2), nullable=False, comment="充电费用")
+    service_fee = Column(Float(precision=2), nullable=False, comment="服务费用")
+    total_fee = Column(Float(precision=2), nullable=False, comment="总费用")
+    created_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, default=func.now(), nullable=False, comment="归档时间")
+
+# 队列变更日志归档表
+class QueueLogArchive(Base):
+    __tablename__ = "t_queue_log_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False, comment="原日志ID")
+    archive_month = Column(Integer, primary_key=True, autoincrement=False, comment="归档月份(YYYYMM，按日志时间)")
+    request_id = Column(Integer, nullable=False, index=True, comment="充电请求ID")
+    from_status = Column(String(20), nullable=False, comment="变更前状态")
+    to_status = Column(String(20), nullable=False, comment="变更后状态")
+    pile_id = Column(Integer, comment="充电桩ID")
+    queue_position = Column(Integer, comment="队列位置")
+    log_time = Column(DateTime, nullable=False, comment="日志时间")
+    remark = Column(String(255), comment="备注")
+    archived_at = Column(DateTime, default=func.now(), nullable=False, comment="归档时间")
@@ -90,6 +90,7 @@ class ChargePileUpdate(BaseModel):
 
 class ChargePileInDB(ChargePileBase, TimeStampModel):
     id: int
+    station_id: str = "default"
     status: PileStatus
     total_charge_count: int
     total_charge_time: int
@@ -110,7 +111,15 @@ class ChargeRequestBase(BaseModel):
     battery_capacity: float
 
 class ChargeRequestCreate(ChargeRequestBase):
-    pass
+    station_id: str = Field("default", description="充电站ID")
+    departure_time: Optional[datetime] = Field(None, description="预计离开时间，按电价最省策略调度时需在此之前充完")
+
+    @validator("departure_time")
+    def to_local_time(cls, value):
+        """带时区的时间转换为本地时间，与数据库中的时间保持一致"""
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone().replace(tzinfo=None)
+        return value
 
 class ChargeRequestUpdate(BaseModel):
     mode: Optional[ChargeMode] = None
@@ -122,9 +131,13 @@ class ChargeModeUpdateRequest(BaseModel):
 class ChargeAmountUpdateRequest(BaseModel):
     amount_kwh: float = Field(..., gt=0, description="新的充电量 (kWh)")
 
+class ChargeStatusBatchRequest(BaseModel):
+    request_ids: List[int] = Field(..., min_length=1, description="要查询的充电请求ID列表")
+
 class ChargeRequestInDB(ChargeRequestBase, TimeStampModel):
     id: int
     user_id: str
+    station_id: str = "default"
     queue_number: str
     status: RequestStatus
     pile_id: Optional[int] = None
@@ -132,6 +145,7 @@ class ChargeRequestInDB(ChargeRequestBase, TimeStampModel):
     request_time: datetime
     start_time: Optional[datetime] = None
     end_time: Optional[datetime] = None
+    departure_time: Optional[datetime] = None
 
 class ChargeRequest(ChargeRequestInDB):
     pile: Optional[ChargePile] = None
@@ -259,6 +273,14 @@ class RateRuleInDB(RateRuleBase, TimeStampModel):
 class RateRule(RateRuleInDB):
     pass
 
+# 重新计价(假设费率)请求
+class RerateRequest(BaseModel):
+    start_date: date = Field(..., description="开始日期")
+    end_date: date = Field(..., description="结束日期(包含)")
+    prices: Optional[Dict[RateType, float]] = Field(None, description="按时段类型替换电价，未指定的时段沿用当前电价")
+    rules: Optional[List[RateRuleCreate]] = Field(None, description="完整替换费率规则(含时段划分)")
+    service_rate: Optional[float] = Field(None, ge=0, description="假设的服务费率，默认沿用当前服务费率")
+
 # 服务费率模型
 class ServiceRateBase(BaseModel):
     rate: float
@@ -1,22 +1,31 @@
-import yaml
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, RedirectResponse
-import uvicorn
+import asyncio
 import os
 import logging
 from pathlib import Path
-from apscheduler.schedulers.background import BackgroundScheduler
 from sqlalchemy.orm import Session
 
 from backend.app.api import auth, charging, billing, admin
-from backend.app.services.websocket import setup_websocket
-from backend.app.db.database import Base, engine
+from backend.app.services.websocket import setup_websocket, manager
+from backend.app.services.event_bus import create_event_bus
+from backend.app.db.database import check_schema
 from backend.app.core.config import get_system_config, get_db_url
+from backend.app.core.serialization import ORJSONResponse
+from backend.app.core.startup import startup_state, WarmupGuardMiddleware
+from backend.app.core.health import health_monitor
+from backend.app.core.stall_detector import stall_detector
 from backend.app.background_tasks import periodic_charge_check
 from backend.app.db.database import SessionLocal
 from backend.app.services.scheduler import ChargingScheduler
+from backend.app.services.eta import eta_service
+from backend.app.services.tariff import tariff_service
+from backend.app.services.billing import BillingService
+from backend.app.services.queue_log_writer import queue_log_writer
+from backend.app.services.billing_pipeline import run_billing_sweep
+from backend.app.services.scheduler_actor import scheduler_actors, SchedulerBusyError
 
 # 配置日志
 logging.basicConfig(
@@ -30,16 +39,21 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# 创建数据库表（如果不存在）
-Base.metadata.create_all(bind=engine)
+# 数据库表由 scripts/init_db.sql 创建，导入时不再访问数据库；
+# 需要启动时检查表结构的，打开系统配置 db_schema_check
 
 # 创建FastAPI应用
 app = FastAPI(
     title="智能充电桩调度计费系统",
     description="提供充电桩调度、充电过程管理、计费和报表功能的API",
-    version="1.0.0"
+    version="1.0.0",
+    # 默认用 orjson 编码响应
+    default_response_class=ORJSONResponse
 )
 
+# 预热完成前拒绝修改数据的接口(在CORS之内，503响应同样带CORS头)
+app.add_middleware(WarmupGuardMiddleware)
+
 # 配置CORS
 origins = [
     "http://localhost",
@@ -54,6 +68,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 设置WebSocket
@@ -65,6 +80,23 @@ app.include_router(charging.router, prefix="/api/charging", tags=["充电"])
 app.include_router(billing.router, prefix="/api/billing", tags=["账单"])
 app.include_router(admin.router, prefix="/api/admin", tags=["管理"])
 
+# 健康检查端点
+@app.get("/health")
+async def health_check():
+    return {"status": "ok"}
+
+# 存活检查端点：能返回即说明进程和事件循环仍在响应
+@app.get("/live")
+async def live_check():
+    return health_monitor.liveness()
+
+# 就绪检查端点：后台预热未完成，或连接池、定期检查、事件循环延迟、发送积压超过阈值时返回503
+@app.get("/ready")
+async def ready_check():
+    report = health_monitor.readiness()
+    status_code = status.HTTP_200_OK if report["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE
+    return ORJSONResponse(status_code=status_code, content=report)
+
 # 静态文件服务 (修复后)
 # 将整个 frontend 目录挂载到根路径，以便能访问到 login.html, index.html 等
 frontend_path = Path(__file__).parent.parent.parent / "frontend"
@@ -73,43 +105,150 @@ if frontend_path.exists():
 else:
     logger.warning(f"Frontend path does not exist: {frontend_path}")
 
-# 健康检查端点
-@app.get("/health")
-async def health_check():
-    return {"status": "ok"}
+# 调度繁忙时返回503，由客户端稍后重试
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusyError):
+    return ORJSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)})
 
-# 应用启动和关闭事件
-@app.on_event("startup")
-async def startup_event():
-    # 初始化数据库会话
+def _start_background_jobs():
+    """启动后台定时任务(定时任务和每天运行一次的归档、导出任务在这里才导入)"""
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from backend.app.services.archive import run_archive_job
+    from backend.app.services.history_store import run_history_export_job
+
+    scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
+    scheduler.add_job(
+        periodic_charge_check,  # 提交给调度执行器，会话由执行器管理
+        'interval',
+        seconds=10,
+        id='periodic_charge_check'
+    )
+    # 每天定时把已结束的历史数据迁移到归档表
+    scheduler.add_job(
+        run_archive_job,
+        'cron',
+        hour=int(get_system_config().get("archive_hour", 3)),
+        id='archive_cold_data'
+    )
+    # 每天把已结束的会话和队列日志导出到列式历史存储
+    scheduler.add_job(
+        run_history_export_job,
+        'cron',
+        hour=int(get_system_config().get("history_export_hour", 2)),
+        id='export_session_history'
+    )
+    # 定期补扫尚未过账的充电会话(过账失败或进程异常退出时遗留)
+    scheduler.add_job(
+        run_billing_sweep,
+        'interval',
+        seconds=int(get_system_config().get("billing_sweep_interval", 30)),
+        id='billing_sweep'
+    )
+    scheduler.start()
+    app.state.scheduler = scheduler
+    health_monitor.expect_ticks()
+    logger.info("后台定时任务已启动，每10秒检查一次充电完成情况。")
+
+def _warm_caches():
+    """预热：检查表结构(可选)、回填月度账单汇总、修复充电桩队列数据、加载队列时间索引和电价曲线"""
+    settings = get_system_config()
     db = SessionLocal()
     try:
+        if settings.get("db_schema_check", False):
+            with startup_state.phase("schema_check"):
+                check_schema(create_missing=settings.get("db_create_missing_tables", False))
+
+        # 回填月度账单汇总(升级前已有的日账单)
+        with startup_state.phase("bill_summary"):
+            BillingService.ensure_monthly_summaries(db)
+
         # 修复充电桩队列数据
-        ChargingScheduler.fix_pile_charging_status(db)
-        
-        # 启动后台调度器
-        scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
-        scheduler.add_job(
-            lambda: periodic_charge_check(SessionLocal()),  # 每次创建新的数据库会话
-            'interval',
-            seconds=10,
-            id='periodic_charge_check'
-        )
-        scheduler.start()
-        app.state.scheduler = scheduler
-        
-        db_url = get_db_url()
-        logger.info(f"应用启动，连接到数据库: {db_url}")
-        logger.info("后台定时任务已启动，每10秒检查一次充电完成情况。")
+        with startup_state.phase("pile_queues"):
+            ChargingScheduler.fix_pile_charging_status(db)
+        startup_state.mark_warm("pile_queues")
+
+        # 加载充电桩队列时间索引
+        with startup_state.phase("eta_index"):
+            eta_service.warm(db)
+        startup_state.mark_warm("eta_index")
+
+        # 加载电价曲线
+        with startup_state.phase("tariff_curve"):
+            tariff_service.curve(db)
+        startup_state.mark_warm("tariff_curve")
     finally:
         db.close()
 
+async def _warm_up():
+    """
+    后台预热，数据库暂不可用时按退避间隔重试
+    预热完成后才启动调度执行器和定时任务：队列修复和索引加载期间没有调度命令修改队列
+    """
+    loop = asyncio.get_running_loop()
+    delay = 1
+    while True:
+        try:
+            await loop.run_in_executor(None, _warm_caches)
+            break
+        except Exception as e:
+            startup_state.record_failure(e)
+            logger.error(f"应用预热失败，{delay} 秒后重试: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    # 启动各充电站的调度执行器，此后各站的队列变更都由本站执行器串行执行
+    with startup_state.phase("scheduler_actors"):
+        await scheduler_actors.start()
+    _start_background_jobs()
+    startup_state.mark_ready()
+
+# 应用启动和关闭事件
+@app.on_event("startup")
+async def startup_event():
+    # 启动时只做不访问数据库的初始化，进程可以立即接受连接；访问数据库的预热在后台执行，
+    # 预热完成后再启动调度执行器，此前修改数据的接口返回503
+    app.state.scheduler = None
+
+    # 启动事件循环延迟监测
+    with startup_state.phase("health_monitor"):
+        await health_monitor.start()
+
+    # 可选的事件循环阻塞检测，采集阻塞期间的调用栈
+    if get_system_config().get("loop_stall_detector", False):
+        with startup_state.phase("stall_detector"):
+            await stall_detector.start(app)
+
+    # 启动队列日志写入器(同时导入上次遗留的备份日志)
+    with startup_state.phase("queue_log_writer"):
+        queue_log_writer.start()
+
+    # 启动 WebSocket 事件总线(多 worker 进程之间转发通知)
+    with startup_state.phase("event_bus"):
+        await manager.start(create_event_bus())
+
+    app.state.warmup_task = asyncio.get_running_loop().create_task(_warm_up())
+
+    db_url = get_db_url()
+    logger.info(f"应用启动，连接到数据库: {db_url}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("应用关闭")
-    if app.state.scheduler.running:
+    warmup_task = getattr(app.state, "warmup_task", None)
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    if app.state.scheduler is not None and app.state.scheduler.running:
         app.state.scheduler.shutdown()
         logger.info("后台定时任务已关闭。")
+    await health_monitor.stop()
+    await stall_detector.stop()
+    # 执行完已提交的调度命令
+    await scheduler_actors.stop()
+    await manager.stop()
+    # 调度执行器停止后仍待过账的会话
+    run_billing_sweep()
+    # 写入缓冲区中剩余的队列日志
+    queue_log_writer.stop()
 
 # 直接运行时的入口点
 if __name__ == "__main__":
@@ -119,4 +258,5 @@ if __name__ == "__main__":
     port = int(settings.get("port", 8000))
     
     # 启动服务器
+    import uvicorn
     uvicorn.run("backend.app.main:app", host=host, port=port, reload=False)
\ No newline at end of file
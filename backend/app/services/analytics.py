@@ -0,0 +1,273 @@
+"""
+运营统计分析
+基于 history_store 导出的列式历史数据做向量化计算：
+各桩分时段利用率、各电价时段的电量与电费、等待时长分布、假设费率下的重新计价
+"""
+from typing import Any, Dict, List, Optional
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.app.db.models import RateRule
+from backend.app.services.history_store import HistoryStore, history_store, REQUEST_STATUSES, EPOCH
+from backend.app.services.tariff import BANDS, minute_tariff
+
+SECONDS_PER_DAY = 86400
+
+def _expand(start: np.ndarray, end: np.ndarray, step: int, aligned: bool):
+    """
+    把每个区间拆成长度不超过 step 秒的片段
+    aligned=True 时按整点(step 的整数倍)切分，否则从区间起点开始每 step 秒切分
+    返回 (片段所属区间下标, 片段起点, 片段终点)
+    """
+    if aligned:
+        first = start // step
+        count = np.maximum((end - 1) // step - first + 1, 1)
+    else:
+        count = np.maximum(-(-(end - start) // step), 1)
+    owner = np.repeat(np.arange(len(start)), count)
+    offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+    if aligned:
+        seg_start = np.maximum((first[owner] + offset) * step, start[owner])
+        seg_end = np.minimum((first[owner] + offset + 1) * step, end[owner])
+    else:
+        seg_start = start[owner] + offset * step
+        seg_end = np.minimum(seg_start + step, end[owner])
+    return owner, seg_start, seg_end
+
+def hourly_utilization(sessions: Dict[str, np.ndarray], days: int) -> Dict[int, List[float]]:
+    """
+    各充电桩按一天 24 个整点时段统计的利用率(充电时长 / 时段总时长)
+    跨越多个整点的会话按实际重叠时长分摊到各时段
+    """
+    valid = sessions["end_ts"] > sessions["start_ts"]
+    start = sessions["start_ts"][valid]
+    end = sessions["end_ts"][valid]
+    piles = sessions["pile_id"][valid]
+    pile_ids = np.unique(piles)
+    if len(pile_ids) == 0 or days <= 0:
+        return {}
+
+    owner, seg_start, seg_end = _expand(start, end, 3600, aligned=True)
+    pile_index = np.searchsorted(pile_ids, piles[owner])
+    hour = (seg_start % SECONDS_PER_DAY) // 3600
+    busy = np.bincount(
+        pile_index * 24 + hour,
+        weights=(seg_end - seg_start).astype(float),
+        minlength=len(pile_ids) * 24
+    ).reshape(len(pile_ids), 24)
+    utilization = busy / (days * 3600.0)
+    return {int(pile_id): [round(float(v), 4) for v in utilization[i]] for i, pile_id in enumerate(pile_ids)}
+
+def revenue_by_band(sessions: Dict[str, np.ndarray], tariff: Dict[str, np.ndarray]) -> Dict[str, Dict[str, float]]:
+    """
+    各电价时段的充电量和充电费
+    与计费逻辑一致：从开始时间起每小时一段，电量按时长比例分摊，电价取片段起点所在时段
+    """
+    result = {band: {"kwh": 0.0, "charge_fee": 0.0} for band in BANDS}
+    valid = sessions["end_ts"] > sessions["start_ts"]
+    start = sessions["start_ts"][valid]
+    end = sessions["end_ts"][valid]
+    kwh = sessions["charged_kwh"][valid]
+    if len(start) == 0:
+        return result
+
+    owner, seg_start, seg_end = _expand(start, end, 3600, aligned=False)
+    seg_kwh = kwh[owner] * (seg_end - seg_start) / (end - start)[owner]
+    minute = (seg_start % SECONDS_PER_DAY) // 60
+    band = tariff["band"][minute]
+    band_kwh = np.bincount(band, weights=seg_kwh, minlength=len(BANDS))
+    band_fee = np.bincount(band, weights=seg_kwh * tariff["price"][minute], minlength=len(BANDS))
+    for i, name in enumerate(BANDS):
+        result[name] = {"kwh": round(float(band_kwh[i]), 2), "charge_fee": round(float(band_fee[i]), 2)}
+    return result
+
+def rerate(sessions: Dict[str, np.ndarray], tariff: Dict[str, np.ndarray], service_rate: float) -> Dict[str, np.ndarray]:
+    """
+    按给定的分钟电价和服务费率重新计算每个会话的费用
+    分段方式与计费逻辑一致：从开始时间起每小时一段，电量按时长比例分摊，电价取片段起点所在时段；
+    时长为零的会话没有充电费，只收服务费
+    """
+    start, end, kwh = sessions["start_ts"], sessions["end_ts"], sessions["charged_kwh"]
+    charge_fee = np.zeros(len(start))
+    valid = np.flatnonzero(end > start)
+    if len(valid):
+        owner, seg_start, seg_end = _expand(start[valid], end[valid], 3600, aligned=False)
+        duration = (end - start)[valid][owner]
+        seg_kwh = kwh[valid][owner] * (seg_end - seg_start) / duration
+        minute = (seg_start % SECONDS_PER_DAY) // 60
+        charge_fee[valid] = np.bincount(owner, weights=seg_kwh * tariff["price"][minute], minlength=len(valid))
+    service_fee = kwh * service_rate
+    return {"charge_fee": charge_fee, "service_fee": service_fee, "total_fee": charge_fee + service_fee}
+
+def _group_totals(keys: np.ndarray, recorded: np.ndarray, rerated: np.ndarray) -> Dict[int, Dict[str, float]]:
+    """按键汇总原收入与重新计价后的收入"""
+    groups, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(groups))
+    old = np.bincount(inverse, weights=recorded, minlength=len(groups))
+    new = np.bincount(inverse, weights=rerated, minlength=len(groups))
+    return {
+        int(key): {
+            "sessions": int(counts[i]),
+            "recorded_fee": round(float(old[i]), 2),
+            "rerated_fee": round(float(new[i]), 2),
+            "delta": round(float(new[i] - old[i]), 2),
+        }
+        for i, key in enumerate(groups)
+    }
+
+def rerating_delta(
+    sessions: Dict[str, np.ndarray],
+    tariff: Dict[str, np.ndarray],
+    service_rate: float
+) -> Dict[str, Any]:
+    """
+    假设费率下的收入变化：与会话实际结算的总费用比较，按充电桩和按日(开始充电日期)汇总
+    """
+    fees = rerate(sessions, tariff, service_rate)
+    recorded = sessions["total_fee"].astype(float)
+    rerated = fees["total_fee"]
+    by_day = _group_totals(sessions["start_ts"] // SECONDS_PER_DAY, recorded, rerated)
+    return {
+        "total": {
+            "sessions": int(len(recorded)),
+            "recorded_fee": round(float(recorded.sum()), 2),
+            "rerated_fee": round(float(rerated.sum()), 2),
+            "delta": round(float(rerated.sum() - recorded.sum()), 2),
+            "rerated_charge_fee": round(float(fees["charge_fee"].sum()), 2),
+            "rerated_service_fee": round(float(fees["service_fee"].sum()), 2),
+        },
+        "by_pile": _group_totals(sessions["pile_id"], recorded, rerated),
+        "by_day": {
+            (EPOCH + timedelta(days=day)).date().isoformat(): totals
+            for day, totals in by_day.items()
+        },
+    }
+
+def hypothetical_rules(
+    rate_rules: List[Any],
+    prices: Optional[Dict[str, float]] = None,
+    rules: Optional[List[Any]] = None
+) -> List[SimpleNamespace]:
+    """
+    构造假设的费率规则：rules 完整替换当前规则，prices 再按时段类型替换电价
+    返回副本，不修改数据库中的规则对象
+    """
+    base = rules if rules is not None else rate_rules
+    prices = {getattr(band, "value", band): price for band, price in (prices or {}).items()}
+    result = []
+    for rule in base:
+        band = getattr(rule.type, "value", rule.type)
+        result.append(SimpleNamespace(
+            type=band,
+            price=prices.get(band, rule.price),
+            start_time=rule.start_time,
+            end_time=rule.end_time
+        ))
+    return result
+
+def _distribution(minutes: np.ndarray, bin_minutes: int, max_minutes: int) -> Dict[str, Any]:
+    if len(minutes) == 0:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p90": 0.0, "p99": 0.0, "max": 0.0, "histogram": []}
+    p50, p90, p99 = np.percentile(minutes, [50, 90, 99])
+    edges = np.arange(0, max_minutes + bin_minutes, bin_minutes)
+    counts = np.bincount(np.minimum(minutes // bin_minutes, len(edges) - 1).astype(int), minlength=len(edges))
+    histogram = [
+        {"from": int(edges[i]), "to": int(edges[i + 1]) if i + 1 < len(edges) else None, "count": int(counts[i])}
+        for i in range(len(edges))
+    ]
+    return {
+        "count": int(len(minutes)),
+        "mean": round(float(minutes.mean()), 2),
+        "p50": round(float(p50), 2),
+        "p90": round(float(p90), 2),
+        "p99": round(float(p99), 2),
+        "max": round(float(minutes.max()), 2),
+        "histogram": histogram,
+    }
+
+def wait_distribution(
+    sessions: Dict[str, np.ndarray],
+    events: Dict[str, np.ndarray],
+    bin_minutes: int = 5,
+    max_minutes: int = 120
+) -> Dict[str, Dict[str, Any]]:
+    """
+    等待时长分布(分钟)
+    total: 提交请求到开始充电；queue: 首次进入充电桩队列到开始充电(由队列日志计算)
+    """
+    has_request = sessions["request_ts"] >= 0
+    total = (sessions["start_ts"][has_request] - sessions["request_ts"][has_request]) / 60.0
+
+    queuing, charging = REQUEST_STATUSES.index("QUEUING"), REQUEST_STATUSES.index("CHARGING")
+    first_ts = {}
+    for code in (queuing, charging):
+        mask = events["to_status"] == code
+        request_ids, ts = events["request_id"][mask], events["log_ts"][mask]
+        order = np.lexsort((ts, request_ids))
+        ids, first = np.unique(request_ids[order], return_index=True)
+        first_ts[code] = (ids, ts[order][first])
+    queue_ids, queue_ts = first_ts[queuing]
+    charge_ids, charge_ts = first_ts[charging]
+    _, queue_pos, charge_pos = np.intersect1d(queue_ids, charge_ids, return_indices=True)
+    queue = (charge_ts[charge_pos] - queue_ts[queue_pos]) / 60.0
+    queue = queue[queue >= 0]
+
+    return {
+        "total": _distribution(np.maximum(total, 0), bin_minutes, max_minutes),
+        "queue": _distribution(queue, bin_minutes, max_minutes),
+    }
+
+class AnalyticsService:
+    """运营统计服务，读取列式历史数据，不查询业务表"""
+
+    @staticmethod
+    def utilization(start_date: date, end_date: date, store: Optional[HistoryStore] = None) -> Dict[int, List[float]]:
+        store = store or history_store
+        days = (end_date - start_date).days + 1
+        return hourly_utilization(store.load_sessions(start_date, end_date), days)
+
+    @staticmethod
+    def revenue_by_band(
+        start_date: date,
+        end_date: date,
+        rate_rules: List[RateRule],
+        store: Optional[HistoryStore] = None
+    ) -> Dict[str, Any]:
+        store = store or history_store
+        sessions = store.load_sessions(start_date, end_date)
+        return {
+            "bands": revenue_by_band(sessions, minute_tariff(rate_rules)),
+            "service_fee": round(float(sessions["service_fee"].sum()), 2),
+            "total_fee": round(float(sessions["total_fee"].sum()), 2),
+            "session_count": int(len(sessions["session_id"])),
+        }
+
+    @staticmethod
+    def rerate(
+        start_date: date,
+        end_date: date,
+        rate_rules: List[Any],
+        service_rate: float,
+        store: Optional[HistoryStore] = None
+    ) -> Dict[str, Any]:
+        """把区间内的历史会话按假设费率重新计价，返回收入变化"""
+        store = store or history_store
+        return rerating_delta(store.load_sessions(start_date, end_date), minute_tariff(rate_rules), service_rate)
+
+    @staticmethod
+    def wait_times(
+        start_date: date,
+        end_date: date,
+        bin_minutes: int = 5,
+        max_minutes: int = 120,
+        store: Optional[HistoryStore] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        store = store or history_store
+        return wait_distribution(
+            store.load_sessions(start_date, end_date),
+            store.load_queue_events(start_date, end_date),
+            bin_minutes,
+            max_minutes
+        )
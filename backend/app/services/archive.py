@@ -0,0 +1,255 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from sqlalchemy import select, insert, extract, func, text
+import logging
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import (
+    CarRequest, ChargeSession, BillDetail, QueueLog,
+    CarRequestArchive, ChargeSessionArchive, BillDetailArchive, QueueLogArchive
+)
+from backend.app.db.schemas import RequestStatus
+from backend.app.core.config import get_system_config
+
+logger = logging.getLogger(__name__)
+
+# 归档表及其对应的业务表和分区时间列
+ARCHIVE_TABLES = [
+    (CarRequestArchive, CarRequest, CarRequest.request_time),
+    (ChargeSessionArchive, ChargeSession, ChargeSession.start_time),
+    (BillDetailArchive, BillDetail, BillDetail.start_time),
+    (QueueLogArchive, QueueLog, QueueLog.log_time),
+]
+
+def _month_of(value: datetime) -> int:
+    return value.year * 100 + value.month
+
+def _next_month(month: int) -> int:
+    year, month = divmod(month, 100)
+    return (year + 1) * 100 + 1 if month == 12 else year * 100 + month + 1
+
+class ArchiveService:
+    """
+    冷数据归档服务
+    把已完成/已取消的充电请求连同其会话、详单和队列日志，以及过期的队列日志，
+    按月迁移到 *_archive 表，使调度和查询涉及的业务表只保留近期数据
+    """
+
+    @staticmethod
+    def _move(db: Session, archive_model, hot_model, time_column, condition) -> int:
+        """INSERT ... SELECT 复制到归档表后删除原记录，返回迁移条数"""
+        table = hot_model.__table__
+        names = [column.name for column in table.columns]
+        month = (extract('year', time_column) * 100 + extract('month', time_column)).label("archive_month")
+        db.execute(
+            insert(archive_model).from_select(
+                names + ["archive_month"],
+                select(*[table.c[name] for name in names], month).where(condition)
+            )
+        )
+        return db.query(hot_model).filter(condition).delete(synchronize_session=False)
+
+    @staticmethod
+    def _keep_request_ids(db: Session) -> List[int]:
+        """每个充电站每种模式最新的一条请求保留在业务表中，生成排队号码依赖它"""
+        return [
+            row[0] for row in
+            db.query(func.max(CarRequest.id)).group_by(CarRequest.station_id, CarRequest.mode).all()
+        ]
+
+    @staticmethod
+    def ensure_partitions(db: Session, first_month: int, last_month: int):
+        """
+        MySQL 下为归档表按月拆分分区(从 p_max 中拆出尚不存在的月份分区)
+        归档表未分区或非 MySQL 数据库时跳过
+        """
+        if db.get_bind().dialect.name != "mysql":
+            return
+        for archive_model, _, _ in ARCHIVE_TABLES:
+            table_name = archive_model.__tablename__
+            rows = db.execute(
+                text(
+                    "SELECT PARTITION_NAME, PARTITION_DESCRIPTION FROM information_schema.PARTITIONS "
+                    "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+                ),
+                {"table": table_name}
+            ).fetchall()
+            if not rows:
+                continue
+            bounds = [int(row[1]) for row in rows if row[1] and row[1] != "MAXVALUE"]
+            # 已有分区上界 b 覆盖的是 b 之前的月份，从 b 所在月份开始继续拆分
+            month = max(first_month, max(bounds)) if bounds else first_month
+            while month <= last_month:
+                upper = _next_month(month)
+                db.execute(text(
+                    f"ALTER TABLE {table_name} REORGANIZE PARTITION p_max INTO ("
+                    f"PARTITION p{month} VALUES LESS THAN ({upper}), "
+                    f"PARTITION p_max VALUES LESS THAN MAXVALUE)"
+                ))
+                logger.info(f"归档表 {table_name} 新增分区 p{month}")
+                month = upper
+
+    @staticmethod
+    def archive_cold_data(
+        db: Session,
+        older_than_days: Optional[int] = None,
+        batch_size: Optional[int] = None
+    ) -> Dict[str, int]:
+        """
+        执行一次归档，按批次提交，返回各类记录的迁移条数
+        """
+        config = get_system_config()
+        if older_than_days is None:
+            older_than_days = int(config.get("archive_after_days", 30))
+        if batch_size is None:
+            batch_size = int(config.get("archive_batch_size", 500))
+        cutoff = datetime.now() - timedelta(days=older_than_days)
+
+        stats = {"requests": 0, "sessions": 0, "bill_details": 0, "queue_logs": 0}
+        keep_ids = ArchiveService._keep_request_ids(db)
+        closed = [RequestStatus.FINISHED, RequestStatus.CANCELED]
+
+        oldest = db.query(func.min(CarRequest.request_time)).filter(CarRequest.status.in_(closed)).scalar()
+        oldest_log = db.query(func.min(QueueLog.log_time)).scalar()
+        candidates = [value for value in (oldest, oldest_log) if value is not None]
+        if candidates:
+            ArchiveService.ensure_partitions(db, _month_of(min(candidates)), _month_of(datetime.now()))
+
+        # 1. 已结束的请求及其会话、详单、队列日志
+        while True:
+            request_ids = [
+                row[0] for row in
+                db.query(CarRequest.id)
+                .filter(CarRequest.status.in_(closed))
+                .filter(func.coalesce(CarRequest.end_time, CarRequest.updated_at) < cutoff)
+                .filter(~CarRequest.id.in_(keep_ids))
+                .order_by(CarRequest.id)
+                .limit(batch_size)
+                .all()
+            ]
+            if not request_ids:
+                break
+            try:
+                session_ids = [
+                    row[0] for row in
+                    db.query(ChargeSession.id).filter(ChargeSession.request_id.in_(request_ids)).all()
+                ]
+                if session_ids:
+                    stats["bill_details"] += ArchiveService._move(
+                        db, BillDetailArchive, BillDetail, BillDetail.start_time,
+                        BillDetail.session_id.in_(session_ids)
+                    )
+                    stats["sessions"] += ArchiveService._move(
+                        db, ChargeSessionArchive, ChargeSession, ChargeSession.start_time,
+                        ChargeSession.id.in_(session_ids)
+                    )
+                stats["queue_logs"] += ArchiveService._move(
+                    db, QueueLogArchive, QueueLog, QueueLog.log_time,
+                    QueueLog.request_id.in_(request_ids)
+                )
+                stats["requests"] += ArchiveService._move(
+                    db, CarRequestArchive, CarRequest, CarRequest.request_time,
+                    CarRequest.id.in_(request_ids)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        # 2. 其余过期的队列日志
+        while True:
+            log_ids = [
+                row[0] for row in
+                db.query(QueueLog.id)
+                .filter(QueueLog.log_time < cutoff)
+                .order_by(QueueLog.id)
+                .limit(batch_size)
+                .all()
+            ]
+            if not log_ids:
+                break
+            try:
+                stats["queue_logs"] += ArchiveService._move(
+                    db, QueueLogArchive, QueueLog, QueueLog.log_time, QueueLog.id.in_(log_ids)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+
+        logger.info(
+            f"冷数据归档完成(早于 {cutoff:%Y-%m-%d %H:%M}): 请求 {stats['requests']} 条, "
+            f"会话 {stats['sessions']} 条, 详单 {stats['bill_details']} 条, 队列日志 {stats['queue_logs']} 条"
+        )
+        return stats
+
+    # ---- 历史数据读取(先查业务表，未命中再查归档表) ----
+
+    @staticmethod
+    def find_request(db: Session, request_id: int):
+        """按ID查询充电请求，包括已归档的请求"""
+        return (
+            db.query(CarRequest).filter(CarRequest.id == request_id).first()
+            or db.query(CarRequestArchive).filter(CarRequestArchive.id == request_id).first()
+        )
+
+    @staticmethod
+    def find_session(db: Session, session_id: int):
+        """按ID查询充电会话，包括已归档的会话"""
+        return (
+            db.query(ChargeSession).filter(ChargeSession.id == session_id).first()
+            or db.query(ChargeSessionArchive).filter(ChargeSessionArchive.id == session_id).first()
+        )
+
+    @staticmethod
+    def find_bill_detail(
+        db: Session,
+        detail_id: Optional[int] = None,
+        detail_number: Optional[str] = None,
+        session_id: Optional[int] = None
+    ):
+        """按ID、详单编号或会话ID查询详单，包括已归档的详单"""
+        for model in (BillDetail, BillDetailArchive):
+            query = db.query(model)
+            if detail_id is not None:
+                query = query.filter(model.id == detail_id)
+            if detail_number is not None:
+                query = query.filter(model.detail_number == detail_number)
+            if session_id is not None:
+                query = query.filter(model.session_id == session_id)
+            detail = query.first()
+            if detail:
+                return detail
+        return None
+
+    @staticmethod
+    def bill_details_of(db: Session, bill_id: int) -> list:
+        """日账单下的全部详单，包括已归档的详单"""
+        details = db.query(BillDetail).filter(BillDetail.bill_id == bill_id).all()
+        archived = db.query(BillDetailArchive).filter(BillDetailArchive.bill_id == bill_id).all()
+        return sorted(details + archived, key=lambda detail: detail.start_time)
+
+    @staticmethod
+    def sessions_between(db: Session, pile_id: int, start_time: datetime, end_time: datetime) -> list:
+        """指定充电桩在时间段内开始的全部会话，包括已归档的会话"""
+        sessions = []
+        for model in (ChargeSession, ChargeSessionArchive):
+            sessions.extend(
+                db.query(model)
+                .filter(model.pile_id == pile_id)
+                .filter(model.start_time >= start_time)
+                .filter(model.start_time <= end_time)
+                .all()
+            )
+        return sessions
+
+def run_archive_job():
+    """定时归档任务入口，使用独立的数据库会话"""
+    db = SessionLocal()
+    try:
+        ArchiveService.archive_cold_data(db)
+    except Exception as e:
+        logger.error(f"冷数据归档失败: {e}", exc_info=True)
+    finally:
+        db.close()
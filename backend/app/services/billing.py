@@ -1,15 +1,18 @@
 from typing import List, Dict, Tuple, Optional, Any
 from datetime import datetime, time, date, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, func
+from sqlalchemy import and_, or_, func, extract
 import uuid
 import logging
 
 from backend.app.db.models import (
     ChargeSession, CarRequest, ChargePile, BillMaster, BillDetail,
-    RateRule, ServiceRate
+    BillMonthlySummary, RateRule, ServiceRate
 )
 from backend.app.db.schemas import SessionStatus
+from backend.app.services.archive import ArchiveService
+from backend.app.services.charge_curve import charged_energy
+from backend.app.services.billing_pipeline import billing_pipeline
 from backend.app.core.config import get_station_config
 
 logger = logging.getLogger(__name__)
@@ -29,6 +32,48 @@ class BillingService:
         config = get_station_config()
         return config.get("ServiceRate", 0.8)
     
+    @staticmethod
+    def load_rate_rules(db: Session) -> List[RateRule]:
+        """一次性加载全部费率规则，供批量计费时在内存中匹配"""
+        return db.query(RateRule).all()
+    
+    @staticmethod
+    def match_rate_rule(rate_rules: List[RateRule], charge_time: datetime) -> float:
+        """
+        在已加载的费率规则中匹配充电时间对应的费率
+        匹配规则与 get_rate_by_time 保持一致
+        """
+        return BillingService.match_rate_band(rate_rules, charge_time)[1]
+    
+    @staticmethod
+    def match_rate_band(rate_rules: List[RateRule], charge_time: datetime) -> Tuple[str, float]:
+        """在已加载的费率规则中匹配充电时间对应的 (费率类型, 费率)"""
+        time_part = charge_time.time()
+        
+        for rule in rate_rules:
+            if rule.start_time <= time_part <= rule.end_time:
+                return rule.type, rule.price
+        
+        # 特殊处理跨天的谷时段 (23:00~次日7:00)
+        valley_night = next(
+            (r for r in rate_rules
+             if r.type == "VALLEY" and r.start_time >= time(23, 0) and r.end_time <= time(23, 59)),
+            None
+        )
+        valley_morning = next(
+            (r for r in rate_rules
+             if r.type == "VALLEY" and r.start_time >= time(0, 0) and r.end_time <= time(7, 0)),
+            None
+        )
+        
+        if valley_night and time_part >= valley_night.start_time:
+            return valley_night.type, valley_night.price
+        elif valley_morning and time_part <= valley_morning.end_time:
+            return valley_morning.type, valley_morning.price
+        
+        # 默认返回平时费率
+        return "NORMAL", 0.7
+    
     @staticmethod
     def get_rate_by_time(db: Session, charge_time: datetime) -> float:
         """根据充电时间获取对应费率"""
@@ -74,11 +119,14 @@ class BillingService:
         db: Session, 
         start_time: datetime, 
         end_time: datetime, 
-        amount_kwh: float
+        amount_kwh: float,
+        rate_rules: Optional[List[RateRule]] = None,
+        service_rate: Optional[float] = None
     ) -> Tuple[float, float, float]:
         """
         计算充电费用
         返回：(充电费, 服务费, 总费用)
+        如果传入了预先加载的 rate_rules / service_rate，则不再逐小时查询数据库
         """
         if not end_time:
             end_time = datetime.now()
@@ -87,7 +135,8 @@ class BillingService:
         charging_minutes = (end_time - start_time).total_seconds() / 60
         
         # 获取服务费率
-        service_rate = BillingService.get_current_service_rate(db)
+        if service_rate is None:
+            service_rate = BillingService.get_current_service_rate(db)
         
         # 计算服务费
         service_fee = amount_kwh * service_rate
@@ -112,7 +161,10 @@ class BillingService:
             hour_kwh = min(remaining_kwh, amount_kwh * hour_fraction / (charging_minutes / 60))
             
             # 获取这个小时的费率
-            rate = BillingService.get_rate_by_time(db, current_time)
+            if rate_rules is not None:
+                rate = BillingService.match_rate_rule(rate_rules, current_time)
+            else:
+                rate = BillingService.get_rate_by_time(db, current_time)
             
             # 计算这个小时的费用
             charge_fee += hour_kwh * rate
@@ -204,8 +256,8 @@ class BillingService:
         db.commit()
         db.refresh(session)
         
-        # 生成详单
-        BillingService.generate_bill_detail(db, session.id)
+        # 登记到账单过账管道，由调度执行器在本批命令结束后统一过账
+        billing_pipeline.enqueue(session.id)
         
         return session
     
@@ -231,10 +283,9 @@ class BillingService:
             pile = db.query(ChargePile).filter(ChargePile.id == session.pile_id).first()
             
             if request and pile:
-                # 计算充电时间(小时)
-                charging_hours = (session.end_time - session.start_time).total_seconds() / 3600
-                # 估算充电量
-                session.charged_kwh = min(request.amount_kwh, pile.power * charging_hours)
+                # 按功率曲线估算充电量
+                charging_minutes = (session.end_time - session.start_time).total_seconds() / 60
+                session.charged_kwh = charged_energy(pile, request, charging_minutes)
             
         # 计算充电时间(分钟)
         charging_minutes = (session.end_time - session.start_time).total_seconds() / 60
@@ -260,79 +311,119 @@ class BillingService:
         db.commit()
         db.refresh(session)
         
-        # 生成详单
-        BillingService.generate_bill_detail(db, session.id)
+        # 登记到账单过账管道，由调度执行器在本批命令结束后统一过账
+        billing_pipeline.enqueue(session.id)
         
         return session
     
     @staticmethod
     def generate_bill_detail(db: Session, session_id: int) -> Optional[BillDetail]:
-        """生成充电详单"""
-        # 获取会话
-        session = db.query(ChargeSession).filter(ChargeSession.id == session_id).first()
-        if not session or not session.end_time:
-            return None
-            
-        # 获取请求和充电桩信息
-        request = db.query(CarRequest).filter(CarRequest.id == session.request_id).first()
-        pile = db.query(ChargePile).filter(ChargePile.id == session.pile_id).first()
-        
-        if not request or not pile:
-            return None
-            
-        # 获取或创建日账单
-        bill_date = session.start_time.date()
-        
-        bill_master = db.query(BillMaster).filter(
-            and_(
-                BillMaster.user_id == request.user_id,
-                BillMaster.bill_date == bill_date
+        """
+        立即为已结束的会话过账并返回详单(已过账的会话直接返回原有详单)
+        正常流程由账单过账管道批量过账，这里只用于需要同步拿到详单的场景
+        """
+        detail = billing_pipeline.post(db, [session_id]).get(session_id)
+        if detail is None:
+            detail = db.query(BillDetail).filter(BillDetail.session_id == session_id).first()
+        return detail
+    
+    @staticmethod
+    def month_range(year: int, month: int) -> Tuple[date, date]:
+        """返回月份的日期范围 [当月1日, 下月1日)"""
+        start = date(year, month, 1)
+        end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        return start, end
+    
+    @staticmethod
+    def get_monthly_summary(db: Session, user_id: str, year: int, month: int) -> Dict[str, Any]:
+        """
+        获取用户月度账单汇总：按主键读取汇总表
+        升级前已有的日账单由建表脚本和启动预热回填；仍缺少汇总行的月份按日期范围从日账单聚合(只读，不回写)
+        """
+        summary = db.get(BillMonthlySummary, (user_id, date(year, month, 1)))
+        if summary is not None:
+            return {
+                "bill_count": summary.bill_count,
+                "total_charge_fee": summary.total_charge_fee,
+                "total_service_fee": summary.total_service_fee,
+                "total_fee": summary.total_fee,
+                "total_kwh": summary.total_kwh
+            }
+        
+        month_start, month_end = BillingService.month_range(year, month)
+        bill_count, total_charge_fee, total_service_fee, total_fee, total_kwh = (
+            db.query(
+                func.count(BillMaster.id),
+                func.coalesce(func.sum(BillMaster.total_charge_fee), 0),
+                func.coalesce(func.sum(BillMaster.total_service_fee), 0),
+                func.coalesce(func.sum(BillMaster.total_fee), 0),
+                func.coalesce(func.sum(BillMaster.total_kwh), 0)
             )
-        ).first()
-        
-        if not bill_master:
-            bill_master = BillMaster(
-                user_id=request.user_id,
-                bill_date=bill_date,
-                total_charge_fee=0.0,
-                total_service_fee=0.0,
-                total_fee=0.0,
-                total_kwh=0.0
+            .filter(
+                BillMaster.user_id == user_id,
+                BillMaster.bill_date >= month_start,
+                BillMaster.bill_date < month_end
             )
-            db.add(bill_master)
-            db.commit()
-            db.refresh(bill_master)
-            
-        # 生成详单编号
-        detail_number = f"D{bill_date.strftime('%Y%m%d')}{session_id:06d}"
-        
-        # 创建详单
-        bill_detail = BillDetail(
-            bill_id=bill_master.id,
-            session_id=session.id,
-            detail_number=detail_number,
-            pile_code=pile.code,
-            charged_kwh=session.charged_kwh,
-            charging_time=session.charging_time,
-            start_time=session.start_time,
-            end_time=session.end_time,
-            charge_fee=session.charge_fee,
-            service_fee=session.service_fee,
-            total_fee=session.total_fee
+            .one()
         )
-        
-        db.add(bill_detail)
-        
-        # 更新日账单
-        bill_master.total_charge_fee += session.charge_fee
-        bill_master.total_service_fee += session.service_fee
-        bill_master.total_fee += session.total_fee
-        bill_master.total_kwh += session.charged_kwh
-        
+        return {
+            "bill_count": bill_count,
+            "total_charge_fee": float(total_charge_fee),
+            "total_service_fee": float(total_service_fee),
+            "total_fee": float(total_fee),
+            "total_kwh": float(total_kwh)
+        }
+    
+    @staticmethod
+    def rebuild_monthly_summaries(db: Session) -> int:
+        """
+        从日账单重建全部月度汇总(升级后首次启用汇总表或数据修复时执行)，返回汇总行数
+        """
+        month = (extract('year', BillMaster.bill_date) * 100 + extract('month', BillMaster.bill_date)).label("bill_month")
+        rows = (
+            db.query(
+                BillMaster.user_id,
+                month,
+                func.count(BillMaster.id),
+                func.sum(BillMaster.total_charge_fee),
+                func.sum(BillMaster.total_service_fee),
+                func.sum(BillMaster.total_fee),
+                func.sum(BillMaster.total_kwh)
+            )
+            .group_by(BillMaster.user_id, month)
+            .all()
+        )
+        db.query(BillMonthlySummary).delete(synchronize_session=False)
+        db.bulk_insert_mappings(BillMonthlySummary, [
+            {
+                "user_id": user_id,
+                "bill_month": date(int(year_month) // 100, int(year_month) % 100, 1),
+                "bill_count": bill_count,
+                "total_charge_fee": float(charge_fee or 0),
+                "total_service_fee": float(service_fee or 0),
+                "total_fee": float(total_fee or 0),
+                "total_kwh": float(total_kwh or 0)
+            }
+            for user_id, year_month, bill_count, charge_fee, service_fee, total_fee, total_kwh in rows
+        ])
         db.commit()
-        db.refresh(bill_detail)
-        
-        return bill_detail
+        logger.info(f"已重建 {len(rows)} 条月度账单汇总")
+        return len(rows)
+    
+    @staticmethod
+    def ensure_monthly_summaries(db: Session) -> bool:
+        """
+        检查月度汇总是否覆盖全部日账单(汇总的账单天数之和等于日账单数)，不一致时重建
+        启动预热时执行，升级前已有的日账单由此回填；返回是否执行了重建
+        """
+        bill_count = db.query(func.count(BillMaster.id)).scalar() or 0
+        summarized = db.query(func.coalesce(func.sum(BillMonthlySummary.bill_count), 0)).scalar() or 0
+        db.rollback()
+        if int(summarized) == bill_count:
+            return False
+        logger.warning(f"月度账单汇总与日账单不一致(汇总 {summarized} 天，日账单 {bill_count} 条)，重建汇总")
+        BillingService.rebuild_monthly_summaries(db)
+        return True
     
     @staticmethod
     def get_user_bill(db: Session, user_id: str, bill_date: date) -> Optional[Dict[str, Any]]:
@@ -348,12 +439,8 @@ class BillingService:
         if not bill_master:
             return None
             
-        # 获取详单列表
-        bill_details = (
-            db.query(BillDetail)
-            .filter(BillDetail.bill_id == bill_master.id)
-            .all()
-        )
+        # 获取详单列表(包括已归档的详单)
+        bill_details = ArchiveService.bill_details_of(db, bill_master.id)
         
         # 转换为字典
         result = {
@@ -382,10 +469,10 @@ class BillingService:
     
     @staticmethod
     def get_bill_detail(db: Session, detail_id: int) -> Optional[BillDetail]:
-        """获取详单信息"""
-        return db.query(BillDetail).filter(BillDetail.id == detail_id).first()
+        """获取详单信息(包括已归档的详单)"""
+        return ArchiveService.find_bill_detail(db, detail_id=detail_id)
     
     @staticmethod
     def get_bill_detail_by_number(db: Session, detail_number: str) -> Optional[BillDetail]:
-        """根据详单编号获取详单信息"""
-        return db.query(BillDetail).filter(BillDetail.detail_number == detail_number).first() 
\ No newline at end of file
+        """根据详单编号获取详单信息(包括已归档的详单)"""
+        return ArchiveService.find_bill_detail(db, detail_number=detail_number) 
\ No newline at end of file
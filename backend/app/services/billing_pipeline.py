@@ -0,0 +1,252 @@
+"""
+账单过账管道
+充电会话结束(完成、中断)时只把会话ID放入待过账集合，由调度执行器在每批命令执行完后统一过账，
+后台任务定期补扫遗漏的会话(进程退出、过账失败等)。
+
+一次过账在同一个事务中完成：
+- 按 (user_id, bill_date) 汇总本批会话，用 upsert 累加日账单，不会并发创建重复的日账单
+- 为每个会话插入详单，详单编号由账单日期和会话ID确定：D + YYYYMMDD + 6位会话ID
+- 按 (user_id, bill_month) 用 upsert 累加月度汇总
+
+已有详单的会话直接跳过，过账是幂等的；另一个进程同时过账同一会话时，
+详单编号唯一键冲突会使整个事务回滚，重试时该会话已有详单而被跳过
+"""
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from collections import defaultdict
+from datetime import date
+import logging
+import threading
+
+from sqlalchemy import and_, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import (
+    BillDetail, BillMaster, BillMonthlySummary, CarRequest, ChargePile, ChargeSession
+)
+from backend.app.db.schemas import SessionStatus
+from backend.app.core.config import get_system_config
+
+logger = logging.getLogger(__name__)
+
+# 账单累加的金额列
+AMOUNT_COLUMNS = ("total_charge_fee", "total_service_fee", "total_fee", "total_kwh")
+
+def detail_number_of(bill_date: date, session_id: int) -> str:
+    """详单编号：D + 账单日期 + 6位会话ID"""
+    return f"D{bill_date.strftime('%Y%m%d')}{session_id:06d}"
+
+def _upsert(db: Session, table, rows: List[Dict[str, Any]], keys: Tuple[str, ...], increments: Tuple[str, ...]):
+    """按唯一键插入，已存在时把 increments 列累加到原有行上"""
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_duplicate_key_update({name: table.c[name] + stmt.inserted[name] for name in increments})
+    else:
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+    db.execute(stmt)
+
+class BillingPipeline:
+    """账单过账管道"""
+
+    def __init__(self):
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        # 同一进程内串行过账
+        self._post_lock = threading.Lock()
+
+    def enqueue(self, session_id: int):
+        """登记一个已结束的会话，等待过账"""
+        with self._lock:
+            self._pending.add(session_id)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, db: Session) -> int:
+        """过账所有待过账的会话，返回新生成的详单数；失败时会话留待下次过账"""
+        with self._lock:
+            session_ids, self._pending = self._pending, set()
+        if not session_ids:
+            return 0
+        try:
+            return len(self.post(db, session_ids))
+        except Exception as e:
+            logger.error(f"账单过账失败，{len(session_ids)} 个会话稍后重试: {e}", exc_info=True)
+            with self._lock:
+                self._pending.update(session_ids)
+            return 0
+
+    def sweep(self, db: Session, limit: Optional[int] = None) -> int:
+        """补扫已结束但还没有详单的会话并过账"""
+        if limit is None:
+            limit = int(get_system_config().get("billing_batch_size", 500))
+        session_ids = [
+            row.id for row in (
+                db.query(ChargeSession.id)
+                .outerjoin(BillDetail, BillDetail.session_id == ChargeSession.id)
+                .filter(
+                    ChargeSession.status.in_([SessionStatus.COMPLETED, SessionStatus.INTERRUPTED]),
+                    ChargeSession.end_time.isnot(None),
+                    BillDetail.id.is_(None)
+                )
+                .order_by(ChargeSession.id)
+                .limit(limit)
+                .all()
+            )
+        ]
+        if not session_ids:
+            return 0
+        return len(self.post(db, session_ids))
+
+    def post(self, db: Session, session_ids: Iterable[int]) -> Dict[int, BillDetail]:
+        """在一个事务中为指定会话过账，返回 {会话ID: 新生成的详单}"""
+        session_ids = sorted(set(session_ids))
+        with self._post_lock:
+            for attempt in range(3):
+                try:
+                    details = self._post_once(db, session_ids)
+                    db.commit()
+                    if details:
+                        logger.info(f"已过账 {len(details)} 个充电会话")
+                    return details
+                except IntegrityError as e:
+                    # 其他进程同时过账了部分会话，重试时跳过已有详单的会话
+                    db.rollback()
+                    logger.warning(f"账单过账冲突，第 {attempt + 1} 次重试: {e}")
+                except Exception:
+                    db.rollback()
+                    raise
+        raise RuntimeError("账单过账多次冲突")
+
+    @staticmethod
+    def _post_once(db: Session, session_ids: List[int]) -> Dict[int, BillDetail]:
+        if not session_ids:
+            return {}
+        sessions = (
+            db.query(ChargeSession)
+            .filter(
+                ChargeSession.id.in_(session_ids),
+                ChargeSession.status != SessionStatus.CHARGING,
+                ChargeSession.end_time.isnot(None)
+            )
+            .all()
+        )
+        posted = {
+            row.session_id for row in
+            db.query(BillDetail.session_id).filter(BillDetail.session_id.in_(session_ids)).all()
+        }
+        sessions = [session for session in sessions if session.id not in posted]
+        if not sessions:
+            return {}
+
+        users = dict(
+            db.query(CarRequest.id, CarRequest.user_id)
+            .filter(CarRequest.id.in_({session.request_id for session in sessions}))
+            .all()
+        )
+        pile_codes = dict(
+            db.query(ChargePile.id, ChargePile.code)
+            .filter(ChargePile.id.in_({session.pile_id for session in sessions}))
+            .all()
+        )
+
+        # 1. 按 (用户, 账单日期) 汇总
+        daily: Dict[Tuple[str, date], Dict[str, float]] = defaultdict(lambda: dict.fromkeys(AMOUNT_COLUMNS, 0.0))
+        billable = []
+        for session in sessions:
+            user_id = users.get(session.request_id)
+            if user_id is None or session.pile_id not in pile_codes:
+                logger.error(f"会话 {session.id} 缺少充电请求或充电桩，无法过账")
+                continue
+            bill_date = session.start_time.date()
+            totals = daily[(user_id, bill_date)]
+            totals["total_charge_fee"] += session.charge_fee
+            totals["total_service_fee"] += session.service_fee
+            totals["total_fee"] += session.total_fee
+            totals["total_kwh"] += session.charged_kwh
+            billable.append((session, user_id, bill_date))
+        if not billable:
+            return {}
+
+        # 2. 锁定已有的日账单，其余的是本次新建的(用于月度汇总的账单天数)
+        key_filter = or_(*[
+            and_(BillMaster.user_id == user_id, BillMaster.bill_date == bill_date)
+            for user_id, bill_date in daily
+        ])
+        existing = {
+            (row.user_id, row.bill_date)
+            for row in db.query(BillMaster.user_id, BillMaster.bill_date).filter(key_filter).with_for_update().all()
+        }
+        _upsert(
+            db, BillMaster.__table__,
+            [{"user_id": user_id, "bill_date": bill_date, **totals} for (user_id, bill_date), totals in daily.items()],
+            ("user_id", "bill_date"), AMOUNT_COLUMNS
+        )
+        bill_ids = {
+            (row.user_id, row.bill_date): row.id
+            for row in db.query(BillMaster.id, BillMaster.user_id, BillMaster.bill_date).filter(key_filter).all()
+        }
+
+        # 3. 插入详单
+        details: Dict[int, BillDetail] = {}
+        for session, user_id, bill_date in billable:
+            details[session.id] = BillDetail(
+                bill_id=bill_ids[(user_id, bill_date)],
+                session_id=session.id,
+                detail_number=detail_number_of(bill_date, session.id),
+                pile_code=pile_codes[session.pile_id],
+                charged_kwh=session.charged_kwh,
+                charging_time=session.charging_time,
+                start_time=session.start_time,
+                end_time=session.end_time,
+                charge_fee=session.charge_fee,
+                service_fee=session.service_fee,
+                total_fee=session.total_fee
+            )
+        db.add_all(details.values())
+
+        # 4. 累加月度汇总
+        monthly: Dict[Tuple[str, date], Dict[str, float]] = defaultdict(
+            lambda: {"bill_count": 0, **dict.fromkeys(AMOUNT_COLUMNS, 0.0)}
+        )
+        for (user_id, bill_date), totals in daily.items():
+            summary = monthly[(user_id, bill_date.replace(day=1))]
+            if (user_id, bill_date) not in existing:
+                summary["bill_count"] += 1
+            for name in AMOUNT_COLUMNS:
+                summary[name] += totals[name]
+        _upsert(
+            db, BillMonthlySummary.__table__,
+            [{"user_id": user_id, "bill_month": bill_month, **totals} for (user_id, bill_month), totals in monthly.items()],
+            ("user_id", "bill_month"), ("bill_count",) + AMOUNT_COLUMNS
+        )
+        db.flush()
+        return details
+
+def run_billing_sweep():
+    """定时补扫任务入口，使用独立的数据库会话"""
+    db = SessionLocal()
+    try:
+        billing_pipeline.flush(db)
+        billing_pipeline.sweep(db)
+    except Exception as e:
+        logger.error(f"账单补扫失败: {e}", exc_info=True)
+    finally:
+        db.close()
+
+# 创建账单过账管道实例
+billing_pipeline = BillingPipeline()
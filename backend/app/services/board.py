@@ -0,0 +1,174 @@
+"""
+管理员看板推送
+看板是所有充电站充电桩和等候区状态的扁平快照 {键: 值}，例如
+"pile.A.status"、"pile.A.queue"、"pile.A.charged_kwh"、"waiting.default.FAST"。
+订阅者先收到一次完整快照，之后每个节拍只收到与上一次快照的差异(增量)，
+每条消息带递增的序号，客户端发现序号不连续时请求重新同步(resync)即可拿到完整快照。
+
+看板由每个进程根据数据库各自计算，只发送给本进程持有的连接，序号在进程内递增
+"""
+from typing import Any, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import asyncio
+import logging
+
+from fastapi import WebSocket
+from sqlalchemy import func
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import CarRequest, ChargePile
+from backend.app.db.schemas import RequestStatus
+from backend.app.services.charge_curve import charged_energy
+from backend.app.core.config import get_station_config
+from backend.app.core.serialization import dumps_text
+from backend.app.services.send_backlog import send_backlog
+
+logger = logging.getLogger(__name__)
+
+BOARD_TOPIC = "admin:board"
+
+def diff_snapshot(old: Dict[str, Any], new: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """返回 (新增或变化的键值, 删除的键)"""
+    changed = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    removed = [key for key in old if key not in new]
+    return changed, removed
+
+def apply_delta(snapshot: Dict[str, Any], changed: Dict[str, Any], removed: List[str]) -> Dict[str, Any]:
+    """把增量应用到快照上(客户端逻辑，供测试和脚本使用)"""
+    result = dict(snapshot)
+    result.update(changed)
+    for key in removed:
+        result.pop(key, None)
+    return result
+
+def compute_board(db, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """从数据库计算看板快照"""
+    now = now or datetime.now()
+    board: Dict[str, Any] = {}
+    piles = {pile.id: pile for pile in db.query(ChargePile).all()}
+    for pile in piles.values():
+        prefix = f"pile.{pile.code}"
+        board[f"{prefix}.station"] = pile.station_id
+        board[f"{prefix}.status"] = pile.status
+        board[f"{prefix}.queue"] = []
+
+    active = (
+        db.query(CarRequest)
+        .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+        .order_by(CarRequest.pile_id, CarRequest.queue_position)
+        .all()
+    )
+    for request in active:
+        pile = piles.get(request.pile_id)
+        if pile is None:
+            continue
+        prefix = f"pile.{pile.code}"
+        board[f"{prefix}.queue"].append(request.queue_number)
+        if request.status == RequestStatus.CHARGING and request.start_time:
+            minutes = (now - request.start_time).total_seconds() / 60
+            # 取一位小数，充电量变化不足 0.1 kWh 时不产生增量
+            board[f"{prefix}.charged_kwh"] = round(charged_energy(pile, request, minutes), 1)
+            board[f"{prefix}.amount_kwh"] = request.amount_kwh
+
+    waiting = (
+        db.query(CarRequest.station_id, CarRequest.mode, func.count(CarRequest.id))
+        .filter(CarRequest.status == RequestStatus.WAITING)
+        .group_by(CarRequest.station_id, CarRequest.mode)
+        .all()
+    )
+    for station_id in {pile.station_id for pile in piles.values()}:
+        board[f"waiting.{station_id}.FAST"] = 0
+        board[f"waiting.{station_id}.SLOW"] = 0
+    for station_id, mode, count in waiting:
+        board[f"waiting.{station_id}.{getattr(mode, 'value', mode)}"] = count
+    return board
+
+class BoardPublisher:
+    """
+    看板推送器
+    有订阅者时按固定节拍计算快照并发送增量，调度执行器每执行完一批命令会提前唤醒一次；
+    没有订阅者时自动停止
+    """
+
+    def __init__(self):
+        self.subscribers: Set[WebSocket] = set()
+        self.snapshot: Dict[str, Any] = {}
+        self.seq = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def subscribe(self, websocket: WebSocket):
+        """订阅看板：立即发送完整快照"""
+        if not self.snapshot:
+            await self._refresh()
+        self.subscribers.add(websocket)
+        self._ensure_running()
+        await self.send_snapshot(websocket)
+
+    def unsubscribe(self, websocket: WebSocket):
+        self.subscribers.discard(websocket)
+
+    async def send_snapshot(self, websocket: WebSocket):
+        """发送完整快照(订阅时或客户端请求重新同步时)"""
+        await send_backlog.send(websocket, dumps_text(
+            {"type": "board_snapshot", "topic": BOARD_TOPIC, "seq": self.seq, "data": self.snapshot}
+        ))
+
+    def poke(self):
+        """提前触发一次计算(必须在事件循环线程中调用)"""
+        if self._wakeup is not None and self.subscribers:
+            self._wakeup.set()
+
+    def _ensure_running(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self.subscribers:
+            try:
+                await self._refresh()
+            except Exception as e:
+                logger.error(f"计算看板失败: {e}", exc_info=True)
+
+            interval = get_station_config().get("BoardUpdateInterval", 2)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+        # 没有订阅者时丢弃快照，下次订阅时重新计算
+        self.snapshot = {}
+
+    async def _refresh(self):
+        """计算新快照，有变化时向订阅者发送增量"""
+        loop = asyncio.get_running_loop()
+        board = await loop.run_in_executor(None, self._compute)
+        changed, removed = diff_snapshot(self.snapshot, board)
+        self.snapshot = board
+        if not changed and not removed:
+            return
+        self.seq += 1
+        # 增量只序列化一次，发送给所有订阅者
+        text = dumps_text(
+            {"type": "board_delta", "topic": BOARD_TOPIC, "seq": self.seq, "set": changed, "unset": removed}
+        )
+        size = len(text.encode("utf-8"))
+        for websocket in list(self.subscribers):
+            try:
+                await send_backlog.send(websocket, text, size)
+            except Exception as e:
+                logger.error(f"发送看板增量失败: {e}")
+                self.subscribers.discard(websocket)
+
+    @staticmethod
+    def _compute() -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            return compute_board(db)
+        finally:
+            db.close()
+
+# 创建看板推送器实例
+board_publisher = BoardPublisher()
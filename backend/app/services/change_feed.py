@@ -0,0 +1,150 @@
+"""
+队列状态变更推送
+调度执行器每批命令使用的数据库会话上挂一个变更记录器，记录本批命令中已提交的
+充电请求(状态、所在充电桩、队列位置)和充电桩状态变化，批次结束后统一推送：
+
+- 充电请求变化: 发给请求所属用户、管理员，以及订阅了 request:<请求ID> 的连接
+- 充电桩状态或队列变化: 广播，并发给订阅了 pile:<桩编号> 的连接
+- 等候区变化(请求进入或离开等候区): 广播，并发给订阅了 mode:<FAST|SLOW> 的连接
+
+只记录已提交事务中的变化，回滚的修改不会推送。按 ORM 属性历史判断变化，
+批量 UPDATE 语句(如队内车辆位置前移)不单独推送，由所在充电桩的队列变化通知覆盖
+"""
+from typing import Any, Dict, Optional, Set, Tuple
+import asyncio
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from backend.app.db.models import CarRequest, ChargePile
+from backend.app.db.schemas import RequestStatus
+from backend.app.services.websocket import (
+    notify_charge_status_change, notify_pile_status_change, notify_queue_update
+)
+
+logger = logging.getLogger(__name__)
+
+# 影响请求推送的属性
+REQUEST_FIELDS = ("status", "pile_id", "queue_position", "mode")
+
+def _value(value: Any) -> Any:
+    return getattr(value, "value", value)
+
+class ChangeSet:
+    """一批命令中已提交的变化"""
+
+    def __init__(self):
+        # {请求ID: 请求的最新状态}
+        self.requests: Dict[int, Dict[str, Any]] = {}
+        # 状态或队列发生变化的充电桩ID
+        self.pile_ids: Set[int] = set()
+        # 等候区发生变化的 (充电站ID, 模式)
+        self.waiting: Set[Tuple[str, str]] = set()
+        # {充电桩ID: 充电桩信息}，批次结束时查询
+        self.piles: Dict[int, Dict[str, Any]] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.requests or self.pile_ids or self.waiting)
+
+    def merge(self, other: "ChangeSet"):
+        self.requests.update(other.requests)
+        self.pile_ids |= other.pile_ids
+        self.waiting |= other.waiting
+
+class ChangeTracker:
+    """挂在数据库会话上，记录已提交事务中的充电请求和充电桩变化"""
+
+    def __init__(self, db: Session):
+        self.committed = ChangeSet()
+        self._pending = ChangeSet()
+        event.listen(db, "after_flush", self._after_flush)
+        event.listen(db, "after_commit", self._after_commit)
+        event.listen(db, "after_rollback", self._after_rollback)
+
+    def _after_flush(self, db: Session, flush_context):
+        for obj in list(db.new) + list(db.dirty):
+            if isinstance(obj, CarRequest):
+                self._track_request(obj, obj in db.new)
+            elif isinstance(obj, ChargePile) and inspect(obj).attrs.status.history.has_changes():
+                self._pending.pile_ids.add(obj.id)
+
+    def _track_request(self, request: CarRequest, created: bool):
+        attrs = inspect(request).attrs
+        if not created and not any(attrs[name].history.has_changes() for name in REQUEST_FIELDS):
+            return
+        self._pending.requests[request.id] = {
+            "user_id": request.user_id,
+            "station_id": request.station_id,
+            "status": _value(request.status),
+            "mode": _value(request.mode),
+            "queue_number": request.queue_number,
+            "pile_id": request.pile_id,
+            "queue_position": request.queue_position,
+        }
+        # 离开的旧充电桩和进入的新充电桩的队列都发生了变化
+        for pile_id in [request.pile_id, *attrs.pile_id.history.deleted]:
+            if pile_id is not None:
+                self._pending.pile_ids.add(pile_id)
+        statuses = [_value(status) for status in [request.status, *attrs.status.history.deleted]]
+        modes = {_value(mode) for mode in [request.mode, *attrs.mode.history.deleted]}
+        if RequestStatus.WAITING.value in statuses:
+            for mode in modes:
+                self._pending.waiting.add((request.station_id, mode))
+
+    def _after_commit(self, db: Session):
+        self.committed.merge(self._pending)
+        self._pending = ChangeSet()
+
+    def _after_rollback(self, db: Session):
+        self._pending = ChangeSet()
+
+    def collect(self, db: Session) -> ChangeSet:
+        """取出已提交的变化，并查询涉及的充电桩编号和状态(在会话关闭前调用)"""
+        changes, self.committed = self.committed, ChangeSet()
+        pile_ids = changes.pile_ids | {
+            request["pile_id"] for request in changes.requests.values() if request["pile_id"] is not None
+        }
+        if pile_ids:
+            rows = (
+                db.query(ChargePile.id, ChargePile.code, ChargePile.status, ChargePile.station_id)
+                .filter(ChargePile.id.in_(pile_ids))
+                .all()
+            )
+            changes.piles = {
+                row.id: {"code": row.code, "status": _value(row.status), "station_id": row.station_id}
+                for row in rows
+            }
+        return changes
+
+async def publish_changes(changes: ChangeSet):
+    """推送一批命令的变化(在事件循环中执行)"""
+    try:
+        for request_id, request in changes.requests.items():
+            pile = changes.piles.get(request["pile_id"])
+            data = dict(request, pile_code=pile["code"] if pile else None)
+            await notify_charge_status_change(request["user_id"], request_id, request["status"], data)
+        for pile_id in changes.pile_ids:
+            pile = changes.piles.get(pile_id)
+            if pile is None:
+                continue
+            await notify_pile_status_change(pile_id, pile["status"], {"station_id": pile["station_id"]}, pile["code"])
+        for station_id, mode in changes.waiting:
+            await notify_queue_update(mode, {"station_id": station_id})
+    except Exception as e:
+        logger.error(f"推送队列状态变化失败: {e}", exc_info=True)
+
+def schedule_publish(changes: ChangeSet, loop: Optional[asyncio.AbstractEventLoop] = None):
+    """
+    从任意线程安排推送：指定事件循环时线程安全地提交，
+    否则在当前线程正在运行的事件循环中创建任务，没有事件循环(脚本)时不推送
+    """
+    if not changes:
+        return
+    if loop is not None:
+        asyncio.run_coroutine_threadsafe(publish_changes(changes), loop)
+        return
+    try:
+        asyncio.get_running_loop().create_task(publish_changes(changes))
+    except RuntimeError:
+        pass
@@ -0,0 +1,182 @@
+"""
+充电功率曲线
+充电功率随电池荷电状态(SOC)变化：接近充满时功率逐渐下降。
+曲线以若干 (SOC, 功率比例) 折点描述，折点之间线性插值，功率比例为实际功率与充电桩额定功率之比。
+
+以额定功率 P(kWh/h)、电池容量 C(kWh)充电时 dSOC/dt = P·f(SOC)/C，
+从 SOC a 充到 b 所需时间为 C/P · ∫[a,b] dSOC/f(SOC) 小时。
+各折点处的积分值 I(s) = ∫[0,s] dSOC/f(SOC) 在构造曲线时预先计算，
+任意区间的充电时间和"充电 t 分钟后的充电量"都只需在所在线段内用解析式求解。
+
+请求中没有车辆当前 SOC，约定充电请求总是把电池充到满：
+起始 SOC = 1 - 充电量/电池容量。电池容量缺失时退化为恒定功率模型
+"""
+from typing import Dict, Optional, Sequence, Tuple
+import bisect
+import math
+import threading
+import logging
+
+from backend.app.core.config import get_station_config
+
+logger = logging.getLogger(__name__)
+
+class ChargeCurve:
+    """分段线性的充电功率曲线"""
+
+    def __init__(self, points: Sequence[Sequence[float]]):
+        points = sorted((float(soc), float(ratio)) for soc, ratio in points)
+        if len(points) < 2 or points[0][0] != 0.0 or points[-1][0] != 1.0:
+            raise ValueError("充电曲线折点必须覆盖 SOC 0 到 1")
+        if any(ratio <= 0 for _, ratio in points):
+            raise ValueError("充电曲线的功率比例必须大于0")
+        self.points: Tuple[Tuple[float, float], ...] = tuple(points)
+        self.socs = [soc for soc, _ in points]
+        self.is_constant = all(ratio == 1.0 for _, ratio in points)
+        # integrals[i] = I(socs[i])
+        self.integrals = [0.0]
+        for (s0, r0), (s1, r1) in zip(points, points[1:]):
+            self.integrals.append(self.integrals[-1] + self._segment_integral(s0, r0, s1, r1, s1))
+
+    @staticmethod
+    def _segment_integral(s0: float, r0: float, s1: float, r1: float, s: float) -> float:
+        """线段 [s0, s1] 内 ∫[s0,s] dSOC/f(SOC)"""
+        if s1 <= s0:
+            return 0.0
+        slope = (r1 - r0) / (s1 - s0)
+        if abs(slope) < 1e-12:
+            return (s - s0) / r0
+        return math.log((r0 + slope * (s - s0)) / r0) / slope
+
+    def _segment(self, soc: float) -> int:
+        return min(max(bisect.bisect_right(self.socs, soc) - 1, 0), len(self.points) - 2)
+
+    def integral(self, soc: float) -> float:
+        """I(soc)"""
+        soc = min(max(soc, 0.0), 1.0)
+        i = self._segment(soc)
+        (s0, r0), (s1, r1) = self.points[i], self.points[i + 1]
+        return self.integrals[i] + self._segment_integral(s0, r0, s1, r1, soc)
+
+    def soc_at(self, value: float) -> float:
+        """I 的反函数：积分值为 value 时的 SOC"""
+        if value <= 0:
+            return 0.0
+        if value >= self.integrals[-1]:
+            return 1.0
+        i = min(bisect.bisect_right(self.integrals, value) - 1, len(self.points) - 2)
+        (s0, r0), (s1, r1) = self.points[i], self.points[i + 1]
+        rest = value - self.integrals[i]
+        slope = (r1 - r0) / (s1 - s0)
+        if abs(slope) < 1e-12:
+            return min(s0 + r0 * rest, s1)
+        return min(s0 + r0 * (math.exp(slope * rest) - 1) / slope, s1)
+
+    def _bounds(self, amount_kwh: float, battery_capacity: Optional[float]) -> Tuple[float, float]:
+        """返回 (起始 SOC, 计算用的电池容量)"""
+        capacity = max(battery_capacity or 0.0, amount_kwh)
+        return 1.0 - amount_kwh / capacity, capacity
+
+    def effective_kwh(self, amount_kwh: float, battery_capacity: Optional[float]) -> float:
+        """
+        等效电量：以额定功率恒定充电时，与按曲线充入 amount_kwh 耗时相同的电量。
+        充电时长 = 等效电量 / 额定功率，恒定功率曲线下等于 amount_kwh
+        """
+        if amount_kwh <= 0:
+            return 0.0
+        if self.is_constant or not battery_capacity:
+            return amount_kwh
+        start_soc, capacity = self._bounds(amount_kwh, battery_capacity)
+        return capacity * (self.integrals[-1] - self.integral(start_soc))
+
+    def charge_minutes(self, amount_kwh: float, power: float, battery_capacity: Optional[float]) -> float:
+        """按曲线充入 amount_kwh 所需时间(分钟)"""
+        if power <= 0:
+            return float('inf')
+        return self.effective_kwh(amount_kwh, battery_capacity) / power * 60
+
+    def energy_after(
+        self,
+        minutes: float,
+        power: float,
+        amount_kwh: float,
+        battery_capacity: Optional[float]
+    ) -> float:
+        """开始充电 minutes 分钟后已充入的电量，不超过 amount_kwh"""
+        if minutes <= 0 or power <= 0 or amount_kwh <= 0:
+            return 0.0
+        if self.is_constant or not battery_capacity:
+            return min(power * minutes / 60, amount_kwh)
+        start_soc, capacity = self._bounds(amount_kwh, battery_capacity)
+        value = self.integral(start_soc) + power * minutes / 60 / capacity
+        if value >= self.integrals[-1]:
+            return amount_kwh
+        reached = self.soc_at(value)
+        return min(max(reached - start_soc, 0.0) * capacity, amount_kwh)
+
+    def remaining_minutes(
+        self,
+        charged_kwh: float,
+        power: float,
+        amount_kwh: float,
+        battery_capacity: Optional[float]
+    ) -> float:
+        """已充入 charged_kwh 后充满 amount_kwh 还需的时间(分钟)"""
+        if power <= 0:
+            return float('inf')
+        charged_kwh = min(max(charged_kwh, 0.0), amount_kwh)
+        if self.is_constant or not battery_capacity:
+            return (amount_kwh - charged_kwh) / power * 60
+        start_soc, capacity = self._bounds(amount_kwh, battery_capacity)
+        reached = min(start_soc + charged_kwh / capacity, 1.0)
+        return capacity * (self.integrals[-1] - self.integral(reached)) / power * 60
+
+# 恒定功率曲线：原有的 功率 × 时间 模型
+CONSTANT_CURVE = ChargeCurve([(0.0, 1.0), (1.0, 1.0)])
+
+_curves: Dict[Tuple[Tuple[float, float], ...], ChargeCurve] = {}
+_lock = threading.Lock()
+
+def _build(points) -> ChargeCurve:
+    key = tuple((float(soc), float(ratio)) for soc, ratio in points)
+    with _lock:
+        curve = _curves.get(key)
+        if curve is None:
+            try:
+                curve = ChargeCurve(key)
+            except (ValueError, TypeError) as e:
+                logger.error(f"充电曲线配置无效，使用恒定功率: {points}: {e}")
+                curve = CONSTANT_CURVE
+            _curves[key] = curve
+        return curve
+
+def curve_for(pile_type, pile_code: Optional[str] = None) -> ChargeCurve:
+    """
+    充电桩适用的功率曲线
+    配置 ChargeCurve 中先按充电桩编号查找，再按类型(FAST/SLOW)查找，都没有时为恒定功率
+    """
+    curves = get_station_config().get("ChargeCurve") or {}
+    points = curves.get(pile_code) if pile_code else None
+    if points is None:
+        points = curves.get(getattr(pile_type, "value", pile_type))
+    if not points:
+        return CONSTANT_CURVE
+    return _build(points)
+
+def pile_curve(pile) -> ChargeCurve:
+    return curve_for(pile.type, pile.code)
+
+def effective_amount(car) -> float:
+    """
+    车辆请求的等效电量，供调度算法使用(各算法按 电量/功率 计算充电时长)
+    使用车辆请求模式对应的曲线
+    """
+    return curve_for(car.mode).effective_kwh(car.amount_kwh, car.battery_capacity)
+
+def charged_energy(pile, request, minutes: float) -> float:
+    """车辆在充电桩上充电 minutes 分钟后已充入的电量"""
+    return pile_curve(pile).energy_after(minutes, pile.power, request.amount_kwh, request.battery_capacity)
+
+def minutes_to_full(pile, request, charged_kwh: float) -> float:
+    """已充入 charged_kwh 后充满请求电量还需的时间(分钟)"""
+    return pile_curve(pile).remaining_minutes(charged_kwh, pile.power, request.amount_kwh, request.battery_capacity)
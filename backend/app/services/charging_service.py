@@ -3,10 +3,12 @@ from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 import logging
 
-from backend.app.db.models import ChargePile, CarRequest, ChargeSession, BillDetail, BillMaster
+from backend.app.db.models import ChargePile, CarRequest, ChargeSession, BillDetail
 from backend.app.db.schemas import RequestStatus, ChargeMode
 from backend.app.services.scheduler import ChargingScheduler
 from backend.app.services.billing import BillingService
+from backend.app.services.billing_pipeline import billing_pipeline
+from backend.app.services.charge_curve import charged_energy, minutes_to_full, pile_curve
 from backend.app.core.config import get_station_config
 
 logger = logging.getLogger(__name__)
@@ -76,7 +78,7 @@ class ChargingService:
     def finish_charge_session(db: Session, session_id: int, charged_kwh: float, charging_time: int) -> Tuple[bool, str, Optional[BillDetail]]:
         """
         完成充电会话
-        在充电结束时调用，计算费用并生成账单
+        在充电结束时调用，计算费用并登记过账；详单由账单过账管道稍后生成，返回的详单为 None
         """
         # 查询充电会话
         session = db.query(ChargeSession).filter(ChargeSession.id == session_id).first()
@@ -124,98 +126,35 @@ class ChargingService:
         if not success:
             return False, message, None
             
-        # 生成账单
-        bill_detail = ChargingService.generate_bill(db, session)
-        if not bill_detail:
-            return False, "生成账单失败", None
-            
         db.commit()
+        
+        # 登记到账单过账管道，详单在本批调度命令结束后生成
+        billing_pipeline.enqueue(session.id)
         logger.info(f"完成充电会话: 会话ID={session_id}, 充电量={charged_kwh}kWh, 充电时间={charging_time}分钟, 费用={total_fee}元")
-        return True, "成功完成充电会话", bill_detail
+        return True, "成功完成充电会话", None
     
     @staticmethod
     def generate_bill(db: Session, session: ChargeSession) -> Optional[BillDetail]:
         """
         生成账单和详单
+        与 BillingService.generate_bill_detail 相同，都经由账单过账管道
         """
-        try:
-            # 查询充电请求
-            request = db.query(CarRequest).filter(CarRequest.id == session.request_id).first()
-            if not request:
-                logger.error(f"生成账单失败: 充电请求不存在, 会话ID={session.id}")
-                return None
-                
-            # 查询充电桩
-            pile = db.query(ChargePile).filter(ChargePile.id == session.pile_id).first()
-            if not pile:
-                logger.error(f"生成账单失败: 充电桩不存在, 会话ID={session.id}")
-                return None
-                
-            # 生成详单编号 (格式: 日期+会话ID, 如: 20230601-123)
-            detail_number = f"{datetime.now().strftime('%Y%m%d')}-{session.id}"
-            
-            # 查询或创建当日账单
-            bill_date = datetime.now().date()
-            bill = db.query(BillMaster).filter(
-                BillMaster.user_id == request.user_id,
-                BillMaster.bill_date == bill_date
-            ).first()
-            
-            if not bill:
-                # 创建新账单
-                bill = BillMaster(
-                    user_id=request.user_id,
-                    bill_date=bill_date,
-                    total_charge_fee=session.charge_fee,
-                    total_service_fee=session.service_fee,
-                    total_fee=session.total_fee,
-                    total_kwh=session.charged_kwh
-                )
-                db.add(bill)
-                db.flush()  # 获取ID但不提交事务
-            else:
-                # 更新账单总额
-                bill.total_charge_fee += session.charge_fee
-                bill.total_service_fee += session.service_fee
-                bill.total_fee += session.total_fee
-                bill.total_kwh += session.charged_kwh
-            
-            # 创建详单
-            bill_detail = BillDetail(
-                bill_id=bill.id,
-                session_id=session.id,
-                detail_number=detail_number,
-                pile_code=pile.code,
-                charged_kwh=session.charged_kwh,
-                charging_time=session.charging_time,
-                start_time=session.start_time,
-                end_time=session.end_time,
-                charge_fee=session.charge_fee,
-                service_fee=session.service_fee,
-                total_fee=session.total_fee
-            )
-            db.add(bill_detail)
-            
-            return bill_detail
-        except Exception as e:
-            logger.error(f"生成账单异常: {str(e)}")
-            return None
+        return BillingService.generate_bill_detail(db, session.id)
     
     @staticmethod
-    def get_charging_status(db: Session, request_id: int) -> Dict:
+    def _build_charging_status(
+        db: Session,
+        request: CarRequest,
+        pile: Optional[ChargePile] = None,
+        session: Optional[ChargeSession] = None,
+        bill_detail: Optional[BillDetail] = None,
+        rate_rules: Optional[List] = None,
+        service_rate: Optional[float] = None
+    ) -> Dict:
         """
-        获取充电状态
-        返回充电进度、已充电量、已充电时间等信息
+        根据已查询到的请求、充电桩、会话和详单组装充电状态
+        单个查询与批量查询共用这一逻辑，保证返回结构一致
         """
-        logger = logging.getLogger(__name__)
-        logger.info(f"获取充电状态: 请求ID={request_id}")
-        
-        # 查询充电请求
-        request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
-        if not request:
-            logger.warning(f"充电请求不存在: ID={request_id}")
-            return {"error": "充电请求不存在", "status": "ERROR"}
-            
         # 基本信息
         result = {
             "request_id": request.id,
@@ -233,9 +172,6 @@ class ChargingService:
         
         # 如果正在充电，计算充电进度
         if request.status == RequestStatus.CHARGING and request.start_time:
-            logger.info(f"处理充电中请求: ID={request_id}")
-            # 查询充电桩
-            pile = db.query(ChargePile).filter(ChargePile.id == request.pile_id).first()
             if pile:
                 result["pile_code"] = pile.code
                 result["pile_power"] = pile.power
@@ -244,10 +180,9 @@ class ChargingService:
                 charging_minutes = (datetime.now() - request.start_time).total_seconds() / 60
                 result["charging_minutes"] = charging_minutes
                 
-                # 估算已充电量
-                power_per_minute = pile.power / 60  # 每分钟充电量
-                charged_kwh = power_per_minute * charging_minutes
-                result["charged_kwh"] = min(charged_kwh, request.amount_kwh)
+                # 按功率曲线估算已充电量
+                charged_kwh = charged_energy(pile, request, charging_minutes)
+                result["charged_kwh"] = charged_kwh
                 
                 # 充电进度
                 progress = min(charged_kwh / request.amount_kwh * 100, 100) if request.amount_kwh > 0 else 0
@@ -258,19 +193,20 @@ class ChargingService:
                 if charged_kwh < request.amount_kwh:
                     remaining_kwh = request.amount_kwh - charged_kwh
                     result["remaining_kwh"] = remaining_kwh
-                    remaining_minutes = remaining_kwh / power_per_minute if power_per_minute > 0 else 0
+                    remaining_minutes = minutes_to_full(pile, request, charged_kwh)
                     result["estimated_remaining_minutes"] = remaining_minutes
                     result["estimated_end_time"] = datetime.now() + timedelta(minutes=remaining_minutes)
                     
                     # 预估费用
                     try:
                         # 简化的费用估算，仅作显示用
-                        from backend.app.services.billing import BillingService
                         charge_fee, service_fee, total_fee = BillingService.calculate_charging_cost(
                             db,
                             request.start_time,
                             datetime.now() + timedelta(minutes=remaining_minutes),
-                            request.amount_kwh
+                            request.amount_kwh,
+                            rate_rules=rate_rules,
+                            service_rate=service_rate
                         )
                         result["estimated_fee"] = total_fee
                     except Exception as e:
@@ -281,13 +217,10 @@ class ChargingService:
                     result["estimated_remaining_minutes"] = 0
                     result["estimated_end_time"] = datetime.now()
             else:
-                logger.warning(f"充电桩不存在: 请求ID={request_id}, 充电桩ID={request.pile_id}")
+                logger.warning(f"充电桩不存在: 请求ID={request.id}, 充电桩ID={request.pile_id}")
         
         # 如果已完成，返回充电会话信息
         elif request.status == RequestStatus.FINISHED:
-            logger.info(f"处理已完成请求: ID={request_id}")
-            # 查询充电会话
-            session = db.query(ChargeSession).filter(ChargeSession.request_id == request.id).first()
             if session:
                 result["session_id"] = session.id
                 result["charged_kwh"] = session.charged_kwh
@@ -303,18 +236,13 @@ class ChargingService:
                 result["estimated_remaining_minutes"] = 0
                 result["estimated_fee"] = session.total_fee
                 
-                # 查询详单
-                bill_detail = db.query(BillDetail).filter(BillDetail.session_id == session.id).first()
                 if bill_detail:
                     result["detail_number"] = bill_detail.detail_number
                     result["bill_id"] = bill_detail.bill_id
             else:
-                logger.warning(f"充电会话不存在: 请求ID={request_id}")
+                logger.warning(f"充电会话不存在: 请求ID={request.id}")
         # 处理已取消但曾经充电过的请求
         elif request.status == RequestStatus.CANCELED and request.start_time:
-            logger.info(f"处理已取消但曾经充电过的请求: ID={request_id}")
-            # 查询充电会话
-            session = db.query(ChargeSession).filter(ChargeSession.request_id == request.id).first()
             if session:
                 result["session_id"] = session.id
                 result["charged_kwh"] = session.charged_kwh
@@ -330,31 +258,131 @@ class ChargingService:
                 result["progress"] = progress
                 result["charging_progress"] = progress
                 
-                # 查询详单
-                bill_detail = db.query(BillDetail).filter(BillDetail.session_id == session.id).first()
                 if bill_detail:
                     result["detail_number"] = bill_detail.detail_number
                     result["bill_id"] = bill_detail.bill_id
-                else:
-                    # 如果没有找到详单，尝试生成一个
-                    logger.info(f"尝试为已取消的充电会话 {session.id} 生成账单")
-                    bill_detail = ChargingService.generate_bill(db, session)
-                    if bill_detail:
-                        db.commit()
-                        result["detail_number"] = bill_detail.detail_number
-                        result["bill_id"] = bill_detail.bill_id
             else:
-                logger.warning(f"充电会话不存在: 请求ID={request_id}")
-        elif request.status in [RequestStatus.WAITING, RequestStatus.QUEUING]:
-            logger.info(f"处理等待/排队中请求: ID={request_id}, 状态={request.status}")
-            # 对于等待或排队中的请求，保持默认值
-            pass
+                logger.warning(f"充电会话不存在: 请求ID={request.id}")
+        
+        return result
+    
+    @staticmethod
+    def get_charging_status(db: Session, request_id: int) -> Dict:
+        """
+        获取充电状态
+        返回充电进度、已充电量、已充电时间等信息
+        """
+        logger.info(f"获取充电状态: 请求ID={request_id}")
+        
+        # 查询充电请求
+        request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
+        if not request:
+            logger.warning(f"充电请求不存在: ID={request_id}")
+            return {"error": "充电请求不存在", "status": "ERROR"}
+        
+        pile = None
+        session = None
+        bill_detail = None
+        
+        if request.status == RequestStatus.CHARGING and request.start_time:
+            logger.info(f"处理充电中请求: ID={request_id}")
+            # 查询充电桩
+            pile = db.query(ChargePile).filter(ChargePile.id == request.pile_id).first()
+        elif request.status == RequestStatus.FINISHED or (
+            request.status == RequestStatus.CANCELED and request.start_time
+        ):
+            logger.info(f"处理已结束请求: ID={request_id}, 状态={request.status}")
+            # 查询充电会话及详单
+            session = db.query(ChargeSession).filter(ChargeSession.request_id == request.id).first()
+            if session:
+                # 只读：详单由账单过账管道生成，尚未过账时不返回详单
+                bill_detail = db.query(BillDetail).filter(BillDetail.session_id == session.id).first()
         else:
             logger.info(f"处理其他状态请求: ID={request_id}, 状态={request.status}")
         
+        result = ChargingService._build_charging_status(db, request, pile, session, bill_detail)
+        
         logger.debug(f"最终状态结果: {result}")
         return result
     
+    @staticmethod
+    def get_charging_status_batch(db: Session, request_ids: List[int], user_id: Optional[str] = None) -> Dict[int, Dict]:
+        """
+        批量获取充电状态
+        无论请求数量多少，都只执行固定次数的查询（请求、充电桩、会话、详单、费率），
+        每个请求返回与 get_charging_status 相同的结构
+        如果提供了 user_id，则只返回该用户名下的请求
+        """
+        ids = list(dict.fromkeys(request_ids))
+        if not ids:
+            return {}
+        
+        # 1. 批量查询充电请求
+        query = db.query(CarRequest).filter(CarRequest.id.in_(ids))
+        if user_id is not None:
+            query = query.filter(CarRequest.user_id == user_id)
+        requests = query.all()
+        
+        # 2. 批量查询充电中请求对应的充电桩
+        pile_ids = {
+            r.pile_id for r in requests
+            if r.status == RequestStatus.CHARGING and r.start_time and r.pile_id
+        }
+        piles = {}
+        if pile_ids:
+            piles = {p.id: p for p in db.query(ChargePile).filter(ChargePile.id.in_(pile_ids)).all()}
+        
+        # 3. 批量查询已结束请求的充电会话
+        ended_ids = [
+            r.id for r in requests
+            if r.status == RequestStatus.FINISHED or (r.status == RequestStatus.CANCELED and r.start_time)
+        ]
+        sessions = {}
+        if ended_ids:
+            for session in (
+                db.query(ChargeSession)
+                .filter(ChargeSession.request_id.in_(ended_ids))
+                .order_by(ChargeSession.id)
+                .all()
+            ):
+                # 与单个查询一致，取每个请求的第一个会话
+                sessions.setdefault(session.request_id, session)
+        
+        # 4. 批量查询会话对应的详单
+        bill_details = {}
+        if sessions:
+            session_ids = [s.id for s in sessions.values()]
+            for detail in (
+                db.query(BillDetail)
+                .filter(BillDetail.session_id.in_(session_ids))
+                .order_by(BillDetail.id)
+                .all()
+            ):
+                bill_details.setdefault(detail.session_id, detail)
+        
+        # 5. 费率只加载一次，在内存中估算费用
+        rate_rules = None
+        service_rate = None
+        if piles:
+            rate_rules = BillingService.load_rate_rules(db)
+            service_rate = BillingService.get_current_service_rate(db)
+        
+        result = {}
+        for request in requests:
+            session = sessions.get(request.id)
+            result[request.id] = ChargingService._build_charging_status(
+                db,
+                request,
+                pile=piles.get(request.pile_id),
+                session=session,
+                bill_detail=bill_details.get(session.id) if session else None,
+                rate_rules=rate_rules,
+                service_rate=service_rate
+            )
+        
+        logger.info(f"批量获取充电状态: 请求数={len(ids)}, 命中数={len(result)}")
+        return result
+    
     @staticmethod
     def simulate_charging_progress(db: Session, request_id: int, progress_percent: float) -> Tuple[bool, str]:
         """
@@ -385,9 +413,12 @@ class ChargingService:
         progress = min(max(progress_percent, 0), 100) / 100
         charged_kwh = request.amount_kwh * progress
         
-        # 计算充电时间(分钟)
-        charging_time_hours = charged_kwh / pile.power
-        charging_time = int(charging_time_hours * 60)
+        # 按功率曲线计算充入该电量所需的时间(分钟)
+        curve = pile_curve(pile)
+        charging_time = int(
+            curve.charge_minutes(request.amount_kwh, pile.power, request.battery_capacity)
+            - curve.remaining_minutes(charged_kwh, pile.power, request.amount_kwh, request.battery_capacity)
+        )
         
         # 更新充电会话
         success, message = ChargingService.update_charge_session(db, session.id, charged_kwh, charging_time)
@@ -0,0 +1,314 @@
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+import threading
+import logging
+
+from backend.app.db.models import ChargePile, CarRequest
+from backend.app.db.schemas import RequestStatus
+from backend.app.services.charge_curve import ChargeCurve, CONSTANT_CURVE, pile_curve
+
+logger = logging.getLogger(__name__)
+
+def charge_minutes(amount_kwh: float, power: float) -> float:
+    """按恒定功率计算充满指定电量所需的时间(分钟)"""
+    if power <= 0:
+        return float('inf')
+    return amount_kwh / power * 60
+
+class PileQueueIndex:
+    """
+    单个充电桩队列的时间索引
+    prefix[i] 为队列中前 i 辆车(从列表起点算)充电时长之和，出队只移动 head 指针，
+    因此"第k位的等待时间"和"追加一辆车后的完成时间"都是 O(1) 计算。
+    version 为构建时充电桩的队列版本号，用于判断索引是否仍与数据库一致
+    """
+
+    __slots__ = (
+        "pile_id", "power", "curve", "version", "request_ids", "durations", "prefix", "head",
+        "head_start", "charging_end"
+    )
+
+    def __init__(self, pile_id: int, power: float, curve: ChargeCurve = CONSTANT_CURVE, version: Optional[int] = None):
+        self.pile_id = pile_id
+        self.power = power
+        self.version = version
+        # 充电桩的功率曲线，用于把请求电量换算成充电时长
+        self.curve = curve
+        self.request_ids: List[int] = []
+        # 每辆车完整充电所需时长(分钟)
+        self.durations: List[float] = []
+        self.prefix: List[float] = [0.0]
+        self.head = 0
+        # 队首车辆(充电中)的开始时间和预计结束时间
+        self.head_start: Optional[datetime] = None
+        self.charging_end: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self.request_ids) - self.head
+
+    def position_of(self, request_id: int) -> Optional[int]:
+        """返回请求在当前队列中的位置"""
+        for i in range(self.head, len(self.request_ids)):
+            if self.request_ids[i] == request_id:
+                return i - self.head
+        return None
+
+    def duration_of(self, amount_kwh: float, battery_capacity: Optional[float] = None) -> float:
+        """车辆在该桩上完整充电所需时长(分钟)"""
+        return self.curve.charge_minutes(amount_kwh, self.power, battery_capacity)
+
+    def append(self, request_id: int, duration: float):
+        """车辆进入队尾"""
+        self.request_ids.append(request_id)
+        self.durations.append(duration)
+        self.prefix.append(self.prefix[-1] + duration)
+
+    def start(self, request_id: int, start_time: datetime) -> bool:
+        """队首车辆开始充电，返回索引是否仍然有效"""
+        if len(self) == 0 or self.request_ids[self.head] != request_id:
+            return False
+        self.head_start = start_time
+        self.charging_end = start_time + timedelta(minutes=self.durations[self.head])
+        return True
+
+    def remove(self, request_id: int) -> bool:
+        """车辆离开队列(完成/取消/转移)，返回索引是否仍然有效"""
+        if len(self) == 0:
+            return False
+        if self.request_ids[self.head] == request_id:
+            # 队首出队，只移动指针
+            self.head += 1
+            self.head_start = None
+            self.charging_end = None
+            if self.head > 32:
+                self._compact()
+            return True
+
+        position = self.position_of(request_id)
+        if position is None:
+            return False
+        # 队列中间的车辆离开，重建前缀和(队列很短，代价可以忽略)
+        index = self.head + position
+        del self.request_ids[index]
+        del self.durations[index]
+        self._compact()
+        return True
+
+    def _compact(self):
+        """丢弃已出队的部分并重建前缀和"""
+        self.request_ids = self.request_ids[self.head:]
+        self.durations = self.durations[self.head:]
+        self.head = 0
+        self.prefix = [0.0]
+        for duration in self.durations:
+            self.prefix.append(self.prefix[-1] + duration)
+
+    def matches(self, version: int, power: float, head_start: Optional[datetime]) -> bool:
+        """索引是否与数据库中充电桩的版本号、功率和充电中车辆的开始时间一致"""
+        if version != self.version or power != self.power:
+            return False
+        if head_start is None or self.head_start is None:
+            return head_start is None and self.head_start is None
+        # 数据库中的时间可能不保留微秒
+        return abs((head_start - self.head_start).total_seconds()) < 1
+
+    def head_remaining(self, now: datetime) -> float:
+        """队首车辆剩余充电时间(分钟)"""
+        if len(self) == 0:
+            return 0.0
+        if self.charging_end is not None:
+            return max(0.0, (self.charging_end - now).total_seconds() / 60)
+        return self.durations[self.head]
+
+    def waiting_minutes(self, position: int, now: datetime) -> float:
+        """排在第 position 位(0为队首)的车辆开始充电前需要等待的时间(分钟)"""
+        position = max(0, min(position, len(self)))
+        if position == 0:
+            return 0.0
+        return self.head_remaining(now) + self.prefix[self.head + position] - self.prefix[self.head + 1]
+
+    def backlog_minutes(self, now: datetime) -> float:
+        """清空当前队列所需的总时间(分钟)"""
+        return self.waiting_minutes(len(self), now)
+
+class EtaService:
+    """
+    充电桩队列预计时间服务
+    为每个充电桩维护队列时间索引，调度器在分配/开始/完成/取消时增量更新，
+    索引缺失或被判定失效时从数据库重建。
+
+    多个 worker 进程各自维护索引，其他进程的队列变更不会经过本进程的增量更新。
+    队列每次变更都会递增充电桩的版本号，读取索引前先比较数据库中的版本号、功率和
+    充电中车辆的开始时间(开始充电不改变版本号)，不一致时重建；增量更新只在索引恰好是
+    变更前的版本时应用，否则丢弃索引
+    """
+
+    def __init__(self):
+        self._piles: Dict[int, PileQueueIndex] = {}
+        self._lock = threading.RLock()
+
+    # ---- 索引维护 ----
+
+    @staticmethod
+    def _current_state(db: Session, pile_id: int):
+        """数据库中充电桩的 (版本号, 功率, 充电中车辆的开始时间)，充电桩不存在时返回 None"""
+        return (
+            db.query(ChargePile.version, ChargePile.power, CarRequest.start_time)
+            .outerjoin(CarRequest, and_(
+                CarRequest.pile_id == ChargePile.id, CarRequest.status == RequestStatus.CHARGING
+            ))
+            .filter(ChargePile.id == pile_id)
+            .first()
+        )
+
+    def _load(self, db: Session, pile_id: int) -> Optional[PileQueueIndex]:
+        """从数据库重建单个充电桩的索引"""
+        pile = db.query(ChargePile).filter(ChargePile.id == pile_id).first()
+        if not pile:
+            return None
+        queue = (
+            db.query(CarRequest)
+            .filter(CarRequest.pile_id == pile_id)
+            .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+            .order_by(CarRequest.queue_position)
+            .all()
+        )
+        index = self.build_index(pile, queue)
+        with self._lock:
+            self._piles[pile_id] = index
+        return index
+
+    @staticmethod
+    def build_index(pile: ChargePile, queue: List[CarRequest]) -> PileQueueIndex:
+        """根据充电桩及其队列(按队列位置排序)构建时间索引"""
+        index = PileQueueIndex(pile.id, pile.power, pile_curve(pile), pile.version)
+        for car in queue:
+            index.append(car.id, index.duration_of(car.amount_kwh, car.battery_capacity))
+        if queue and queue[0].status == RequestStatus.CHARGING and queue[0].start_time:
+            index.start(queue[0].id, queue[0].start_time)
+        return index
+
+    def warm(self, db: Session):
+        """一次性加载所有充电桩的索引"""
+        piles = db.query(ChargePile).all()
+        cars = (
+            db.query(CarRequest)
+            .filter(CarRequest.pile_id.isnot(None))
+            .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+            .order_by(CarRequest.pile_id, CarRequest.queue_position)
+            .all()
+        )
+        queues: Dict[int, List[CarRequest]] = {}
+        for car in cars:
+            queues.setdefault(car.pile_id, []).append(car)
+
+        indexes = {pile.id: self.build_index(pile, queues.get(pile.id, [])) for pile in piles}
+        with self._lock:
+            self._piles = indexes
+        logger.info(f"队列时间索引已加载: {len(indexes)} 个充电桩")
+
+    def get(self, db: Session, pile_id: int) -> Optional[PileQueueIndex]:
+        """获取充电桩索引，缺失或与数据库不一致(其他进程修改了队列)时从数据库加载"""
+        state = self._current_state(db, pile_id)
+        if state is None:
+            self.invalidate(pile_id)
+            return None
+        with self._lock:
+            index = self._piles.get(pile_id)
+            if index is not None and index.matches(state.version, state.power, state.start_time):
+                return index
+        return self._load(db, pile_id)
+
+    def invalidate(self, pile_id: Optional[int] = None):
+        """使索引失效，下次访问时重建"""
+        with self._lock:
+            if pile_id is None:
+                self._piles.clear()
+            else:
+                self._piles.pop(pile_id, None)
+
+    def _current(self, pile_id: int, version: int) -> Optional[PileQueueIndex]:
+        """
+        取出恰好是 version 前一个版本的索引并更新为 version(调用时已持有锁)，
+        否则说明中间有其他变更没有经过本进程，丢弃索引
+        """
+        index = self._piles.get(pile_id)
+        if index is None:
+            return None
+        if index.version is None or index.version + 1 != version:
+            self._piles.pop(pile_id, None)
+            return None
+        index.version = version
+        return index
+
+    def on_assign(
+        self,
+        pile_id: int,
+        request_id: int,
+        amount_kwh: float,
+        battery_capacity: Optional[float],
+        version: int
+    ):
+        """车辆分配到充电桩队尾，version 为本次分配后的队列版本号"""
+        with self._lock:
+            index = self._current(pile_id, version)
+            if index is None:
+                return
+            if index.position_of(request_id) is not None:
+                self._piles.pop(pile_id, None)
+                return
+            index.append(request_id, index.duration_of(amount_kwh, battery_capacity))
+
+    def on_start(self, pile_id: int, request_id: int, start_time: datetime):
+        """队首车辆开始充电"""
+        with self._lock:
+            index = self._piles.get(pile_id)
+            if index is not None and not index.start(request_id, start_time):
+                self._piles.pop(pile_id, None)
+
+    def on_leave(self, pile_id: int, request_id: int, version: int):
+        """车辆离开充电桩队列(完成、取消或被转移)，version 为出队后的队列版本号"""
+        with self._lock:
+            index = self._current(pile_id, version)
+            if index is not None and not index.remove(request_id):
+                self._piles.pop(pile_id, None)
+
+    # ---- 查询 ----
+
+    def waiting_minutes(self, db: Session, pile_id: int, queue_position: Optional[int] = None) -> float:
+        """
+        队列等待时间(分钟)
+        不指定 queue_position 时返回整个队列清空所需时间
+        """
+        index = self.get(db, pile_id)
+        if index is None or index.power <= 0:
+            return float('inf')
+        now = datetime.now()
+        with self._lock:
+            if queue_position is None:
+                return index.backlog_minutes(now)
+            return index.waiting_minutes(queue_position, now)
+
+    def finish_if_appended(
+        self,
+        db: Session,
+        pile_id: int,
+        amount_kwh: float,
+        battery_capacity: Optional[float] = None
+    ) -> float:
+        """车辆追加到该桩队尾时，从现在起到充电完成的总时长(分钟)"""
+        index = self.get(db, pile_id)
+        if index is None or index.power <= 0:
+            return float('inf')
+        with self._lock:
+            return index.backlog_minutes(datetime.now()) + index.duration_of(amount_kwh, battery_capacity)
+
+    def queue_length(self, db: Session, pile_id: int) -> int:
+        """充电桩当前队列长度(充电中+排队中)"""
+        index = self.get(db, pile_id)
+        return len(index) if index is not None else 0
+
+# 创建预计时间服务实例
+eta_service = EtaService()
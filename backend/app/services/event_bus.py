@@ -0,0 +1,301 @@
+"""
+进程间事件总线
+以多个 worker 进程运行时，每个进程只持有连接到自己的 WebSocket，
+某个进程中产生的通知需要经事件总线转发到所有进程，再由各进程发送给自己持有的连接。
+
+- local: 进程内直接投递(单进程部署，默认)
+- socket: 基于 Unix 域套接字的本机中转，同一台机器上的多个 worker 之间转发(依赖 fcntl，Windows 上不可用)
+- redis: 基于 Redis 发布/订阅，跨机器部署时使用(需要安装 redis 包)
+
+消息是可 JSON 序列化的字典。本进程发布的消息直接在本地投递，不等待中转回送
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+import asyncio
+import logging
+import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，只能使用 local 或 redis 事件总线
+    fcntl = None
+
+from backend.app.core.config import get_system_config
+from backend.app.core.serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# 单条消息(一行 JSON)的长度上限，超过时丢弃该连接，由客户端重连
+MAX_LINE_BYTES = 4 * 1024 * 1024
+
+# 消息处理函数: handler(channel, message)
+Handler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class EventBus:
+    """事件总线基类：进程内投递"""
+
+    def __init__(self):
+        self._handler: Optional[Handler] = None
+        # 用于识别本进程发布的消息
+        self.origin = uuid.uuid4().hex
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+
+    async def stop(self):
+        self._handler = None
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        """发布消息：先投递给本进程，再转发给其他进程"""
+        await self._deliver(channel, message)
+        await self._forward(channel, message)
+
+    async def _forward(self, channel: str, message: Dict[str, Any]):
+        """转发给其他进程，进程内总线不需要转发"""
+
+    async def _deliver(self, channel: str, message: Dict[str, Any]):
+        if self._handler is None:
+            return
+        try:
+            await self._handler(channel, message)
+        except Exception as e:
+            logger.error(f"处理事件 {channel} 失败: {e}", exc_info=True)
+
+    def _encode(self, channel: str, message: Dict[str, Any]) -> bytes:
+        return dumps({"origin": self.origin, "channel": channel, "message": message})
+
+    async def _receive(self, data: bytes):
+        """处理从其他进程收到的消息，忽略本进程发出的回送"""
+        try:
+            envelope = loads(data)
+        except ValueError:
+            logger.error(f"无效的事件数据: {data[:200]!r}")
+            return
+        if envelope.get("origin") == self.origin:
+            return
+        await self._deliver(envelope.get("channel", ""), envelope.get("message") or {})
+
+class SocketEventBus(EventBus):
+    """
+    Unix 域套接字事件总线
+    同一台机器上的 worker 中，先拿到锁文件的一个作为中转站监听套接字，其余作为客户端连接。
+    中转站把收到的消息转发给除发送者以外的所有客户端；中转站退出后锁被释放，
+    客户端在重连时重新竞选，其中一个接任中转站
+    """
+
+    def __init__(self, path: str, reconnect_interval: float = 1.0):
+        super().__init__()
+        self.path = path
+        self.reconnect_interval = reconnect_interval
+        self._lock_fd: Optional[int] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Set[asyncio.StreamWriter] = set()
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._connected = asyncio.Event()
+
+    @property
+    def is_hub(self) -> bool:
+        return self._server is not None
+
+    async def start(self, handler: Handler):
+        await super().start(handler)
+        self._stopping = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        # 等待完成第一次连接(或成为中转站)，避免启动后立即发布的消息丢失
+        try:
+            await asyncio.wait_for(self._connected.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            logger.warning(f"事件总线未能连接到 {self.path}，稍后重试")
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+        await super().stop()
+
+    async def _close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        for writer in list(self._clients):
+            writer.close()
+        self._clients.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+        self._connected.clear()
+
+    def _try_lock(self) -> bool:
+        """尝试成为中转站"""
+        fd = os.open(self.path + ".lock", os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    async def _run(self):
+        """竞选中转站或连接中转站，连接断开后重试"""
+        while not self._stopping:
+            try:
+                if self._try_lock():
+                    try:
+                        os.unlink(self.path)
+                    except FileNotFoundError:
+                        pass
+                    self._server = await asyncio.start_unix_server(
+                        self._serve_client, path=self.path, limit=MAX_LINE_BYTES
+                    )
+                    logger.info(f"事件总线中转站已启动: {self.path}")
+                    self._connected.set()
+                    await self._server.serve_forever()
+                else:
+                    reader, self._writer = await asyncio.open_unix_connection(self.path, limit=MAX_LINE_BYTES)
+                    logger.info(f"已连接事件总线中转站: {self.path}")
+                    self._connected.set()
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        await self._receive(line)
+                    logger.warning("事件总线中转站已断开")
+            except asyncio.CancelledError:
+                raise
+            except OSError as e:
+                logger.warning(f"事件总线连接失败: {e}")
+            except ValueError as e:
+                # readline 遇到超过长度上限的消息时抛出 ValueError，断开后重连
+                logger.error(f"事件总线收到超长消息，重新连接: {e}")
+            await self._close()
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def _serve_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """中转站：接收客户端消息，本地投递并转发给其他客户端"""
+        self._clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                await self._broadcast(line, exclude=writer)
+                await self._receive(line)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except ValueError as e:
+            # 超长消息：断开该客户端，由客户端重连
+            logger.error(f"事件总线客户端发送超长消息，已断开: {e}")
+        finally:
+            self._clients.discard(writer)
+            writer.close()
+
+    async def _broadcast(self, line: bytes, exclude: Optional[asyncio.StreamWriter] = None):
+        for writer in list(self._clients):
+            if writer is exclude:
+                continue
+            try:
+                writer.write(line)
+                await writer.drain()
+            except (ConnectionError, RuntimeError):
+                self._clients.discard(writer)
+
+    async def _forward(self, channel: str, message: Dict[str, Any]):
+        line = self._encode(channel, message) + b"\n"
+        if len(line) > MAX_LINE_BYTES:
+            logger.error(f"事件 {channel} 超过 {MAX_LINE_BYTES} 字节，只在本进程投递")
+            return
+        if self.is_hub:
+            await self._broadcast(line)
+        elif self._writer is not None:
+            try:
+                self._writer.write(line)
+                await self._writer.drain()
+            except (ConnectionError, RuntimeError) as e:
+                logger.warning(f"转发事件失败，其他进程将收不到该消息: {e}")
+        else:
+            logger.warning(f"事件总线未连接，事件 {channel} 只在本进程投递")
+
+class RedisEventBus(EventBus):
+    """Redis 发布/订阅事件总线，所有消息发布到同一个频道"""
+
+    def __init__(self, url: str, channel: str = "smart_charge:events"):
+        super().__init__()
+        self.url = url
+        self.channel = channel
+        self._redis = None
+        self._pubsub = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self, handler: Handler):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("使用 redis 事件总线需要安装 redis 包") from e
+        await super().start(handler)
+        self._redis = redis.from_url(self.url)
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"已订阅 Redis 事件频道 {self.channel}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await self._pubsub.close()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+        await super().stop()
+
+    async def _run(self):
+        async for item in self._pubsub.listen():
+            if item.get("type") == "message":
+                await self._receive(item["data"])
+
+    async def _forward(self, channel: str, message: Dict[str, Any]):
+        if self._redis is None:
+            return
+        try:
+            await self._redis.publish(self.channel, self._encode(channel, message))
+        except Exception as e:
+            logger.warning(f"发布事件到 Redis 失败: {e}")
+
+def create_event_bus() -> EventBus:
+    """根据系统配置 event_bus 创建事件总线"""
+    settings = get_system_config()
+    backend = settings.get("event_bus", "local")
+    if backend == "socket":
+        if fcntl is None or not hasattr(asyncio, "start_unix_server"):
+            raise RuntimeError("socket 事件总线依赖 fcntl 和 Unix 域套接字，当前系统不支持，请改用 local 或 redis")
+        return SocketEventBus(settings.get("event_bus_socket", "/tmp/smart_charge_events.sock"))
+    if backend == "redis":
+        return RedisEventBus(settings.get("event_bus_redis_url", "redis://localhost:6379/0"))
+    if backend != "local":
+        logger.warning(f"未知的事件总线类型 {backend}，使用进程内总线")
+    return EventBus()
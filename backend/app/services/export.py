@@ -0,0 +1,203 @@
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import date, datetime, timedelta
+from itertools import chain
+from sqlalchemy.orm import Session
+import csv
+import io
+import logging
+import zlib
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import (
+    ChargePile, CarRequest, ChargeSession, BillMaster, BillDetail, ReportDaily,
+    CarRequestArchive, ChargeSessionArchive, BillDetailArchive
+)
+
+logger = logging.getLogger(__name__)
+
+# 每次从数据库游标取回的行数
+FETCH_SIZE = 1000
+# 累积到该大小(字节)后输出一块数据
+CHUNK_SIZE = 64 * 1024
+
+def _fmt_time(value: Optional[datetime]) -> str:
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else ""
+
+def _fmt_money(value: Optional[float]) -> str:
+    return f"{value or 0:.2f}"
+
+def _stream_rows(build_query: Callable[[Session], Any]) -> Iterator[Any]:
+    """
+    用独立的数据库会话和服务端游标逐批读取查询结果
+    导出在响应发送过程中进行，不能依赖请求作用域的会话
+    """
+    db = SessionLocal()
+    try:
+        query = build_query(db).execution_options(stream_results=True).yield_per(FETCH_SIZE)
+        for row in query:
+            yield row
+    finally:
+        db.close()
+
+def _day_range(start_date: date, end_date: date) -> Tuple[datetime, datetime]:
+    """日期区间转为 [起始时刻, 结束日次日零点)"""
+    return datetime.combine(start_date, datetime.min.time()), datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+# ---- 各类导出数据 ----
+
+REPORT_HEADER = [
+    "日期", "充电桩编号", "累计充电次数", "累计充电时长(分钟)",
+    "累计充电量(kWh)", "累计充电费用(元)", "累计服务费用(元)", "累计总费用(元)"
+]
+
+def _report_rows(start_date: date, end_date: date) -> Iterator[List[Any]]:
+    rows = _stream_rows(lambda db: (
+        db.query(ReportDaily)
+        .filter(ReportDaily.report_date >= start_date)
+        .filter(ReportDaily.report_date <= end_date)
+        .order_by(ReportDaily.report_date, ReportDaily.pile_code)
+    ))
+    for report in rows:
+        yield [
+            report.report_date.strftime("%Y-%m-%d"),
+            report.pile_code,
+            report.charge_count,
+            report.charge_time,
+            f"{report.charge_kwh:.2f}",
+            _fmt_money(report.charge_fee),
+            _fmt_money(report.service_fee),
+            _fmt_money(report.total_fee),
+        ]
+
+SESSION_HEADER = [
+    "会话ID", "请求ID", "用户ID", "排队号码", "充电桩编号", "开始时间", "结束时间",
+    "充电量(kWh)", "充电时长(分钟)", "充电费用(元)", "服务费用(元)", "总费用(元)", "会话状态"
+]
+
+def _session_rows(start_date: date, end_date: date, user_id: Optional[str] = None) -> Iterator[List[Any]]:
+    start_time, end_time = _day_range(start_date, end_date)
+
+    def build(session_model, request_model):
+        def query(db: Session):
+            q = (
+                db.query(
+                    session_model.id, session_model.request_id, request_model.user_id,
+                    request_model.queue_number, ChargePile.code, session_model.start_time,
+                    session_model.end_time, session_model.charged_kwh, session_model.charging_time,
+                    session_model.charge_fee, session_model.service_fee, session_model.total_fee,
+                    session_model.status
+                )
+                .outerjoin(request_model, request_model.id == session_model.request_id)
+                .outerjoin(ChargePile, ChargePile.id == session_model.pile_id)
+                .filter(session_model.start_time >= start_time)
+                .filter(session_model.start_time < end_time)
+            )
+            if user_id:
+                q = q.filter(request_model.user_id == user_id)
+            return q.order_by(session_model.id)
+        return query
+
+    # 归档数据在前，业务表中的近期数据在后
+    rows = chain(
+        _stream_rows(build(ChargeSessionArchive, CarRequestArchive)),
+        _stream_rows(build(ChargeSession, CarRequest)),
+    )
+    for row in rows:
+        yield [
+            row[0], row[1], row[2] or "", row[3] or "", row[4] or "",
+            _fmt_time(row[5]), _fmt_time(row[6]), f"{row[7] or 0:.2f}", row[8],
+            _fmt_money(row[9]), _fmt_money(row[10]), _fmt_money(row[11]), row[12],
+        ]
+
+BILL_DETAIL_HEADER = [
+    "详单编号", "用户ID", "账单日期", "充电桩编号", "充电量(kWh)", "充电时长(分钟)",
+    "启动时间", "停止时间", "充电费用(元)", "服务费用(元)", "总费用(元)"
+]
+
+def _bill_detail_rows(start_date: date, end_date: date, user_id: Optional[str] = None) -> Iterator[List[Any]]:
+    start_time, end_time = _day_range(start_date, end_date)
+
+    def build(detail_model):
+        def query(db: Session):
+            q = (
+                db.query(
+                    detail_model.detail_number, BillMaster.user_id, BillMaster.bill_date,
+                    detail_model.pile_code, detail_model.charged_kwh, detail_model.charging_time,
+                    detail_model.start_time, detail_model.end_time, detail_model.charge_fee,
+                    detail_model.service_fee, detail_model.total_fee
+                )
+                .join(BillMaster, BillMaster.id == detail_model.bill_id)
+                .filter(detail_model.start_time >= start_time)
+                .filter(detail_model.start_time < end_time)
+            )
+            if user_id:
+                q = q.filter(BillMaster.user_id == user_id)
+            return q.order_by(detail_model.id)
+        return query
+
+    rows = chain(_stream_rows(build(BillDetailArchive)), _stream_rows(build(BillDetail)))
+    for row in rows:
+        yield [
+            row[0], row[1], row[2].strftime("%Y-%m-%d") if row[2] else "", row[3],
+            f"{row[4] or 0:.2f}", row[5], _fmt_time(row[6]), _fmt_time(row[7]),
+            _fmt_money(row[8]), _fmt_money(row[9]), _fmt_money(row[10]),
+        ]
+
+# 可导出的数据集: 名称 -> (表头, 行生成器)
+EXPORT_DATASETS: Dict[str, Tuple[List[str], Callable[..., Iterator[List[Any]]]]] = {
+    "reports": (REPORT_HEADER, _report_rows),
+    "sessions": (SESSION_HEADER, _session_rows),
+    "bill-details": (BILL_DETAIL_HEADER, _bill_detail_rows),
+}
+
+# 支持按用户过滤的数据集，日报表按充电桩汇总，没有用户维度
+USER_FILTER_DATASETS = {"sessions", "bill-details"}
+
+class ExportService:
+    """流式导出服务，按块生成 CSV(可选 gzip 压缩)，内存占用与导出行数无关"""
+
+    @staticmethod
+    def csv_chunks(header: List[str], rows: Iterable[List[Any]]) -> Iterator[bytes]:
+        """把行数据编码为 CSV 数据块，带 BOM 以便 Excel 正确识别中文"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate(0)
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    @staticmethod
+    def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """边生成边做 gzip 压缩"""
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+        yield compressor.flush()
+
+    @staticmethod
+    def stream_csv(
+        dataset: str,
+        start_date: date,
+        end_date: date,
+        user_id: Optional[str] = None,
+        compress: bool = False
+    ) -> Iterator[bytes]:
+        """生成指定数据集在日期区间内的 CSV 数据流，不支持按用户过滤的数据集指定 user_id 时抛出 ValueError"""
+        header, rows = EXPORT_DATASETS[dataset]
+        if dataset in USER_FILTER_DATASETS:
+            row_iter = rows(start_date, end_date, user_id)
+        elif user_id:
+            raise ValueError(f"{dataset} 不支持按用户导出")
+        else:
+            row_iter = rows(start_date, end_date)
+        logger.info(f"开始导出 {dataset}: {start_date} ~ {end_date}, 压缩={compress}")
+        chunks = ExportService.csv_chunks(header, row_iter)
+        return ExportService.gzip_chunks(chunks) if compress else chunks
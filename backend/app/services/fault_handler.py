@@ -1,12 +1,17 @@
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Set, Callable
 from datetime import datetime
 from sqlalchemy.orm import Session
 import logging
 
-from backend.app.db.models import ChargePile, CarRequest, FaultLog, QueueLog
-from backend.app.db.schemas import ChargeMode, PileStatus, RequestStatus
+from backend.app.db.models import ChargePile, CarRequest, ChargeSession, FaultLog
+from backend.app.db.schemas import ChargeMode, PileStatus, RequestStatus, SessionStatus
 from backend.app.services.scheduler import ChargingScheduler
 from backend.app.services.charging_service import ChargingService
+from backend.app.services.eta import eta_service
+from backend.app.services.queue_log_writer import queue_log_writer
+from backend.app.services.scoring import assign_sequentially
+from backend.app.services.charge_curve import charged_energy, effective_amount
+from backend.app.core.config import get_station_config
 
 logger = logging.getLogger(__name__)
 
@@ -63,10 +68,8 @@ class FaultHandler:
                     # 计算已充电时间(分钟)
                     charging_minutes = (datetime.now() - charging_request.start_time).total_seconds() / 60
                     
-                    # 估算已充电量
-                    power_per_minute = pile.power / 60  # 每分钟充电量
-                    charged_kwh = power_per_minute * charging_minutes
-                    charged_kwh = min(charged_kwh, charging_request.amount_kwh)  # 不超过请求充电量
+                    # 按功率曲线估算已充电量(不超过请求充电量)
+                    charged_kwh = charged_energy(pile, charging_request, charging_minutes)
                     
                     # 完成充电会话，生成账单
                     from backend.app.services.charging_service import ChargingService
@@ -83,8 +86,10 @@ class FaultHandler:
                 charging_request.pile_id = None
                 charging_request.queue_position = None
                 
+                db.commit()
+                
                 # 记录状态变更日志
-                queue_log = QueueLog(
+                queue_log_writer.log(
                     request_id=charging_request.id,
                     from_status=RequestStatus.CHARGING,
                     to_status=RequestStatus.WAITING,
@@ -92,8 +97,6 @@ class FaultHandler:
                     queue_position=0,
                     remark="充电桩故障，中断充电，回到等候区"
                 )
-                db.add(queue_log)
-                db.commit()
             except Exception as e:
                 logger.error(f"处理充电中的请求失败: {str(e)}", exc_info=True)
                 db.rollback()
@@ -109,6 +112,7 @@ class FaultHandler:
             )
             
             # 将所有排队中的车辆移回等候区
+            log_rows = []
             for car in queue_cars:
                 # 记录原状态
                 old_status = car.status
@@ -120,22 +124,27 @@ class FaultHandler:
                 car.pile_id = None
                 car.queue_position = None
                 
-                # 记录状态变更日志
-                queue_log = QueueLog(
+                log_rows.append(dict(
                     request_id=car.id,
                     from_status=old_status,
                     to_status=RequestStatus.WAITING,
                     pile_id=old_pile_id,
                     queue_position=old_queue_position,
                     remark="充电桩故障，移回等候区"
-                )
-                db.add(queue_log)
+                ))
             
+            # 队列已清空，递增版本号使各进程的队列时间索引失效
+            ChargingScheduler.bump_pile_version(db, pile)
             db.commit()
+            # 记录状态变更日志
+            queue_log_writer.log_many(log_rows)
         except Exception as e:
             logger.error(f"处理排队中的请求失败: {str(e)}", exc_info=True)
             db.rollback()
             return False, f"处理排队中的请求失败: {str(e)}"
+        finally:
+            # 故障桩的队列已清空，使队列时间索引失效
+            eta_service.invalidate(pile_id)
         
         return True, f"充电桩 {pile.code} 故障已报告，影响 {len(queue_cars) + (1 if charging_request else 0)} 辆车"
     
@@ -167,6 +176,113 @@ class FaultHandler:
         
         return True, f"充电桩 {pile.code} 故障已恢复"
     
+    @staticmethod
+    def _snapshot_piles(
+        db: Session, piles: List[ChargePile], exclude_ids: Set[int]
+    ) -> Tuple[List[float], List[int], Dict[int, int]]:
+        """
+        一次查询读取目标充电桩队列的快照
+        返回 (各桩清空队列所需时间, 各桩剩余车位, 各桩下一个队列位置)，
+        exclude_ids 中的车辆视为已移出队列
+        """
+        queue_len = get_station_config().get("ChargingQueueLen", 2)
+        queues: Dict[int, List[CarRequest]] = {pile.id: [] for pile in piles}
+        if piles:
+            # 锁定目标充电桩(按ID顺序加锁)，直到执行方案的事务提交前其他分配/出队操作需等待
+            (
+                db.query(ChargePile)
+                .filter(ChargePile.id.in_(list(queues.keys())))
+                .order_by(ChargePile.id)
+                .populate_existing()
+                .with_for_update()
+                .all()
+            )
+            cars = (
+                db.query(CarRequest)
+                .filter(CarRequest.pile_id.in_(list(queues.keys())))
+                .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+                .order_by(CarRequest.pile_id, CarRequest.queue_position)
+                .all()
+            )
+            for car in cars:
+                if car.id not in exclude_ids:
+                    queues[car.pile_id].append(car)
+        
+        now = datetime.now()
+        backlogs, free_slots, next_positions = [], [], {}
+        for pile in piles:
+            queue = queues[pile.id]
+            backlogs.append(eta_service.build_index(pile, queue).backlog_minutes(now))
+            free_slots.append(max(0, queue_len - len(queue)))
+            next_positions[pile.id] = (queue[-1].queue_position or 0) + 1 if queue else 0
+        return backlogs, free_slots, next_positions
+    
+    @staticmethod
+    def _apply_plan(
+        db: Session,
+        cars: List[CarRequest],
+        piles: List[ChargePile],
+        assignment: List[int],
+        next_positions: Dict[int, int],
+        remark: Callable[[ChargePile], str],
+        log_rows: List[Dict[str, Any]]
+    ) -> List[int]:
+        """
+        在一个事务中执行分配方案：更新请求和充电桩状态，为进入空桩的车辆创建充电会话，
+        递增各目标充电桩的队列版本号，提交后把所有队列日志一次性交给日志写入器
+        """
+        now = datetime.now()
+        rescheduled_cars = []
+        
+        for car, index in zip(cars, assignment):
+            if index < 0:
+                continue
+            pile = piles[index]
+            old_status = car.status
+            position = next_positions[pile.id]
+            next_positions[pile.id] += 1
+            
+            # 分配到新的充电桩
+            car.pile_id = pile.id
+            car.status = RequestStatus.QUEUING
+            car.queue_position = position
+            log_rows.append(dict(
+                request_id=car.id, from_status=old_status, to_status=RequestStatus.QUEUING,
+                pile_id=pile.id, queue_position=position, remark=remark(pile)
+            ))
+            
+            # 目标桩空闲时直接开始充电
+            if position == 0:
+                car.status = RequestStatus.CHARGING
+                car.start_time = now
+                db.add(ChargeSession(
+                    request_id=car.id,
+                    pile_id=pile.id,
+                    start_time=now,
+                    charged_kwh=0.0,
+                    charging_time=0,
+                    charge_fee=0.0,
+                    service_fee=0.0,
+                    total_fee=0.0,
+                    status=SessionStatus.CHARGING
+                ))
+                log_rows.append(dict(
+                    request_id=car.id, from_status=RequestStatus.QUEUING, to_status=RequestStatus.CHARGING,
+                    pile_id=pile.id, queue_position=position, remark="开始充电"
+                ))
+            
+            # 更新目标充电桩状态
+            if pile.status == PileStatus.AVAILABLE:
+                pile.status = PileStatus.BUSY
+            
+            rescheduled_cars.append(car.id)
+        
+        for pile in piles:
+            ChargingScheduler.bump_pile_version(db, pile)
+        db.commit()
+        queue_log_writer.log_many(log_rows)
+        return rescheduled_cars
+    
     @staticmethod
     def priority_reschedule(db: Session, fault_pile_id: int) -> List[int]:
         """
@@ -189,68 +305,43 @@ class FaultHandler:
             .order_by(CarRequest.queue_position)
             .all()
         )
+        if not queue_cars:
+            return rescheduled_cars
         
-        # 获取同类型的其他充电桩
+        # 获取本站同类型的其他充电桩
         same_type_piles = (
             db.query(ChargePile)
+            .filter(ChargePile.station_id == fault_pile.station_id)
             .filter(ChargePile.type == fault_pile.type)
             .filter(ChargePile.id != fault_pile_id)
             .filter(ChargePile.status.in_([PileStatus.AVAILABLE, PileStatus.BUSY]))
             .all()
         )
         
-        # 依次为故障队列中的车辆重新调度
-        for car in queue_cars:
-            best_pile_id = None
-            min_finish_time = float('inf')
-            
-            # 找到最优的充电桩
-            for pile in same_type_piles:
-                # 检查队列是否有空位
-                if not ChargingScheduler.check_pile_queue_available(db, pile.id):
-                    continue
-                    
-                finish_time = ChargingScheduler.calculate_finish_time(db, pile.id, car.amount_kwh)
-                if finish_time < min_finish_time:
-                    min_finish_time = finish_time
-                    best_pile_id = pile.id
+        try:
+            # 基于队列快照在内存中规划：依次为故障队列中的车辆选择完成时间最短的充电桩
+            backlogs, free_slots, next_positions = FaultHandler._snapshot_piles(db, same_type_piles, set())
+            assignment = assign_sequentially(
+                [effective_amount(car) for car in queue_cars],
+                [pile.power for pile in same_type_piles],
+                backlogs,
+                free_slots
+            )
             
-            if best_pile_id:
-                # 记录原状态
-                old_status = car.status
-                old_pile_id = car.pile_id
-                old_queue_position = car.queue_position
-                
-                # 分配到新的充电桩
-                car.pile_id = best_pile_id
-                car.status = RequestStatus.QUEUING
-                car.queue_position = ChargingScheduler.get_pile_queue_length(db, best_pile_id)
-                
-                # 记录状态变更日志
-                queue_log = QueueLog(
-                    request_id=car.id,
-                    from_status=old_status,
-                    to_status=RequestStatus.QUEUING,
-                    pile_id=best_pile_id,
-                    queue_position=car.queue_position,
-                    remark=f"故障调度：从充电桩 {fault_pile.code} 转移到充电桩 {pile.code}"
-                )
-                db.add(queue_log)
-                
-                rescheduled_cars.append(car.id)
-                
-                # 如果是第一个位置，则启动充电
-                if car.queue_position == 0:
-                    car.status = RequestStatus.CHARGING
-                    car.start_time = datetime.now()
-                
-                # 更新目标充电桩状态
-                pile = db.query(ChargePile).filter(ChargePile.id == best_pile_id).first()
-                if pile and pile.status == PileStatus.AVAILABLE:
-                    pile.status = PileStatus.BUSY
-                
-                db.commit()
+            rescheduled_cars = FaultHandler._apply_plan(
+                db, queue_cars, same_type_piles, assignment, next_positions,
+                lambda pile: f"故障调度：从充电桩 {fault_pile.code} 转移到充电桩 {pile.code}",
+                []
+            )
+        except Exception as e:
+            logger.error(f"优先级调度失败: {str(e)}", exc_info=True)
+            db.rollback()
+            rescheduled_cars = []
+        finally:
+            # 多个充电桩的队列发生了变化，使队列时间索引失效
+            eta_service.invalidate()
         
+        logger.info(f"优先级调度完成: 故障充电桩 {fault_pile.code}，重新调度 {len(rescheduled_cars)} 辆车")
         return rescheduled_cars
     
     @staticmethod
@@ -275,124 +366,71 @@ class FaultHandler:
             .all()
         )
         
-        # 获取同类型的其他充电桩中尚未充电的车辆
+        # 获取本站同类型的其他充电桩中尚未充电的车辆
         other_queue_cars = (
             db.query(CarRequest)
             .join(ChargePile, CarRequest.pile_id == ChargePile.id)
+            .filter(ChargePile.station_id == fault_pile.station_id)
             .filter(ChargePile.type == fault_pile.type)
             .filter(ChargePile.id != fault_pile_id)
             .filter(CarRequest.status == RequestStatus.QUEUING)
             .all()
         )
         
-        # 合并队列
+        # 合并队列，按照排队号码排序
         combined_queue = fault_queue_cars + other_queue_cars
-        
-        # 按照排队号码排序
         combined_queue.sort(key=lambda x: x.queue_number)
+        if not combined_queue:
+            return rescheduled_cars
         
-        # 获取同类型的所有可用充电桩
+        # 获取本站同类型的所有可用充电桩
         available_piles = (
             db.query(ChargePile)
+            .filter(ChargePile.station_id == fault_pile.station_id)
             .filter(ChargePile.type == fault_pile.type)
             .filter(ChargePile.id != fault_pile_id)
             .filter(ChargePile.status.in_([PileStatus.AVAILABLE, PileStatus.BUSY]))
             .all()
         )
         
-        # 清空所有充电桩的队列
-        for car in other_queue_cars:
-            # 记录原状态
-            old_status = car.status
-            old_pile_id = car.pile_id
-            old_queue_position = car.queue_position
-            
-            # 临时设置为等待状态
-            car.status = RequestStatus.WAITING
-            car.pile_id = None
-            car.queue_position = None
-            
-            # 记录状态变更日志
-            queue_log = QueueLog(
-                request_id=car.id,
-                from_status=old_status,
-                to_status=RequestStatus.WAITING,
-                pile_id=old_pile_id,
-                queue_position=old_queue_position,
-                remark="故障时间顺序调度：临时移出队列"
+        try:
+            # 快照中不包含将被移出队列的车辆
+            backlogs, free_slots, next_positions = FaultHandler._snapshot_piles(
+                db, available_piles, {car.id for car in combined_queue}
             )
-            db.add(queue_log)
-        
-        # 对故障队列车辆也设置为等待状态
-        for car in fault_queue_cars:
-            # 记录原状态
-            old_status = car.status
-            old_pile_id = car.pile_id
-            old_queue_position = car.queue_position
             
-            # 临时设置为等待状态
-            car.status = RequestStatus.WAITING
-            car.pile_id = None
-            car.queue_position = None
+            # 所有车辆先移出队列(与重新分配在同一事务中提交)
+            log_rows = []
+            for car in combined_queue:
+                log_rows.append(dict(
+                    request_id=car.id, from_status=car.status, to_status=RequestStatus.WAITING,
+                    pile_id=car.pile_id, queue_position=car.queue_position,
+                    remark="故障时间顺序调度：临时移出队列"
+                ))
+                car.status = RequestStatus.WAITING
+                car.pile_id = None
+                car.queue_position = None
             
-            # 记录状态变更日志
-            queue_log = QueueLog(
-                request_id=car.id,
-                from_status=old_status,
-                to_status=RequestStatus.WAITING,
-                pile_id=old_pile_id,
-                queue_position=old_queue_position,
-                remark="故障时间顺序调度：临时移出队列"
+            # 按照排队号码顺序重新调度，每辆车选择完成时间最短的充电桩
+            assignment = assign_sequentially(
+                [effective_amount(car) for car in combined_queue],
+                [pile.power for pile in available_piles],
+                backlogs,
+                free_slots
             )
-            db.add(queue_log)
-        
-        db.commit()
-        
-        # 按照排队号码顺序重新调度
-        for car in combined_queue:
-            best_pile_id = None
-            min_finish_time = float('inf')
             
-            # 找到最优的充电桩
-            for pile in available_piles:
-                # 检查队列是否有空位
-                if not ChargingScheduler.check_pile_queue_available(db, pile.id):
-                    continue
-                    
-                finish_time = ChargingScheduler.calculate_finish_time(db, pile.id, car.amount_kwh)
-                if finish_time < min_finish_time:
-                    min_finish_time = finish_time
-                    best_pile_id = pile.id
-            
-            if best_pile_id:
-                # 分配到新的充电桩
-                car.pile_id = best_pile_id
-                car.status = RequestStatus.QUEUING
-                car.queue_position = ChargingScheduler.get_pile_queue_length(db, best_pile_id)
-                
-                # 记录状态变更日志
-                queue_log = QueueLog(
-                    request_id=car.id,
-                    from_status=RequestStatus.WAITING,
-                    to_status=RequestStatus.QUEUING,
-                    pile_id=best_pile_id,
-                    queue_position=car.queue_position,
-                    remark=f"故障时间顺序调度：分配到充电桩 {pile.code}"
-                )
-                db.add(queue_log)
-                
-                rescheduled_cars.append(car.id)
-                
-                # 如果是第一个位置，则启动充电
-                if car.queue_position == 0:
-                    car.status = RequestStatus.CHARGING
-                    car.start_time = datetime.now()
-                
-                # 更新目标充电桩状态
-                pile = db.query(ChargePile).filter(ChargePile.id == best_pile_id).first()
-                if pile and pile.status == PileStatus.AVAILABLE:
-                    pile.status = PileStatus.BUSY
-                
-                db.commit()
+            rescheduled_cars = FaultHandler._apply_plan(
+                db, combined_queue, available_piles, assignment, next_positions,
+                lambda pile: f"故障时间顺序调度：分配到充电桩 {pile.code}",
+                log_rows
+            )
+        except Exception as e:
+            logger.error(f"时间顺序调度失败: {str(e)}", exc_info=True)
+            db.rollback()
+            rescheduled_cars = []
+        finally:
+            # 多个充电桩的队列发生了变化，使队列时间索引失效
+            eta_service.invalidate()
         
-        return rescheduled_cars 
\ No newline at end of file
+        logger.info(f"时间顺序调度完成: 故障充电桩 {fault_pile.code}，重新调度 {len(rescheduled_cars)} 辆车")
+        return rescheduled_cars
@@ -0,0 +1,252 @@
+"""
+会话历史列式存储
+每晚把已结束的充电会话和队列日志按月导出为 NumPy .npy 列文件：
+    <history_dir>/sessions/YYYYMM/<列名>.npy
+    <history_dir>/queue_events/YYYYMM/<列名>.npy
+读取时以只读内存映射打开，统计分析直接对列做向量化扫描，不再访问 MySQL
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+from array import array
+from datetime import date, datetime, timedelta
+from sqlalchemy.orm import Session
+import logging
+import os
+import shutil
+
+import numpy as np
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import (
+    CarRequest, ChargeSession, QueueLog,
+    CarRequestArchive, ChargeSessionArchive, QueueLogArchive
+)
+from backend.app.core.config import get_system_config
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+FETCH_SIZE = 5000
+
+# 状态在列文件中以下标存储，未知状态记为 -1
+REQUEST_STATUSES = ["WAITING", "QUEUING", "CHARGING", "FINISHED", "CANCELED"]
+SESSION_STATUSES = ["CHARGING", "COMPLETED", "INTERRUPTED"]
+
+# 数据集 -> {列名: (array 类型码, NumPy 类型)}；时间列为本地时间的秒级时间戳，缺失记为 -1
+DATASETS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "sessions": {
+        "session_id": ("q", "int64"),
+        "request_id": ("q", "int64"),
+        "pile_id": ("q", "int64"),
+        "request_ts": ("q", "int64"),
+        "start_ts": ("q", "int64"),
+        "end_ts": ("q", "int64"),
+        "charged_kwh": ("d", "float64"),
+        "charge_fee": ("d", "float64"),
+        "service_fee": ("d", "float64"),
+        "total_fee": ("d", "float64"),
+        "status": ("b", "int8"),
+    },
+    "queue_events": {
+        "request_id": ("q", "int64"),
+        "pile_id": ("q", "int64"),
+        "log_ts": ("q", "int64"),
+        "from_status": ("b", "int8"),
+        "to_status": ("b", "int8"),
+    },
+}
+
+def to_ts(value: Optional[datetime]) -> int:
+    """datetime 转为秒级时间戳(按本地时间，不做时区换算)"""
+    return int((value - EPOCH).total_seconds()) if value else -1
+
+def from_ts(value: int) -> datetime:
+    return EPOCH + timedelta(seconds=int(value))
+
+def _code(statuses: List[str], value) -> int:
+    value = getattr(value, "value", value)
+    return statuses.index(value) if value in statuses else -1
+
+def month_of(value: date) -> int:
+    return value.year * 100 + value.month
+
+def month_bounds(month: int) -> Tuple[datetime, datetime]:
+    """YYYYMM 对应的 [月初, 下月初)"""
+    year, mon = divmod(month, 100)
+    start = datetime(year, mon, 1)
+    end = datetime(year + 1, 1, 1) if mon == 12 else datetime(year, mon + 1, 1)
+    return start, end
+
+def months_between(start_date: date, end_date: date) -> List[int]:
+    months = []
+    month = month_of(start_date)
+    while month <= month_of(end_date):
+        months.append(month)
+        _, upper = month_bounds(month)
+        month = month_of(upper)
+    return months
+
+class HistoryStore:
+    """按月分区的列式历史数据存储"""
+
+    def __init__(self, base_dir: Optional[str] = None):
+        self._base_dir = base_dir
+
+    @property
+    def base_dir(self) -> str:
+        return self._base_dir or get_system_config().get("history_dir", "data/history")
+
+    def partition_dir(self, dataset: str, month: int) -> str:
+        return os.path.join(self.base_dir, dataset, str(month))
+
+    # ---- 写入 ----
+
+    def write_partition(self, dataset: str, month: int, columns: Dict[str, np.ndarray]):
+        """
+        原子地替换一个月的分区：先写入临时目录再改名。
+        没有数据时删除该分区
+        """
+        final_dir = self.partition_dir(dataset, month)
+        rows = len(next(iter(columns.values()))) if columns else 0
+        if rows == 0:
+            shutil.rmtree(final_dir, ignore_errors=True)
+            return
+
+        tmp_dir = final_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name, (_, dtype) in DATASETS[dataset].items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(columns[name], dtype=dtype))
+
+        old_dir = final_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(final_dir):
+            os.replace(final_dir, old_dir)
+        os.replace(tmp_dir, final_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    @staticmethod
+    def _collect(dataset: str, rows: Iterable[tuple]) -> Dict[str, np.ndarray]:
+        """逐行追加到紧凑的 array 缓冲区，最后转为 NumPy 列"""
+        spec = DATASETS[dataset]
+        buffers = {name: array(typecode) for name, (typecode, _) in spec.items()}
+        appends = [buffers[name].append for name in spec]
+        for row in rows:
+            for append, value in zip(appends, row):
+                append(value)
+        return {
+            name: np.frombuffer(buffers[name], dtype=dtype) if len(buffers[name]) else np.empty(0, dtype=dtype)
+            for name, (_, dtype) in spec.items()
+        }
+
+    @staticmethod
+    def _session_rows(db: Session, start: datetime, end: datetime) -> Iterable[tuple]:
+        for session_model, request_model in ((ChargeSessionArchive, CarRequestArchive), (ChargeSession, CarRequest)):
+            query = (
+                db.query(
+                    session_model.id, session_model.request_id, session_model.pile_id,
+                    request_model.request_time, session_model.start_time, session_model.end_time,
+                    session_model.charged_kwh, session_model.charge_fee, session_model.service_fee,
+                    session_model.total_fee, session_model.status
+                )
+                .outerjoin(request_model, request_model.id == session_model.request_id)
+                .filter(session_model.start_time >= start)
+                .filter(session_model.start_time < end)
+                .filter(session_model.end_time.isnot(None))
+                .order_by(session_model.id)
+                .execution_options(stream_results=True)
+                .yield_per(FETCH_SIZE)
+            )
+            for row in query:
+                yield (
+                    row[0], row[1], row[2], to_ts(row[3]), to_ts(row[4]), to_ts(row[5]),
+                    row[6] or 0.0, row[7] or 0.0, row[8] or 0.0, row[9] or 0.0,
+                    _code(SESSION_STATUSES, row[10]),
+                )
+
+    @staticmethod
+    def _event_rows(db: Session, start: datetime, end: datetime) -> Iterable[tuple]:
+        for model in (QueueLogArchive, QueueLog):
+            query = (
+                db.query(model.request_id, model.pile_id, model.log_time, model.from_status, model.to_status)
+                .filter(model.log_time >= start)
+                .filter(model.log_time < end)
+                .order_by(model.id)
+                .execution_options(stream_results=True)
+                .yield_per(FETCH_SIZE)
+            )
+            for row in query:
+                yield (
+                    row[0], row[1] if row[1] is not None else -1, to_ts(row[2]),
+                    _code(REQUEST_STATUSES, row[3]), _code(REQUEST_STATUSES, row[4]),
+                )
+
+    def export_month(self, db: Session, month: int) -> Dict[str, int]:
+        """重新导出一个月的会话和队列日志(包括归档表)，返回各数据集行数"""
+        start, end = month_bounds(month)
+        sessions = self._collect("sessions", self._session_rows(db, start, end))
+        events = self._collect("queue_events", self._event_rows(db, start, end))
+        self.write_partition("sessions", month, sessions)
+        self.write_partition("queue_events", month, events)
+        stats = {"sessions": len(sessions["session_id"]), "queue_events": len(events["request_id"])}
+        logger.info(f"历史数据 {month} 导出完成: 会话 {stats['sessions']} 条, 队列日志 {stats['queue_events']} 条")
+        return stats
+
+    # ---- 读取 ----
+
+    def load(
+        self,
+        dataset: str,
+        start_date: date,
+        end_date: date,
+        time_column: str
+    ) -> Dict[str, np.ndarray]:
+        """
+        读取日期区间 [start_date, end_date] 内的数据
+        各月分区以只读内存映射打开，仅把命中的行复制出来
+        """
+        spec = DATASETS[dataset]
+        lower = to_ts(datetime.combine(start_date, datetime.min.time()))
+        upper = to_ts(datetime.combine(end_date + timedelta(days=1), datetime.min.time()))
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in spec}
+
+        for month in months_between(start_date, end_date):
+            directory = self.partition_dir(dataset, month)
+            if not os.path.isdir(directory):
+                continue
+            columns = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                for name in spec
+            }
+            times = columns[time_column]
+            mask = (times >= lower) & (times < upper)
+            for name in spec:
+                parts[name].append(np.asarray(columns[name][mask]))
+
+        return {
+            name: np.concatenate(chunks) if chunks else np.empty(0, dtype=spec[name][1])
+            for name, chunks in parts.items()
+        }
+
+    def load_sessions(self, start_date: date, end_date: date) -> Dict[str, np.ndarray]:
+        """按开始充电时间读取会话"""
+        return self.load("sessions", start_date, end_date, "start_ts")
+
+    def load_queue_events(self, start_date: date, end_date: date) -> Dict[str, np.ndarray]:
+        """按日志时间读取队列事件"""
+        return self.load("queue_events", start_date, end_date, "log_ts")
+
+# 创建历史数据存储实例
+history_store = HistoryStore()
+
+def run_history_export_job():
+    """
+    每晚导出任务入口：重新导出昨天所在的月份，
+    每月1日执行时即完成上个月最终的导出
+    """
+    db = SessionLocal()
+    try:
+        history_store.export_month(db, month_of(date.today() - timedelta(days=1)))
+    except Exception as e:
+        logger.error(f"历史数据导出失败: {e}", exc_info=True)
+    finally:
+        db.close()
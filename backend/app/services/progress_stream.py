@@ -0,0 +1,104 @@
+from typing import Dict, List, Optional, Set, Any
+import asyncio
+import logging
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.schemas import RequestStatus
+from backend.app.services.charging_service import ChargingService
+from backend.app.core.config import get_station_config
+
+logger = logging.getLogger(__name__)
+
+# 推送后即结束推流的终态
+TERMINAL_STATUSES = {RequestStatus.FINISHED.value, RequestStatus.CANCELED.value, "ERROR"}
+
+class ProgressBroadcaster:
+    """
+    充电进度广播器
+    按固定节拍对所有被订阅的请求做一次批量计算，再把结果分发给各自的订阅者，
+    同一请求(或同一充电站)被多少人订阅，每个节拍都只计算一次
+    """
+
+    def __init__(self):
+        # 订阅者: {request_id: {asyncio.Queue}}
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        # 每个请求最近一次计算出的状态，新订阅者可以立即拿到
+        self.latest: Dict[int, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def subscribe(self, request_id: int) -> asyncio.Queue:
+        """订阅指定请求的进度，返回接收更新的队列"""
+        # 队列只保留最新一条，慢消费者不会积压旧数据
+        queue: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.subscribers.setdefault(request_id, set()).add(queue)
+
+        if request_id in self.latest:
+            queue.put_nowait(self.latest[request_id])
+
+        self._ensure_running()
+        # 唤醒广播循环，让新订阅者尽快拿到第一条数据
+        self._wakeup.set()
+        logger.info(f"新增进度订阅: 请求ID={request_id}, 当前订阅数={len(self.subscribers[request_id])}")
+        return queue
+
+    def unsubscribe(self, request_id: int, queue: asyncio.Queue):
+        """取消订阅"""
+        queues = self.subscribers.get(request_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[request_id]
+            self.latest.pop(request_id, None)
+        logger.info(f"取消进度订阅: 请求ID={request_id}")
+
+    def _ensure_running(self):
+        """确保广播循环在运行"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        """广播循环：没有订阅者时自动退出"""
+        loop = asyncio.get_running_loop()
+        while self.subscribers:
+            request_ids = list(self.subscribers.keys())
+            try:
+                # 数据库访问放到线程池中执行，避免阻塞事件循环
+                states = await loop.run_in_executor(None, self._compute, request_ids)
+                self._fan_out(request_ids, states)
+            except Exception as e:
+                logger.error(f"计算充电进度失败: {e}", exc_info=True)
+
+            interval = get_station_config().get("ProgressStreamInterval", 5)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @staticmethod
+    def _compute(request_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """一次批量查询计算所有被订阅请求的状态"""
+        db = SessionLocal()
+        try:
+            return ChargingService.get_charging_status_batch(db, request_ids)
+        finally:
+            db.close()
+
+    def _fan_out(self, request_ids: List[int], states: Dict[int, Dict[str, Any]]):
+        """把计算结果分发给订阅者"""
+        for request_id in request_ids:
+            state = states.get(request_id) or {
+                "request_id": request_id, "error": "充电请求不存在", "status": "ERROR"
+            }
+            self.latest[request_id] = state
+            for queue in list(self.subscribers.get(request_id, ())):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(state)
+
+# 创建进度广播器实例
+progress_broadcaster = ProgressBroadcaster()
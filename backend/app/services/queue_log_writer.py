@@ -0,0 +1,231 @@
+from typing import Any, Dict, List, Optional
+from collections import deque
+from datetime import datetime
+import atexit
+import json
+import logging
+import os
+import threading
+
+from sqlalchemy import insert
+
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import QueueLog
+from backend.app.core.config import get_system_config
+
+logger = logging.getLogger(__name__)
+
+def _plain(value: Any) -> Any:
+    """枚举转为其取值，便于批量写入和序列化"""
+    return getattr(value, "value", value)
+
+class QueueLogWriter:
+    """
+    队列日志异步写入器
+    状态变更提交后只把日志放入内存缓冲区，由后台线程在数量或时间阈值到达时
+    用一条多行 INSERT 批量写入 t_queue_log；写入失败、缓冲区溢出或进程退出时
+    未写入的日志追加到本地 JSONL 备份文件，下次启动时重新导入
+    """
+
+    def __init__(self):
+        self._buffer: deque = deque()
+        self._lock = threading.Lock()
+        # 串行化数据库写入和备份文件读写
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---- 配置 ----
+
+    @staticmethod
+    def _settings() -> Dict[str, Any]:
+        config = get_system_config()
+        return {
+            "flush_size": int(config.get("queue_log_flush_size", 200)),
+            "flush_interval": float(config.get("queue_log_flush_interval", 1.0)),
+            "buffer_size": int(config.get("queue_log_buffer_size", 10000)),
+            "spool_file": config.get("queue_log_spool_file", "queue_log.spool.jsonl"),
+        }
+
+    # ---- 写入接口 ----
+
+    def log(
+        self,
+        request_id: int,
+        from_status: Any,
+        to_status: Any,
+        pile_id: Optional[int] = None,
+        queue_position: Optional[int] = None,
+        remark: Optional[str] = None,
+        log_time: Optional[datetime] = None
+    ):
+        """记录一条队列状态变更，应在对应的数据库事务提交之后调用"""
+        self.log_many([dict(
+            request_id=request_id,
+            from_status=from_status,
+            to_status=to_status,
+            pile_id=pile_id,
+            queue_position=queue_position,
+            remark=remark,
+            log_time=log_time,
+        )])
+
+    def log_many(self, rows: List[Dict[str, Any]]):
+        """批量记录队列状态变更"""
+        if not rows:
+            return
+        settings = self._settings()
+        now = datetime.now()
+        overflow = []
+        with self._lock:
+            for row in rows:
+                self._buffer.append({
+                    "request_id": row["request_id"],
+                    "from_status": _plain(row["from_status"]),
+                    "to_status": _plain(row["to_status"]),
+                    "pile_id": row.get("pile_id"),
+                    "queue_position": row.get("queue_position"),
+                    "remark": row.get("remark"),
+                    "log_time": row.get("log_time") or now,
+                })
+            # 缓冲区已满时把最旧的日志转存到备份文件，不丢弃
+            while len(self._buffer) > settings["buffer_size"]:
+                overflow.append(self._buffer.popleft())
+            pending = len(self._buffer)
+
+        if overflow:
+            logger.warning(f"队列日志缓冲区已满，{len(overflow)} 条日志转存到备份文件")
+            self._spool(overflow, settings["spool_file"])
+
+        self._ensure_started()
+        if pending >= settings["flush_size"]:
+            self._wakeup.set()
+
+    def pending(self) -> int:
+        """缓冲区中尚未写入的日志数量"""
+        with self._lock:
+            return len(self._buffer)
+
+    # ---- 后台写入 ----
+
+    def start(self):
+        """启动后台写入线程，并导入上次遗留在备份文件中的日志"""
+        self.replay_spool()
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="queue-log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self._settings()["flush_interval"])
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"队列日志写入线程异常: {e}", exc_info=True)
+
+    def flush(self) -> int:
+        """把缓冲区中的日志批量写入数据库，返回写入条数"""
+        with self._flush_lock:
+            with self._lock:
+                rows = list(self._buffer)
+                self._buffer.clear()
+            if not rows:
+                return 0
+
+            settings = self._settings()
+            try:
+                self._insert(rows, settings["flush_size"])
+                return len(rows)
+            except Exception as e:
+                logger.error(f"批量写入队列日志失败，{len(rows)} 条日志转存到备份文件: {e}")
+                self._spool(rows, settings["spool_file"])
+                return 0
+
+    @staticmethod
+    def _insert(rows: List[Dict[str, Any]], batch_size: int):
+        """在一个事务中按批次执行多行 INSERT"""
+        db = SessionLocal()
+        try:
+            for i in range(0, len(rows), batch_size):
+                db.execute(insert(QueueLog), rows[i:i + batch_size])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def stop(self):
+        """停止后台线程并写入剩余日志(进程退出时自动调用)"""
+        self._stopped.set()
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self._thread = None
+        self.flush()
+
+    # ---- 备份文件 ----
+
+    @staticmethod
+    def _spool(rows: List[Dict[str, Any]], path: str):
+        """把日志追加写入备份文件并落盘"""
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    record = dict(row)
+                    record["log_time"] = record["log_time"].isoformat()
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logger.critical(f"写入队列日志备份文件失败，{len(rows)} 条日志丢失: {e}", exc_info=True)
+
+    def replay_spool(self) -> int:
+        """导入备份文件中的日志，成功后删除备份文件"""
+        settings = self._settings()
+        path = settings["spool_file"]
+        with self._flush_lock:
+            if not os.path.exists(path):
+                return 0
+            # 先改名，导入期间新产生的备份写入新文件
+            replaying = f"{path}.replay"
+            if not os.path.exists(replaying):
+                os.replace(path, replaying)
+
+            rows = []
+            with open(replaying, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                        record["log_time"] = datetime.fromisoformat(record["log_time"])
+                        rows.append(record)
+                    except (ValueError, KeyError) as e:
+                        logger.error(f"跳过无法解析的队列日志备份记录: {e}")
+
+            try:
+                if rows:
+                    self._insert(rows, settings["flush_size"])
+            except Exception as e:
+                logger.error(f"导入队列日志备份文件失败，保留备份文件: {e}")
+                return 0
+            os.remove(replaying)
+            logger.info(f"已从备份文件导入 {len(rows)} 条队列日志")
+            return len(rows)
+
+# 创建队列日志写入器实例
+queue_log_writer = QueueLogWriter()
+atexit.register(queue_log_writer.stop)
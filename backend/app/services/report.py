@@ -7,8 +7,9 @@ import io
 import logging
 
 from backend.app.db.models import (
-    ChargePile, ChargeSession, ReportDaily
+    ChargePile, ReportDaily
 )
+from backend.app.services.archive import ArchiveService
 
 logger = logging.getLogger(__name__)
 
@@ -31,13 +32,7 @@ class ReportService:
             start_datetime = datetime.combine(report_date, datetime.min.time())
             end_datetime = datetime.combine(report_date, datetime.max.time())
             
-            sessions = (
-                db.query(ChargeSession)
-                .filter(ChargeSession.pile_id == pile.id)
-                .filter(ChargeSession.start_time >= start_datetime)
-                .filter(ChargeSession.start_time <= end_datetime)
-                .all()
-            )
+            sessions = ArchiveService.sessions_between(db, pile.id, start_datetime, end_datetime)
             
             # 计算统计数据
             charge_count = len(sessions)
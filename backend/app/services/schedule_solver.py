@@ -0,0 +1,102 @@
+"""
+批量调度求解器
+求解"多台速度不同的机器上总完成时间最短"问题(Q||ΣCj)，并考虑每个充电桩已有的排队时长和剩余车位
+"""
+from typing import List, Tuple
+
+def solve_min_total_completion(
+    amounts: List[float],
+    powers: List[float],
+    backlogs: List[float],
+    capacities: List[int]
+) -> Tuple[List[List[int]], float]:
+    """
+    将车辆分配到充电桩并确定每个桩内的充电顺序，使所有车辆完成时间之和最小
+
+    参数:
+        amounts: 每辆车的请求充电量(kWh)
+        powers: 每个充电桩的功率(kWh/h)
+        backlogs: 每个充电桩清空现有队列所需时间(分钟)
+        capacities: 每个充电桩剩余可用车位数
+
+    返回:
+        (每个充电桩按充电顺序排列的车辆下标列表, 总完成时间(分钟))
+
+    位置权重建模：车辆 j 排在充电桩 i 的倒数第 k 位时，它的充电时长会计入本桩
+    后面 k 辆车(含自身)的完成时间，因此贡献为 backlog_i + k * amount_j / power_i * 60。
+    任意选定一组位置后，按充电量从大到小与位置权重从小到大配对即为最优(排序不等式)，
+    所以只需在按权重排序的位置序列上做动态规划选择位置，复杂度 O(位置数 × 车辆数)。
+    """
+    n = len(amounts)
+    if n == 0:
+        return [[] for _ in powers], 0.0
+
+    # 生成所有可用位置: (权重, 固定代价, 充电桩下标, 倒数第k位)
+    positions = []
+    for i, (power, backlog, capacity) in enumerate(zip(powers, backlogs, capacities)):
+        if power <= 0:
+            continue
+        for k in range(1, min(capacity, n) + 1):
+            positions.append((k * 60.0 / power, backlog, i, k))
+
+    if len(positions) < n:
+        raise ValueError(f"可用车位({len(positions)})少于待调度车辆({n})")
+
+    positions.sort(key=lambda pos: (pos[0], pos[1]))
+    # 车辆按充电量从大到小排列，第 r 个被选中的位置配第 r 辆车
+    order = sorted(range(n), key=lambda j: amounts[j], reverse=True)
+    sorted_amounts = [amounts[j] for j in order]
+
+    inf = float('inf')
+    total_positions = len(positions)
+    # dp[r]: 在已处理的位置中选出 r 个位置、配给最大的 r 辆车的最小代价
+    dp = [0.0] + [inf] * n
+    take = []
+    for t, (weight, backlog, _, _) in enumerate(positions):
+        # 剩余位置不足以放下剩余车辆的状态无需计算
+        low = max(1, n - (total_positions - t) + 1)
+        high = min(n, t + 1)
+        chosen = bytearray(n + 1)
+        for r in range(high, low - 1, -1):
+            previous = dp[r - 1]
+            if previous == inf:
+                continue
+            candidate = previous + sorted_amounts[r - 1] * weight + backlog
+            if candidate < dp[r]:
+                dp[r] = candidate
+                chosen[r] = 1
+        take.append(chosen)
+
+    # 回溯得到每辆车的位置
+    assigned = {}
+    r = n
+    for t in range(total_positions - 1, -1, -1):
+        if r == 0:
+            break
+        if take[t][r]:
+            _, _, pile_index, k = positions[t]
+            assigned.setdefault(pile_index, []).append((k, order[r - 1]))
+            r -= 1
+
+    # 倒数位次越大越先充电，即每个桩内按充电量从小到大(最短作业优先)
+    schedule: List[List[int]] = [[] for _ in powers]
+    for pile_index, items in assigned.items():
+        items.sort(key=lambda item: item[0], reverse=True)
+        schedule[pile_index] = [job for _, job in items]
+
+    return schedule, total_completion_time(schedule, amounts, powers, backlogs)
+
+def total_completion_time(
+    schedule: List[List[int]],
+    amounts: List[float],
+    powers: List[float],
+    backlogs: List[float]
+) -> float:
+    """计算给定分配方案下所有车辆完成时间之和(分钟)"""
+    total = 0.0
+    for pile_index, jobs in enumerate(schedule):
+        finish = backlogs[pile_index]
+        for job in jobs:
+            finish += amounts[job] / powers[pile_index] * 60
+            total += finish
+    return total
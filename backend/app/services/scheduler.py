@@ -1,17 +1,34 @@
 import logging
 import math
+import random
+import time
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, Callable
 
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
 
-from backend.app.db.models import CarRequest, ChargePile, ChargeSession, QueueLog
+from backend.app.db.models import CarRequest, ChargePile, ChargeSession
 from backend.app.db.schemas import RequestStatus, ChargeMode, PileStatus
 from backend.app.services.billing import BillingService
+from backend.app.services.eta import eta_service
+from backend.app.services.charge_curve import charged_energy, effective_amount, pile_curve
+from backend.app.services.queue_log_writer import queue_log_writer
+from backend.app.services.schedule_solver import solve_min_total_completion
+from backend.app.services.scoring import best_pile_index, assign_sequentially, completion_matrix
+from backend.app.services.tariff import tariff_service
 from backend.app.core.config import get_station_config
+from backend.app.core.station import DEFAULT_STATION, current_station_id
 
 logger = logging.getLogger(__name__)
 
+# MySQL 锁等待超时、死锁的错误码，队列变更遇到时回滚重试
+LOCK_CONFLICT_CODES = (1205, 1213)
+
+class QueueConflictError(Exception):
+    """充电桩队列在读取之后被其他事务修改"""
+
 class ChargingScheduler:
     """充电调度器，实现核心调度算法"""
     
@@ -20,38 +37,42 @@ class ChargingScheduler:
         """
         生成排队号码
         F开头 → 快充；T开头 → 慢充
-        号码格式：<mode><顺序号>，顺序号自增
+        号码格式：<mode><顺序号>，顺序号在当前充电站内自增
+        默认充电站以外的号码加充电站前缀 <station_id>-，保证各站号码不重复
         """
+        station_id = current_station_id()
         # 确定前缀
         prefix = "F" if mode == ChargeMode.FAST else "T"
+        if station_id != DEFAULT_STATION:
+            prefix = f"{station_id}-{prefix}"
         
-        # 查询当前模式下最大的序号
+        # 查询当前充电站该模式下最大的序号
         last_request = (
             db.query(CarRequest)
             .filter(CarRequest.mode == mode)
+            .filter(CarRequest.station_id == station_id)
             .order_by(CarRequest.id.desc())
             .first()
         )
         
         # 计算新序号
+        count_query = db.query(CarRequest).filter(CarRequest.mode == mode, CarRequest.station_id == station_id)
         if last_request and last_request.queue_number.startswith(prefix):
             try:
-                last_number = int(last_request.queue_number[1:])
+                last_number = int(last_request.queue_number[len(prefix):])
                 new_number = last_number + 1
             except (ValueError, IndexError):
                 # 如果最新的号码格式不正确，则重新从1开始
-                count = db.query(CarRequest).filter(CarRequest.mode == mode).count()
-                new_number = count + 1
+                new_number = count_query.count() + 1
         else:
-            count = db.query(CarRequest).filter(CarRequest.mode == mode).count()
-            new_number = count + 1
+            new_number = count_query.count() + 1
             
         return f"{prefix}{new_number}"
     
     @staticmethod
     def check_waiting_area_capacity(db: Session) -> bool:
         """
-        检查等候区容量是否已满
+        检查当前充电站等候区容量是否已满
         返回True表示有空位，False表示已满
         """
         config = get_station_config()
@@ -60,6 +81,7 @@ class ChargingScheduler:
         # 计算等候区当前车辆数量
         current_waiting_count = (
             db.query(CarRequest)
+            .filter(CarRequest.station_id == current_station_id())
             .filter(CarRequest.status == RequestStatus.WAITING)
             .count()
         )
@@ -68,19 +90,21 @@ class ChargingScheduler:
     
     @staticmethod
     def get_all_piles_by_mode(db: Session, mode: ChargeMode) -> List[ChargePile]:
-        """获取指定模式下的所有充电桩，无论其状态如何"""
+        """获取当前充电站指定模式下的所有充电桩，无论其状态如何"""
         pile_type = "FAST" if mode == ChargeMode.FAST else "SLOW"
         return (
             db.query(ChargePile)
+            .filter(ChargePile.station_id == current_station_id())
             .filter(ChargePile.type == pile_type)
             .all()
         )
     
     @staticmethod
     def get_available_piles_for_dispatch(db: Session, mode: ChargeMode) -> List[ChargePile]:
-        """获取指定模式下可用于调度的充电桩 (状态为可用或繁忙，且队列未满)"""
+        """获取当前充电站指定模式下可用于调度的充电桩 (状态为可用或繁忙，且队列未满)"""
         pile_type = "FAST" if mode == ChargeMode.FAST else "SLOW"
         all_piles = db.query(ChargePile).filter(
+            ChargePile.station_id == current_station_id(),
             ChargePile.type == pile_type,
             ChargePile.status.in_([PileStatus.AVAILABLE, PileStatus.BUSY])
         ).all()
@@ -93,9 +117,10 @@ class ChargingScheduler:
 
     @staticmethod
     def count_waiting_cars(db: Session, mode: ChargeMode) -> int:
-        """获取指定模式下等候区等待的车辆数量"""
+        """获取当前充电站指定模式下等候区等待的车辆数量"""
         return (
             db.query(CarRequest)
+            .filter(CarRequest.station_id == current_station_id())
             .filter(CarRequest.mode == mode)
             .filter(CarRequest.status == RequestStatus.WAITING)
             .count()
@@ -132,70 +157,32 @@ class ChargingScheduler:
         """
         计算指定充电桩队列的总预计等待时间(分钟)
         如果提供了queue_position，则只计算位置小于该值的车辆的等待时间
+        基于预计时间服务维护的队列前缀和，为 O(1) 查询
         """
         try:
-            logger.info(f"计算充电桩 {pile_id} 的等待时间，队列位置条件: {queue_position}")
-            
-            pile = db.query(ChargePile).filter(ChargePile.id == pile_id).first()
-            if not pile:
-                logger.warning(f"充电桩 {pile_id} 不存在")
-                return float('inf')
-                
-            if pile.power <= 0:
-                logger.warning(f"充电桩 {pile_id} 功率为0或负值: {pile.power}")
-                return float('inf')
-
-            power = pile.power
-            
-            query = db.query(CarRequest).filter(
-                CarRequest.pile_id == pile_id,
-                CarRequest.status.in_([RequestStatus.QUEUING, RequestStatus.CHARGING])
-            )
-            
-            # 如果指定了队列位置，只计算该位置之前的车辆
-            if queue_position is not None:
-                query = query.filter(CarRequest.queue_position < queue_position)
-            
-            queuing_requests = query.order_by(CarRequest.queue_position).all()
-            logger.info(f"找到 {len(queuing_requests)} 辆队列中的车辆需要计算等待时间")
-            
-            total_waiting_time = 0.0
-            for request in queuing_requests:
-                if request.status == RequestStatus.CHARGING and request.start_time:
-                    # 正在充电的车辆，计算剩余充电时间
-                    duration_hours = (datetime.now() - request.start_time).total_seconds() / 3600
-                    charged_kwh = duration_hours * power
-                    remaining_kwh = max(0, request.amount_kwh - charged_kwh)
-                    remaining_time_hours = remaining_kwh / power
-                    total_waiting_time += remaining_time_hours * 60
-                    logger.info(f"车辆 {request.id} 正在充电，已充 {charged_kwh:.2f} kWh，剩余 {remaining_kwh:.2f} kWh，剩余时间 {remaining_time_hours*60:.2f} 分钟")
-                else:
-                    # 排队中的车辆，计算完整充电时间
-                    charging_time_hours = request.amount_kwh / power
-                    total_waiting_time += charging_time_hours * 60
-                    logger.info(f"车辆 {request.id} 在排队中，需要充电 {request.amount_kwh:.2f} kWh，预计需要 {charging_time_hours*60:.2f} 分钟")
-            
-            logger.info(f"充电桩 {pile_id} 的总等待时间: {total_waiting_time:.2f} 分钟")
-            return total_waiting_time
-            
+            waiting_time = eta_service.waiting_minutes(db, pile_id, queue_position)
+            logger.debug(f"充电桩 {pile_id} 的等待时间(队列位置条件: {queue_position}): {waiting_time:.2f} 分钟")
+            return waiting_time
         except Exception as e:
             logger.error(f"计算充电桩 {pile_id} 等待时间时发生错误: {e}", exc_info=True)
             return float('inf')
     
     @staticmethod
-    def calculate_total_finish_time(db: Session, pile_id: int, amount_kwh: float) -> float:
+    def calculate_total_finish_time(
+        db: Session,
+        pile_id: int,
+        amount_kwh: float,
+        battery_capacity: Optional[float] = None
+    ) -> float:
         """
         计算车辆在该桩的预计总完成时长(分钟) = 等待时间 + 自身充电时间
+        提供电池容量时自身充电时间按充电桩的功率曲线计算
         """
-        pile = db.query(ChargePile).filter(ChargePile.id == pile_id).first()
-        if not pile or pile.power <= 0:
+        try:
+            return eta_service.finish_if_appended(db, pile_id, amount_kwh, battery_capacity)
+        except Exception as e:
+            logger.error(f"计算充电桩 {pile_id} 完成时间时发生错误: {e}", exc_info=True)
             return float('inf')
-            
-        # 获取当前队列所有车辆的等待时间
-        waiting_time = ChargingScheduler.get_pile_queue_waiting_time(db, pile_id)
-        self_charging_time_minutes = (amount_kwh / pile.power) * 60
-        
-        return waiting_time + self_charging_time_minutes
     
     @staticmethod
     def select_optimal_pile(db: Session, request: CarRequest) -> Optional[ChargePile]:
@@ -204,40 +191,52 @@ class ChargingScheduler:
         策略：完成充电所需时长（等待时间+自己充电时间）最短
         """
         available_piles = ChargingScheduler.get_available_piles_for_dispatch(db, request.mode)
-        if not available_piles:
-            return None
-            
-        best_pile = None
-        min_finish_time = float('inf')
-        
-        for pile in available_piles:
-            finish_time = ChargingScheduler.calculate_total_finish_time(db, pile.id, request.amount_kwh)
-            if finish_time < min_finish_time:
-                min_finish_time = finish_time
-                best_pile = pile
-                
-        return best_pile
+        return ChargingScheduler.pick_best_pile(db, available_piles, effective_amount(request))
     
     @staticmethod
     def find_best_pile(db: Session, mode: ChargeMode, amount_kwh: float) -> Optional[ChargePile]:
         """
         根据充电模式和充电量找到最优的充电桩
         策略：完成充电所需时长（等待时间+自己充电时间）最短
+        amount_kwh 为等效电量(见 charge_curve.effective_amount)
         """
         available_piles = ChargingScheduler.get_available_piles_for_dispatch(db, mode)
-        if not available_piles:
+        return ChargingScheduler.pick_best_pile(db, available_piles, amount_kwh)
+    
+    @staticmethod
+    def get_pile_backlogs(db: Session, piles: List[ChargePile]) -> List[float]:
+        """获取一组充电桩清空当前队列所需的时间(分钟)"""
+        return [ChargingScheduler.get_pile_queue_waiting_time(db, pile.id) for pile in piles]
+    
+    @staticmethod
+    def get_pile_free_slots(db: Session, piles: List[ChargePile]) -> List[int]:
+        """获取一组充电桩的剩余车位数(充电中+排队中不超过队列长度)"""
+        if not piles:
+            return []
+        queue_len = get_station_config().get("ChargingQueueLen", 2)
+        counts = dict(
+            db.query(CarRequest.pile_id, func.count(CarRequest.id))
+            .filter(CarRequest.pile_id.in_([pile.id for pile in piles]))
+            .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+            .group_by(CarRequest.pile_id)
+            .all()
+        )
+        return [max(0, queue_len - counts.get(pile.id, 0)) for pile in piles]
+    
+    @staticmethod
+    def pick_best_pile(db: Session, piles: List[ChargePile], amount_kwh: float) -> Optional[ChargePile]:
+        """
+        在给定充电桩中选出完成时间(等待时间+自己充电时间)最短的一个
+        amount_kwh 为等效电量(见 charge_curve.effective_amount)，充电时长按 电量/功率 计算
+        """
+        if not piles:
             return None
-            
-        best_pile = None
-        min_finish_time = float('inf')
-        
-        for pile in available_piles:
-            finish_time = ChargingScheduler.calculate_total_finish_time(db, pile.id, amount_kwh)
-            if finish_time < min_finish_time:
-                min_finish_time = finish_time
-                best_pile = pile
-                
-        return best_pile
+        index = best_pile_index(
+            amount_kwh,
+            [pile.power for pile in piles],
+            ChargingScheduler.get_pile_backlogs(db, piles)
+        )
+        return piles[index] if index >= 0 else None
     
     @staticmethod
     def calculate_finish_time(db: Session, pile_id: int, amount_kwh: float) -> float:
@@ -246,64 +245,146 @@ class ChargingScheduler:
         """
         return ChargingScheduler.calculate_total_finish_time(db, pile_id, amount_kwh)
     
+    @staticmethod
+    def lock_pile(db: Session, pile_id: int) -> Optional[ChargePile]:
+        """
+        锁定充电桩行(SELECT ... FOR UPDATE)
+        同一充电桩的队列变更都先锁定该行，因此在数据库层串行执行
+        """
+        return db.query(ChargePile).filter(ChargePile.id == pile_id).populate_existing().with_for_update().first()
+    
+    @staticmethod
+    def bump_pile_version(db: Session, pile: ChargePile):
+        """
+        比较并递增充电桩的队列版本号
+        读取队列之后版本号已被其他事务修改(数据库不支持行锁时)抛出 QueueConflictError
+        """
+        updated = (
+            db.query(ChargePile)
+            .filter(ChargePile.id == pile.id, ChargePile.version == pile.version)
+            .update({ChargePile.version: ChargePile.version + 1}, synchronize_session=False)
+        )
+        if updated != 1:
+            raise QueueConflictError(f"充电桩 {pile.code} 的队列已被其他操作修改")
+        db.expire(pile, ["version"])
+    
+    @staticmethod
+    def _is_lock_conflict(error: Exception) -> bool:
+        """是否为可以重试的并发冲突：版本号冲突、死锁或锁等待超时"""
+        if isinstance(error, QueueConflictError):
+            return True
+        if isinstance(error, OperationalError) and error.orig is not None and error.orig.args:
+            return error.orig.args[0] in LOCK_CONFLICT_CODES
+        return False
+    
+    @staticmethod
+    def _run_with_retry(db: Session, action: Callable[[], Any], description: str) -> Any:
+        """
+        执行一个队列变更事务，发生并发冲突时回滚并重试
+        重试次数由 QueueMutationRetries 配置，其他异常回滚后直接抛出
+        """
+        retries = max(1, int(get_station_config().get("QueueMutationRetries", 3)))
+        for attempt in range(1, retries + 1):
+            try:
+                return action()
+            except Exception as e:
+                db.rollback()
+                if attempt == retries or not ChargingScheduler._is_lock_conflict(e):
+                    raise
+                logger.warning(f"{description}时发生并发冲突，第 {attempt} 次重试: {e}")
+                time.sleep(random.uniform(0, 0.02 * attempt))
+    
+    @staticmethod
+    def _assign_once(db: Session, request_id: int, pile_id: int) -> Optional[Tuple[CarRequest, ChargePile, str, int]]:
+        """
+        分配事务：锁定充电桩和请求，在锁内读取队列长度作为新车的队列位置，
+        写入后递增充电桩版本号。请求已不在等候区或队列已满时返回 None
+        """
+        pile = ChargingScheduler.lock_pile(db, pile_id)
+        if not pile:
+            logger.error(f"Pile {pile_id} not found")
+            return None
+        
+        request = db.query(CarRequest).filter(CarRequest.id == request_id).with_for_update().first()
+        if not request:
+            logger.error(f"Request {request_id} not found")
+            db.rollback()
+            return None
+        if request.status != RequestStatus.WAITING:
+            # 已被并发的调度分配，或已被取消
+            logger.warning(f"Request {request_id} is {request.status}, not WAITING. Skipping assignment to pile {pile.code}.")
+            db.rollback()
+            return None
+        if request.station_id != pile.station_id:
+            # 各充电站的车辆只能分配到本站的充电桩
+            logger.error(f"Request {request_id} belongs to station {request.station_id}, pile {pile.code} to {pile.station_id}.")
+            db.rollback()
+            return None
+        
+        # 获取当前队列中的车辆数量（充电中+排队中）
+        queue_length = (
+            db.query(CarRequest)
+            .filter(CarRequest.pile_id == pile_id)
+            .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+            .count()
+        )
+        queue_len = get_station_config(pile.station_id).get("ChargingQueueLen", 2)
+        if queue_length >= queue_len:
+            logger.warning(f"Pile {pile.code} queue is full ({queue_length}/{queue_len}). Cannot assign request {request_id}.")
+            db.rollback()
+            return None
+        
+        # 新车的队列位置
+        queue_position = queue_length
+        
+        old_status = request.status
+        request.status = RequestStatus.QUEUING
+        request.pile_id = pile_id
+        request.queue_position = queue_position
+        
+        if pile.status == PileStatus.AVAILABLE:
+            pile.status = PileStatus.BUSY
+        
+        ChargingScheduler.bump_pile_version(db, pile)
+        db.commit()
+        return request, pile, old_status, queue_position
+    
     @staticmethod
     def assign_to_pile(db: Session, request_id: int, pile_id: int) -> bool:
         """
         将请求分配到充电桩队列
+        在锁定充电桩的事务中计算队列位置，并发冲突时重试，
+        保证同一位置不会被分配两次、同一请求不会被分配到两个充电桩
         """
         try:
-            request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
-            if not request:
-                logger.error(f"Request {request_id} not found")
-                return False
-                
-            pile = db.query(ChargePile).filter(ChargePile.id == pile_id).first()
-            if not pile:
-                logger.error(f"Pile {pile_id} not found")
-                return False
-                
-            # 获取当前队列中的车辆数量（充电中+排队中）
-            current_queue = (
-                db.query(CarRequest)
-                .filter(CarRequest.pile_id == pile_id)
-                .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
-                .order_by(CarRequest.queue_position)
-                .all()
-            )
-            
-            # 计算新车的队列位置
-            queue_position = len(current_queue)
-            
-            old_status = request.status
-            request.status = RequestStatus.QUEUING
-            request.pile_id = pile_id
-            request.queue_position = queue_position
-            
-            queue_log = QueueLog(
-                request_id=request.id,
-                from_status=old_status,
-                to_status=RequestStatus.QUEUING,
-                pile_id=pile_id,
-                queue_position=queue_position,
-                remark=f"分配到充电桩 {pile.code}, 队列位置 {queue_position}"
+            assigned = ChargingScheduler._run_with_retry(
+                db,
+                lambda: ChargingScheduler._assign_once(db, request_id, pile_id),
+                f"分配请求 {request_id} 到充电桩 {pile_id}"
             )
-            db.add(queue_log)
-            
-            if pile.status == PileStatus.AVAILABLE:
-                pile.status = PileStatus.BUSY
-            
-            db.commit()
-
-            logger.info(f"Successfully assigned request {request.id} to pile {pile.code} at position {queue_position}")
-            
-            if queue_position == 0:
-                ChargingScheduler.start_charging(db, request.id)
-                
-            return True
         except Exception as e:
             logger.error(f"Error assigning request {request_id} to pile {pile_id}: {e}", exc_info=True)
-            db.rollback()
             return False
+        if assigned is None:
+            return False
+        
+        request, pile, old_status, queue_position = assigned
+        eta_service.on_assign(pile_id, request.id, request.amount_kwh, request.battery_capacity, pile.version)
+        queue_log_writer.log(
+            request_id=request.id,
+            from_status=old_status,
+            to_status=RequestStatus.QUEUING,
+            pile_id=pile_id,
+            queue_position=queue_position,
+            remark=f"分配到充电桩 {pile.code}, 队列位置 {queue_position}"
+        )
+
+        logger.info(f"Successfully assigned request {request.id} to pile {pile.code} at position {queue_position}")
+        
+        if queue_position == 0:
+            ChargingScheduler.start_charging(db, request.id)
+            
+        return True
 
     @staticmethod
     def call_next_waiting_car(db: Session, mode: ChargeMode):
@@ -322,6 +403,7 @@ class ChargingScheduler:
         # 2. 获取等候区下一辆车 (按排队号FIFO)
         logger.info(f"[{mode.value}] Step 2: Getting next car from waiting area.")
         next_car = db.query(CarRequest).filter(
+            CarRequest.station_id == current_station_id(),
             CarRequest.mode == mode,
             CarRequest.status == RequestStatus.WAITING
         ).order_by(CarRequest.queue_number).first()
@@ -348,6 +430,7 @@ class ChargingScheduler:
         - default: 默认调度，按照排队号码顺序依次调度
         - batch_mode: 单次调度总充电时长最短
         - bulk_mode: 批量调度总充电时长最短
+        - cost_mode: 满足离开时间的前提下电费最省
         """
         logger.info("--- Main Scheduler: Checking and calling waiting cars ---")
         
@@ -364,6 +447,11 @@ class ChargingScheduler:
             # 批量调度总充电时长最短
             logger.info("使用批量调度总充电时长最短策略")
             ChargingScheduler.bulk_schedule_shortest_total_time(db)
+        elif strategy == "cost_mode":
+            # 电价最省
+            logger.info("使用电价最省调度策略")
+            for mode in [ChargeMode.FAST, ChargeMode.SLOW]:
+                ChargingScheduler.tariff_schedule_cheapest(db, mode)
         else:
             # 默认调度
             logger.info("使用默认调度策略")
@@ -374,15 +462,19 @@ class ChargingScheduler:
     def start_charging(db: Session, request_id: int) -> Tuple[bool, str]:
         """
         开始充电，将队列中第一个位置的车辆状态改为充电中
+        锁定请求行，避免并发的队内晋升重复创建充电会话
         """
-        request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
+        request = db.query(CarRequest).filter(CarRequest.id == request_id).with_for_update().first()
         if not request:
+            db.rollback()
             return False, "充电请求不存在"
         
         if request.status != RequestStatus.QUEUING:
+            db.rollback()
             return False, f"充电请求状态错误: {request.status}"
         
         if request.queue_position != 0:
+            db.rollback()
             return False, f"队列位置错误，不是第一个位置: {request.queue_position}"
         
         old_status = request.status
@@ -392,90 +484,136 @@ class ChargingScheduler:
         # 创建充电会话
         BillingService.create_charge_session(db, request.id, request.pile_id)
 
-        queue_log = QueueLog(
+        db.commit()
+        eta_service.on_start(request.pile_id, request.id, request.start_time)
+        queue_log_writer.log(
             request_id=request.id, from_status=old_status, to_status=RequestStatus.CHARGING,
             pile_id=request.pile_id, queue_position=request.queue_position, remark="开始充电"
         )
-        db.add(queue_log)
-        db.commit()
         
         logger.info(f"Request {request.id} has started charging on pile {request.pile_id}.")
         return True, "成功开始充电"
     
+    @staticmethod
+    def _release_once(
+        db: Session,
+        request_id: int,
+        allowed_statuses: List[str],
+        new_status: str
+    ) -> Optional[Tuple[CarRequest, str, Optional[ChargePile], Optional[int]]]:
+        """
+        出队事务：锁定请求所在的充电桩和请求本身，把请求置为结束状态，
+        队列中排在其后的车辆位置前移一位，更新充电桩状态并递增版本号。
+        请求状态不在 allowed_statuses 中时返回 None(例如已被并发地完成或取消)
+        返回 (请求, 原状态, 原充电桩, 原队列位置)
+        """
+        request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
+        if not request:
+            return None
+        # 先锁充电桩再锁请求，与分配事务的加锁顺序一致
+        locked_pile_id = request.pile_id
+        pile = ChargingScheduler.lock_pile(db, locked_pile_id) if locked_pile_id else None
+        db.refresh(request, with_for_update=True)
+        if request.status not in allowed_statuses:
+            db.rollback()
+            return None
+        if request.pile_id != locked_pile_id:
+            raise QueueConflictError(f"请求 {request_id} 所在的充电桩已变化")
+        
+        old_status = request.status
+        queue_position = request.queue_position
+        request.status = new_status
+        request.end_time = datetime.now()
+        request.pile_id = None
+        request.queue_position = None
+        db.flush()
+        
+        if pile:
+            if queue_position is not None:
+                db.query(CarRequest).filter(
+                    CarRequest.pile_id == pile.id,
+                    CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]),
+                    CarRequest.queue_position > queue_position
+                ).update({CarRequest.queue_position: CarRequest.queue_position - 1}, synchronize_session="fetch")
+            
+            remaining = (
+                db.query(CarRequest)
+                .filter(CarRequest.pile_id == pile.id)
+                .filter(CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING]))
+                .count()
+            )
+            # 故障或关闭的充电桩保持原状态
+            if pile.status in [PileStatus.AVAILABLE, PileStatus.BUSY]:
+                pile.status = PileStatus.BUSY if remaining else PileStatus.AVAILABLE
+            ChargingScheduler.bump_pile_version(db, pile)
+        
+        db.commit()
+        return request, old_status, pile, queue_position
+    
+    @staticmethod
+    def _promote_next(db: Session, pile: ChargePile):
+        """队首空出后，让队列位置0的排队车辆开始充电("队内晋升")"""
+        next_car = (
+            db.query(CarRequest)
+            .filter(CarRequest.pile_id == pile.id)
+            .filter(CarRequest.status == RequestStatus.QUEUING)
+            .filter(CarRequest.queue_position == 0)
+            .first()
+        )
+        if next_car:
+            logger.info(f"Promoting request {next_car.id} to start charging on pile {pile.code}.")
+            ChargingScheduler.start_charging(db, next_car.id)
+    
     @staticmethod
     def finish_charging(db: Session, request_id: int) -> Tuple[bool, str]:
         """
         完成充电, 并处理后续调度
+        先在锁定充电桩的事务中把请求出队(请求必须仍处于充电中，
+        自动完成与用户结束充电并发时只有一方成功)，再结算账单、队内晋升并从等候区叫号
         """
         logger.info(f"--- Attempting to finish charging for request_id: {request_id} ---")
-        with db.begin_nested():
+        try:
+            released = ChargingScheduler._run_with_retry(
+                db,
+                lambda: ChargingScheduler._release_once(db, request_id, [RequestStatus.CHARGING], RequestStatus.FINISHED),
+                f"完成充电请求 {request_id}"
+            )
+        except Exception as e:
+            logger.error(f"Finish charging failed for request {request_id}: {e}", exc_info=True)
+            return False, "完成充电失败"
+        
+        if released is None:
             request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
             if not request:
                 logger.error(f"Finish charging failed: Request {request_id} not found.")
                 return False, "充电请求不存在"
-
-            if request.status != RequestStatus.CHARGING:
-                logger.warning(f"Finish charging called on a non-charging request. Status: {request.status}")
-                return False, f"充电请求状态为 {request.status}，无法完成充电"
-
-            pile_id = request.pile_id
-            if not pile_id:
-                logger.error(f"FATAL: Request {request_id} is CHARGING but has no pile_id.")
-                request.status = RequestStatus.FINISHED
-                db.commit()
-                return False, "请求状态不一致"
-
-            pile = db.query(ChargePile).filter(ChargePile.id == pile_id).first()
-            if not pile:
-                logger.error(f"Finish charging failed: Pile {pile_id} not found for request {request_id}.")
-                return False, "充电桩不存在"
-
-            # 1. 结算账单
-            active_session = db.query(ChargeSession).filter(ChargeSession.request_id == request_id, ChargeSession.status == "CHARGING").first()
-            if active_session:
-                BillingService.complete_charge_session(db, active_session.id)
-            else:
-                logger.warning(f"Could not find an active charging session for request {request_id} to finalize billing.")
-
-            # 2. 记录日志并释放已完成的请求
-            queue_log = QueueLog(
-                request_id=request.id, from_status=RequestStatus.CHARGING, to_status=RequestStatus.FINISHED,
-                pile_id=pile.id, queue_position=request.queue_position, remark=f"充电完成，从充电桩 {pile.code} 释放"
-            )
-            db.add(queue_log)
-            
-            request.status = RequestStatus.FINISHED
-            request.end_time = datetime.now()
-            request.pile_id = None
-            request.queue_position = None
+            logger.warning(f"Finish charging called on a non-charging request. Status: {request.status}")
+            return False, f"充电请求状态为 {request.status}，无法完成充电"
         
-        logger.info(f"Request {request_id} has finished and is released. Now managing the queue for pile {pile.code}.")
-
-        # 3. "队内晋升": 处理桩内剩余的排队车辆
-        remaining_cars = db.query(CarRequest).filter(CarRequest.pile_id == pile_id).order_by(CarRequest.queue_position).all()
-        if remaining_cars:
-            logger.info(f"Found {len(remaining_cars)} car(s) remaining in pile {pile.code}'s queue. Updating positions.")
-            with db.begin_nested():
-                for car in remaining_cars:
-                    if car.queue_position is not None and car.queue_position > 0:
-                        car.queue_position -= 1
-            
-            next_car_to_charge = next((car for car in remaining_cars if car.queue_position == 0), None)
-            if next_car_to_charge and next_car_to_charge.status == RequestStatus.QUEUING:
-                logger.info(f"Promoting request {next_car_to_charge.id} to start charging on pile {pile.code}.")
-                ChargingScheduler.start_charging(db, next_car_to_charge.id)
-
-        # 4. 更新充电桩状态
-        final_car_count = db.query(CarRequest).filter(CarRequest.pile_id == pile_id).count()
-        if final_car_count == 0:
-            pile.status = PileStatus.AVAILABLE
-            logger.info(f"Pile {pile.code} status set to AVAILABLE as it is now empty.")
+        request, _, pile, queue_position = released
+        
+        # 1. 结算账单
+        active_session = db.query(ChargeSession).filter(ChargeSession.request_id == request_id, ChargeSession.status == "CHARGING").first()
+        if active_session:
+            BillingService.complete_charge_session(db, active_session.id)
         else:
-            pile.status = PileStatus.BUSY
-            logger.info(f"Pile {pile.code} remains BUSY with {final_car_count} car(s) in its queue.")
-        db.commit()
+            logger.warning(f"Could not find an active charging session for request {request_id} to finalize billing.")
+        
+        if not pile:
+            logger.error(f"FATAL: Request {request_id} was CHARGING but had no pile_id.")
+            return False, "请求状态不一致"
+        
+        eta_service.on_leave(pile.id, request_id, pile.version)
+        queue_log_writer.log(
+            request_id=request_id, from_status=RequestStatus.CHARGING, to_status=RequestStatus.FINISHED,
+            pile_id=pile.id, queue_position=queue_position, remark=f"充电完成，从充电桩 {pile.code} 释放"
+        )
+        logger.info(f"Request {request_id} has finished and is released from pile {pile.code}.")
 
-        # 5. 触发全局调度
+        # 2. 队内晋升
+        ChargingScheduler._promote_next(db, pile)
+
+        # 3. 触发全局调度
         logger.info(f"Pile {pile.code} queue management finished. Now checking main waiting area for new cars to schedule.")
         ChargingScheduler.check_and_call_waiting_cars(db)
         
@@ -484,13 +622,16 @@ class ChargingScheduler:
     @staticmethod
     def check_and_finish_completed_charges(db: Session):
         """
-        检查并结束所有已完成的充电任务
+        检查并结束当前充电站所有已完成的充电任务
         这是为了防止客户端没有上报完成状态导致调度卡死的核心保障机制
         """
         logger.info("--- Auto-finishing check: Starting scan for completed charges. ---")
         
         try:
-            charging_requests = db.query(CarRequest).filter(CarRequest.status == RequestStatus.CHARGING).all()
+            charging_requests = db.query(CarRequest).filter(
+                CarRequest.station_id == current_station_id(),
+                CarRequest.status == RequestStatus.CHARGING
+            ).all()
             
             if not charging_requests:
                 # logger.info("--- Auto-finishing check: No active charging sessions found. ---")
@@ -508,8 +649,9 @@ class ChargingScheduler:
                     logger.warning(f"--- Auto-finishing check: Skipping request {req.id} due to missing pile or pile power is zero. ---")
                     continue
 
-                duration_hours = (datetime.now() - req.start_time).total_seconds() / 3600
-                charged_kwh = duration_hours * pile.power
+                # 按功率曲线计算已充电量，接近充满时功率下降
+                charging_minutes = (datetime.now() - req.start_time).total_seconds() / 60
+                charged_kwh = charged_energy(pile, req, charging_minutes)
                 
                 if charged_kwh >= req.amount_kwh:
                     logger.info(f"--- Auto-finishing check: Request {req.id} has reached 100% progress ({charged_kwh:.2f}/{req.amount_kwh:.2f} kWh). Attempting to finish it automatically. ---")
@@ -521,20 +663,33 @@ class ChargingScheduler:
     def cancel_charging(db: Session, request_id: int) -> Tuple[bool, str]:
         """
         取消充电请求
+        与完成充电相同，先在锁定充电桩的事务中出队，再结算已充电量、队内晋升并从等候区叫号
         """
         logger.info(f"--- Attempting to cancel request {request_id} ---")
-        request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
-        if not request:
-            return False, "充电请求不存在"
-
-        if request.status in [RequestStatus.FINISHED, RequestStatus.CANCELED]:
+        try:
+            released = ChargingScheduler._run_with_retry(
+                db,
+                lambda: ChargingScheduler._release_once(
+                    db, request_id,
+                    [RequestStatus.WAITING, RequestStatus.QUEUING, RequestStatus.CHARGING],
+                    RequestStatus.CANCELED
+                ),
+                f"取消充电请求 {request_id}"
+            )
+        except Exception as e:
+            logger.error(f"Cancel failed for request {request_id}: {e}", exc_info=True)
+            return False, "取消充电请求失败"
+        
+        if released is None:
+            request = db.query(CarRequest).filter(CarRequest.id == request_id).first()
+            if not request:
+                return False, "充电请求不存在"
             return False, f"无法取消状态为 {request.status} 的请求"
-
-        old_status = request.status
-        old_pile_id = request.pile_id
+        
+        request, old_status, pile, _ = released
         
         # 如果是充电中状态，需要结算账单
-        if old_status == RequestStatus.CHARGING and old_pile_id:
+        if old_status == RequestStatus.CHARGING and pile:
             active_session = db.query(ChargeSession).filter(
                 ChargeSession.request_id == request_id, 
                 ChargeSession.status == "CHARGING"
@@ -544,10 +699,9 @@ class ChargingScheduler:
                 logger.info(f"Request {request_id} was in CHARGING state. Interrupting charging session {active_session.id}.")
                 
                 # 计算已充电量
-                pile = db.query(ChargePile).filter(ChargePile.id == old_pile_id).first()
-                if pile and request.start_time:
-                    charging_hours = (datetime.now() - request.start_time).total_seconds() / 3600
-                    charged_kwh = min(request.amount_kwh, pile.power * charging_hours)
+                if request.start_time:
+                    charging_minutes = (request.end_time - request.start_time).total_seconds() / 60
+                    charged_kwh = charged_energy(pile, request, charging_minutes)
                     
                     # 中断充电会话并结算
                     BillingService.interrupt_charge_session(db, active_session.id, charged_kwh)
@@ -558,28 +712,20 @@ class ChargingScheduler:
             else:
                 logger.warning(f"Could not find an active charging session for request {request_id}.")
 
+        if pile:
+            eta_service.on_leave(pile.id, request_id, pile.version)
         # 记录取消日志
-        queue_log = QueueLog(
-            request_id=request.id, from_status=old_status, to_status=RequestStatus.CANCELED,
+        queue_log_writer.log(
+            request_id=request_id, from_status=old_status, to_status=RequestStatus.CANCELED,
             remark=f"用户取消请求，原始状态: {old_status}"
         )
-        db.add(queue_log)
-
-        # 更新请求状态
-        request.status = RequestStatus.CANCELED
-        request.pile_id = None
-        request.queue_position = None
-        request.end_time = datetime.now()
-
-        db.commit()
         logger.info(f"Request {request_id} status set to CANCELED.")
 
-        # 如果取消的是在充电桩队列中的车，需要进行后续处理
-        if old_status in [RequestStatus.QUEUING, RequestStatus.CHARGING] and old_pile_id:
-            logger.info(f"Request was in pile {old_pile_id}, proceeding to manage queue.")
-            # 重新触发一次完成流程，来处理队列晋升和状态更新
-            # 这是最安全的方式，因为它会检查队内下一辆车，并检查是否需要从等候区拉人
-            ChargingScheduler.finish_charging(db, request.id)
+        # 如果取消的是在充电桩队列中的车，处理队内晋升并从等候区叫号
+        if pile:
+            logger.info(f"Request was in pile {pile.code}, proceeding to manage queue.")
+            ChargingScheduler._promote_next(db, pile)
+            ChargingScheduler.check_and_call_waiting_cars(db)
         
         return True, "成功取消充电请求"
 
@@ -587,9 +733,11 @@ class ChargingScheduler:
     def fix_pile_charging_status(db: Session):
         """
         修复充电桩队列数据 - 系统启动时调用
-        确保每个充电桩只有位置0的车辆处于CHARGING状态
+        确保每个充电桩只有位置0的车辆处于CHARGING状态。
+        运行期间的队列变更都在锁定充电桩的事务中完成，这里只用于修复异常退出或旧版本遗留的数据
         """
         logger.info("执行修复充电桩队列数据的操作...")
+        changed = False
         try:
             # 获取所有充电桩
             piles = db.query(ChargePile).all()
@@ -606,6 +754,7 @@ class ChargingScheduler:
                 # 如果队列为空，确保充电桩状态为AVAILABLE
                 if not queue_cars and pile.status == PileStatus.BUSY:
                     pile.status = PileStatus.AVAILABLE
+                    changed = True
                     logger.info(f"修复: 充电桩 {pile.code} 没有车辆但状态为BUSY，已改为AVAILABLE")
                     continue
                 
@@ -615,6 +764,7 @@ class ChargingScheduler:
                         # 第一个位置的车应该在充电
                         car.status = RequestStatus.CHARGING
                         car.start_time = datetime.now()
+                        changed = True
                         logger.info(f"修复: 将队列位置0的车辆 {car.id} 状态从QUEUING改为CHARGING")
                         
                         # 确保充电桩状态为BUSY
@@ -626,25 +776,33 @@ class ChargingScheduler:
                         # 非第一个位置的车不应该在充电
                         car.status = RequestStatus.QUEUING
                         car.start_time = None
+                        changed = True
                         logger.info(f"修复: 将非队列位置0的车辆 {car.id} 状态从CHARGING改为QUEUING")
                     
                     # 确保队列位置正确
                     if car.queue_position != i:
                         logger.info(f"修复: 车辆 {car.id} 队列位置从 {car.queue_position} 改为 {i}")
                         car.queue_position = i
+                        changed = True
             
             db.commit()
+            if changed:
+                # 修复改动了队列，使队列时间索引失效
+                eta_service.invalidate()
             logger.info("充电桩队列数据修复完成")
         except Exception as e:
             logger.error(f"修复充电桩队列数据失败: {e}", exc_info=True)
             db.rollback()
+            # 由启动预热重试
+            raise
 
     @staticmethod
     def get_available_piles(db: Session, mode: ChargeMode) -> List[ChargePile]:
-        """获取指定模式下可用的充电桩(状态为可用或繁忙)"""
+        """获取当前充电站指定模式下可用的充电桩(状态为可用或繁忙)"""
         pile_type = "FAST" if mode == ChargeMode.FAST else "SLOW"
         return (
             db.query(ChargePile)
+            .filter(ChargePile.station_id == current_station_id())
             .filter(ChargePile.type == pile_type)
             .filter(ChargePile.status.in_([PileStatus.AVAILABLE, PileStatus.BUSY]))
             .all()
@@ -662,7 +820,7 @@ class ChargingScheduler:
                 return False
                 
             # 找到最优的充电桩
-            best_pile = ChargingScheduler.find_best_pile(db, request.mode, request.amount_kwh)
+            best_pile = ChargingScheduler.find_best_pile(db, request.mode, effective_amount(request))
             if not best_pile:
                 logger.warning(f"No available pile found for request {request_id}")
                 return False
@@ -692,23 +850,9 @@ class ChargingScheduler:
             return
         
         # 计算可用空位数量
-        available_slots = 0
-        for pile in available_piles:
-            # 检查每个充电桩的可用空位
-            queue_length = ChargingScheduler.get_pile_queue_length(db, pile.id)
-            charging_car = db.query(CarRequest).filter(
-                CarRequest.pile_id == pile.id,
-                CarRequest.status == RequestStatus.CHARGING
-            ).first()
-            
-            # 如果没有正在充电的车，则第一个位置也可用
-            if not charging_car:
-                available_slots += 1
-            
-            # 剩余队列位置
-            config = get_station_config()
-            max_queue_len = config.get("ChargingQueueLen", 2)
-            available_slots += max_queue_len - queue_length - (1 if charging_car else 0)
+        free_slots = ChargingScheduler.get_pile_free_slots(db, available_piles)
+        pile_free_slots = {pile.id: slots for pile, slots in zip(available_piles, free_slots)}
+        available_slots = sum(free_slots)
         
         if available_slots <= 0:
             logger.info(f"[{mode.value}] 没有可用空位，跳过调度")
@@ -716,6 +860,7 @@ class ChargingScheduler:
         
         # 2. 获取等候区中该模式的车辆
         waiting_cars = db.query(CarRequest).filter(
+            CarRequest.station_id == current_station_id(),
             CarRequest.mode == mode,
             CarRequest.status == RequestStatus.WAITING
         ).order_by(CarRequest.queue_number).limit(available_slots).all()
@@ -755,7 +900,7 @@ class ChargingScheduler:
             for pile in piles:
                 # 检查充电桩是否有足够空间
                 pile_assignments = [c_id for c_id, p_id in current_assignment.items() if p_id == pile.id]
-                if len(pile_assignments) >= config.get("ChargingQueueLen", 2):
+                if len(pile_assignments) >= pile_free_slots[pile.id]:
                     continue
                 
                 # 分配车辆到充电桩
@@ -775,6 +920,16 @@ class ChargingScheduler:
         logger.info(f"[{mode.value}] 生成了{len(all_possible_assignments)}种可能的分配方案")
         
         # 4. 评估每种方案的总充电时长
+        # 各充电桩当前队列时长和每辆车在各桩的充电时长与方案无关，只计算一次
+        pile_index = {pile.id: j for j, pile in enumerate(available_piles)}
+        car_index = {car.id: i for i, car in enumerate(waiting_cars)}
+        backlogs = ChargingScheduler.get_pile_backlogs(db, available_piles)
+        charge_times = completion_matrix(
+            [effective_amount(car) for car in waiting_cars],
+            [pile.power for pile in available_piles],
+            [0.0] * len(available_piles)
+        )
+        
         best_assignment = None
         min_total_time = float('inf')
         
@@ -785,39 +940,18 @@ class ChargingScheduler:
             # 为每个充电桩创建队列
             pile_queues = {}
             for car_id, pile_id in assignment.items():
-                if pile_id not in pile_queues:
-                    pile_queues[pile_id] = []
-                pile_queues[pile_id].append(next(car for car in waiting_cars if car.id == car_id))
-            
-            # 对每个充电桩的队列按照排队号码排序
-            for pile_id, queue in pile_queues.items():
-                queue.sort(key=lambda car: car.queue_number)
+                pile_queues.setdefault(pile_id, []).append(car_index[car_id])
             
-            # 计算每个充电桩的总等待时间和充电时间
             for pile_id, queue in pile_queues.items():
-                pile = next(p for p in available_piles if p.id == pile_id)
-                
-                # 获取当前充电桩的状态
-                current_queue = db.query(CarRequest).filter(
-                    CarRequest.pile_id == pile_id,
-                    CarRequest.status.in_([RequestStatus.CHARGING, RequestStatus.QUEUING])
-                ).order_by(CarRequest.queue_position).all()
+                # 对每个充电桩的队列按照排队号码排序
+                queue.sort(key=lambda i: waiting_cars[i].queue_number)
                 
-                # 计算当前队列的等待时间
-                waiting_time = ChargingScheduler.get_pile_queue_waiting_time(db, pile_id)
-                
-                # 计算新车辆的等待时间和充电时间
-                for i, car in enumerate(queue):
-                    # 等待时间 = 当前队列等待时间 + 前面新车的充电时间
-                    car_waiting_time = waiting_time
-                    for j in range(i):
-                        car_waiting_time += (queue[j].amount_kwh / pile.power) * 60  # 转换为分钟
-                    
-                    # 充电时间
-                    car_charging_time = (car.amount_kwh / pile.power) * 60  # 转换为分钟
-                    
-                    # 总时间
-                    total_time += car_waiting_time + car_charging_time
+                # 每辆新车的总时间 = 当前队列等待时间 + 前面新车的充电时间 + 自身充电时间
+                j = pile_index[pile_id]
+                finish_time = backlogs[j]
+                for i in queue:
+                    finish_time += charge_times[i][j]
+                    total_time += finish_time
             
             # 更新最佳方案
             if total_time < min_total_time:
@@ -856,6 +990,7 @@ class ChargingScheduler:
         
         # 2. 获取等候区中的车辆数量
         waiting_cars_count = db.query(CarRequest).filter(
+            CarRequest.station_id == current_station_id(),
             CarRequest.status == RequestStatus.WAITING
         ).count()
         
@@ -873,23 +1008,13 @@ class ChargingScheduler:
             logger.info("没有可用充电桩，跳过调度")
             return
         
-        # 计算可用空位总数
-        total_available_slots = 0
-        for pile in all_available_piles:
-            # 检查每个充电桩的可用空位
-            queue_length = ChargingScheduler.get_pile_queue_length(db, pile.id)
-            charging_car = db.query(CarRequest).filter(
-                CarRequest.pile_id == pile.id,
-                CarRequest.status == RequestStatus.CHARGING
-            ).first()
-            
-            # 如果没有正在充电的车，则第一个位置也可用
-            if not charging_car:
-                total_available_slots += 1
-            
-            # 剩余队列位置
-            max_queue_len = config.get("ChargingQueueLen", 2)
-            total_available_slots += max_queue_len - queue_length - (1 if charging_car else 0)
+        # 计算每个充电桩的可用空位(与 check_pile_queue_available 一致，充电中+排队中不超过队列长度)
+        max_queue_len = config.get("ChargingQueueLen", 2)
+        pile_free_slots = {
+            pile.id: max(0, max_queue_len - eta_service.queue_length(db, pile.id))
+            for pile in all_available_piles
+        }
+        total_available_slots = sum(pile_free_slots.values())
         
         if total_available_slots < bulk_size:
             logger.info(f"可用空位数量({total_available_slots})不足批量调度要求({bulk_size})，跳过调度")
@@ -897,6 +1022,7 @@ class ChargingScheduler:
         
         # 4. 获取等候区中的车辆（按照排队号码排序）
         waiting_cars = db.query(CarRequest).filter(
+            CarRequest.station_id == current_station_id(),
             CarRequest.status == RequestStatus.WAITING
         ).order_by(CarRequest.queue_number).limit(bulk_size).all()
         
@@ -906,48 +1032,28 @@ class ChargingScheduler:
         
         logger.info(f"找到{len(waiting_cars)}辆等候车辆，开始批量调度")
         
-        # 5. 计算所有可能的分配方案
-        # 由于组合数可能非常大，这里使用贪心算法而不是穷举
-        # 首先按照充电量从大到小排序车辆
-        waiting_cars.sort(key=lambda car: car.amount_kwh, reverse=True)
-        
-        # 为每个充电桩创建队列
-        pile_queues = {pile.id: [] for pile in all_available_piles}
-        
         # 计算每个充电桩的当前等待时间
-        pile_waiting_times = {}
-        for pile in all_available_piles:
-            pile_waiting_times[pile.id] = ChargingScheduler.get_pile_queue_waiting_time(db, pile.id)
+        pile_waiting_times = {
+            pile.id: ChargingScheduler.get_pile_queue_waiting_time(db, pile.id)
+            for pile in all_available_piles
+        }
         
-        # 贪心分配：每次选择完成时间最早的充电桩
-        for car in waiting_cars:
-            best_pile_id = None
-            min_finish_time = float('inf')
-            
-            for pile in all_available_piles:
-                # 检查充电桩是否有足够空间
-                if len(pile_queues[pile.id]) >= config.get("ChargingQueueLen", 2):
-                    continue
-                
-                # 计算在该充电桩上的完成时间
-                waiting_time = pile_waiting_times[pile.id]
-                charging_time = (car.amount_kwh / pile.power) * 60  # 转换为分钟
-                finish_time = waiting_time + charging_time
-                
-                if finish_time < min_finish_time:
-                    min_finish_time = finish_time
-                    best_pile_id = pile.id
-            
-            if best_pile_id:
-                # 分配车辆到最佳充电桩
-                pile_queues[best_pile_id].append(car)
-                # 更新该充电桩的等待时间
-                pile = next(p for p in all_available_piles if p.id == best_pile_id)
-                pile_waiting_times[best_pile_id] += (car.amount_kwh / pile.power) * 60
-            else:
-                logger.warning(f"无法为车辆{car.id}找到合适的充电桩")
+        # 5. 求解分配方案
+        solver = config.get("BulkScheduleSolver", "optimal")
+        pile_queues = None
+        if solver == "optimal":
+            try:
+                pile_queues = ChargingScheduler._solve_bulk_optimal(
+                    waiting_cars, all_available_piles, pile_waiting_times, pile_free_slots
+                )
+            except ValueError as e:
+                logger.warning(f"最优批量调度求解失败，改用贪心算法: {e}")
+        if pile_queues is None:
+            pile_queues = ChargingScheduler._solve_bulk_greedy(
+                waiting_cars, all_available_piles, pile_waiting_times, pile_free_slots
+            )
         
-        # 6. 执行分配方案
+        # 6. 执行分配方案(每个桩内按求解出的充电顺序依次入队)
         assigned_count = 0
         for pile_id, queue in pile_queues.items():
             for car in queue:
@@ -957,4 +1063,119 @@ class ChargingScheduler:
                 else:
                     logger.error(f"分配车辆{car.id}到充电桩{pile_id}失败")
         
-        logger.info(f"批量调度完成，成功分配{assigned_count}辆车") 
\ No newline at end of file
+        logger.info(f"批量调度完成，成功分配{assigned_count}辆车")
+
+    @staticmethod
+    def tariff_schedule_cheapest(db: Session, mode: ChargeMode):
+        """
+        电价最省调度：
+        对填写了预计离开时间的车辆，在满足离开时间的前提下选择电费最低的充电桩和开始时刻。
+        最优开始时刻就是该桩的最早可开始时刻时立即分配；晚于最早时刻(等待低谷电价)时
+        车辆继续留在等候区，由后续调度周期重新评估。
+        未填写离开时间或无法在离开时间前充完的车辆按完成时间最短分配。
+        功率曲线下按各桩的平均充电功率(请求电量 / 充电时长)估算充电时长和电费。
+        这与 BillingService.calculate_charging_cost 把电量按时长均摊到各小时的计费方式一致，
+        估算的电费就是实际账单的充电费；按曲线实际的充电过程(前段快、尾段慢)计算会有偏差，
+        见 TariffCurve.charge_cost
+        """
+        available_piles = ChargingScheduler.get_available_piles_for_dispatch(db, mode)
+        if not available_piles:
+            return
+        free_slots = ChargingScheduler.get_pile_free_slots(db, available_piles)
+        if sum(free_slots) <= 0:
+            return
+        
+        waiting_cars = db.query(CarRequest).filter(
+            CarRequest.station_id == current_station_id(),
+            CarRequest.mode == mode,
+            CarRequest.status == RequestStatus.WAITING
+        ).order_by(CarRequest.queue_number).all()
+        if not waiting_cars:
+            return
+        
+        now = datetime.now()
+        powers = [pile.power for pile in available_piles]
+        backlogs = ChargingScheduler.get_pile_backlogs(db, available_piles)
+        curve = tariff_service.curve(db, now)
+        tolerance = float(get_station_config().get("TariffStartTolerance", 1))
+        
+        for car in waiting_cars:
+            if sum(free_slots) <= 0:
+                break
+            
+            durations = [
+                pile_curve(pile).charge_minutes(car.amount_kwh, pile.power, car.battery_capacity)
+                for pile in available_piles
+            ]
+            choice = None
+            if car.departure_time:
+                average_powers = [
+                    car.amount_kwh / duration * 60 if 0 < duration < float('inf') else 0.0
+                    for duration in durations
+                ]
+                choice = curve.cheapest_start(car.amount_kwh, average_powers, backlogs, free_slots, now, car.departure_time)
+            if choice is None:
+                if car.departure_time:
+                    logger.warning(f"[{mode.value}] 车辆 {car.queue_number} 无法在离开时间 {car.departure_time} 前充完，按完成时间最短分配")
+                index = best_pile_index(effective_amount(car), powers, backlogs, free_slots)
+                if index < 0:
+                    break
+            else:
+                index, start_offset, cost = choice
+                if start_offset - backlogs[index] > tolerance:
+                    logger.info(
+                        f"[{mode.value}] 车辆 {car.queue_number} 推迟约 {start_offset - backlogs[index]:.0f} 分钟"
+                        f"在充电桩 {available_piles[index].code} 开始充电，预计电费 {cost:.2f} 元"
+                    )
+                    continue
+            
+            pile = available_piles[index]
+            if ChargingScheduler.assign_to_pile(db, car.id, pile.id):
+                backlogs[index] += durations[index]
+                free_slots[index] -= 1
+    
+    @staticmethod
+    def _solve_bulk_optimal(
+        cars: List[CarRequest],
+        piles: List[ChargePile],
+        pile_waiting_times: Dict[int, float],
+        pile_free_slots: Dict[int, int]
+    ) -> Dict[int, List[CarRequest]]:
+        """精确求解总完成时间最短的分配方案，返回 {充电桩ID: 按充电顺序排列的车辆}"""
+        schedule, total_minutes = solve_min_total_completion(
+            [effective_amount(car) for car in cars],
+            [pile.power for pile in piles],
+            [pile_waiting_times[pile.id] for pile in piles],
+            [pile_free_slots[pile.id] for pile in piles]
+        )
+        logger.info(f"最优批量调度方案总完成时间: {total_minutes:.2f}分钟")
+        return {
+            pile.id: [cars[j] for j in schedule[i]]
+            for i, pile in enumerate(piles)
+        }
+    
+    @staticmethod
+    def _solve_bulk_greedy(
+        cars: List[CarRequest],
+        piles: List[ChargePile],
+        pile_waiting_times: Dict[int, float],
+        pile_free_slots: Dict[int, int]
+    ) -> Dict[int, List[CarRequest]]:
+        """贪心分配：按充电量从大到小，每次选择完成时间最早的充电桩"""
+        pile_queues = {pile.id: [] for pile in piles}
+        amounts = {car.id: effective_amount(car) for car in cars}
+        ordered_cars = sorted(cars, key=lambda c: amounts[c.id], reverse=True)
+        
+        assignment = assign_sequentially(
+            [amounts[car.id] for car in ordered_cars],
+            [pile.power for pile in piles],
+            [pile_waiting_times[pile.id] for pile in piles],
+            [pile_free_slots[pile.id] for pile in piles]
+        )
+        for car, index in zip(ordered_cars, assignment):
+            if index >= 0:
+                pile_queues[piles[index].id].append(car)
+            else:
+                logger.warning(f"无法为车辆{car.id}找到合适的充电桩")
+        
+        return pile_queues
@@ -0,0 +1,376 @@
+"""
+调度执行器(单写者)
+请求处理函数和后台定时任务不再各自直接修改队列，而是把状态变更封装成命令提交到同一个命令队列，
+由唯一的执行循环依次执行：
+
+- 所有状态变更都在同一个工作线程中串行执行，队列时间索引等内存状态只有一个写者；
+- 执行循环每次取出队列中已积压的一批命令连续执行，批内需要从等候区叫号的命令
+  只在整批结束后统一叫号一次，避免每个请求都触发一次完整调度；
+- 命令队列有容量上限，提交方等待结果有超时，队列已满或等待超时时立即返回"调度繁忙"，
+  使单个命令的延迟有上界。
+
+命令是接收数据库会话的函数，在执行器自己的会话中运行。
+命令应只返回普通值(如ID)，不要返回 ORM 对象：会话在批次结束后关闭
+
+每个充电站有独立的执行器(各自的命令队列和工作线程)，命令在所属充电站的作用域内执行，
+一个繁忙的充电站不会阻塞其他充电站的调度
+"""
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy.orm import Session
+
+from backend.app.db.database import SessionLocal
+from backend.app.services.scheduler import ChargingScheduler
+from backend.app.services.board import board_publisher
+from backend.app.services.billing_pipeline import billing_pipeline
+from backend.app.services.change_feed import ChangeTracker, schedule_publish
+from backend.app.core.config import get_station_config, get_station_ids, get_system_config
+from backend.app.core.station import DEFAULT_STATION, station_scope
+
+logger = logging.getLogger(__name__)
+
+# 每种命令保留的最近延迟样本数
+LATENCY_SAMPLES = 500
+
+class SchedulerBusyError(Exception):
+    """调度命令队列已满，或命令等待超时"""
+
+class _Command:
+    __slots__ = ("name", "fn", "dispatch", "future", "enqueued_at")
+
+    def __init__(self, name: str, fn: Callable[[Session], Any], dispatch: bool, future: asyncio.Future):
+        self.name = name
+        self.fn = fn
+        self.dispatch = dispatch
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+class SchedulerActor:
+    """单个充电站的调度执行器：一个命令队列 + 一个执行循环 + 一个工作线程"""
+
+    def __init__(self, station_id: str = DEFAULT_STATION):
+        self.station_id = station_id
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # 统计信息在工作线程中写入、在事件循环中读取
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self._latencies: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._counts: Dict[str, List[int]] = {}
+        self._max_depth = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._batches = 0
+        self._dispatch_requests = 0
+        self._dispatch_runs = 0
+
+    # ---- 配置 ----
+
+    def _settings(self) -> Dict[str, Any]:
+        config = get_station_config(self.station_id)
+        return {
+            "queue_size": int(config.get("ActorQueueSize", 1000)),
+            "batch_size": int(config.get("ActorBatchSize", 32)),
+            "timeout": float(config.get("ActorCommandTimeout", 10)),
+        }
+
+    # ---- 生命周期 ----
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """在事件循环中启动执行循环(应用启动时调用)"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self._settings()["queue_size"])
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"scheduler-{self.station_id}")
+        self._task = self._loop.create_task(self._run())
+        logger.info(f"充电站 {self.station_id} 的调度执行器已启动")
+
+    async def stop(self):
+        """执行完已提交的命令后停止"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._executor.shutdown(wait=True)
+        self._task = None
+        logger.info(f"充电站 {self.station_id} 的调度执行器已停止")
+
+    # ---- 提交命令 ----
+
+    async def submit(self, name: str, fn: Callable[[Session], Any], dispatch: bool = False) -> Any:
+        """
+        提交命令并等待结果，命令抛出的异常原样抛给调用方
+        dispatch=True 表示命令执行成功后需要从等候区叫号(同一批次内合并为一次)
+        执行器未启动(脚本、测试)时直接在当前线程执行
+        """
+        if not self.running:
+            return self._run_inline(name, fn, dispatch)
+
+        future = self._loop.create_future()
+        try:
+            self._queue.put_nowait(_Command(name, fn, dispatch, future))
+        except asyncio.QueueFull:
+            with self._stats_lock:
+                self._rejected += 1
+            raise SchedulerBusyError("调度队列已满，请稍后再试")
+        with self._stats_lock:
+            self._max_depth = max(self._max_depth, self._queue.qsize())
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), self._settings()["timeout"])
+        except asyncio.TimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise SchedulerBusyError(f"调度命令 {name} 等待超时，请稍后查询结果")
+
+    def submit_threadsafe(self, name: str, fn: Callable[[Session], Any], dispatch: bool = False) -> Any:
+        """
+        从其他线程(后台定时任务)提交命令并阻塞等待结果
+        不能在事件循环线程或执行器工作线程中调用
+        """
+        if not self.running:
+            return self._run_inline(name, fn, dispatch)
+        return asyncio.run_coroutine_threadsafe(self.submit(name, fn, dispatch), self._loop).result()
+
+    def _run_inline(self, name: str, fn: Callable[[Session], Any], dispatch: bool) -> Any:
+        results = self._execute_batch([_Command(name, fn, dispatch, None)])
+        ok, value = results[0]
+        if not ok:
+            raise value
+        return value
+
+    # ---- 执行 ----
+
+    async def _run(self):
+        """执行循环：取出一批命令交给工作线程执行，再把结果交还给各提交方"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            command = await self._queue.get()
+            if command is None:
+                break
+            batch = [command]
+            batch_size = self._settings()["batch_size"]
+            while len(batch) < batch_size and not self._queue.empty():
+                command = self._queue.get_nowait()
+                if command is None:
+                    stopping = True
+                    break
+                batch.append(command)
+
+            try:
+                results = await loop.run_in_executor(self._executor, self._execute_batch, batch)
+            except Exception as e:
+                logger.error(f"调度命令批次执行失败: {e}", exc_info=True)
+                results = [(False, e)] * len(batch)
+
+            for command, (ok, value) in zip(batch, results):
+                if command.future.done():
+                    continue
+                if ok:
+                    command.future.set_result(value)
+                else:
+                    command.future.set_exception(value)
+            # 队列可能已变化，提前刷新管理员看板
+            board_publisher.poke()
+
+    def _execute_batch(self, batch: List[_Command]) -> List[Tuple[bool, Any]]:
+        """在工作线程中依次执行一批命令，批次结束后按需统一叫号一次"""
+        results: List[Tuple[bool, Any]] = []
+        dispatch = False
+        db = SessionLocal()
+        # 记录本批命令已提交的队列变化，批次结束后推送给订阅者
+        tracker = ChangeTracker(db)
+        changes = None
+        with station_scope(self.station_id):
+            try:
+                for command in batch:
+                    started = time.perf_counter()
+                    try:
+                        results.append((True, command.fn(db)))
+                        dispatch = dispatch or command.dispatch
+                        failed = False
+                    except Exception as e:
+                        db.rollback()
+                        results.append((False, e))
+                        failed = True
+                    self._record(command.name, started - command.enqueued_at, time.perf_counter() - started, failed)
+
+                if dispatch:
+                    started = time.perf_counter()
+                    failed = False
+                    try:
+                        ChargingScheduler.check_and_call_waiting_cars(db)
+                    except Exception as e:
+                        db.rollback()
+                        failed = True
+                        logger.error(f"批次结束后叫号失败: {e}", exc_info=True)
+                    self._record("dispatch", 0.0, time.perf_counter() - started, failed)
+
+                # 本批命令结束的会话一次性过账
+                if billing_pipeline.pending_count():
+                    started = time.perf_counter()
+                    billing_pipeline.flush(db)
+                    self._record("billing", 0.0, time.perf_counter() - started, False)
+
+                changes = tracker.collect(db)
+            finally:
+                db.close()
+        if changes:
+            schedule_publish(changes, self._loop if self.running else None)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._dispatch_requests += sum(1 for command in batch if command.dispatch)
+            self._dispatch_runs += 1 if dispatch else 0
+        return results
+
+    # ---- 统计 ----
+
+    def _record(self, name: str, wait: float, run: float, failed: bool):
+        with self._stats_lock:
+            self._latencies.setdefault(name, deque(maxlen=LATENCY_SAMPLES)).append((wait, run))
+            counts = self._counts.setdefault(name, [0, 0])
+            counts[0] += 1
+            counts[1] += 1 if failed else 0
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        values = sorted(values)
+        return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、批次和各类命令的延迟统计(毫秒，基于最近的样本)"""
+        with self._stats_lock:
+            commands = {}
+            for name, samples in self._latencies.items():
+                waits = [wait * 1000 for wait, _ in samples]
+                totals = [(wait + run) * 1000 for wait, run in samples]
+                commands[name] = {
+                    "count": self._counts[name][0],
+                    "errors": self._counts[name][1],
+                    "wait_ms_p50": round(self._percentile(waits, 0.5), 2),
+                    "wait_ms_p95": round(self._percentile(waits, 0.95), 2),
+                    "latency_ms_p50": round(self._percentile(totals, 0.5), 2),
+                    "latency_ms_p95": round(self._percentile(totals, 0.95), 2),
+                    "latency_ms_max": round(max(totals), 2) if totals else 0.0,
+                }
+            return {
+                "station_id": self.station_id,
+                "running": self.running,
+                "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+                "max_queue_depth": self._max_depth,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "batches": self._batches,
+                "dispatch_requests": self._dispatch_requests,
+                "dispatch_runs": self._dispatch_runs,
+                "commands": commands,
+            }
+
+class StationActors:
+    """
+    各充电站的调度执行器
+    所有进程都为每个充电站启动执行器以处理接口请求，跨进程的并发由充电桩行锁和版本号保证；
+    定期检查只由负责该充电站的进程执行(配置 scheduler_stations 或环境变量 SCHEDULER_STATIONS)
+    """
+
+    def __init__(self):
+        self._actors: Dict[str, SchedulerActor] = {}
+        self._lock = threading.Lock()
+
+    def get(self, station_id: Optional[str] = None) -> SchedulerActor:
+        """充电站的调度执行器，未启动时命令在调用线程中直接执行"""
+        station_id = station_id or DEFAULT_STATION
+        with self._lock:
+            actor = self._actors.get(station_id)
+            if actor is None:
+                actor = self._actors[station_id] = SchedulerActor(station_id)
+            return actor
+
+    @staticmethod
+    def owned_station_ids() -> List[str]:
+        """本进程负责定期检查的充电站"""
+        station_ids = get_station_ids()
+        owned = os.environ.get("SCHEDULER_STATIONS")
+        if owned:
+            owned = [item.strip() for item in owned.split(",") if item.strip()]
+        else:
+            owned = [str(item) for item in get_system_config().get("scheduler_stations") or []]
+        if not owned:
+            return station_ids
+        return [station_id for station_id in station_ids if station_id in owned]
+
+    async def start(self):
+        for station_id in get_station_ids():
+            await self.get(station_id).start()
+
+    async def stop(self):
+        with self._lock:
+            actors = list(self._actors.values())
+        for actor in actors:
+            await actor.stop()
+
+    def submit_each_threadsafe(
+        self,
+        name: str,
+        fn: Callable[[Session], Any],
+        station_ids: Iterable[str],
+        dispatch: bool = False
+    ) -> Dict[str, Any]:
+        """
+        从其他线程向多个充电站各提交一次同一命令，各站并行执行，等待全部完成
+        返回 {充电站ID: 结果或异常}
+        """
+        pending = {}
+        for station_id in station_ids:
+            actor = self.get(station_id)
+            if actor.running:
+                pending[station_id] = asyncio.run_coroutine_threadsafe(actor.submit(name, fn, dispatch), actor._loop)
+            else:
+                pending[station_id] = None
+        results = {}
+        for station_id, future in pending.items():
+            try:
+                if future is None:
+                    results[station_id] = self.get(station_id).submit_threadsafe(name, fn, dispatch)
+                else:
+                    results[station_id] = future.result()
+            except Exception as e:
+                results[station_id] = e
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            actors = dict(self._actors)
+        return {"stations": {station_id: actor.stats() for station_id, actor in actors.items()}}
+
+    def queue_depths(self) -> Dict[str, int]:
+        """各充电站命令队列中积压的命令数(不计算延迟统计，供健康检查使用)"""
+        with self._lock:
+            actors = dict(self._actors)
+        return {
+            station_id: actor._queue.qsize() if actor._queue is not None else 0
+            for station_id, actor in actors.items()
+        }
+
+# 创建各充电站调度执行器的注册表
+scheduler_actors = StationActors()
@@ -0,0 +1,144 @@
+"""
+充电桩候选评分内核
+根据充电桩功率、当前队列时长和剩余车位，一次性计算一批车辆在各充电桩上的完成时间，
+所有调度策略共用。安装了 NumPy 时使用向量化计算，否则退化为纯 Python 实现
+"""
+from typing import List, Optional, Sequence, Tuple, Any
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - 未安装 NumPy 时使用纯 Python 实现
+    np = None
+
+HAS_NUMPY = np is not None
+
+INF = float('inf')
+
+def _charge_minutes(amount: float, power: float) -> float:
+    return amount / power * 60 if power > 0 else INF
+
+def completion_matrix(
+    amounts: Sequence[float],
+    powers: Sequence[float],
+    backlogs: Sequence[float],
+    free_slots: Optional[Sequence[int]] = None
+) -> Any:
+    """
+    完成时间矩阵(分钟)，第 i 行第 j 列为车辆 i 追加到充电桩 j 队尾后的完成时长
+    = backlogs[j] + amounts[i] / powers[j] * 60
+    没有剩余车位或功率无效的充电桩记为 inf。
+    安装 NumPy 时返回 ndarray，否则返回二维列表
+    """
+    if HAS_NUMPY:
+        power = np.asarray(powers, dtype=float)
+        backlog = np.asarray(backlogs, dtype=float)
+        amount = np.asarray(amounts, dtype=float)
+        unusable = power <= 0
+        if free_slots is not None:
+            unusable |= np.asarray(free_slots) <= 0
+        minutes_per_kwh = np.divide(60.0, power, out=np.full(power.shape, np.inf), where=~unusable)
+        matrix = backlog[np.newaxis, :] + amount[:, np.newaxis] * minutes_per_kwh[np.newaxis, :]
+        matrix[:, unusable] = np.inf
+        return matrix
+
+    usable = [
+        power > 0 and (free_slots is None or free_slots[j] > 0)
+        for j, power in enumerate(powers)
+    ]
+    return [
+        [
+            backlogs[j] + _charge_minutes(amount, powers[j]) if usable[j] else INF
+            for j in range(len(powers))
+        ]
+        for amount in amounts
+    ]
+
+def score_piles(
+    amounts: Sequence[float],
+    powers: Sequence[float],
+    backlogs: Sequence[float],
+    free_slots: Optional[Sequence[int]] = None
+) -> Tuple[List[int], Any]:
+    """
+    为每辆车独立选出完成时间最短的充电桩
+    返回 (每辆车最优充电桩下标列表(-1表示没有可用充电桩), 完成时间矩阵)，
+    完成时间相同时取下标较小的充电桩
+    """
+    matrix = completion_matrix(amounts, powers, backlogs, free_slots)
+    if len(amounts) == 0 or len(powers) == 0:
+        return [-1] * len(amounts), matrix
+
+    if HAS_NUMPY:
+        best = np.argmin(matrix, axis=1)
+        best[np.isinf(matrix[np.arange(len(amounts)), best])] = -1
+        return best.tolist(), matrix
+
+    best = []
+    for row in matrix:
+        index, value = -1, INF
+        for j, finish in enumerate(row):
+            if finish < value:
+                index, value = j, finish
+        best.append(index)
+    return best, matrix
+
+def best_pile_index(
+    amount: float,
+    powers: Sequence[float],
+    backlogs: Sequence[float],
+    free_slots: Optional[Sequence[int]] = None
+) -> int:
+    """单辆车完成时间最短的充电桩下标，没有可用充电桩时返回 -1"""
+    best, _ = score_piles([amount], powers, backlogs, free_slots)
+    return best[0]
+
+def assign_sequentially(
+    amounts: Sequence[float],
+    powers: Sequence[float],
+    backlogs: Sequence[float],
+    free_slots: Sequence[int]
+) -> List[int]:
+    """
+    按给定顺序逐辆分配：每辆车进入当前完成时间最短的充电桩，
+    之后该桩队列时长增加、剩余车位减一。返回每辆车的充电桩下标(-1表示未能分配)
+    """
+    if HAS_NUMPY:
+        power = np.asarray(powers, dtype=float)
+        backlog = np.array(backlogs, dtype=float)
+        slots = np.array(free_slots, dtype=int)
+        valid = power > 0
+        minutes_per_kwh = np.divide(60.0, power, out=np.full(power.shape, np.inf), where=valid)
+        finish = np.empty_like(backlog)
+        result = []
+        for amount in amounts:
+            np.multiply(minutes_per_kwh, amount, out=finish)
+            finish += backlog
+            finish[(slots <= 0) | ~valid] = np.inf
+            if finish.size == 0:
+                result.append(-1)
+                continue
+            j = int(np.argmin(finish))
+            if np.isinf(finish[j]):
+                result.append(-1)
+                continue
+            backlog[j] = finish[j]
+            slots[j] -= 1
+            result.append(j)
+        return result
+
+    backlog = list(backlogs)
+    slots = list(free_slots)
+    result = []
+    for amount in amounts:
+        index, value = -1, INF
+        for j, power in enumerate(powers):
+            if slots[j] <= 0 or power <= 0:
+                continue
+            finish = backlog[j] + _charge_minutes(amount, power)
+            if finish < value:
+                index, value = j, finish
+        if index >= 0:
+            backlog[index] = value
+            slots[index] -= 1
+        result.append(index)
+    return result
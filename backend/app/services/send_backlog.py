@@ -0,0 +1,48 @@
+"""
+WebSocket 发送积压统计
+所有发给客户端的消息(通知、主题消息、看板快照和增量、订阅确认)都经过 send_backlog.send 发送。
+客户端接收慢时，send_text 会等待写缓冲区排空；同一连接上已交给发送但尚未发送完成的消息
+就是该连接的积压，按连接记录消息数和字节数，就绪检查按单个连接的最大积压判断
+"""
+from typing import Any, Dict, List, Optional
+
+from fastapi import WebSocket
+
+class SendBacklog:
+    """按连接统计已开始但尚未完成的发送"""
+
+    def __init__(self):
+        # {WebSocket: [消息数, 字节数]}，只保留有积压的连接
+        self._pending: Dict[WebSocket, List[int]] = {}
+
+    async def send(self, websocket: WebSocket, text: str, size: Optional[int] = None):
+        """
+        发送文本帧并记录积压，发送完成(或失败)后扣除
+        同一条消息发给多个连接时，调用方可以传入预先计算的字节数
+        """
+        if size is None:
+            size = len(text.encode("utf-8"))
+        entry = self._pending.setdefault(websocket, [0, 0])
+        entry[0] += 1
+        entry[1] += size
+        try:
+            await websocket.send_text(text)
+        finally:
+            entry[0] -= 1
+            entry[1] -= size
+            if entry[0] == 0 and self._pending.get(websocket) is entry:
+                del self._pending[websocket]
+
+    def stats(self) -> Dict[str, Any]:
+        """有积压的连接数，以及各连接积压消息数和字节数的最大值、总和"""
+        entries = list(self._pending.values())
+        return {
+            "connections": len(entries),
+            "max_messages": max((messages for messages, _ in entries), default=0),
+            "max_bytes": max((size for _, size in entries), default=0),
+            "total_messages": sum(messages for messages, _ in entries),
+            "total_bytes": sum(size for _, size in entries),
+        }
+
+# 创建发送积压统计实例
+send_backlog = SendBacklog()
@@ -0,0 +1,136 @@
+"""
+分时电价曲线
+把峰/平/谷费率规则展开为按分钟的电价数组，并预先计算步长 60 分钟的累加和，
+使"从某一时刻开始以恒定功率充入指定电量"的电费可以 O(1) 求出(与计费逻辑一致：
+从开始时刻起每满一小时为一段，每段电价取该段起点所在时段)
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+from datetime import datetime
+from sqlalchemy.orm import Session
+import math
+import threading
+import logging
+
+import numpy as np
+
+from backend.app.db.models import RateRule
+from backend.app.services.billing import BillingService
+
+logger = logging.getLogger(__name__)
+
+BANDS = ["PEAK", "NORMAL", "VALLEY"]
+MINUTES_PER_DAY = 1440
+
+def minute_tariff(rate_rules: List[RateRule]) -> Dict[str, np.ndarray]:
+    """
+    一天 1440 分钟各自对应的电价时段下标和电价
+    与 BillingService.match_rate_rule 的匹配规则一致，未命中任何规则的分钟记为平时
+    """
+    prices = np.empty(MINUTES_PER_DAY, dtype=float)
+    bands = np.empty(MINUTES_PER_DAY, dtype=np.int8)
+    for minute in range(MINUTES_PER_DAY):
+        moment = datetime(2000, 1, 1, minute // 60, minute % 60)
+        band, price = BillingService.match_rate_band(rate_rules, moment)
+        prices[minute] = price
+        bands[minute] = BANDS.index(band) if band in BANDS else BANDS.index("NORMAL")
+    return {"price": prices, "band": bands}
+
+class TariffCurve:
+    """
+    从 origin(某天零点)开始连续若干天的分钟级电价曲线
+    hourly_prefix[m + 60] = hourly_prefix[m] + price[m]，
+    于是 price[s] + price[s+60] + ... + price[s+60(K-1)] = hourly_prefix[s+60K] - hourly_prefix[s]
+    """
+
+    def __init__(self, daily_prices: np.ndarray, origin: datetime, days: int = 3):
+        self.origin = origin
+        self.prices = np.tile(np.asarray(daily_prices, dtype=float), days)
+        self.horizon = len(self.prices)
+        by_hour = self.prices.reshape(-1, 60).cumsum(axis=0).ravel()
+        self.hourly_prefix = np.concatenate([np.zeros(60), by_hour])
+
+    def minute_of(self, moment: datetime) -> float:
+        """时刻相对曲线起点的分钟数"""
+        return (moment - self.origin).total_seconds() / 60
+
+    def charge_cost(self, start_minutes, amount_kwh: float, power: float) -> np.ndarray:
+        """
+        以恒定功率从各开始分钟充入 amount_kwh 的电费(不含服务费)
+        start_minutes 可以是标量或数组，超出曲线范围的部分按曲线末端计算
+        功率曲线下调用方传入平均功率(请求电量 / 充电时长)，结果与计费逻辑按时长均摊电量的
+        充电费相同，但不是按曲线实际各小时充入电量计算的电费：实际充电前段快、尾段慢，
+        两者之差不超过 各相邻小时段电价差之和 × 两种方式累计电量的最大差值
+        """
+        start = np.clip(np.floor(np.asarray(start_minutes, dtype=float)).astype(np.int64), 0, self.horizon - 1)
+        full_hours = int(math.floor(amount_kwh / power + 1e-9))
+        remainder = max(amount_kwh - full_hours * power, 0.0)
+        end = np.minimum(start + 60 * full_hours, self.horizon - 1)
+        full_cost = power * (self.hourly_prefix[end] - self.hourly_prefix[start])
+        return full_cost + remainder * self.prices[end]
+
+    def cheapest_start(
+        self,
+        amount_kwh: float,
+        powers: Sequence[float],
+        backlogs: Sequence[float],
+        free_slots: Sequence[int],
+        now: datetime,
+        deadline: datetime
+    ) -> Optional[Tuple[int, float, float]]:
+        """
+        在各充电桩上选择满足离开时间的最便宜开始时刻
+        每个桩最早在当前时刻 + 队列时长后开始，最晚在离开时间 - 自身充电时长开始，
+        逐分钟评估候选开始时刻的电费(向量化)，电费相同时取完成时间最早的方案。
+        返回 (充电桩下标, 开始时刻(相对当前的分钟数), 电费)，没有可行方案时返回 None
+        """
+        now_minute = self.minute_of(now)
+        deadline_minute = min(self.minute_of(deadline), float(self.horizon))
+        best = None
+        for j, power in enumerate(powers):
+            if power <= 0 or free_slots[j] <= 0:
+                continue
+            duration = amount_kwh / power * 60
+            earliest = now_minute + backlogs[j]
+            latest = deadline_minute - duration
+            if latest < earliest:
+                continue
+            starts = np.concatenate([[earliest], np.arange(math.ceil(earliest), math.floor(latest) + 1)])
+            # 先舍入再比较，避免浮点误差使较晚的同价时刻胜出
+            costs = np.round(self.charge_cost(starts, amount_kwh, power), 6)
+            k = int(np.argmin(costs))
+            candidate = (float(costs[k]), starts[k] + duration, j, starts[k] - now_minute)
+            if best is None or candidate[:2] < best[:2]:
+                best = candidate
+        if best is None:
+            return None
+        cost, _, index, offset = best
+        return index, float(offset), cost
+
+class TariffService:
+    """电价曲线缓存，费率规则变更时需调用 invalidate"""
+
+    def __init__(self, days: int = 3):
+        self._days = days
+        self._lock = threading.Lock()
+        self._daily: Optional[Dict[str, np.ndarray]] = None
+        self._curve: Optional[TariffCurve] = None
+
+    def curve(self, db: Session, now: Optional[datetime] = None) -> TariffCurve:
+        """返回以今天零点为起点的电价曲线，日期变化时重新平移"""
+        now = now or datetime.now()
+        origin = datetime.combine(now.date(), datetime.min.time())
+        with self._lock:
+            if self._daily is None:
+                self._daily = minute_tariff(BillingService.load_rate_rules(db))
+                self._curve = None
+            if self._curve is None or self._curve.origin != origin:
+                self._curve = TariffCurve(self._daily["price"], origin, self._days)
+            return self._curve
+
+    def invalidate(self):
+        with self._lock:
+            self._daily = None
+            self._curve = None
+
+# 创建电价曲线服务实例
+tariff_service = TariffService()
@@ -1,20 +1,90 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set
 from fastapi import WebSocket, FastAPI, WebSocketDisconnect
 import json
 import logging
 import asyncio
+import re
 from datetime import datetime
 
+from backend.app.db.database import SessionLocal
+from backend.app.db.models import CarRequest
+from backend.app.services.event_bus import EventBus
+from backend.app.core.serialization import dumps_text
+from backend.app.services.board import BOARD_TOPIC, board_publisher
+from backend.app.services.send_backlog import send_backlog
+
 logger = logging.getLogger(__name__)
 
+# 用户可订阅的主题：pile:<桩编号>、mode:<FAST|SLOW>、request:<请求ID>
+USER_TOPIC_PATTERN = re.compile(r"^(pile:[A-Za-z0-9_-]{1,20}|mode:(FAST|SLOW)|request:\d+)$")
+# 管理员额外可订阅的主题
+ADMIN_TOPICS = {BOARD_TOPIC}
+
+def valid_topic(topic: str, admin: bool = False) -> bool:
+    """主题名是否合法(admin:board 只允许管理员订阅)"""
+    if admin and topic in ADMIN_TOPICS:
+        return True
+    return bool(USER_TOPIC_PATTERN.match(topic))
+
+def owned_request_ids(user_id: str, request_ids: Set[int]) -> Set[int]:
+    """request_ids 中属于该用户的充电请求ID(同步查询数据库，在线程池中调用)"""
+    db = SessionLocal()
+    try:
+        return {
+            row.id for row in
+            db.query(CarRequest.id).filter(CarRequest.id.in_(request_ids), CarRequest.user_id == user_id).all()
+        }
+    finally:
+        db.close()
+
+def encode_message(message: Dict[str, Any]) -> str:
+    """
+    序列化消息，同一条消息发送给多个连接时只序列化一次
+    保持文本帧(前端按文本解析 JSON)，编码后的字符串由所有接收者共用
+    """
+    return dumps_text(message)
+
 class ConnectionManager:
-    """WebSocket连接管理器"""
+    """
+    WebSocket连接管理器
+    消息先发布到事件总线，由每个 worker 进程发送给自己持有的连接，
+    多进程部署时任一进程产生的通知都能到达所有客户端。
+
+    客户端可以发送 {"action": "subscribe", "topics": [...]} 订阅主题，
+    订阅了主题的连接只接收所订阅主题的消息；从未订阅的连接保持原有行为，接收个人、管理员和广播消息
+    """
     
-    def __init__(self):
+    def __init__(self, bus: Optional[EventBus] = None):
         # 活动连接: {"user_id": {"client_id": WebSocket}}
         self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
         # 管理员连接: {"client_id": WebSocket}
         self.admin_connections: Dict[str, WebSocket] = {}
+        # 主题订阅: {"topic": {WebSocket}}，以及每个连接订阅的主题
+        self.topic_subscribers: Dict[str, Set[WebSocket]] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.bus = bus or EventBus()
+    
+    async def start(self, bus: Optional[EventBus] = None):
+        """启动事件总线(应用启动时调用)"""
+        if bus is not None:
+            self.bus = bus
+        await self.bus.start(self._on_event)
+    
+    async def stop(self):
+        await self.bus.stop()
+    
+    async def _on_event(self, channel: str, payload: Dict[str, Any]):
+        """把事件总线上的消息发送给本进程持有的连接"""
+        message = payload.get("message") or {}
+        if channel == "user":
+            await self._send_user_local(message, payload.get("user_id"))
+        elif channel == "admin":
+            await self._send_admin_local(message)
+        elif channel == "broadcast":
+            await self._send_user_local_all(message)
+            await self._send_admin_local(message)
+        elif channel == "topic":
+            await self._send_topic_local(payload.get("topic", ""), message)
     
     async def connect(self, websocket: WebSocket, user_id: str, client_id: str):
         """用户连接"""
@@ -33,7 +103,7 @@ class ConnectionManager:
     def disconnect(self, user_id: str, client_id: str):
         """用户断开连接"""
         if user_id in self.active_connections and client_id in self.active_connections[user_id]:
-            del self.active_connections[user_id][client_id]
+            self._drop_subscriptions(self.active_connections[user_id].pop(client_id))
             # 如果用户没有活动连接，删除用户条目
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
@@ -42,49 +112,152 @@ class ConnectionManager:
     def disconnect_admin(self, client_id: str):
         """管理员断开连接"""
         if client_id in self.admin_connections:
-            del self.admin_connections[client_id]
+            self._drop_subscriptions(self.admin_connections.pop(client_id))
             logger.info(f"管理员客户端 {client_id} 已断开连接")
     
+    def connection_count(self) -> int:
+        return sum(len(clients) for clients in self.active_connections.values()) + len(self.admin_connections)
+    
+    @staticmethod
+    async def _send(connection: WebSocket, text: str, size: Optional[int] = None):
+        """发送文本帧，按连接统计积压(见 send_backlog)"""
+        await send_backlog.send(connection, text, size)
+    
+    # ---- 主题订阅 ----
+    
+    async def subscribe(
+        self, websocket: WebSocket, topics: List[str], admin: bool = False, user_id: Optional[str] = None
+    ) -> List[str]:
+        """订阅主题，返回实际订阅成功的主题；用户只能订阅自己的充电请求 request:<请求ID>"""
+        topics = [topic for topic in topics if isinstance(topic, str) and valid_topic(topic, admin)]
+        request_ids = {int(topic.split(":", 1)[1]) for topic in topics if topic.startswith("request:")}
+        owned: Set[int] = set()
+        if request_ids and not admin and user_id is not None:
+            loop = asyncio.get_running_loop()
+            owned = await loop.run_in_executor(None, owned_request_ids, user_id, request_ids)
+        accepted = []
+        for topic in topics:
+            if topic.startswith("request:") and not admin and int(topic.split(":", 1)[1]) not in owned:
+                continue
+            self.topic_subscribers.setdefault(topic, set()).add(websocket)
+            self.subscriptions.setdefault(websocket, set()).add(topic)
+            accepted.append(topic)
+        # 先回复订阅结果，再发送看板快照
+        await self._send(websocket, encode_message({"type": "subscribed", "topics": accepted}))
+        if BOARD_TOPIC in accepted:
+            await board_publisher.subscribe(websocket)
+        return accepted
+    
+    def unsubscribe(self, websocket: WebSocket, topics: List[str]):
+        """取消订阅主题"""
+        subscribed = self.subscriptions.get(websocket, set())
+        for topic in topics:
+            if topic not in subscribed:
+                continue
+            subscribed.discard(topic)
+            subscribers = self.topic_subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(websocket)
+                if not subscribers:
+                    del self.topic_subscribers[topic]
+            if topic == BOARD_TOPIC:
+                board_publisher.unsubscribe(websocket)
+        # 取消全部订阅后仍保留"已订阅"状态，不再接收广播消息
+    
+    def _drop_subscriptions(self, websocket: WebSocket):
+        self.unsubscribe(websocket, list(self.subscriptions.get(websocket, ())))
+        self.subscriptions.pop(websocket, None)
+    
+    async def handle_client_message(
+        self, websocket: WebSocket, message: Dict[str, Any], admin: bool = False, user_id: Optional[str] = None
+    ):
+        """处理客户端发来的订阅控制消息"""
+        action = message.get("action")
+        topics = message.get("topics") or ([message["topic"]] if message.get("topic") else [])
+        if action == "subscribe":
+            await self.subscribe(websocket, topics, admin, user_id)
+        elif action == "unsubscribe":
+            self.unsubscribe(websocket, topics)
+            await self._send(websocket, encode_message({"type": "unsubscribed", "topics": topics}))
+        elif action == "resync" and BOARD_TOPIC in topics and BOARD_TOPIC in self.subscriptions.get(websocket, ()):
+            # 客户端发现看板增量序号不连续，重新发送完整快照
+            await board_publisher.send_snapshot(websocket)
+    
+    async def publish(self, topic: str, message: Dict[str, Any]):
+        """发布主题消息给所有进程中订阅了该主题的连接"""
+        message["timestamp"] = datetime.now().isoformat()
+        message["topic"] = topic
+        await self.bus.publish("topic", {"topic": topic, "message": message})
+    
+    async def _send_topic_local(self, topic: str, message: Dict[str, Any]):
+        """发送给本进程中订阅了该主题的连接"""
+        subscribers = self.topic_subscribers.get(topic)
+        if not subscribers:
+            return
+        text = encode_message(message)
+        size = len(text.encode("utf-8"))
+        for connection in list(subscribers):
+            try:
+                await self._send(connection, text, size)
+            except Exception as e:
+                logger.error(f"发送主题 {topic} 的消息失败: {str(e)}")
+    
+    # ---- 个人、管理员和广播消息 ----
+    
     async def send_personal_message(self, message: Dict[str, Any], user_id: str):
-        """发送个人消息给特定用户的所有客户端"""
-        if user_id in self.active_connections:
-            # 添加时间戳
-            message["timestamp"] = datetime.now().isoformat()
-            for client_id, connection in self.active_connections[user_id].items():
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"发送消息给用户 {user_id} 的客户端 {client_id} 失败: {str(e)}")
+        """发送个人消息给特定用户的所有客户端(所有进程)"""
+        # 添加时间戳
+        message["timestamp"] = datetime.now().isoformat()
+        await self.bus.publish("user", {"user_id": user_id, "message": message})
     
     async def send_admin_message(self, message: Dict[str, Any]):
-        """发送消息给所有管理员客户端"""
+        """发送消息给所有管理员客户端(所有进程)"""
         # 添加时间戳
         message["timestamp"] = datetime.now().isoformat()
-        for client_id, connection in self.admin_connections.items():
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"发送消息给管理员客户端 {client_id} 失败: {str(e)}")
+        await self.bus.publish("admin", {"message": message})
     
     async def broadcast_message(self, message: Dict[str, Any]):
-        """广播消息给所有连接的客户端"""
+        """广播消息给所有连接的客户端(所有进程)"""
         # 添加时间戳
         message["timestamp"] = datetime.now().isoformat()
-        
-        # 发送给所有用户
-        for user_id, clients in self.active_connections.items():
-            for client_id, connection in clients.items():
+        await self.bus.publish("broadcast", {"message": message})
+    
+    async def _send_user_local(self, message: Dict[str, Any], user_id: str):
+        """发送给本进程中特定用户的所有(未订阅主题的)客户端"""
+        text = encode_message(message)
+        size = len(text.encode("utf-8"))
+        for client_id, connection in list(self.active_connections.get(user_id, {}).items()):
+            if connection in self.subscriptions:
+                continue
+            try:
+                await self._send(connection, text, size)
+            except Exception as e:
+                logger.error(f"发送消息给用户 {user_id} 的客户端 {client_id} 失败: {str(e)}")
+    
+    async def _send_user_local_all(self, message: Dict[str, Any]):
+        """发送给本进程中所有用户的(未订阅主题的)客户端"""
+        text = encode_message(message)
+        size = len(text.encode("utf-8"))
+        for user_id, clients in list(self.active_connections.items()):
+            for client_id, connection in list(clients.items()):
+                if connection in self.subscriptions:
+                    continue
                 try:
-                    await connection.send_json(message)
+                    await self._send(connection, text, size)
                 except Exception as e:
                     logger.error(f"广播消息给用户 {user_id} 的客户端 {client_id} 失败: {str(e)}")
-        
-        # 发送给所有管理员
-        for client_id, connection in self.admin_connections.items():
+    
+    async def _send_admin_local(self, message: Dict[str, Any]):
+        """发送给本进程中所有(未订阅主题的)管理员客户端"""
+        text = encode_message(message)
+        size = len(text.encode("utf-8"))
+        for client_id, connection in list(self.admin_connections.items()):
+            if connection in self.subscriptions:
+                continue
             try:
-                await connection.send_json(message)
+                await self._send(connection, text, size)
             except Exception as e:
-                logger.error(f"广播消息给管理员客户端 {client_id} 失败: {str(e)}")
+                logger.error(f"发送消息给管理员客户端 {client_id} 失败: {str(e)}")
 
 # 创建连接管理器实例
 manager = ConnectionManager()
@@ -102,8 +275,9 @@ def setup_websocket(app: FastAPI):
                 data = await websocket.receive_text()
                 try:
                     message = json.loads(data)
-                    # 处理接收到的消息，可以根据需要添加更多逻辑
                     logger.debug(f"收到用户 {user_id} 的消息: {message}")
+                    if isinstance(message, dict):
+                        await manager.handle_client_message(websocket, message, user_id=user_id)
                 except json.JSONDecodeError:
                     logger.error(f"无效的JSON数据: {data}")
         except WebSocketDisconnect:
@@ -119,8 +293,9 @@ def setup_websocket(app: FastAPI):
                 data = await websocket.receive_text()
                 try:
                     message = json.loads(data)
-                    # 处理接收到的消息，可以根据需要添加更多逻辑
                     logger.debug(f"收到管理员 {client_id} 的消息: {message}")
+                    if isinstance(message, dict):
+                        await manager.handle_client_message(websocket, message, admin=True)
                 except json.JSONDecodeError:
                     logger.error(f"无效的JSON数据: {data}")
         except WebSocketDisconnect:
@@ -146,8 +321,11 @@ async def notify_charge_status_change(user_id: str, request_id: int, status: str
         "data": data
     }
     await manager.send_admin_message(admin_message)
+    
+    # 订阅了该请求的连接
+    await manager.publish(f"request:{request_id}", dict(message))
 
-async def notify_pile_status_change(pile_id: int, status: str, data: Dict[str, Any]):
+async def notify_pile_status_change(pile_id: int, status: str, data: Dict[str, Any], pile_code: Optional[str] = None):
     """通知充电桩状态变化"""
     message = {
         "type": "pile_status_change",
@@ -156,6 +334,8 @@ async def notify_pile_status_change(pile_id: int, status: str, data: Dict[str, A
         "data": data
     }
     await manager.broadcast_message(message)
+    await manager.publish(f"pile:{pile_code or pile_id}", dict(message))
+    board_publisher.poke()
 
 async def notify_queue_update(mode: str, data: Dict[str, Any]):
     """通知队列更新"""
@@ -164,4 +344,6 @@ async def notify_queue_update(mode: str, data: Dict[str, Any]):
         "mode": mode,
         "data": data
     }
-    await manager.broadcast_message(message) 
\ No newline at end of file
+    await manager.broadcast_message(message)
+    await manager.publish(f"mode:{mode}", dict(message))
+    board_publisher.poke() 
\ No newline at end of file
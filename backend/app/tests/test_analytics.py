@@ -0,0 +1,122 @@
+import random
+import tempfile
+import unittest
+from datetime import date, datetime, time, timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from backend.app.services import analytics
+from backend.app.services.billing import BillingService
+from backend.app.services.tariff import minute_tariff
+from backend.app.services.history_store import HistoryStore, DATASETS, REQUEST_STATUSES, to_ts
+
+def rule(band, price, start, end):
+    return SimpleNamespace(type=band, price=price, start_time=start, end_time=end)
+
+RATE_RULES = [
+    rule("PEAK", 1.0, time(10), time(15)),
+    rule("PEAK", 1.0, time(18), time(21)),
+    rule("NORMAL", 0.7, time(7), time(10)),
+    rule("NORMAL", 0.7, time(15), time(18)),
+    rule("NORMAL", 0.7, time(21), time(23)),
+    rule("VALLEY", 0.4, time(23), time(23, 59, 59)),
+    rule("VALLEY", 0.4, time(0), time(7)),
+]
+
+class TestAnalytics(unittest.TestCase):
+    """列式历史数据统计测试类"""
+
+    def setUp(self):
+        rng = random.Random(3)
+        base = datetime(2026, 3, 1)
+        self.rows = []
+        for i in range(200):
+            request_time = base + timedelta(minutes=rng.randrange(0, 30 * 24 * 60))
+            start = request_time + timedelta(minutes=rng.randrange(0, 90))
+            end = start + timedelta(minutes=rng.randrange(1, 300))
+            self.rows.append((i + 1, i + 1, rng.choice([1, 2, 3]), request_time, start, end, round(rng.uniform(5, 60), 2)))
+        self.sessions = {
+            "session_id": np.array([r[0] for r in self.rows]),
+            "request_id": np.array([r[1] for r in self.rows]),
+            "pile_id": np.array([r[2] for r in self.rows]),
+            "request_ts": np.array([to_ts(r[3]) for r in self.rows]),
+            "start_ts": np.array([to_ts(r[4]) for r in self.rows]),
+            "end_ts": np.array([to_ts(r[5]) for r in self.rows]),
+            "charged_kwh": np.array([r[6] for r in self.rows]),
+            "charge_fee": np.zeros(len(self.rows)),
+            "service_fee": np.zeros(len(self.rows)),
+            "total_fee": np.zeros(len(self.rows)),
+            "status": np.ones(len(self.rows), dtype=np.int8),
+        }
+
+    def test_revenue_matches_billing(self):
+        """各时段电费合计与计费逻辑逐小时计算的结果一致"""
+        result = analytics.revenue_by_band(self.sessions, minute_tariff(RATE_RULES))
+        expected_fee = sum(
+            BillingService.calculate_charging_cost(None, r[4], r[5], r[6], rate_rules=RATE_RULES, service_rate=0)[0]
+            for r in self.rows
+        )
+        self.assertAlmostEqual(sum(band["charge_fee"] for band in result.values()), expected_fee, places=1)
+        self.assertAlmostEqual(sum(band["kwh"] for band in result.values()), sum(r[6] for r in self.rows), places=1)
+
+    def test_rerate_matches_billing(self):
+        """重新计价的逐会话费用与计费逻辑一致，费率不变时收入变化为零"""
+        fees = analytics.rerate(self.sessions, minute_tariff(RATE_RULES), 0.8)
+        for i, r in enumerate(self.rows):
+            expected = BillingService.calculate_charging_cost(None, r[4], r[5], r[6], rate_rules=RATE_RULES, service_rate=0.8)
+            self.assertAlmostEqual(fees["charge_fee"][i], expected[0], places=6)
+            self.assertAlmostEqual(fees["total_fee"][i], expected[2], places=6)
+
+        self.sessions["total_fee"] = fees["total_fee"]
+        unchanged = analytics.rerating_delta(self.sessions, minute_tariff(RATE_RULES), 0.8)
+        self.assertEqual(unchanged["total"]["delta"], 0.0)
+        self.assertEqual(sum(p["sessions"] for p in unchanged["by_pile"].values()), len(self.rows))
+
+        # 峰时电价上调 0.5 元：收入变化等于峰时段电量 * 0.5
+        peak_kwh = analytics.revenue_by_band(self.sessions, minute_tariff(RATE_RULES))["PEAK"]["kwh"]
+        rules = analytics.hypothetical_rules(RATE_RULES, prices={"PEAK": 1.5})
+        changed = analytics.rerating_delta(self.sessions, minute_tariff(rules), 0.8)
+        self.assertAlmostEqual(changed["total"]["delta"], peak_kwh * 0.5, delta=0.05)
+        self.assertAlmostEqual(sum(d["delta"] for d in changed["by_day"].values()), changed["total"]["delta"], delta=0.05)
+        self.assertEqual(RATE_RULES[0].price, 1.0)
+
+    def test_hourly_utilization(self):
+        """按整点切分后的忙碌时长与会话总时长一致"""
+        days = 31
+        result = analytics.hourly_utilization(self.sessions, days)
+        for pile_id, hours in result.items():
+            busy = sum(
+                (r[5] - r[4]).total_seconds() for r in self.rows if r[2] == pile_id
+            )
+            self.assertAlmostEqual(sum(hours) * days * 3600, busy, delta=24 * days * 3600 * 1e-4)
+
+    def test_wait_distribution(self):
+        """等待时长分布：总等待取自会话，队列等待取自队列日志"""
+        queuing, charging = REQUEST_STATUSES.index("QUEUING"), REQUEST_STATUSES.index("CHARGING")
+        events = {
+            "request_id": np.array([1, 1, 1, 2, 2]),
+            "pile_id": np.array([1, 1, 2, 1, 1]),
+            "log_ts": np.array([600, 0, 1800, 100, 400]),
+            "from_status": np.zeros(5, dtype=np.int8),
+            "to_status": np.array([queuing, queuing, charging, queuing, charging], dtype=np.int8),
+        }
+        result = analytics.wait_distribution(self.sessions, events, bin_minutes=10, max_minutes=60)
+        self.assertEqual(result["total"]["count"], len(self.rows))
+        self.assertEqual(result["queue"]["count"], 2)
+        self.assertAlmostEqual(result["queue"]["max"], 30.0)
+        self.assertEqual(sum(b["count"] for b in result["total"]["histogram"]), len(self.rows))
+
+    def test_store_round_trip(self):
+        """按月分区写入后按日期区间读取"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = HistoryStore(directory)
+            march = {name: self.sessions[name].astype(dtype) for name, (_, dtype) in DATASETS["sessions"].items()}
+            store.write_partition("sessions", 202603, march)
+            loaded = store.load_sessions(date(2026, 3, 10), date(2026, 4, 30))
+            expected = sum(1 for r in self.rows if r[4] >= datetime(2026, 3, 10))
+            self.assertEqual(len(loaded["session_id"]), expected)
+            self.assertTrue((loaded["start_ts"] >= to_ts(datetime(2026, 3, 10))).all())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+from datetime import date, datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.db.database import Base
+from backend.app.db.models import BillDetail, BillMaster, BillMonthlySummary, CarRequest, ChargePile, ChargeSession
+from backend.app.services.billing_pipeline import BillingPipeline, detail_number_of
+
+class TestBillingPipeline(unittest.TestCase):
+    """账单过账管道测试类"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine, autoflush=False)()
+        self.db.add(ChargePile(code="A", type="FAST", status="AVAILABLE", power=30))
+        self.db.commit()
+        self.pipeline = BillingPipeline()
+
+    def tearDown(self):
+        self.db.close()
+
+    def add_session(self, user_id: str, start_time: datetime, total_fee: float = 7.0) -> int:
+        """添加一个已完成的充电会话，返回会话ID"""
+        request = CarRequest(
+            user_id=user_id, queue_number=f"F{self.db.query(CarRequest).count() + 1}", mode="FAST",
+            amount_kwh=5, battery_capacity=50, status="FINISHED"
+        )
+        self.db.add(request)
+        self.db.flush()
+        session = ChargeSession(
+            request_id=request.id, pile_id=1, start_time=start_time, end_time=start_time + timedelta(hours=1),
+            charged_kwh=5, charge_fee=3, service_fee=total_fee - 3, total_fee=total_fee, status="COMPLETED"
+        )
+        self.db.add(session)
+        self.db.commit()
+        return session.id
+
+    def monthly(self, user_id: str, bill_month: date) -> BillMonthlySummary:
+        self.db.expire_all()
+        return self.db.get(BillMonthlySummary, (user_id, bill_month))
+
+    def test_repost_is_idempotent(self):
+        """同一用户同一天的会话累加到一张日账单，重复过账已有详单的会话不重复计费"""
+        s1 = self.add_session("u1", datetime(2024, 5, 1, 8))
+        s2 = self.add_session("u1", datetime(2024, 5, 1, 10), total_fee=9)
+        s3 = self.add_session("u1", datetime(2024, 5, 1, 12), total_fee=11)
+
+        self.assertEqual(len(self.pipeline.post(self.db, [s1, s2])), 2)
+        self.assertEqual(list(self.pipeline.post(self.db, [s1, s2, s3])), [s3])
+        self.assertEqual(self.pipeline.post(self.db, [s1, s2, s3]), {})
+        self.assertEqual(self.pipeline.post(self.db, [s2]), {})
+
+        masters = self.db.query(BillMaster).all()
+        self.assertEqual(len(masters), 1)
+        self.assertEqual(masters[0].bill_date, date(2024, 5, 1))
+        self.assertAlmostEqual(masters[0].total_fee, 27)
+        self.assertAlmostEqual(masters[0].total_kwh, 15)
+        details = self.db.query(BillDetail).order_by(BillDetail.session_id).all()
+        self.assertEqual([detail.session_id for detail in details], [s1, s2, s3])
+        self.assertEqual(details[0].detail_number, detail_number_of(date(2024, 5, 1), s1))
+        self.assertTrue(all(detail.bill_id == masters[0].id for detail in details))
+
+        summary = self.monthly("u1", date(2024, 5, 1))
+        self.assertEqual(summary.bill_count, 1)
+        self.assertAlmostEqual(summary.total_fee, 27)
+
+    def test_monthly_bill_count_across_existing_and_new_days(self):
+        """月度汇总的账单天数只统计新建的日账单，金额按会话累加"""
+        self.pipeline.post(self.db, [self.add_session("u1", datetime(2024, 5, 1, 8))])
+        # 一批中既有已有日账单的日期，也有新的日期，以及另一个月和另一个用户
+        batch = [
+            self.add_session("u1", datetime(2024, 5, 1, 20)),
+            self.add_session("u1", datetime(2024, 5, 2, 8)),
+            self.add_session("u1", datetime(2024, 5, 2, 9)),
+            self.add_session("u1", datetime(2024, 6, 1, 8)),
+            self.add_session("u2", datetime(2024, 5, 2, 8)),
+        ]
+        self.assertEqual(len(self.pipeline.post(self.db, batch)), 5)
+
+        may = self.monthly("u1", date(2024, 5, 1))
+        self.assertEqual(may.bill_count, 2)
+        self.assertAlmostEqual(may.total_fee, 28)
+        self.assertEqual(self.monthly("u1", date(2024, 6, 1)).bill_count, 1)
+        self.assertEqual(self.monthly("u2", date(2024, 5, 1)).bill_count, 1)
+        self.assertEqual(self.db.query(BillMaster).count(), 4)
+
+    def test_flush_requeues_on_failure(self):
+        """过账失败时会话放回待过账集合，下次 flush 时过账"""
+        session_ids = [self.add_session("u1", datetime(2024, 5, 1, hour)) for hour in (8, 9)]
+        for session_id in session_ids:
+            self.pipeline.enqueue(session_id)
+
+        with patch.object(self.pipeline, "_post_once", side_effect=RuntimeError("db down")):
+            self.assertEqual(self.pipeline.flush(self.db), 0)
+        self.assertEqual(self.pipeline.pending_count(), 2)
+        self.assertEqual(self.db.query(BillDetail).count(), 0)
+
+        self.assertEqual(self.pipeline.flush(self.db), 2)
+        self.assertEqual(self.pipeline.pending_count(), 0)
+        self.assertEqual(self.pipeline.flush(self.db), 0)
+        self.assertEqual(self.monthly("u1", date(2024, 5, 1)).bill_count, 1)
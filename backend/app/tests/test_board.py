@@ -0,0 +1,39 @@
+import json
+import random
+import unittest
+
+from backend.app.services.board import apply_delta, diff_snapshot
+from backend.app.services.websocket import valid_topic
+
+class TestBoard(unittest.TestCase):
+    """看板增量与主题订阅测试类"""
+
+    def test_delta_round_trip(self):
+        """按序应用增量后与最新快照一致，增量远小于完整快照"""
+        rng = random.Random(3)
+        board = {f"pile.P{i}.status": "AVAILABLE" for i in range(500)}
+        board.update({f"pile.P{i}.queue": [] for i in range(500)})
+        client = dict(board)
+        for _ in range(50):
+            new = dict(board)
+            for key in rng.sample(sorted(new), 5):
+                new[key] = rng.choice(["BUSY", "FAULT", ["F1"], ["F1", "F2"]])
+            if rng.random() < 0.2:
+                new.pop(rng.choice(sorted(new)))
+            changed, removed = diff_snapshot(board, new)
+            self.assertLess(len(json.dumps(changed)) + len(json.dumps(removed)), len(json.dumps(new)) / 50)
+            client = apply_delta(client, changed, removed)
+            board = new
+            self.assertEqual(client, board)
+        self.assertEqual(diff_snapshot(board, board), ({}, []))
+
+    def test_topic_validation(self):
+        """只接受已知格式的主题，看板主题只允许管理员订阅"""
+        for topic in ("pile:A", "mode:FAST", "request:123"):
+            self.assertTrue(valid_topic(topic))
+        for topic in ("pile:", "mode:TURBO", "request:abc", "admin:board", "*"):
+            self.assertFalse(valid_topic(topic))
+        self.assertTrue(valid_topic("admin:board", admin=True))
+
+if __name__ == "__main__":
+    unittest.main()
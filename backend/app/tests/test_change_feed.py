@@ -0,0 +1,78 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# 调度执行器、变更推送和连接管理器通过 backend.app 互相引用，这里使用同一套模块
+from backend.app.db.database import Base
+from backend.app.db.models import CarRequest, ChargePile
+from backend.app.services import queue_log_writer, scheduler_actor, websocket
+from backend.app.services.scheduler_actor import SchedulerActor
+from backend.app.services.websocket import manager
+
+class FakeWebSocket:
+    def __init__(self):
+        self.messages = []
+
+    async def send_text(self, text: str):
+        self.messages.append(json.loads(text))
+
+    def topics(self):
+        return [message.get("topic") for message in self.messages if message.get("type") != "subscribed"]
+
+class TestChangeFeed(unittest.TestCase):
+    """队列状态变更推送测试类"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+        Base.metadata.create_all(engine)
+        self.Session = sessionmaker(bind=engine, autoflush=False)
+        db = self.Session()
+        db.add(ChargePile(code="A", station_id="default", type="FAST", status="AVAILABLE", power=30))
+        db.add(CarRequest(
+            user_id="u1", station_id="default", queue_number="F1", mode="FAST",
+            amount_kwh=10, battery_capacity=60, status="WAITING"
+        ))
+        db.commit()
+        db.close()
+
+    def test_dispatch_publishes_to_subscribers(self):
+        """调度命令叫号后，订阅了请求和充电桩主题的连接收到推送；其他用户不能订阅该请求"""
+        async def run():
+            owner, other = FakeWebSocket(), FakeWebSocket()
+            actor = SchedulerActor("default")
+            await manager.start()
+            await actor.start()
+            try:
+                accepted = await manager.subscribe(owner, ["request:1", "pile:A"], user_id="u1")
+                rejected = await manager.subscribe(other, ["request:1", "pile:A"], user_id="u2")
+                await actor.submit("noop", lambda db: None, dispatch=True)
+                for _ in range(100):
+                    if "request:1" in owner.topics() and "pile:A" in owner.topics():
+                        break
+                    await asyncio.sleep(0.01)
+            finally:
+                await actor.stop()
+                await manager.stop()
+                manager._drop_subscriptions(owner)
+                manager._drop_subscriptions(other)
+            return accepted, rejected, owner, other
+
+        with patch.object(scheduler_actor, "SessionLocal", self.Session), \
+                patch.object(websocket, "SessionLocal", self.Session), \
+                patch.object(queue_log_writer, "SessionLocal", self.Session):
+            accepted, rejected, owner, other = asyncio.run(run())
+            queue_log_writer.queue_log_writer.flush()
+
+        self.assertEqual(accepted, ["request:1", "pile:A"])
+        self.assertEqual(rejected, ["pile:A"])
+        request_events = [message for message in owner.messages if message.get("topic") == "request:1"]
+        # 叫号后分配到空闲的充电桩A并直接开始充电
+        self.assertEqual(request_events[-1]["data"]["status"], "CHARGING")
+        self.assertEqual(request_events[-1]["data"]["pile_code"], "A")
+        self.assertIn("pile:A", owner.topics())
+        self.assertNotIn("request:1", other.topics())
@@ -0,0 +1,45 @@
+import unittest
+
+from backend.app.services.charge_curve import ChargeCurve, CONSTANT_CURVE
+
+TAPER = ChargeCurve([(0.0, 1.0), (0.8, 1.0), (1.0, 0.4)])
+
+def simulate_minutes(curve: ChargeCurve, amount: float, power: float, capacity: float, step: float = 1e-3) -> float:
+    """逐步数值积分求充电时长(分钟)"""
+    soc, target, minutes = 1 - amount / capacity, 1.0, 0.0
+    while soc < target - 1e-12:
+        s0, r0 = max(p for p in curve.points if p[0] <= soc)
+        s1, r1 = min(p for p in curve.points if p[0] > soc)
+        ratio = r0 + (r1 - r0) * (soc - s0) / (s1 - s0)
+        minutes += step
+        soc += power * ratio * step / 60 / capacity
+    return minutes
+
+class TestChargeCurve(unittest.TestCase):
+    """充电功率曲线测试类"""
+
+    def test_constant_is_special_case(self):
+        """恒定功率曲线与 功率 × 时间 模型一致"""
+        self.assertAlmostEqual(CONSTANT_CURVE.charge_minutes(30, 30, 60), 60.0)
+        self.assertAlmostEqual(CONSTANT_CURVE.energy_after(30, 30, 40, 60), 15.0)
+        self.assertAlmostEqual(CONSTANT_CURVE.energy_after(300, 30, 40, 60), 40.0)
+        # 电池容量缺失时任何曲线都按恒定功率计算
+        self.assertAlmostEqual(TAPER.charge_minutes(30, 30, None), 60.0)
+
+    def test_matches_numeric_integration(self):
+        """充电时长与数值积分一致，尾段降功率使时长变长"""
+        for amount in (5.0, 12.0, 30.0, 60.0):
+            expected = simulate_minutes(TAPER, amount, 30.0, 60.0)
+            self.assertAlmostEqual(TAPER.charge_minutes(amount, 30.0, 60.0), expected, delta=0.05)
+            self.assertGreater(TAPER.charge_minutes(amount, 30.0, 60.0), amount / 30.0 * 60)
+
+    def test_energy_inverts_minutes(self):
+        """energy_after 是充电时长的反函数，remaining_minutes 与之相容"""
+        total = TAPER.charge_minutes(40.0, 30.0, 60.0)
+        self.assertAlmostEqual(TAPER.energy_after(total, 30.0, 40.0, 60.0), 40.0)
+        for minutes in (1.0, 20.0, 50.0, total - 1):
+            charged = TAPER.energy_after(minutes, 30.0, 40.0, 60.0)
+            self.assertAlmostEqual(minutes + TAPER.remaining_minutes(charged, 30.0, 40.0, 60.0), total, places=6)
+
+if __name__ == "__main__":
+    unittest.main()
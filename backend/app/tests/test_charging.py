@@ -2,9 +2,9 @@ import unittest
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock, patch
 
-from app.services.charging_service import ChargingService
-from app.db.models import CarRequest, ChargePile, ChargeSession
-from app.db.schemas import RequestStatus, ChargeMode
+from backend.app.services.charging_service import ChargingService
+from backend.app.db.models import CarRequest, ChargePile, ChargeSession
+from backend.app.db.schemas import RequestStatus, ChargeMode
 
 class TestChargingService(unittest.TestCase):
     """充电服务测试类"""
@@ -41,8 +41,8 @@ class TestChargingService(unittest.TestCase):
         # 设置模拟查询结果
         self.db.query().filter().first.side_effect = [self.request, self.pile, self.session]
     
-    @patch('app.services.billing.BillingService.calculate_charging_cost')
-    @patch('app.services.scheduler.ChargingScheduler.finish_charging')
+    @patch('backend.app.services.billing.BillingService.calculate_charging_cost')
+    @patch('backend.app.services.scheduler.ChargingScheduler.finish_charging')
     def test_finish_charge_session(self, mock_finish_charging, mock_calculate_cost):
         """测试完成充电会话"""
         # 设置模拟返回值
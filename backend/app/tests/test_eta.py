@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.db.database import Base
+from backend.app.db.models import CarRequest, ChargePile
+from backend.app.services.eta import EtaService
+
+class TestEtaService(unittest.TestCase):
+    """队列时间索引测试类"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine, autoflush=False)()
+        self.db.add(ChargePile(code="A", type="FAST", status="BUSY", power=30, version=3))
+        self.db.add(CarRequest(
+            user_id="u1", queue_number="F1", mode="FAST", amount_kwh=30, battery_capacity=60,
+            status="QUEUING", pile_id=1, queue_position=0
+        ))
+        self.db.commit()
+        self.eta = EtaService()
+
+    def tearDown(self):
+        self.db.close()
+
+    def other_worker_assigns(self):
+        """模拟另一个 worker 进程分配一辆车：写入数据库并递增版本号，不经过本进程的增量更新"""
+        self.db.add(CarRequest(
+            user_id="u2", queue_number="F2", mode="FAST", amount_kwh=15, battery_capacity=60,
+            status="QUEUING", pile_id=1, queue_position=1
+        ))
+        self.db.get(ChargePile, 1).version += 1
+        self.db.commit()
+
+    def test_rebuild_when_version_changes(self):
+        """其他进程修改队列后版本号变化，读取时重建索引"""
+        self.assertEqual(self.eta.queue_length(self.db, 1), 1)
+        backlog = self.eta.waiting_minutes(self.db, 1)
+
+        self.other_worker_assigns()
+        self.assertEqual(self.eta.queue_length(self.db, 1), 2)
+        index = self.eta.get(self.db, 1)
+        self.assertEqual(index.version, 4)
+        self.assertAlmostEqual(self.eta.waiting_minutes(self.db, 1), backlog + index.duration_of(15, 60))
+
+    def test_rebuild_when_other_worker_starts_charging(self):
+        """开始充电不改变版本号，按充电中车辆的开始时间判断"""
+        index = self.eta.get(self.db, 1)
+        self.assertIsNone(index.head_start)
+        car = self.db.get(CarRequest, 1)
+        car.status = "CHARGING"
+        car.start_time = datetime(2024, 5, 1, 8)
+        self.db.commit()
+        index = self.eta.get(self.db, 1)
+        self.assertEqual(index.head_start, datetime(2024, 5, 1, 8))
+        self.assertIs(self.eta.get(self.db, 1), index)
+
+    def test_incremental_update_only_from_previous_version(self):
+        """增量更新只应用在恰好是前一个版本的索引上，跳过了版本时丢弃索引"""
+        index = self.eta.get(self.db, 1)
+        self.eta.on_assign(1, 2, 15, 60, version=4)
+        self.assertEqual((len(index), index.version), (2, 4))
+
+        # 版本 5 的变更没有经过本进程，版本 6 的增量更新不能应用
+        self.eta.on_leave(1, 2, version=6)
+        self.assertNotIn(1, self.eta._piles)
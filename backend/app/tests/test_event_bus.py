@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from backend.app.services import event_bus
+from backend.app.services.event_bus import EventBus, SocketEventBus, create_event_bus
+
+class Collector:
+    def __init__(self):
+        self.received = []
+
+    async def __call__(self, channel, message):
+        self.received.append((channel, message))
+
+async def settle(condition, timeout: float = 2.0):
+    """等待消息送达"""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+class TestEventBus(unittest.TestCase):
+    """事件总线测试类"""
+
+    def test_local_delivery(self):
+        """进程内总线直接投递给本进程"""
+        async def run():
+            bus, collector = EventBus(), Collector()
+            await bus.start(collector)
+            await bus.publish("admin", {"message": {"type": "x"}})
+            await bus.stop()
+            return collector.received
+        self.assertEqual(asyncio.run(run()), [("admin", {"message": {"type": "x"}})])
+
+    def test_socket_fan_out(self):
+        """中转站和客户端之间互相转发，每个进程恰好收到一次"""
+        async def run(path):
+            collectors = [Collector() for _ in range(3)]
+            buses = [SocketEventBus(path, reconnect_interval=0.05) for _ in collectors]
+            for bus, collector in zip(buses, collectors):
+                await bus.start(collector)
+            self.assertEqual(sum(bus.is_hub for bus in buses), 1)
+
+            await buses[1].publish("user", {"user_id": "u1", "n": 1})
+            await buses[0].publish("broadcast", {"n": 2})
+            await settle(lambda: all(len(c.received) == 2 for c in collectors))
+            for collector in collectors:
+                self.assertEqual(sorted(m["n"] for _, m in collector.received), [1, 2])
+
+            # 中转站退出后由其余进程接任
+            await buses[0].stop()
+            await settle(lambda: any(bus.is_hub for bus in buses[1:]))
+            await asyncio.sleep(0.2)
+            await buses[1].publish("admin", {"n": 3})
+            await settle(lambda: len(collectors[2].received) == 3)
+            self.assertEqual(collectors[2].received[-1], ("admin", {"n": 3}))
+            for bus in buses[1:]:
+                await bus.stop()
+
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(run(os.path.join(directory, "events.sock")))
+    def test_socket_oversized_line_reconnects(self):
+        """收到超长的一行时断开重连，之后的消息照常送达"""
+        async def run(path):
+            collectors = [Collector() for _ in range(2)]
+            buses = [SocketEventBus(path, reconnect_interval=0.05) for _ in collectors]
+            for bus, collector in zip(buses, collectors):
+                await bus.start(collector)
+            hub, client = (buses[0], buses[1]) if buses[0].is_hub else (buses[1], buses[0])
+
+            # 中转站发出超长的一行，客户端读取失败后重连
+            await hub._broadcast(b"x" * 2048 + b"\n")
+            await asyncio.sleep(0.3)
+            await hub.publish("admin", {"n": 1})
+            # 客户端发出超长的一行，中转站断开该客户端，客户端重连
+            client._writer.write(b"y" * 2048 + b"\n")
+            await asyncio.sleep(0.3)
+            await client.publish("admin", {"n": 2})
+            # 超长事件不转发，只在本进程投递
+            await client.publish("admin", {"blob": "z" * 2048})
+            await settle(lambda: len(collectors[0].received) + len(collectors[1].received) >= 5)
+            for bus in buses:
+                await bus.stop()
+            return collectors
+
+        with tempfile.TemporaryDirectory() as directory, patch.object(event_bus, "MAX_LINE_BYTES", 1024):
+            collectors = asyncio.run(run(os.path.join(directory, "events.sock")))
+        for collector in collectors:
+            self.assertEqual([m["n"] for _, m in collector.received if "n" in m], [1, 2])
+        self.assertEqual(sum("blob" in m for c in collectors for _, m in c.received), 1)
+
+    def test_socket_backend_requires_fcntl(self):
+        """没有 fcntl 的系统(Windows)上选择 socket 总线时给出明确的错误，默认的 local 不受影响"""
+        with patch.object(event_bus, "fcntl", None):
+            with patch.object(event_bus, "get_system_config", return_value={"event_bus": "socket"}):
+                with self.assertRaises(RuntimeError):
+                    create_event_bus()
+            with patch.object(event_bus, "get_system_config", return_value={"event_bus": "local"}):
+                self.assertIs(type(create_event_bus()), EventBus)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import time
+import unittest
+
+from backend.app.core.health import HealthMonitor, _check
+from backend.app.services.send_backlog import SendBacklog
+
+class SlowWebSocket:
+    """客户端接收慢：每次发送要等待写缓冲区排空"""
+
+    def __init__(self):
+        self.drained = asyncio.Event()
+
+    async def send_text(self, text: str):
+        await self.drained.wait()
+
+class TestHealth(unittest.TestCase):
+    """存活与就绪检查测试类"""
+
+    def test_loop_lag_detects_blocking_call(self):
+        """同步阻塞事件循环的时间被记为延迟"""
+        async def run():
+            monitor = HealthMonitor()
+            await monitor.start()
+            monitor.interval = 0.02
+            await asyncio.sleep(0.6)
+            time.sleep(0.3)
+            await asyncio.sleep(0.1)
+            await monitor.stop()
+            return monitor.loop_lag()
+        lag = asyncio.run(run())
+        self.assertFalse(lag["running"])
+        self.assertGreaterEqual(lag["max_lag_ms"], 200)
+
+    def test_tick_age(self):
+        """定时任务启动前没有数据，启动后按最近一次成功的检查计算"""
+        monitor = HealthMonitor()
+        self.assertIsNone(monitor.tick_age())
+        monitor.expect_ticks()
+        self.assertLess(monitor.tick_age(), 1)
+        monitor._last_tick = time.monotonic() - 120
+        self.assertFalse(_check(monitor.tick_age(), 60)["ok"])
+        monitor.record_tick()
+        self.assertTrue(_check(monitor.tick_age(), 60)["ok"])
+        self.assertTrue(_check(None, 60)["ok"])
+
+    def test_send_backlog_per_connection(self):
+        """按连接统计尚未发送完成的消息数和字节数，发送完成后清零"""
+        async def run():
+            backlog = SendBacklog()
+            slow, other = SlowWebSocket(), SlowWebSocket()
+            sends = [asyncio.create_task(backlog.send(slow, "消息")) for _ in range(3)]
+            sends.append(asyncio.create_task(backlog.send(other, "ok")))
+            await asyncio.sleep(0.01)
+            pending = backlog.stats()
+            slow.drained.set()
+            other.drained.set()
+            await asyncio.gather(*sends)
+            return pending, backlog.stats()
+
+        pending, drained = asyncio.run(run())
+        self.assertEqual(pending, {
+            "connections": 2, "max_messages": 3, "max_bytes": 18, "total_messages": 4, "total_bytes": 20
+        })
+        self.assertEqual(drained["connections"], 0)
+        self.assertEqual(drained["total_bytes"], 0)
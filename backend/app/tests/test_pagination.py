@@ -0,0 +1,105 @@
+import base64
+import unittest
+from datetime import date, datetime, timedelta
+
+from fastapi import HTTPException, Response
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.core.pagination import NEXT_CURSOR_HEADER, decode_cursor, encode_cursor, keyset_page, paginate
+from backend.app.db.models import Base, BillMaster, CarRequest
+
+class TestPagination(unittest.TestCase):
+    """键集分页测试类"""
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = sessionmaker(bind=engine)()
+        # 每3条请求共用同一个请求时间
+        start = datetime(2024, 5, 1, 8)
+        for i in range(23):
+            self.db.add(CarRequest(
+                user_id="u1", queue_number=f"F{i}", mode="FAST", amount_kwh=10, battery_capacity=60,
+                status="FINISHED", request_time=start + timedelta(minutes=i // 3)
+            ))
+        for day in range(1, 8):
+            self.db.add(BillMaster(user_id="u1", bill_date=date(2024, 5, day)))
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    def walk(self, query, sort_column, id_column, limit, parse=datetime.fromisoformat):
+        pages, cursor = [], None
+        while True:
+            rows, cursor = keyset_page(query, sort_column, id_column, cursor, limit, parse)
+            pages.append(rows)
+            if cursor is None:
+                return pages
+
+    def test_walk_all_pages_with_duplicate_sort_values(self):
+        """逐页读取，没有遗漏和重复，顺序与整体倒序一致，最后一页不返回游标"""
+        query = self.db.query(CarRequest)
+        expected = [row.id for row in query.order_by(CarRequest.request_time.desc(), CarRequest.id.desc()).all()]
+        for limit in (1, 2, 3, 4, 5, 23, 50):
+            pages = self.walk(query, CarRequest.request_time, CarRequest.id, limit)
+            ids = [row.id for page in pages for row in page]
+            self.assertEqual(ids, expected)
+            self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+            self.assertTrue(pages[-1])
+
+    def test_date_cursor(self):
+        """日期排序列的游标用 date.fromisoformat 还原"""
+        query = self.db.query(BillMaster)
+        pages = self.walk(query, BillMaster.bill_date, BillMaster.id, 3, parse=date.fromisoformat)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(
+            [row.bill_date.day for page in pages for row in page], [7, 6, 5, 4, 3, 2, 1]
+        )
+        _, cursor = keyset_page(query, BillMaster.bill_date, BillMaster.id, None, 3, date.fromisoformat)
+        self.assertEqual(decode_cursor(cursor)[0], "2024-05-05")
+
+    def test_paginate_sets_header(self):
+        """有下一页时设置响应头，最后一页不设置"""
+        query = self.db.query(CarRequest)
+        response = Response()
+        rows = paginate(response, query, CarRequest.request_time, CarRequest.id, None, 20)
+        self.assertEqual(len(rows), 20)
+        cursor = response.headers[NEXT_CURSOR_HEADER]
+        response = Response()
+        rows = paginate(response, query, CarRequest.request_time, CarRequest.id, cursor, 20)
+        self.assertEqual(len(rows), 3)
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+
+    def test_invalid_cursor_returns_400(self):
+        """格式错误或被篡改的游标返回400"""
+        tampered = base64.urlsafe_b64encode(b'["2024-05-01T08:00:00", "x"]').decode("ascii")
+        cursors = [
+            "not-base64!",
+            base64.urlsafe_b64encode(b"{}").decode("ascii"),
+            tampered,
+            encode_cursor("not a time", 1),
+        ]
+        for cursor in cursors:
+            with self.assertRaises(HTTPException) as context:
+                paginate(Response(), self.db.query(CarRequest), CarRequest.request_time, CarRequest.id, cursor, 10)
+            self.assertEqual(context.exception.status_code, 400)
+        # 时间游标不能用于日期排序列
+        with self.assertRaises(HTTPException) as context:
+            paginate(
+                Response(), self.db.query(BillMaster), BillMaster.bill_date, BillMaster.id,
+                encode_cursor("2024-05-01T08:00:00", 1), 10, parse=date.fromisoformat
+            )
+        self.assertEqual(context.exception.status_code, 400)
+
+    def test_unpaged_by_default(self):
+        """未指定游标和每页数量时返回全部数据，指定任一项时分页"""
+        query = self.db.query(CarRequest)
+        response = Response()
+        rows = paginate(response, query, CarRequest.request_time, CarRequest.id, None, None, unpaged_by_default=True)
+        self.assertEqual(len(rows), 23)
+        self.assertNotIn(NEXT_CURSOR_HEADER, response.headers)
+        rows = paginate(response, query, CarRequest.request_time, CarRequest.id, None, 5, unpaged_by_default=True)
+        self.assertEqual(len(rows), 5)
+        self.assertIn(NEXT_CURSOR_HEADER, response.headers)
@@ -0,0 +1,62 @@
+import itertools
+import random
+import unittest
+
+from backend.app.services.schedule_solver import solve_min_total_completion, total_completion_time
+
+def brute_force(amounts, powers, backlogs, capacities):
+    """穷举所有分配方案(每个桩内按最短作业优先排序)，返回最小总完成时间"""
+    best = float('inf')
+    n = len(amounts)
+    for assignment in itertools.product(range(len(powers)), repeat=n):
+        schedule = [[] for _ in powers]
+        for job, pile in enumerate(assignment):
+            schedule[pile].append(job)
+        if any(len(jobs) > cap for jobs, cap in zip(schedule, capacities)):
+            continue
+        for jobs in schedule:
+            jobs.sort(key=lambda j: amounts[j])
+        best = min(best, total_completion_time(schedule, amounts, powers, backlogs))
+    return best
+
+class TestScheduleSolver(unittest.TestCase):
+    """批量调度求解器测试类"""
+
+    def test_matches_brute_force(self):
+        """随机小规模实例与穷举结果一致"""
+        rng = random.Random(42)
+        for _ in range(200):
+            pile_count = rng.randint(1, 3)
+            powers = [rng.choice([7.0, 30.0, 60.0]) for _ in range(pile_count)]
+            backlogs = [rng.choice([0.0, rng.uniform(0, 120)]) for _ in range(pile_count)]
+            capacities = [rng.randint(0, 3) for _ in range(pile_count)]
+            if sum(capacities) == 0:
+                continue
+            n = rng.randint(1, min(sum(capacities), 6))
+            amounts = [round(rng.uniform(5, 80), 1) for _ in range(n)]
+
+            schedule, total = solve_min_total_completion(amounts, powers, backlogs, capacities)
+
+            self.assertAlmostEqual(total, brute_force(amounts, powers, backlogs, capacities), places=6)
+            self.assertEqual(sorted(j for jobs in schedule for j in jobs), list(range(n)))
+            for jobs, cap in zip(schedule, capacities):
+                self.assertLessEqual(len(jobs), cap)
+
+    def test_shortest_job_first_within_pile(self):
+        """同一充电桩内按充电量从小到大充电"""
+        schedule, _ = solve_min_total_completion([30.0, 10.0, 20.0], [30.0], [0.0], [3])
+        self.assertEqual(schedule, [[1, 2, 0]])
+
+    def test_insufficient_slots(self):
+        """车位不足时抛出异常"""
+        with self.assertRaises(ValueError):
+            solve_min_total_completion([10.0, 20.0], [30.0, 7.0], [0.0, 0.0], [1, 0])
+
+    def test_empty_batch(self):
+        """空批次"""
+        schedule, total = solve_min_total_completion([], [30.0, 7.0], [0.0, 0.0], [2, 2])
+        self.assertEqual(schedule, [[], []])
+        self.assertEqual(total, 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
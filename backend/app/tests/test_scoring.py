@@ -0,0 +1,55 @@
+import random
+import unittest
+from unittest.mock import patch
+
+from backend.app.services import scoring
+
+class TestScoring(unittest.TestCase):
+    """充电桩评分内核测试类"""
+
+    def setUp(self):
+        rng = random.Random(7)
+        self.powers = [30.0, 30.0, 7.0, 0.0, 60.0]
+        self.backlogs = [rng.uniform(0, 90) for _ in self.powers]
+        self.free_slots = [2, 0, 3, 1, 1]
+        self.amounts = [round(rng.uniform(5, 80), 1) for _ in range(12)]
+
+    def run_both(self, func, *args):
+        """分别用 NumPy 和纯 Python 实现计算"""
+        results = []
+        for use_numpy in (True, False):
+            if use_numpy and not scoring.HAS_NUMPY:
+                continue
+            with patch.object(scoring, "HAS_NUMPY", use_numpy):
+                results.append(func(*args))
+        return results
+
+    def test_score_piles(self):
+        """最优充电桩与完成时间矩阵"""
+        for best, matrix in self.run_both(scoring.score_piles, self.amounts, self.powers, self.backlogs, self.free_slots):
+            for i, amount in enumerate(self.amounts):
+                expected = [
+                    self.backlogs[j] + amount / power * 60 if power > 0 and slots > 0 else float('inf')
+                    for j, (power, slots) in enumerate(zip(self.powers, self.free_slots))
+                ]
+                self.assertEqual(best[i], expected.index(min(expected)))
+                for j, value in enumerate(expected):
+                    self.assertAlmostEqual(float(matrix[i][j]), value)
+
+    def test_assign_sequentially(self):
+        """逐辆分配时累计队列时长并占用车位"""
+        results = self.run_both(scoring.assign_sequentially, self.amounts, self.powers, self.backlogs, self.free_slots)
+        for assignment in results:
+            self.assertEqual(assignment, results[0])
+            # 功率有效的充电桩共有 6 个车位，多出的车辆无法分配
+            self.assertEqual(sum(1 for index in assignment if index >= 0), 6)
+            for j, slots in enumerate(self.free_slots):
+                self.assertLessEqual(assignment.count(j), slots)
+
+    def test_no_piles(self):
+        """没有充电桩时返回 -1"""
+        for index in self.run_both(scoring.best_pile_index, 10.0, [], []):
+            self.assertEqual(index, -1)
+
+if __name__ == "__main__":
+    unittest.main()
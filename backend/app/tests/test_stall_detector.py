@@ -0,0 +1,40 @@
+import asyncio
+import time
+import unittest
+from types import SimpleNamespace
+
+from backend.app.core.stall_detector import StallDetector
+
+def blocking_service():
+    """模拟在事件循环中执行的同步数据库调用"""
+    time.sleep(0.3)
+
+async def blocking_endpoint():
+    blocking_service()
+    return {}
+
+class TestStallDetector(unittest.TestCase):
+    """事件循环阻塞检测测试类"""
+
+    def test_stall_attributed_to_route_and_function(self):
+        """阻塞超过阈值时记录一次，归因到路由和应用内最深的函数"""
+        app = SimpleNamespace(routes=[SimpleNamespace(endpoint=blocking_endpoint, methods={"GET"}, path="/slow")])
+
+        async def run():
+            detector = StallDetector()
+            await detector.start(app)
+            await asyncio.sleep(0.1)
+            await blocking_endpoint()
+            # 短暂让出事件循环不算阻塞
+            await asyncio.sleep(0.2)
+            await detector.stop()
+            return detector.stats()
+
+        stats = asyncio.run(run())
+        self.assertFalse(stats["running"])
+        self.assertEqual(stats["stalls"], 1)
+        self.assertGreaterEqual(stats["max_ms"], 150)
+        site = stats["sites"][0]
+        self.assertEqual(site["route"], "GET /slow")
+        self.assertTrue(site["function"].endswith("test_stall_detector.blocking_service"))
+        self.assertTrue(stats["recent"][0]["stack"][0].endswith(f"blocking_service:{blocking_service.__code__.co_firstlineno + 2}"))
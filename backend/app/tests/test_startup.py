@@ -0,0 +1,39 @@
+import asyncio
+import unittest
+
+from backend.app.core.startup import StartupState, WarmupGuardMiddleware
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+def call(middleware, method: str, path: str) -> int:
+    """发送一个请求，返回响应状态码"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "headers": []}
+    asyncio.run(middleware(scope, receive, send))
+    return messages[0]["status"]
+
+class TestStartup(unittest.TestCase):
+    """启动预热测试类"""
+
+    def test_guard_rejects_writes_until_ready(self):
+        """预热完成前修改数据的接口返回503，查询和登录不受影响"""
+        state = StartupState()
+        middleware = WarmupGuardMiddleware(ok_app, state=state)
+        self.assertEqual(call(middleware, "POST", "/api/charging/request"), 503)
+        self.assertEqual(call(middleware, "DELETE", "/api/charging/request/1"), 503)
+        self.assertEqual(call(middleware, "GET", "/api/charging/queue"), 200)
+        self.assertEqual(call(middleware, "POST", "/api/auth/login"), 200)
+
+        for cache in state.warm:
+            state.mark_warm(cache)
+        state.mark_ready()
+        self.assertEqual(call(middleware, "POST", "/api/charging/request"), 200)
@@ -0,0 +1,126 @@
+import random
+import time as timer
+import unittest
+from datetime import datetime, time, timedelta
+from types import SimpleNamespace
+
+from backend.app.services.billing import BillingService
+from backend.app.services.charge_curve import ChargeCurve
+from backend.app.services.tariff import TariffCurve, minute_tariff
+
+def rule(band, price, start, end):
+    return SimpleNamespace(type=band, price=price, start_time=start, end_time=end)
+
+RATE_RULES = [
+    rule("PEAK", 1.0, time(10), time(15)),
+    rule("PEAK", 1.0, time(18), time(21)),
+    rule("NORMAL", 0.7, time(7), time(10)),
+    rule("NORMAL", 0.7, time(15), time(18)),
+    rule("NORMAL", 0.7, time(21), time(23)),
+    rule("VALLEY", 0.4, time(23), time(23, 59, 59)),
+    rule("VALLEY", 0.4, time(0), time(7)),
+]
+
+class TestTariffCurve(unittest.TestCase):
+    """分时电价曲线测试类"""
+
+    def setUp(self):
+        self.origin = datetime(2026, 3, 1)
+        self.curve = TariffCurve(minute_tariff(RATE_RULES)["price"], self.origin)
+
+    def billing_cost(self, start: datetime, amount: float, power: float) -> float:
+        end = start + timedelta(hours=amount / power)
+        return BillingService.calculate_charging_cost(None, start, end, amount, rate_rules=RATE_RULES, service_rate=0)[0]
+
+    def test_cost_matches_billing(self):
+        """整分钟开始时的电费与计费逻辑一致"""
+        rng = random.Random(5)
+        for _ in range(300):
+            minute = rng.randrange(0, 2 * 1440)
+            power = rng.choice([7.0, 30.0])
+            amount = round(rng.uniform(1, 60), 2)
+            expected = self.billing_cost(self.origin + timedelta(minutes=minute), amount, power)
+            self.assertAlmostEqual(float(self.curve.charge_cost(minute, amount, power)), expected, places=6)
+
+    def test_tapered_curve_uses_average_power(self):
+        """功率曲线下按平均功率估算的电费等于账单充电费，与按实际充电过程计算的电费之差不超过界限"""
+        curve = ChargeCurve([(0.0, 1.0), (0.8, 1.0), (1.0, 0.4)])
+        amount, power, capacity = 40.0, 30.0, 50.0
+        # 9:30 开始，10:00 进入峰时
+        start = self.origin + timedelta(hours=9, minutes=30)
+        duration = curve.charge_minutes(amount, power, capacity)
+        estimate = float(self.curve.charge_cost(self.curve.minute_of(start), amount, amount / duration * 60))
+        billed = BillingService.calculate_charging_cost(
+            None, start, start + timedelta(minutes=duration), amount, rate_rules=RATE_RULES, service_rate=0
+        )[0]
+        self.assertAlmostEqual(estimate, billed, places=6)
+
+        # 按曲线实际各小时段充入的电量计算，各小时段按开始时的电价
+        edges = list(range(0, int(duration), 60)) + [duration]
+        actual, prices, gap = 0.0, [], 0.0
+        for begin, end in zip(edges, edges[1:]):
+            price = BillingService.match_rate_rule(RATE_RULES, start + timedelta(minutes=begin))
+            charged = curve.energy_after(end, power, amount, capacity)
+            actual += price * (charged - curve.energy_after(begin, power, amount, capacity))
+            prices.append(price)
+            gap = max(gap, abs(charged - amount * end / duration))
+        bound = sum(abs(later - earlier) for earlier, later in zip(prices, prices[1:])) * gap
+        # 实际充电前段快，更多电量落在开始时较低的电价上
+        self.assertLess(actual, estimate)
+        self.assertLessEqual(estimate - actual, bound + 1e-6)
+
+    def test_cheapest_start(self):
+        """与逐分钟逐桩枚举的结果一致，并满足离开时间"""
+        rng = random.Random(9)
+        powers, free_slots = [30.0, 30.0, 7.0], [1, 2, 0]
+        for _ in range(50):
+            now = self.origin + timedelta(minutes=rng.randrange(0, 1440))
+            deadline = now + timedelta(minutes=rng.randrange(60, 1200))
+            backlogs = [rng.uniform(0, 120) for _ in powers]
+            amount = round(rng.uniform(5, 60), 1)
+            choice = self.curve.cheapest_start(amount, powers, backlogs, free_slots, now, deadline)
+
+            best = None
+            for j, power in enumerate(powers):
+                if free_slots[j] <= 0:
+                    continue
+                duration = amount / power * 60
+                offset = backlogs[j]
+                while offset + duration <= (deadline - now).total_seconds() / 60 + 1e-9:
+                    start = self.curve.minute_of(now) + offset
+                    cost = round(float(self.curve.charge_cost(start, amount, power)), 6)
+                    best = cost if best is None else min(best, cost)
+                    offset = int(start) + 1 - self.curve.minute_of(now)
+
+            if best is None:
+                self.assertIsNone(choice)
+                continue
+            index, start_offset, cost = choice
+            self.assertAlmostEqual(cost, best, places=6)
+            self.assertLessEqual(start_offset + amount / powers[index] * 60, (deadline - now).total_seconds() / 60 + 1e-6)
+            self.assertGreaterEqual(start_offset + 1e-9, backlogs[index])
+
+    def test_waits_for_valley(self):
+        """晚间到达、次日早上离开的车辆等到谷时开始充电"""
+        now = self.origin + timedelta(hours=21)
+        index, start_offset, cost = self.curve.cheapest_start(
+            30.0, [30.0], [0.0], [1], now, now + timedelta(hours=10)
+        )
+        self.assertEqual(index, 0)
+        # 平时规则 21:00~23:00 含 23:00 整，谷时从 23:01 开始
+        self.assertAlmostEqual(start_offset, 121.0)
+        self.assertAlmostEqual(cost, 30.0 * 0.4)
+
+    def test_decision_time(self):
+        """单次决策耗时低于 1 毫秒"""
+        now = self.origin + timedelta(hours=8)
+        args = (40.0, [30.0, 30.0, 30.0], [10.0, 35.0, 70.0], [1, 1, 1], now, now + timedelta(hours=20))
+        self.curve.cheapest_start(*args)
+        rounds = 200
+        began = timer.perf_counter()
+        for _ in range(rounds):
+            self.curve.cheapest_start(*args)
+        self.assertLess((timer.perf_counter() - began) / rounds, 1e-3)
+
+if __name__ == "__main__":
+    unittest.main()
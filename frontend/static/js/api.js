@@ -460,7 +460,7 @@ const admin = {
     
     /**
      * 更新调度策略
-     * @param {string} strategy - 调度策略 (default: 默认调度, batch_mode: 单次调度总充电时长最短, bulk_mode: 批量调度总充电时长最短)
+     * @param {string} strategy - 调度策略 (default: 默认调度, batch_mode: 单次调度总充电时长最短, bulk_mode: 批量调度总充电时长最短, cost_mode: 电价最省)
      * @param {number} bulkSize - 批量调度时的车辆数量，仅在bulk_mode模式下有效
      * @returns {Promise} 更新结果
      */
@@ -6,21 +6,25 @@ USE smart_charge;
 CREATE TABLE IF NOT EXISTS t_charge_pile (
     id INT AUTO_INCREMENT PRIMARY KEY,
     code VARCHAR(10) NOT NULL,
+    station_id VARCHAR(20) NOT NULL DEFAULT 'default',
     type ENUM('FAST', 'SLOW') NOT NULL,
     status ENUM('AVAILABLE', 'BUSY', 'FAULT', 'OFFLINE') NOT NULL DEFAULT 'OFFLINE',
     power DECIMAL(10,2) NOT NULL,
     total_charge_count INT NOT NULL DEFAULT 0,
     total_charge_time INT NOT NULL DEFAULT 0,
     total_charge_amount DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    version INT NOT NULL DEFAULT 0,
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    UNIQUE KEY idx_pile_code (code)
+    UNIQUE KEY idx_pile_code (code),
+    INDEX idx_station_id (station_id)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Charging request table
 CREATE TABLE IF NOT EXISTS t_car_request (
     id INT AUTO_INCREMENT PRIMARY KEY,
     user_id VARCHAR(50) NOT NULL,
+    station_id VARCHAR(20) NOT NULL DEFAULT 'default',
     queue_number VARCHAR(20) NOT NULL,
     mode ENUM('FAST', 'SLOW') NOT NULL,
     amount_kwh DECIMAL(10,2) NOT NULL,
@@ -31,11 +35,14 @@ CREATE TABLE IF NOT EXISTS t_car_request (
     request_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     start_time TIMESTAMP NULL,
     end_time TIMESTAMP NULL,
+    departure_time TIMESTAMP NULL,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     UNIQUE KEY idx_queue_number (queue_number),
-    INDEX idx_user_id (user_id),
-    INDEX idx_status (status),
-    INDEX idx_pile_id (pile_id)
+    INDEX idx_user_time (user_id, request_time, id),
+    INDEX idx_request_time (request_time, id),
+    INDEX idx_status_time (status, request_time, id),
+    INDEX idx_pile_time (pile_id, request_time, id),
+    INDEX idx_station_status (station_id, status)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
 -- Charging session table
@@ -70,6 +77,33 @@ CREATE TABLE IF NOT EXISTS t_bill_master (
     UNIQUE KEY idx_user_date (user_id, bill_date)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
 
+-- Monthly bill summary table
+CREATE TABLE IF NOT EXISTS t_bill_monthly_summary (
+    user_id VARCHAR(50) NOT NULL,
+    bill_month DATE NOT NULL,
+    bill_count INT NOT NULL DEFAULT 0,
+    total_charge_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    total_service_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    total_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    total_kwh DECIMAL(10,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, bill_month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Backfill monthly summaries from daily bills (idempotent, safe to re-run on upgrade)
+INSERT INTO t_bill_monthly_summary
+    (user_id, bill_month, bill_count, total_charge_fee, total_service_fee, total_fee, total_kwh)
+SELECT user_id, DATE_FORMAT(bill_date, '%Y-%m-01'), COUNT(*),
+       SUM(total_charge_fee), SUM(total_service_fee), SUM(total_fee), SUM(total_kwh)
+FROM t_bill_master
+GROUP BY user_id, DATE_FORMAT(bill_date, '%Y-%m-01')
+ON DUPLICATE KEY UPDATE
+    bill_count = VALUES(bill_count),
+    total_charge_fee = VALUES(total_charge_fee),
+    total_service_fee = VALUES(total_service_fee),
+    total_fee = VALUES(total_fee),
+    total_kwh = VALUES(total_kwh);
+
 -- Bill detail table
 CREATE TABLE IF NOT EXISTS t_bill_detail (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -6,21 +6,25 @@ USE smart_charge;
 CREATE TABLE IF NOT EXISTS t_charge_pile (
     id INT AUTO_INCREMENT PRIMARY KEY,
     code VARCHAR(10) NOT NULL COMMENT '桩编号，如A、B、C等',
+    station_id VARCHAR(20) NOT NULL DEFAULT 'default' COMMENT '所属充电站ID',
     type ENUM('FAST', 'SLOW') NOT NULL COMMENT '桩类型，快充或慢充',
     status ENUM('AVAILABLE', 'BUSY', 'FAULT', 'OFFLINE') NOT NULL DEFAULT 'OFFLINE' COMMENT '桩状态',
     power DECIMAL(10,2) NOT NULL COMMENT '充电功率 kWh/h',
     total_charge_count INT NOT NULL DEFAULT 0 COMMENT '累计充电次数',
     total_charge_time INT NOT NULL DEFAULT 0 COMMENT '累计充电时长(分钟)',
     total_charge_amount DECIMAL(10,2) NOT NULL DEFAULT 0.00 COMMENT '累计充电度数',
+    version INT NOT NULL DEFAULT 0 COMMENT '队列版本号，队列每次变更时递增(乐观锁)',
     created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    UNIQUE KEY idx_pile_code (code)
+    UNIQUE KEY idx_pile_code (code),
+    INDEX idx_station_id (station_id)
 ) COMMENT='充电桩信息表';
 
 -- 充电请求表
 CREATE TABLE IF NOT EXISTS t_car_request (
     id INT AUTO_INCREMENT PRIMARY KEY,
     user_id VARCHAR(50) NOT NULL COMMENT '用户ID',
+    station_id VARCHAR(20) NOT NULL DEFAULT 'default' COMMENT '所属充电站ID',
     queue_number VARCHAR(20) NOT NULL COMMENT '排队号码，如F1、T2等',
     mode ENUM('FAST', 'SLOW') NOT NULL COMMENT '充电模式，快充或慢充',
     amount_kwh DECIMAL(10,2) NOT NULL COMMENT '请求充电量(kWh)',
@@ -31,11 +35,14 @@ CREATE TABLE IF NOT EXISTS t_car_request (
     request_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '请求时间',
     start_time TIMESTAMP NULL COMMENT '开始充电时间',
     end_time TIMESTAMP NULL COMMENT '结束充电时间',
+    departure_time TIMESTAMP NULL COMMENT '用户预计离开时间(最晚完成时间)',
     updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     UNIQUE KEY idx_queue_number (queue_number),
-    INDEX idx_user_id (user_id),
-    INDEX idx_status (status),
-    INDEX idx_pile_id (pile_id)
+    INDEX idx_user_time (user_id, request_time, id),
+    INDEX idx_request_time (request_time, id),
+    INDEX idx_status_time (status, request_time, id),
+    INDEX idx_pile_time (pile_id, request_time, id),
+    INDEX idx_station_status (station_id, status)
 ) COMMENT='充电请求表';
 
 -- 充电会话表
@@ -70,6 +77,33 @@ CREATE TABLE IF NOT EXISTS t_bill_master (
     UNIQUE KEY idx_user_date (user_id, bill_date)
 ) COMMENT='日账单主表';
 
+-- 用户月度账单汇总表
+CREATE TABLE IF NOT EXISTS t_bill_monthly_summary (
+    user_id VARCHAR(50) NOT NULL COMMENT '用户ID',
+    bill_month DATE NOT NULL COMMENT '账单月份(当月1日)',
+    bill_count INT NOT NULL DEFAULT 0 COMMENT '有账单的天数',
+    total_charge_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00 COMMENT '总充电费用',
+    total_service_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00 COMMENT '总服务费用',
+    total_fee DECIMAL(10,2) NOT NULL DEFAULT 0.00 COMMENT '总费用',
+    total_kwh DECIMAL(10,2) NOT NULL DEFAULT 0.00 COMMENT '总充电量',
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, bill_month)
+) COMMENT='用户月度账单汇总表';
+
+-- 从日账单回填月度汇总(升级已有数据库时重新执行本脚本即可，重复执行结果不变)
+INSERT INTO t_bill_monthly_summary
+    (user_id, bill_month, bill_count, total_charge_fee, total_service_fee, total_fee, total_kwh)
+SELECT user_id, DATE_FORMAT(bill_date, '%Y-%m-01'), COUNT(*),
+       SUM(total_charge_fee), SUM(total_service_fee), SUM(total_fee), SUM(total_kwh)
+FROM t_bill_master
+GROUP BY user_id, DATE_FORMAT(bill_date, '%Y-%m-01')
+ON DUPLICATE KEY UPDATE
+    bill_count = VALUES(bill_count),
+    total_charge_fee = VALUES(total_charge_fee),
+    total_service_fee = VALUES(total_service_fee),
+    total_fee = VALUES(total_fee),
+    total_kwh = VALUES(total_kwh);
+
 -- 账单详情表
 CREATE TABLE IF NOT EXISTS t_bill_detail (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -120,7 +154,8 @@ CREATE TABLE IF NOT EXISTS t_queue_log (
     pile_id INT NULL COMMENT '充电桩ID',
     queue_position INT NULL COMMENT '队列位置',
     log_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '日志时间',
-    remark VARCHAR(255) NULL COMMENT '备注'
+    remark VARCHAR(255) NULL COMMENT '备注',
+    INDEX idx_log_time (log_time)
 ) COMMENT='队列变更日志表';
 
 -- 故障日志表
@@ -175,6 +210,91 @@ CREATE TABLE IF NOT EXISTS t_user (
     UNIQUE KEY idx_username (username)
 ) COMMENT='用户表';
 
+-- 冷数据归档表
+-- 已完成/已取消的请求及其会话、详单、队列日志由归档任务按月迁移到以下表中，
+-- 按归档月份(YYYYMM)做范围分区，归档任务会按需拆分出新的月份分区
+CREATE TABLE IF NOT EXISTS t_car_request_archive (
+    id INT NOT NULL COMMENT '原充电请求ID',
+    archive_month INT NOT NULL COMMENT '归档月份(YYYYMM，按请求时间)',
+    user_id VARCHAR(50) NOT NULL COMMENT '用户ID',
+    station_id VARCHAR(20) NOT NULL DEFAULT 'default' COMMENT '所属充电站ID',
+    queue_number VARCHAR(20) NOT NULL COMMENT '排队号码',
+    mode ENUM('FAST', 'SLOW') NOT NULL COMMENT '充电模式，快充或慢充',
+    amount_kwh DECIMAL(10,2) NOT NULL COMMENT '请求充电量(kWh)',
+    battery_capacity DECIMAL(10,2) NOT NULL COMMENT '电池总容量(kWh)',
+    status ENUM('WAITING', 'QUEUING', 'CHARGING', 'FINISHED', 'CANCELED') NOT NULL COMMENT '请求状态',
+    pile_id INT NULL COMMENT '分配的充电桩ID',
+    queue_position INT NULL COMMENT '在充电桩队列中的位置',
+    request_time DATETIME NOT NULL COMMENT '请求时间',
+    start_time DATETIME NULL COMMENT '开始充电时间',
+    end_time DATETIME NULL COMMENT '结束充电时间',
+    departure_time DATETIME NULL COMMENT '用户预计离开时间(最晚完成时间)',
+    updated_at DATETIME NOT NULL,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+    PRIMARY KEY (id, archive_month),
+    INDEX idx_user_id (user_id)
+) COMMENT='充电请求归档表'
+PARTITION BY RANGE (archive_month) (PARTITION p_max VALUES LESS THAN MAXVALUE);
+
+CREATE TABLE IF NOT EXISTS t_charge_session_archive (
+    id INT NOT NULL COMMENT '原充电会话ID',
+    archive_month INT NOT NULL COMMENT '归档月份(YYYYMM，按会话开始时间)',
+    request_id INT NOT NULL COMMENT '关联的充电请求ID',
+    pile_id INT NOT NULL COMMENT '充电桩ID',
+    start_time DATETIME NOT NULL COMMENT '会话开始时间',
+    end_time DATETIME NULL COMMENT '会话结束时间',
+    charged_kwh DECIMAL(10,2) NOT NULL COMMENT '充电电量(kWh)',
+    charging_time INT NOT NULL COMMENT '充电时长(分钟)',
+    charge_fee DECIMAL(10,2) NOT NULL COMMENT '充电费用',
+    service_fee DECIMAL(10,2) NOT NULL COMMENT '服务费用',
+    total_fee DECIMAL(10,2) NOT NULL COMMENT '总费用',
+    status ENUM('CHARGING', 'COMPLETED', 'INTERRUPTED') NOT NULL COMMENT '会话状态',
+    created_at DATETIME NOT NULL,
+    updated_at DATETIME NOT NULL,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+    PRIMARY KEY (id, archive_month),
+    INDEX idx_request_id (request_id)
+) COMMENT='充电会话归档表'
+PARTITION BY RANGE (archive_month) (PARTITION p_max VALUES LESS THAN MAXVALUE);
+
+CREATE TABLE IF NOT EXISTS t_bill_detail_archive (
+    id INT NOT NULL COMMENT '原详单ID',
+    archive_month INT NOT NULL COMMENT '归档月份(YYYYMM，按启动时间)',
+    bill_id INT NOT NULL COMMENT '关联的账单ID',
+    session_id INT NOT NULL COMMENT '关联的充电会话ID',
+    detail_number VARCHAR(50) NOT NULL COMMENT '详单编号',
+    pile_code VARCHAR(10) NOT NULL COMMENT '充电桩编号',
+    charged_kwh DECIMAL(10,2) NOT NULL COMMENT '充电电量',
+    charging_time INT NOT NULL COMMENT '充电时长(分钟)',
+    start_time DATETIME NOT NULL COMMENT '启动时间',
+    end_time DATETIME NULL COMMENT '停止时间',
+    charge_fee DECIMAL(10,2) NOT NULL COMMENT '充电费用',
+    service_fee DECIMAL(10,2) NOT NULL COMMENT '服务费用',
+    total_fee DECIMAL(10,2) NOT NULL COMMENT '总费用',
+    created_at DATETIME NOT NULL,
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+    PRIMARY KEY (id, archive_month),
+    INDEX idx_bill_id (bill_id),
+    INDEX idx_detail_number (detail_number)
+) COMMENT='账单详情归档表'
+PARTITION BY RANGE (archive_month) (PARTITION p_max VALUES LESS THAN MAXVALUE);
+
+CREATE TABLE IF NOT EXISTS t_queue_log_archive (
+    id INT NOT NULL COMMENT '原日志ID',
+    archive_month INT NOT NULL COMMENT '归档月份(YYYYMM，按日志时间)',
+    request_id INT NOT NULL COMMENT '充电请求ID',
+    from_status VARCHAR(20) NOT NULL COMMENT '变更前状态',
+    to_status VARCHAR(20) NOT NULL COMMENT '变更后状态',
+    pile_id INT NULL COMMENT '充电桩ID',
+    queue_position INT NULL COMMENT '队列位置',
+    log_time DATETIME NOT NULL COMMENT '日志时间',
+    remark VARCHAR(255) NULL COMMENT '备注',
+    archived_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+    PRIMARY KEY (id, archive_month),
+    INDEX idx_request_id (request_id)
+) COMMENT='队列变更日志归档表'
+PARTITION BY RANGE (archive_month) (PARTITION p_max VALUES LESS THAN MAXVALUE);
+
 -- 初始化充电桩数据
 INSERT INTO t_charge_pile (code, type, status, power) VALUES 
 ('A', 'FAST', 'OFFLINE', 30.00),
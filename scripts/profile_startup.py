@@ -0,0 +1,90 @@
+"""
+启动耗时分析
+在子进程中以 python -X importtime 导入应用模块，汇总各模块的导入耗时，
+按累计耗时和自身耗时分别列出最慢的模块；指定 --url 时同时读取运行中服务的 /ready，
+列出启动各阶段和后台预热的耗时。
+
+用法(在项目根目录执行):
+    python scripts/profile_startup.py
+    python scripts/profile_startup.py --top 30 --package backend
+    python scripts/profile_startup.py --url http://127.0.0.1:8000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def profile_imports(module: str):
+    """返回 [(模块名, 自身耗时us, 累计耗时us)] 和导入是否成功"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            # 模块名前的缩进表示嵌套层级，顶层模块没有缩进
+            rows.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print("导入失败:\n" + "\n".join(errors[-10:]))
+    return rows, result.returncode == 0
+
+def print_top(title: str, rows, key: int, top: int):
+    print(f"\n{title}")
+    print(f"{'累计(ms)':>10} {'自身(ms)':>10}  模块")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[key], reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>10.1f} {self_us / 1000:>10.1f}  {name}")
+
+def print_ready(url: str):
+    try:
+        with urllib.request.urlopen(url.rstrip("/") + "/ready", timeout=5) as response:
+            report = json.load(response)
+    except urllib.error.HTTPError as e:
+        # 预热未完成时返回503，内容仍是启动报告
+        report = json.load(e)
+    except OSError as e:
+        print(f"\n无法读取 {url}/ready: {e}")
+        return
+    print(f"\n就绪: {report['ready']}  距启动 {report['ready_after_seconds']} 秒  预热尝试 {report['warmup_attempts']} 次")
+    for name, seconds in report["phases"].items():
+        print(f"{seconds * 1000:>10.1f} ms  {name}")
+    if report.get("last_error"):
+        print(f"最近一次预热错误: {report['last_error']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="分析应用启动耗时")
+    parser.add_argument("--module", default="backend.app.main", help="要导入的模块")
+    parser.add_argument("--top", type=int, default=20, help="列出最慢的模块数")
+    parser.add_argument("--package", default=None, help="只列出该包下的模块，例如 backend")
+    parser.add_argument("--url", default=None, help="运行中服务的地址，读取 /ready 中的启动阶段耗时")
+    args = parser.parse_args()
+
+    rows, ok = profile_imports(args.module)
+    if rows:
+        # 顶层模块的累计耗时之和即总导入耗时
+        total = sum(cumulative_us for name, _, cumulative_us in rows if not name.startswith(" "))
+        print(f"导入 {args.module} 共 {len(rows)} 个模块，总耗时 {total / 1000:.1f} ms")
+        if args.package:
+            rows = [row for row in rows if row[0].strip().split(".")[0] == args.package]
+        rows = [(name.strip(), self_us, cumulative_us) for name, self_us, cumulative_us in rows]
+        print_top("按累计耗时:", rows, 2, args.top)
+        print_top("按自身耗时:", rows, 1, args.top)
+    if args.url:
+        print_ready(args.url)
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()